@@ -1,3 +1,25 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Agent, AgentRun, AgentRunStep
+
+
+@admin.register(Agent)
+class AgentAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "workspace", "channel", "model", "is_active")
+    list_filter = ("is_active",)
+    search_fields = ("id", "name")
+
+
+class AgentRunStepInline(admin.TabularInline):
+    model = AgentRunStep
+    extra = 0
+    readonly_fields = ("attempt", "seq", "kind", "ok", "duration_ms", "data", "error", "started_at")
+
+
+@admin.register(AgentRun)
+class AgentRunAdmin(admin.ModelAdmin):
+    list_display = ("id", "agent", "status", "attempts", "input_tokens", "output_tokens", "created_at")
+    list_filter = ("status",)
+    search_fields = ("id", "correlation_id")
+    list_select_related = ("agent",)
+    inlines = [AgentRunStepInline]
@@ -0,0 +1,34 @@
+import signal
+import threading
+
+from apps.agents.scheduler import AgentScheduler
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Executa os AgentRuns pendentes (pool de workers com limite de concorrência por workspace)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument("--per-workspace", type=int, default=None,
+                            help="Runs simultâneos por workspace (padrão: AGENT_WORKSPACE_CONCURRENCY).")
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--once", action="store_true",
+                            help="Drena a fila atual e sai.")
+
+    def handle(self, *args, **opts):
+        scheduler = AgentScheduler(
+            workers=opts["workers"],
+            per_workspace=opts["per_workspace"],
+            batch_size=opts["batch_size"],
+        )
+
+        if opts["once"]:
+            scheduler.drain(timeout=float("inf"))
+            scheduler.shutdown()
+            return
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        signal.signal(signal.SIGINT, lambda *_: stop.set())
+        scheduler.run_forever(stop)
@@ -0,0 +1,107 @@
+# Generated by Django 4.2.28 on 2026-10-19 08:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('chat_messages', '0003_message_correlation_id'),
+        ('conversations', '0001_initial'),
+        ('channels', '0003_channel_deleted_at'),
+        ('tenants', '0002_apikey_prefix_last_used'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Agent',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=120)),
+                ('instructions', models.TextField(blank=True, default='')),
+                ('model', models.CharField(blank=True, default='', max_length=100)),
+                ('use_rag', models.BooleanField(default=True)),
+                ('rag_top_k', models.PositiveSmallIntegerField(default=5)),
+                ('history_limit', models.PositiveSmallIntegerField(default=10)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('channel', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='agents', to='channels.channel')),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agents', to='tenants.workspace')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AgentRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('running', 'running'), ('succeeded', 'succeeded'), ('failed', 'failed'), ('cancelled', 'cancelled')], default='queued', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('correlation_id', models.CharField(blank=True, default='', max_length=64)),
+                ('model', models.CharField(blank=True, default='', max_length=100)),
+                ('input_tokens', models.PositiveIntegerField(default=0)),
+                ('output_tokens', models.PositiveIntegerField(default=0)),
+                ('cost_usd', models.DecimalField(decimal_places=6, default=0, max_digits=12)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='agents.agent')),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agent_runs', to='conversations.conversation')),
+                ('response_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat_messages.message')),
+                ('trigger_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='agent_runs', to='chat_messages.message')),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agent_runs', to='tenants.workspace')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AgentRunStep',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('attempt', models.PositiveSmallIntegerField(default=1)),
+                ('seq', models.PositiveSmallIntegerField()),
+                ('kind', models.CharField(choices=[('retrieval', 'retrieval'), ('history', 'history'), ('prompt', 'prompt'), ('llm', 'llm'), ('response', 'response')], max_length=20)),
+                ('ok', models.BooleanField(default=True)),
+                ('duration_ms', models.FloatField(default=0)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('started_at', models.DateTimeField()),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='steps', to='agents.agentrun')),
+            ],
+            options={
+                'ordering': ['run', 'attempt', 'seq'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='agentrunstep',
+            constraint=models.UniqueConstraint(fields=('run', 'attempt', 'seq'), name='uniq_agent_run_step_seq'),
+        ),
+        migrations.AddIndex(
+            model_name='agentrun',
+            index=models.Index(condition=models.Q(('status__in', ['queued', 'running'])), fields=['next_attempt_at'], name='agentrun_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agentrun',
+            index=models.Index(fields=['conversation', '-created_at'], name='agentrun_conv_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agentrun',
+            index=models.Index(fields=['workspace', '-created_at'], name='agentrun_ws_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='agentrun',
+            constraint=models.UniqueConstraint(condition=models.Q(('trigger_message__isnull', False)), fields=('trigger_message',), name='uniq_agent_run_per_trigger_message'),
+        ),
+        migrations.AddConstraint(
+            model_name='agent',
+            constraint=models.UniqueConstraint(condition=models.Q(('channel__isnull', False), ('is_active', True)), fields=('channel',), name='uniq_active_agent_per_channel'),
+        ),
+        migrations.AddConstraint(
+            model_name='agent',
+            constraint=models.UniqueConstraint(condition=models.Q(('channel__isnull', True), ('is_active', True)), fields=('workspace',), name='uniq_default_agent_per_workspace'),
+        ),
+    ]
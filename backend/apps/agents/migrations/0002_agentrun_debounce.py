@@ -0,0 +1,28 @@
+# Generated by Django 4.2.28 on 2026-10-19 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='debounce_seconds',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='agentrun',
+            name='coalesced_messages',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='agentrun',
+            name='pending_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.28 on 2026-10-19 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0002_agentrun_debounce'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='answer_cache',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='agentrunstep',
+            name='kind',
+            field=models.CharField(choices=[('retrieval', 'retrieval'), ('history', 'history'), ('cache', 'cache'), ('prompt', 'prompt'), ('llm', 'llm'), ('response', 'response')], max_length=20),
+        ),
+    ]
@@ -1,3 +1,183 @@
+import uuid
+
 from django.db import models
 
-# Create your models here.
+
+class Agent(models.Model):
+    """
+    Quem responde as conversas (PIPELINE.md, passo 7). Um agent ativo por
+    channel; o agent sem channel é o padrão do workspace.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    workspace = models.ForeignKey(
+        "tenants.Workspace",
+        on_delete=models.CASCADE,
+        related_name="agents",
+    )
+    channel = models.ForeignKey(
+        "channels.Channel",
+        on_delete=models.SET_NULL,
+        related_name="agents",
+        null=True,
+        blank=True,
+    )
+
+    name = models.CharField(max_length=120)
+    instructions = models.TextField(blank=True, default="")
+    # vazio = rota "agent" do gateway (LLM_MODEL_ROUTES; sem rota, LLM_CHAT_MODEL); aceita alias
+    model = models.CharField(max_length=100, blank=True, default="")
+
+    use_rag = models.BooleanField(default=True)
+    rag_top_k = models.PositiveSmallIntegerField(default=5)
+    # reaproveita respostas de perguntas parecidas (apps.rag.answer_cache; precisa de
+    # RAG_ANSWER_CACHE). O hit ignora o histórico: serve para agents de FAQ
+    answer_cache = models.BooleanField(default=False)
+    # histórico curto no prompt (últimas N mensagens da conversa)
+    history_limit = models.PositiveSmallIntegerField(default=10)
+    # silêncio esperado antes de responder uma rajada; vazio = AGENT_DEBOUNCE_SECONDS
+    debounce_seconds = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["channel"],
+                name="uniq_active_agent_per_channel",
+                condition=models.Q(is_active=True, channel__isnull=False),
+            ),
+            models.UniqueConstraint(
+                fields=["workspace"],
+                name="uniq_default_agent_per_workspace",
+                condition=models.Q(is_active=True, channel__isnull=True),
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class AgentRun(models.Model):
+    """
+    Uma execução do agent (passos 7-10) para a última mensagem de uma rajada
+    (as anteriores vêm no histórico; ver apps.agents.runtime.enqueue_runs).
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "queued"
+        RUNNING = "running", "running"
+        SUCCEEDED = "succeeded", "succeeded"
+        FAILED = "failed", "failed"
+        CANCELLED = "cancelled", "cancelled"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    workspace = models.ForeignKey(
+        "tenants.Workspace",
+        on_delete=models.CASCADE,
+        related_name="agent_runs",
+    )
+    agent = models.ForeignKey(
+        Agent,
+        on_delete=models.CASCADE,
+        related_name="runs",
+    )
+    conversation = models.ForeignKey(
+        "conversations.Conversation",
+        on_delete=models.CASCADE,
+        related_name="agent_runs",
+    )
+    trigger_message = models.ForeignKey(
+        "chat_messages.Message",
+        on_delete=models.SET_NULL,
+        related_name="agent_runs",
+        null=True,
+        blank=True,
+    )
+    response_message = models.ForeignKey(
+        "chat_messages.Message",
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    correlation_id = models.CharField(max_length=64, blank=True, default="")
+    # debounce: mensagens respondidas por este run e desde quando a primeira espera
+    coalesced_messages = models.PositiveSmallIntegerField(default=1)
+    pending_since = models.DateTimeField(null=True, blank=True)
+
+    model = models.CharField(max_length=100, blank=True, default="")
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    cost_usd = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # reprocessar o mesmo lote do ingest não cria run duplicado
+            models.UniqueConstraint(
+                fields=["trigger_message"],
+                name="uniq_agent_run_per_trigger_message",
+                condition=models.Q(trigger_message__isnull=False),
+            ),
+        ]
+        indexes = [
+            # fila do scheduler: só runs ainda pendentes
+            models.Index(
+                fields=["next_attempt_at"],
+                name="agentrun_pending_idx",
+                condition=models.Q(status__in=["queued", "running"]),
+            ),
+            models.Index(fields=["conversation", "-created_at"], name="agentrun_conv_created_idx"),
+            models.Index(fields=["workspace", "-created_at"], name="agentrun_ws_created_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"AgentRun(status={self.status}, id={self.id})"
+
+
+class AgentRunStep(models.Model):
+    """Trace persistido de um run (retrieval, prompt, llm, resposta), gravado em lote no fim."""
+
+    class Kind(models.TextChoices):
+        RETRIEVAL = "retrieval", "retrieval"
+        HISTORY = "history", "history"
+        CACHE = "cache", "cache"
+        PROMPT = "prompt", "prompt"
+        LLM = "llm", "llm"
+        RESPONSE = "response", "response"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    run = models.ForeignKey(
+        AgentRun,
+        on_delete=models.CASCADE,
+        related_name="steps",
+    )
+    attempt = models.PositiveSmallIntegerField(default=1)
+    seq = models.PositiveSmallIntegerField()
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    ok = models.BooleanField(default=True)
+    duration_ms = models.FloatField(default=0)
+    data = models.JSONField(default=dict, blank=True)
+    error = models.TextField(null=True, blank=True)
+    started_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["run", "attempt", "seq"]
+        constraints = [
+            models.UniqueConstraint(fields=["run", "attempt", "seq"], name="uniq_agent_run_step_seq"),
+        ]
+
+    def __str__(self) -> str:
+        return f"AgentRunStep({self.kind}, run={self.run_id})"
@@ -0,0 +1,397 @@
+"""
+Runtime dos agents (PIPELINE.md, passos 7-10).
+
+    enqueue_runs(messages)      # ingest: Message IN -> AgentRun "queued" (routing + debounce)
+    AgentRuntime().execute(run) # worker: retrieval -> histórico -> prompt -> LLM -> Message OUT
+
+- routing: agent ativo do channel; senão o agent padrão do workspace (sem
+  channel); sem agent => nenhum run;
+- cada passo vira um AgentRunStep (e um span no trace do correlation_id da
+  mensagem); os steps são gravados em lote junto com o resultado do run, na
+  mesma transação que enfileira a resposta no outbox;
+- debounce: rajadas de mensagens da mesma conversa viram um run só, que
+  espera a conversa ficar quieta; run que ficou velho (chegou mensagem
+  depois dele) é cancelado antes do LLM ou antes de enviar a resposta;
+- falhas voltam o run para "queued" com backoff até AGENT_MAX_ATTEMPTS;
+- Agent.answer_cache (com RAG_ANSWER_CACHE): pergunta parecida com uma já
+  respondida reaproveita a resposta (apps.rag.answer_cache) sem retrieval nem LLM.
+
+O agendamento (concorrência/fairness entre workspaces) fica em
+apps.agents.scheduler.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.agents.models import Agent, AgentRun, AgentRunStep
+from apps.audit import usage
+from apps.conversations import history
+from apps.core import tracing
+from apps.messages.models import Message
+from apps.messages.outbox import enqueue_outbound, retry_delay
+from apps.providers.llm.gateway import Completion, gateway, resolve_model
+from apps.rag import answer_cache
+from apps.rag.services import embed_texts, search_chunks
+
+logger = logging.getLogger(__name__)
+
+_RUN_RESULT_FIELDS = [
+    "status",
+    "attempts",
+    "next_attempt_at",
+    "last_error",
+    "model",
+    "input_tokens",
+    "output_tokens",
+    "cost_usd",
+    "response_message",
+    "finished_at",
+    "updated_at",
+]
+
+
+# ---------- passo 7: routing ----------
+
+def route_agents(pairs: set[tuple]) -> dict[tuple, Agent]:
+    """{(workspace_id, channel_id): Agent} numa query só."""
+    if not pairs:
+        return {}
+    workspace_ids = {w for w, _ in pairs}
+    channel_ids = {c for _, c in pairs}
+    agents = Agent.objects.filter(workspace_id__in=workspace_ids, is_active=True).filter(
+        Q(channel_id__in=channel_ids) | Q(channel__isnull=True)
+    )
+    by_channel = {}
+    defaults = {}
+    for agent in agents:
+        if agent.channel_id:
+            by_channel[agent.channel_id] = agent
+        else:
+            defaults[agent.workspace_id] = agent
+    routed = {}
+    for workspace_id, channel_id in pairs:
+        agent = by_channel.get(channel_id) or defaults.get(workspace_id)
+        if agent is not None:
+            routed[(workspace_id, channel_id)] = agent
+    return routed
+
+
+def debounce_delay(agent: Agent) -> float:
+    if agent.debounce_seconds is not None:
+        return float(agent.debounce_seconds)
+    return float(getattr(settings, "AGENT_DEBOUNCE_SECONDS", 3))
+
+
+def enqueue_runs(messages: list[Message]) -> int:
+    """
+    Agenda um AgentRun por conversa com Message IN nova (já inserida: o
+    ingest descarta as reentregas antes), com debounce:
+
+    - o run só fica elegível depois de `debounce_delay` sem mensagem nova;
+    - rajadas viram um run só: o da última mensagem, e os runs ainda na fila
+      da mesma conversa são cancelados (status "cancelled") e somados nele;
+    - a espera total desde a primeira mensagem pendente é limitada por
+      AGENT_DEBOUNCE_MAX_SECONDS (quem digita sem parar também é atendido).
+
+    O ingest já travou as Conversations do lote (upsert ON CONFLICT), então
+    lotes concorrentes da mesma conversa não criam dois runs. Número de
+    queries constante por lote.
+    """
+    inbound = [m for m in messages if m.direction == Message.Direction.IN]
+    if not inbound:
+        return 0
+
+    agents = route_agents({(m.workspace_id, m.channel_id) for m in inbound})
+    latest: dict = {}
+    counts: dict = {}
+    for m in inbound:  # ordem cronológica: a última da conversa vence
+        if (m.workspace_id, m.channel_id) in agents:
+            latest[m.conversation_id] = m
+            counts[m.conversation_id] = counts.get(m.conversation_id, 0) + 1
+    if not latest:
+        return 0
+
+    now = timezone.now()
+    superseded = AgentRun.objects.filter(conversation_id__in=list(latest), status=AgentRun.Status.QUEUED)
+    pending = {
+        row["conversation_id"]: row
+        for row in superseded.values("conversation_id").annotate(
+            since=Min(Coalesce("pending_since", "created_at")), coalesced=Sum("coalesced_messages"))
+    }
+    if pending:
+        superseded.update(status=AgentRun.Status.CANCELLED, last_error="superseded",
+                          finished_at=now, updated_at=now)
+
+    max_wait = timedelta(seconds=float(getattr(settings, "AGENT_DEBOUNCE_MAX_SECONDS", 15)))
+    runs = []
+    for conversation_id, m in latest.items():
+        agent = agents[(m.workspace_id, m.channel_id)]
+        previous = pending.get(conversation_id)
+        since = previous["since"] if previous else now
+        runs.append(AgentRun(
+            workspace_id=m.workspace_id,
+            agent=agent,
+            conversation_id=conversation_id,
+            trigger_message_id=m.id,
+            correlation_id=m.correlation_id,
+            coalesced_messages=counts[conversation_id] + (previous["coalesced"] if previous else 0),
+            pending_since=since,
+            next_attempt_at=min(now + timedelta(seconds=debounce_delay(agent)), since + max_wait),
+        ))
+    AgentRun.objects.bulk_create(runs, ignore_conflicts=True)
+    return len(runs)
+
+
+def is_superseded(run: AgentRun) -> bool:
+    """Chegou mensagem depois deste run (há um run mais novo na fila da conversa)."""
+    return AgentRun.objects.filter(
+        conversation_id=run.conversation_id,
+        status=AgentRun.Status.QUEUED,
+        created_at__gt=run.created_at,
+    ).exists()
+
+
+def has_newer_run(run: AgentRun) -> bool:
+    """Há run mais novo na conversa, em qualquer status (já respondeu, responde ou vai responder)."""
+    return AgentRun.objects.filter(
+        conversation_id=run.conversation_id,
+        created_at__gt=run.created_at,
+    ).exists()
+
+
+# ---------- passos 8-10: execução ----------
+
+class _Steps:
+    def __init__(self, run: AgentRun, attempt: int):
+        self.run = run
+        self.attempt = attempt
+        self.items: list[AgentRunStep] = []
+
+    @contextmanager
+    def step(self, kind: str, **data):
+        started_at = timezone.now()
+        t0 = time.perf_counter()
+        step = AgentRunStep(
+            run_id=self.run.id, attempt=self.attempt, seq=len(self.items) + 1,
+            kind=kind, data=data, started_at=started_at,
+        )
+        self.items.append(step)
+        try:
+            with tracing.span(f"agent.{kind}", **{k: v for k, v in data.items() if not isinstance(v, (list, dict))}):
+                yield step
+        except Exception as e:
+            step.ok = False
+            step.error = f"{type(e).__name__}: {e}"[:2000]
+            raise
+        finally:
+            step.duration_ms = round((time.perf_counter() - t0) * 1000, 2)
+
+
+def history_for(run: AgentRun, limit: int, max_tokens: int | None = None) -> tuple[list[dict], str]:
+    """
+    Últimas `limit` mensagens até a que disparou o run, em ordem cronológica,
+    no formato da janela (apps.conversations.history), cortadas em
+    `max_tokens`. Lê a janela da Conversation já carregada; o banco só é
+    consultado se ela não cobrir o run.
+    """
+    entries = history.recent(run.conversation, limit=limit, max_tokens=max_tokens,
+                             until_message_id=run.trigger_message_id)
+    if entries is not None:
+        return entries, "window"
+
+    qs = Message.objects.filter(conversation_id=run.conversation_id).exclude(text="")
+    if run.trigger_message_id and run.trigger_message is not None:
+        qs = qs.filter(created_at__lte=run.trigger_message.created_at)
+    rows = list(qs.order_by("-created_at").only("id", "direction", "text")[:limit])
+    entries = [e for e in (history.entry_for(m) for m in reversed(rows)) if e]
+    entries, _ = history.within_budget(entries, max_tokens)
+    return entries, "db"
+
+
+def build_prompt(agent: Agent, entries: list[dict], contexts: list[str]) -> list[dict]:
+    system = agent.instructions.strip() or "Você é um assistente do Omnichat. Responda em PT-BR."
+    if contexts:
+        context_block = "\n\n".join(f"[{i + 1}] {c}" for i, c in enumerate(contexts))
+        system += (
+            "\n\nUse o CONTEXTO abaixo quando for relevante; se não houver base nele, "
+            f"diga que não encontrou nos documentos.\n\nCONTEXTO:\n{context_block}"
+        )
+    prompt = [{"role": "system", "content": system}]
+    for entry in entries:
+        role = "user" if entry["d"] == Message.Direction.IN else "assistant"
+        prompt.append({"role": role, "content": entry["t"]})
+    return prompt
+
+
+class AgentRuntime:
+    def __init__(self, *, llm=None, retriever=None, embedder=None, max_attempts: int | None = None):
+        """
+        llm(prompt, model=, workspace_id=) -> Completion (padrão: o gateway, rota "agent");
+        retriever(workspace_id, question, top_k=[, embedding=]) -> [{chunk, ...}];
+        embedder(texts, workspace_id=) -> vetores (cache semântico, Agent.answer_cache).
+        """
+        self.llm = llm or partial(gateway.complete, route="agent")
+        self.retriever = retriever or search_chunks
+        self.embedder = embedder or embed_texts
+        self.max_attempts = max_attempts or int(getattr(settings, "AGENT_MAX_ATTEMPTS", 3))
+
+    def execute(self, run: AgentRun) -> AgentRun:
+        """Roda um run já reivindicado (status "running") e grava o resultado."""
+        attempt = run.attempts + 1
+        if is_superseded(run):
+            # claim e mensagem nova se cruzaram: nem gasta o LLM
+            return self._cancel(run, attempt)
+        steps = _Steps(run, attempt)
+        with tracing.bind(run.correlation_id), \
+                tracing.span("agent.run", run_id=str(run.id), agent_id=str(run.agent_id), attempt=attempt):
+            try:
+                text, completion = self._run_steps(run, steps)
+            except Exception as e:
+                logger.warning("agent run %s failed (attempt %d): %s", run.id, attempt, e)
+                return self._fail(run, steps, attempt, f"{type(e).__name__}: {e}")
+            return self._succeed(run, steps, attempt, text, completion)
+
+    def _run_steps(self, run: AgentRun, steps: _Steps):
+        agent = run.agent
+
+        with steps.step(AgentRunStep.Kind.HISTORY, limit=agent.history_limit) as step:
+            entries, source = history_for(
+                run, agent.history_limit, int(getattr(settings, "AGENT_HISTORY_MAX_TOKENS", 2000)) or None)
+            step.data.update(messages=len(entries), tokens=sum(e["n"] for e in entries), source=source)
+
+        # rajada coalescida: a pergunta são as mensagens IN desde a última resposta
+        burst = []
+        for entry in reversed(entries):
+            if entry["d"] != Message.Direction.IN:
+                break
+            burst.append(entry["t"])
+        question = "\n".join(reversed(burst)) or (run.trigger_message.text if run.trigger_message else "") or ""
+
+        contexts: list[str] = []
+        sources: list[dict] = []
+        cache = None
+        # a resposta sai do prompt com o histórico: só a rajada que abre a conversa
+        # (sem turno anterior, histórico não cortado no limite) vale para outra
+        standalone = len(burst) == len(entries) and len(entries) < agent.history_limit
+        if agent.use_rag and question and standalone and agent.answer_cache and answer_cache.enabled():
+            cache = {"scope": f"agent:{agent.id}", "model": resolve_model(agent.model or None, route="agent")}
+            with steps.step(AgentRunStep.Kind.CACHE) as step:
+                cache["embedding"] = self.embedder([question], workspace_id=run.workspace_id)[0]
+                hit = answer_cache.lookup(run.workspace_id, cache["embedding"], scope=cache["scope"],
+                                          model=cache["model"], actor=f"agent:{agent.id}")
+                step.data["hit"] = hit is not None
+                if hit is not None:
+                    step.data.update(entry_id=str(hit.id), similarity=hit.similarity)
+            if hit is not None:
+                # retrieval, prompt e LLM pulados: o run custa zero tokens
+                return hit.answer, Completion(text=hit.answer, model=hit.model)
+
+        if agent.use_rag and question:
+            with steps.step(AgentRunStep.Kind.RETRIEVAL, top_k=agent.rag_top_k) as step:
+                extra = {"embedding": cache["embedding"]} if cache else {}
+                sources = self.retriever(str(run.workspace_id), question, top_k=agent.rag_top_k, **extra)
+                contexts = [s["chunk"] for s in sources]
+                step.data["sources"] = [
+                    {"document_id": s.get("document_id"), "score": round(s.get("score") or 0, 4)}
+                    for s in sources
+                ]
+            usage.record(usage.RAG_QUERY, run.workspace_id, actor=f"agent:{agent.id}",
+                         agent_run_id=str(run.id), sources=len(contexts))
+
+        with steps.step(AgentRunStep.Kind.PROMPT) as step:
+            prompt = build_prompt(agent, entries, contexts)
+            step.data["chars"] = sum(len(p["content"]) for p in prompt)
+
+        with steps.step(AgentRunStep.Kind.LLM, model=agent.model or "") as step:
+            completion = self.llm(prompt, model=agent.model or None, workspace_id=run.workspace_id)
+            step.data.update(
+                model=completion.model,
+                input_tokens=completion.input_tokens,
+                output_tokens=completion.output_tokens,
+            )
+        if not completion.text:
+            raise ValueError("LLM não devolveu texto.")
+        if cache:
+            answer_cache.store(
+                run.workspace_id, question, cache["embedding"], scope=cache["scope"], model=cache["model"],
+                answer=completion.text, sources=sources,
+                tokens=completion.total_tokens, cost_usd=completion.cost_usd,
+            )
+        return completion.text, completion
+
+    def _succeed(self, run: AgentRun, steps: _Steps, attempt: int, text: str, completion) -> AgentRun:
+        now = timezone.now()
+        with transaction.atomic():
+            run.attempts = attempt
+            run.next_attempt_at = None
+            run.last_error = None
+            run.model = completion.model
+            run.input_tokens = completion.input_tokens
+            run.output_tokens = completion.output_tokens
+            run.cost_usd = completion.cost_usd
+            run.finished_at = now
+            run.updated_at = now
+            # mensagem nova durante o LLM: o run mais novo responde tudo, esta resposta já nasceu velha
+            if is_superseded(run):
+                run.status = AgentRun.Status.CANCELLED
+                run.last_error = "superseded"
+            else:
+                with steps.step(AgentRunStep.Kind.RESPONSE) as step:
+                    # passo 10: Message OUT "queued" herda o correlation_id (bind acima)
+                    response = enqueue_outbound(run.conversation, text)
+                    step.data["message_id"] = str(response.id)
+                run.status = AgentRun.Status.SUCCEEDED
+                run.response_message = response
+            self._save(run, steps)
+            usage.record(
+                usage.AGENT_RUN, run.workspace_id,
+                tokens=completion.total_tokens, cost_usd=completion.cost_usd,
+                actor=f"agent:{run.agent_id}", agent_run_id=str(run.id), model=completion.model,
+                status=run.status,
+            )
+        return run
+
+    def _cancel(self, run: AgentRun, attempt: int) -> AgentRun:
+        now = timezone.now()
+        run.status = AgentRun.Status.CANCELLED
+        run.attempts = attempt
+        run.next_attempt_at = None
+        run.last_error = "superseded"
+        run.finished_at = now
+        run.updated_at = now
+        run.save(update_fields=_RUN_RESULT_FIELDS)
+        return run
+
+    def _fail(self, run: AgentRun, steps: _Steps, attempt: int, error: str) -> AgentRun:
+        now = timezone.now()
+        give_up = attempt >= self.max_attempts
+        run.attempts = attempt
+        run.updated_at = now
+        if not give_up and has_newer_run(run):
+            # o run mais novo cobre estas mensagens (mesmo se já rodou): retry responderia de novo
+            run.status = AgentRun.Status.CANCELLED
+            run.next_attempt_at = None
+            run.last_error = f"superseded; {error}"[:2000]
+            run.finished_at = now
+        else:
+            run.status = AgentRun.Status.FAILED if give_up else AgentRun.Status.QUEUED
+            run.next_attempt_at = None if give_up else now + timedelta(seconds=retry_delay(attempt))
+            run.last_error = error[:2000]
+            run.finished_at = now if give_up else None
+        with transaction.atomic():
+            self._save(run, steps)
+        return run
+
+    @staticmethod
+    def _save(run: AgentRun, steps: _Steps):
+        run.save(update_fields=_RUN_RESULT_FIELDS)
+        if steps.items:
+            AgentRunStep.objects.bulk_create(steps.items)
@@ -0,0 +1,234 @@
+"""
+Agendador de AgentRuns (manage.py agent_worker).
+
+O LLM é o recurso caro e compartilhado: um workspace com rajada de mensagens
+não pode ocupar todos os workers. Por isso:
+
+  - o claim (SKIP LOCKED) pega só o que os workers livres conseguem começar
+    e, por workspace, no máximo `per_workspace` menos os runs dele já em voo
+    no banco (em qualquer processo), via window function;
+  - o claim só reserva o run (continua "queued", com next_attempt_at adiado
+    por um lease); ele vira "running" e ganha started_at quando um worker o
+    pega, num UPDATE condicionado à reserva — se ela venceu na fila em memória
+    e outro processo pegou o run, este não executa de novo;
+  - cada workspace tem sua fila e no máximo `per_workspace` runs em voo;
+  - os workers livres são distribuídos em round-robin entre os workspaces,
+    então um tenant barulhento espera a vez dele em vez de empurrar os outros.
+
+Diferente do outbox, os workers tocam o banco (histórico, RAG, gravação do
+run): cada thread usa a própria conexão, reciclada por close_old_connections.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils import timezone
+
+from apps.agents.models import AgentRun
+from apps.agents.runtime import AgentRuntime
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _WorkspaceQueue:
+    items: deque = field(default_factory=deque)
+    running: int = 0
+
+
+class AgentScheduler:
+    def __init__(
+        self,
+        *,
+        workers: int | None = None,
+        per_workspace: int | None = None,
+        batch_size: int = 100,
+        lease_seconds: int | None = None,
+        runtime: AgentRuntime | None = None,
+    ):
+        self.workers = workers or int(getattr(settings, "AGENT_WORKERS", 8))
+        self.per_workspace = per_workspace or int(getattr(settings, "AGENT_WORKSPACE_CONCURRENCY", 2))
+        self.batch_size = batch_size
+        self.lease = timedelta(seconds=lease_seconds or int(getattr(settings, "AGENT_LEASE_SECONDS", 300)))
+        self.runtime = runtime or AgentRuntime()
+
+        self._queues: dict[object, _WorkspaceQueue] = {}
+        self._order: deque = deque()  # round-robin de workspaces
+        self._pending = 0
+        self._running = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="agent")
+
+    # ---------- DB (thread do scheduler) ----------
+
+    def claim(self) -> int:
+        with self._lock:
+            room = min(self.batch_size, self.workers) - self._pending
+            # fila em memória ainda não despachada: reservas que o banco não conta como em voo
+            waiting = [wid for wid, q in self._queues.items() if q.items]
+        if room <= 0:
+            return 0
+
+        now = timezone.now()
+        due = Q(status=AgentRun.Status.QUEUED) & (Q(next_attempt_at__lte=now) | Q(next_attempt_at__isnull=True))
+        # worker que morreu no meio do run: lease vencido volta para a fila
+        stale = Q(status=AgentRun.Status.RUNNING, updated_at__lt=now - self.lease)
+        in_flight = (
+            AgentRun.objects.filter(
+                workspace_id=OuterRef("workspace_id"),
+                status=AgentRun.Status.RUNNING,
+                updated_at__gte=now - self.lease,
+            )
+            .order_by()
+            .values("workspace_id")
+            .annotate(n=Count("id"))
+            .values("n")
+        )
+
+        # FOR UPDATE não combina com window function: escolhe os candidatos
+        # (justos por workspace) sem lock e trava só eles, pulando os ocupados
+        candidates = list(
+            AgentRun.objects.filter(due | stale)
+            .exclude(workspace_id__in=waiting)
+            .annotate(
+                in_flight=Coalesce(Subquery(in_flight), 0),
+                rank=Window(
+                    RowNumber(),
+                    partition_by=[F("workspace_id")],
+                    order_by=[F("next_attempt_at").asc(nulls_first=True), F("created_at").asc()],
+                ),
+            )
+            .filter(rank__lte=self.per_workspace - F("in_flight"))
+            .order_by("next_attempt_at", "created_at")
+            .values_list("id", flat=True)[:room]
+        )
+        if not candidates:
+            return 0
+
+        reserved_until = now + self.lease
+        with transaction.atomic():
+            ids = list(
+                AgentRun.objects.select_for_update(skip_locked=True)
+                .filter(Q(id__in=candidates) & (due | stale))
+                .values_list("id", flat=True)
+            )
+            if not ids:
+                return 0
+            AgentRun.objects.filter(id__in=ids).update(
+                status=AgentRun.Status.QUEUED, next_attempt_at=reserved_until, updated_at=now)
+
+        runs = list(
+            AgentRun.objects.filter(id__in=ids)
+            .select_related("agent", "conversation", "trigger_message")
+            .order_by("next_attempt_at", "created_at")
+        )
+        with self._lock:
+            for run in runs:
+                q = self._queues.get(run.workspace_id)
+                if q is None:
+                    q = self._queues[run.workspace_id] = _WorkspaceQueue()
+                    self._order.append(run.workspace_id)
+                q.items.append(run)
+                self._pending += 1
+        return len(runs)
+
+    # ---------- scheduling ----------
+
+    def dispatch(self) -> int:
+        """Distribui os workers livres em round-robin entre os workspaces com fila."""
+        submitted = 0
+        with self._lock:
+            progress = True
+            while progress and self._running < self.workers:
+                progress = False
+                for _ in range(len(self._order)):
+                    if self._running >= self.workers:
+                        break
+                    wid = self._order[0]
+                    self._order.rotate(-1)
+                    q = self._queues[wid]
+                    if not q.items or q.running >= self.per_workspace:
+                        continue
+                    run = q.items.popleft()
+                    q.running += 1
+                    self._running += 1
+                    self._executor.submit(self._execute, wid, run)
+                    submitted += 1
+                    progress = True
+            # workspace sem fila nem run em voo sai da rotação
+            for wid in [w for w, q in self._queues.items() if not q.items and not q.running]:
+                del self._queues[wid]
+                self._order.remove(wid)
+        return submitted
+
+    @property
+    def idle(self) -> bool:
+        with self._lock:
+            return self._pending == 0
+
+    # ---------- workers ----------
+
+    @staticmethod
+    def _start(run: AgentRun) -> bool:
+        """queued (reservado por este claim) -> running; False se a reserva já não é nossa."""
+        now = timezone.now()
+        started = AgentRun.objects.filter(
+            id=run.id, status=AgentRun.Status.QUEUED, next_attempt_at=run.next_attempt_at,
+        ).update(status=AgentRun.Status.RUNNING, next_attempt_at=None, started_at=now, updated_at=now)
+        if not started:
+            logger.info("agent run %s: reservation lost before start, skipped", run.id)
+            return False
+        run.status = AgentRun.Status.RUNNING
+        run.next_attempt_at = None
+        run.started_at = run.updated_at = now
+        return True
+
+    def _execute(self, workspace_id, run: AgentRun):
+        try:
+            if self._start(run):
+                self.runtime.execute(run)
+        except Exception:
+            # o runtime já grava falhas; aqui só sobra erro de banco
+            # (o run fica "running" e volta pela expiração do lease)
+            logger.exception("agent run %s crashed", run.id)
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._queues[workspace_id].running -= 1
+                self._running -= 1
+                self._pending -= 1
+
+    # ---------- loop ----------
+
+    def run_once(self) -> int:
+        self.claim()
+        return self.dispatch()
+
+    def drain(self, *, timeout: float = 30.0):
+        """Processa até não sobrar nada reivindicável nem em voo."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            claimed = self.claim()
+            self.dispatch()
+            if not claimed and self.idle:
+                return
+            time.sleep(0.02)
+
+    def run_forever(self, stop_event: threading.Event | None = None, *, poll_interval: float = 0.5):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            claimed = self.claim()
+            self.dispatch()
+            stop_event.wait(0.05 if claimed or not self.idle else poll_interval)
+        self.shutdown()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
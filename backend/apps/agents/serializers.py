@@ -0,0 +1,64 @@
+from rest_framework import serializers
+
+from apps.agents.models import Agent, AgentRun, AgentRunStep
+from apps.channels.models import Channel
+
+
+class AgentSerializer(serializers.ModelSerializer):
+    channel = serializers.PrimaryKeyRelatedField(
+        queryset=Channel.objects.all(), required=False, allow_null=True)
+
+    class Meta:
+        model = Agent
+        fields = [
+            "id", "name", "channel", "instructions", "model", "use_rag", "rag_top_k",
+            "answer_cache", "history_limit", "debounce_seconds", "is_active", "created_at", "updated_at",
+        ]
+        read_only_fields = ["id", "created_at", "updated_at"]
+
+    def validate_channel(self, channel):
+        request = self.context.get("request")
+        workspace = getattr(request, "workspace", None)
+        if channel is not None and workspace is not None and channel.workspace_id != workspace.id:
+            raise serializers.ValidationError("Channel de outro workspace.")
+        return channel
+
+    def validate(self, attrs):
+        request = self.context.get("request")
+        workspace = getattr(request, "workspace", None)
+        instance = self.instance
+        is_active = attrs.get("is_active", instance.is_active if instance else True)
+        channel = attrs.get("channel", instance.channel if instance else None)
+        if workspace is not None and is_active:
+            clash = Agent.objects.filter(workspace=workspace, is_active=True, channel=channel)
+            if instance is not None:
+                clash = clash.exclude(id=instance.id)
+            if clash.exists():
+                raise serializers.ValidationError(
+                    "Já existe um agent ativo para este channel." if channel
+                    else "Já existe um agent padrão ativo no workspace."
+                )
+        return attrs
+
+
+class AgentRunStepSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AgentRunStep
+        fields = ["attempt", "seq", "kind", "ok", "duration_ms", "data", "error", "started_at"]
+
+
+class AgentRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AgentRun
+        fields = [
+            "id", "agent", "conversation", "trigger_message", "response_message", "status",
+            "attempts", "last_error", "correlation_id", "coalesced_messages", "model", "input_tokens", "output_tokens",
+            "cost_usd", "started_at", "finished_at", "created_at",
+        ]
+
+
+class AgentRunDetailSerializer(AgentRunSerializer):
+    steps = AgentRunStepSerializer(many=True, read_only=True)
+
+    class Meta(AgentRunSerializer.Meta):
+        fields = AgentRunSerializer.Meta.fields + ["steps"]
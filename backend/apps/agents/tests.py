@@ -1,3 +1,441 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from apps.agents.models import Agent, AgentRun, AgentRunStep
+from apps.agents.runtime import AgentRuntime, history_for
+from apps.agents.scheduler import AgentScheduler
+from apps.audit import usage
+from apps.channels.models import Channel
+from apps.core import cache as core_cache
+from apps.conversations import history
+from apps.conversations.models import Contact, Conversation
+from apps.messages.ingest import process_pending_events
+from apps.messages.models import Message
+from apps.messages.tests import upsert_payload
+from apps.providers.llm.gateway import Completion
+from apps.providers.llm.testing import fake_embedding
+from apps.rag.models import AnswerCacheEntry, KnowledgeDocument
+from apps.tenants.models import Membership, Workspace
+from apps.webhooks.models import WebhookEvent
+
+User = get_user_model()
+
+
+class FakeLLM:
+    def __init__(self, text="Olá! Como posso ajudar?", fail=False, delay=0.0):
+        self.text = text
+        self.fail = fail
+        self.delay = delay
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt, *, model=None, workspace_id=None):
+        with self._lock:
+            self.prompts.append(prompt)
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream 503")
+        return Completion(text=self.text, model="gpt-4o-mini", input_tokens=120, output_tokens=30)
+
+
+def fake_retriever(workspace_id, question, top_k=5):
+    return [{"document_id": "doc-1", "filename": "faq.txt", "chunk": "Entrega em 2 dias.", "score": 0.91}]
+
+
+def make_channel(workspace, name="wsp-1__ch-1"):
+    return Channel.objects.create(
+        workspace=workspace, name=name, provider=Channel.Provider.EVOLUTION, external_id=name)
+
+
+class AgentRoutingTests(TestCase):
+    def setUp(self):
+        self.workspace = Workspace.objects.create(name="Acme")
+        self.channel = make_channel(self.workspace)
+
+    def _ingest(self, *payloads):
+        for i, payload in enumerate(payloads):
+            WebhookEvent.objects.create(provider="evolution", idempotency_key=f"{payload['data']['key']['id']}-{i}",
+                                        raw_payload=payload)
+        return process_pending_events()
+
+    def test_inbound_messages_get_run_for_channel_agent(self):
+        Agent.objects.create(workspace=self.workspace, name="Padrão")
+        support = Agent.objects.create(workspace=self.workspace, channel=self.channel, name="Suporte")
+
+        result = self._ingest(
+            upsert_payload("wsp-1__ch-1", "A1", "oi"),
+            upsert_payload("wsp-1__ch-1", "A2", "eu", from_me=True),
+        )
+
+        self.assertEqual(result.runs, 1)
+        run = AgentRun.objects.get()
+        self.assertEqual(run.agent, support)
+        self.assertEqual(run.trigger_message.provider_message_id, "A1")
+        self.assertEqual(run.status, AgentRun.Status.QUEUED)
+
+    def test_default_agent_and_no_duplicate_runs(self):
+        default = Agent.objects.create(workspace=self.workspace, name="Padrão")
+
+        self._ingest(upsert_payload("wsp-1__ch-1", "A1", "oi"))
+        # reentrega da mesma mensagem: ON CONFLICT no Message, nenhum run novo
+        result = self._ingest(upsert_payload("wsp-1__ch-1", "A1", "oi"))
+
+        self.assertEqual(result.runs, 0)
+        self.assertEqual(list(AgentRun.objects.values_list("agent_id", flat=True)), [default.id])
+
+    def test_without_agent_no_run(self):
+        self.assertEqual(self._ingest(upsert_payload("wsp-1__ch-1", "A1", "oi")).runs, 0)
+
+
+class AgentRuntimeTests(TestCase):
+    def setUp(self):
+        self.workspace = Workspace.objects.create(name="Acme")
+        channel = make_channel(self.workspace)
+        contact = Contact.objects.create(workspace=self.workspace, channel=channel, external_id="5516999990001")
+        self.conversation = Conversation.objects.create(workspace=self.workspace, channel=channel, contact=contact)
+        self.agent = Agent.objects.create(workspace=self.workspace, name="Suporte", instructions="Seja breve.")
+        for direction, text in (("in", "oi"), ("out", "Olá!"), ("in", "qual o prazo de entrega?")):
+            trigger = Message.objects.create(
+                workspace=self.workspace, channel=channel, conversation=self.conversation,
+                direction=direction, status="received", text=text, correlation_id="c0ffee00c0ffee00",
+            )
+        self.run = AgentRun.objects.create(
+            workspace=self.workspace, agent=self.agent, conversation=self.conversation,
+            trigger_message=trigger, correlation_id=trigger.correlation_id, status=AgentRun.Status.RUNNING,
+        )
+
+    def test_successful_run_persists_steps_and_queues_response(self):
+        llm = FakeLLM()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            AgentRuntime(llm=llm, retriever=fake_retriever).execute(self.run)
+
+        self.run.refresh_from_db()
+        self.assertEqual(self.run.status, AgentRun.Status.SUCCEEDED)
+        self.assertEqual((self.run.input_tokens, self.run.output_tokens), (120, 30))
+        self.assertGreater(self.run.cost_usd, 0)
+
+        response = self.run.response_message
+        self.assertEqual((response.direction, response.status, response.text),
+                         ("out", "queued", "Olá! Como posso ajudar?"))
+        self.assertEqual(response.correlation_id, "c0ffee00c0ffee00")
+
+        self.assertEqual(
+            list(self.run.steps.values_list("kind", flat=True)),
+            ["history", "retrieval", "prompt", "llm", "response"],
+        )
+
+        prompt = llm.prompts[0]
+        self.assertIn("Seja breve.", prompt[0]["content"])
+        self.assertIn("Entrega em 2 dias.", prompt[0]["content"])
+        self.assertEqual([p["role"] for p in prompt[1:]], ["user", "assistant", "user"])
+        self.assertEqual(prompt[-1]["content"], "qual o prazo de entrega?")
+
+        self.assertEqual(usage.pending(), 2)  # rag.query + agent.run
+        usage.flush()
+
+    def _conversation_run(self, phone: str, *turns) -> AgentRun:
+        contact = Contact.objects.create(workspace=self.workspace, channel=self.conversation.channel,
+                                         external_id=phone)
+        conversation = Conversation.objects.create(
+            workspace=self.workspace, channel=self.conversation.channel, contact=contact)
+        for direction, text in turns:
+            trigger = Message.objects.create(
+                workspace=self.workspace, channel=conversation.channel, conversation=conversation,
+                direction=direction, status="received", text=text,
+            )
+        return AgentRun.objects.create(
+            workspace=self.workspace, agent=self.agent, conversation=conversation,
+            trigger_message=trigger, status=AgentRun.Status.RUNNING,
+        )
+
+    def _cached_runtime(self, llm, retrieved):
+        doc = KnowledgeDocument.objects.create(
+            workspace=self.workspace, filename="faq.txt", status=KnowledgeDocument.STATUS_INDEXED, version=1)
+        self.agent.answer_cache = True
+        self.agent.save(update_fields=["answer_cache"])
+
+        def retriever(workspace_id, question, top_k=5, embedding=None):
+            retrieved.append(embedding)
+            return [{"document_id": str(doc.id), "document_version": 1, "chunk": "Entrega em 2 dias.", "score": 0.9}]
+
+        def embedder(texts, workspace_id=None):
+            return [fake_embedding(t) for t in texts]
+
+        return AgentRuntime(llm=llm, retriever=retriever, embedder=embedder)
+
+    @override_settings(RAG_ANSWER_CACHE=True)
+    def test_answer_cache_skips_retrieval_and_llm_for_repeated_question(self):
+        llm, retrieved = FakeLLM(), []
+        runtime = self._cached_runtime(llm, retrieved)
+        runtime.execute(self._conversation_run("5516999990002", ("in", "qual o prazo de entrega?")))
+        second = self._conversation_run("5516999990003", ("in", "qual o prazo de entrega?"))
+        runtime.execute(second)
+
+        self.assertEqual(len(llm.prompts), 1)
+        self.assertEqual(len(retrieved), 1)
+        self.assertIsNotNone(retrieved[0])  # o retrieval reaproveita a embedding do cache
+        self.assertEqual(second.status, AgentRun.Status.SUCCEEDED)
+        self.assertEqual(second.response_message.text, "Olá! Como posso ajudar?")
+        self.assertEqual(second.input_tokens, 0)
+        self.assertEqual(list(second.steps.values_list("kind", flat=True)), ["history", "cache", "response"])
+        self.assertEqual(AnswerCacheEntry.objects.get().hits, 1)
+        usage.flush()
+
+    @override_settings(RAG_ANSWER_CACHE=True)
+    def test_answer_cache_ignores_replies_that_depend_on_history(self):
+        llm, retrieved = FakeLLM(), []
+        runtime = self._cached_runtime(llm, retrieved)
+        runtime.execute(self._conversation_run(
+            "5516999990002", ("in", "entregam no sábado?"), ("out", "Entregamos, quer agendar?"), ("in", "sim")))
+        other = self._conversation_run(
+            "5516999990003", ("in", "posso trocar o tamanho?"), ("out", "Pode, quer a etiqueta?"), ("in", "sim"))
+        runtime.execute(other)
+
+        # mesmo "sim", contextos diferentes: cada conversa tem a própria resposta
+        self.assertEqual(len(llm.prompts), 2)
+        self.assertIn("posso trocar o tamanho?", [m["content"] for m in llm.prompts[1]])
+        self.assertNotIn("cache", other.steps.values_list("kind", flat=True))
+        self.assertFalse(AnswerCacheEntry.objects.exists())
+        usage.flush()
+
+    def test_history_comes_from_conversation_window(self):
+        history.append(Message.objects.filter(conversation=self.conversation).order_by("created_at"))
+        self.run = AgentRun.objects.select_related("conversation", "trigger_message", "agent").get(id=self.run.id)
+        with self.assertNumQueries(0):
+            entries, source = history_for(self.run, limit=2)
+
+        self.assertEqual(source, "window")
+        self.assertEqual([e["t"] for e in entries], ["Olá!", "qual o prazo de entrega?"])
+
+    def test_history_from_db_respects_token_budget(self):
+        self.run = AgentRun.objects.select_related("conversation", "trigger_message", "agent").get(id=self.run.id)
+        # sem janela: cai para o banco, com o mesmo corte por tokens (1 + 6)
+        entries, source = history_for(self.run, limit=10, max_tokens=7)
+
+        self.assertEqual(source, "db")
+        self.assertEqual([e["t"] for e in entries], ["Olá!", "qual o prazo de entrega?"])
+        self.assertEqual(len(history_for(self.run, limit=10)[0]), 3)
+
+    def test_failure_is_retried_then_given_up(self):
+        runtime = AgentRuntime(llm=FakeLLM(fail=True), retriever=fake_retriever, max_attempts=2)
+
+        runtime.execute(self.run)
+        self.run.refresh_from_db()
+        self.assertEqual((self.run.status, self.run.attempts), (AgentRun.Status.QUEUED, 1))
+        self.assertIsNotNone(self.run.next_attempt_at)
+        failed = AgentRunStep.objects.get(run=self.run, ok=False)
+        self.assertEqual((failed.kind, failed.attempt), ("llm", 1))
+
+        runtime.execute(self.run)
+        self.run.refresh_from_db()
+        self.assertEqual((self.run.status, self.run.attempts), (AgentRun.Status.FAILED, 2))
+        self.assertIn("upstream 503", self.run.last_error)
+        self.assertFalse(Message.objects.filter(direction="out", status="queued").exists())
+
+
+    def test_failure_is_not_retried_once_a_newer_run_exists(self):
+        # o run mais novo da conversa já respondeu enquanto este falhava
+        AgentRun.objects.create(
+            workspace=self.workspace, agent=self.agent, conversation=self.conversation,
+            status=AgentRun.Status.SUCCEEDED,
+        )
+
+        AgentRuntime(llm=FakeLLM(fail=True), retriever=fake_retriever, max_attempts=3).execute(self.run)
+
+        self.run.refresh_from_db()
+        self.assertEqual(self.run.status, AgentRun.Status.CANCELLED)
+        self.assertIsNone(self.run.next_attempt_at)
+        self.assertIn("upstream 503", self.run.last_error)
+
+
+class AgentDebounceTests(TestCase):
+    def setUp(self):
+        self.workspace = Workspace.objects.create(name="Acme")
+        make_channel(self.workspace)
+        self.agent = Agent.objects.create(workspace=self.workspace, name="Suporte")
+        self.keys = 0
+
+    def _ingest(self, *texts):
+        for text in texts:
+            self.keys += 1
+            WebhookEvent.objects.create(
+                provider="evolution", idempotency_key=str(self.keys),
+                raw_payload=upsert_payload("wsp-1__ch-1", f"M{self.keys}", text),
+            )
+        return process_pending_events()
+
+    @override_settings(AGENT_DEBOUNCE_SECONDS=5, AGENT_DEBOUNCE_MAX_SECONDS=60)
+    def test_burst_becomes_one_delayed_run(self):
+        before = timezone.now()
+        result = self._ingest("oi", "tudo bem?", "queria saber do meu pedido")
+
+        self.assertEqual(result.runs, 1)
+        run = AgentRun.objects.get()
+        self.assertEqual(run.coalesced_messages, 3)
+        self.assertEqual(run.trigger_message.text, "queria saber do meu pedido")
+        self.assertGreaterEqual(run.next_attempt_at, before + timedelta(seconds=5))
+
+    @override_settings(AGENT_DEBOUNCE_SECONDS=5, AGENT_DEBOUNCE_MAX_SECONDS=1)
+    def test_new_message_supersedes_queued_run_with_capped_wait(self):
+        self._ingest("oi")
+        first = AgentRun.objects.get()
+        self._ingest("tudo bem?")
+
+        first.refresh_from_db()
+        self.assertEqual(first.status, AgentRun.Status.CANCELLED)
+        run = AgentRun.objects.get(status=AgentRun.Status.QUEUED)
+        self.assertEqual(run.coalesced_messages, 2)
+        self.assertEqual(run.pending_since, first.pending_since)
+        # espera limitada pela primeira mensagem da rajada, não pela última
+        self.assertEqual(run.next_attempt_at, first.pending_since + timedelta(seconds=1))
+
+    def test_coalesced_messages_form_the_question(self):
+        self._ingest("oi", "qual o prazo", "de entrega?")
+        run = AgentRun.objects.select_related("agent", "conversation", "trigger_message").get()
+        questions = []
+
+        def retriever(workspace_id, question, top_k=5):
+            questions.append(question)
+            return []
+
+        AgentRuntime(llm=FakeLLM(), retriever=retriever).execute(run)
+
+        self.assertEqual(questions, ["oi\nqual o prazo\nde entrega?"])
+        self.assertEqual(run.status, AgentRun.Status.SUCCEEDED)
+
+    def test_superseded_run_is_cancelled_without_llm(self):
+        self._ingest("oi")
+        run = AgentRun.objects.select_related("agent", "conversation", "trigger_message").get()
+        # já reivindicado pelo scheduler quando a mensagem nova chega
+        AgentRun.objects.filter(id=run.id).update(status=AgentRun.Status.RUNNING)
+        self._ingest("mais uma coisa")
+        llm = FakeLLM()
+
+        AgentRuntime(llm=llm).execute(run)
+
+        run.refresh_from_db()
+        self.assertEqual(run.status, AgentRun.Status.CANCELLED)
+        self.assertEqual(llm.prompts, [])
+        self.assertEqual(AgentRun.objects.filter(status=AgentRun.Status.QUEUED).count(), 1)
+
+
+class AgentSchedulerTests(TransactionTestCase):
+    def setUp(self):
+        self.workspaces = {}
+        for name, count in (("noisy", 6), ("quiet", 1)):
+            workspace = Workspace.objects.create(name=name)
+            channel = make_channel(workspace, name=f"{name}-ch")
+            agent = Agent.objects.create(workspace=workspace, name=name, use_rag=False, instructions=name)
+            for i in range(count):
+                # um contato por run: runs da mesma conversa se substituiriam (debounce)
+                contact = Contact.objects.create(workspace=workspace, channel=channel, external_id=f"551699999000{i}")
+                conversation = Conversation.objects.create(workspace=workspace, channel=channel, contact=contact)
+                msg = Message.objects.create(
+                    workspace=workspace, channel=channel, conversation=conversation,
+                    direction="in", status="received", text=f"{name} {i}",
+                )
+                AgentRun.objects.create(
+                    workspace=workspace, agent=agent, conversation=conversation, trigger_message=msg)
+            self.workspaces[name] = workspace
+
+    def tearDown(self):
+        usage.flush()
+
+    def test_noisy_workspace_does_not_starve_others(self):
+        llm = FakeLLM(delay=0.05)
+        scheduler = AgentScheduler(workers=2, per_workspace=1, runtime=AgentRuntime(llm=llm))
+
+        scheduler.drain(timeout=10)
+        scheduler.shutdown()
+
+        self.assertEqual(AgentRun.objects.filter(status=AgentRun.Status.SUCCEEDED).count(), 7)
+        started = [prompt[0]["content"] for prompt in llm.prompts]
+        # o run do workspace quieto entra junto com o primeiro do barulhento
+        self.assertIn("quiet", started[:2])
+
+    def test_per_workspace_concurrency_limit(self):
+        active = {"now": 0, "max": 0}
+        lock = threading.Lock()
+        base = FakeLLM()
+
+        def llm(prompt, *, model=None, workspace_id=None):
+            with lock:
+                active["now"] += 1
+                active["max"] = max(active["max"], active["now"])
+            try:
+                time.sleep(0.03)
+                return base(prompt, model=model)
+            finally:
+                with lock:
+                    active["now"] -= 1
+
+        AgentRun.objects.filter(workspace=self.workspaces["quiet"]).delete()
+        scheduler = AgentScheduler(workers=4, per_workspace=2, runtime=AgentRuntime(llm=llm))
+        scheduler.drain(timeout=10)
+        scheduler.shutdown()
+
+        self.assertEqual(active["max"], 2)
+        self.assertEqual(AgentRun.objects.filter(status=AgentRun.Status.SUCCEEDED).count(), 6)
+
+
+    def test_per_workspace_limit_counts_runs_in_flight_elsewhere(self):
+        # outro processo já roda um run do barulhento
+        busy = AgentRun.objects.filter(workspace=self.workspaces["noisy"]).first()
+        AgentRun.objects.filter(id=busy.id).update(status=AgentRun.Status.RUNNING, updated_at=timezone.now())
+
+        scheduler = AgentScheduler(workers=4, per_workspace=1, runtime=AgentRuntime(llm=FakeLLM()))
+        self.assertEqual(scheduler.claim(), 1)
+        scheduler.shutdown()
+
+        reserved = AgentRun.objects.filter(next_attempt_at__gt=timezone.now())
+        self.assertEqual([r.workspace_id for r in reserved], [self.workspaces["quiet"].id])
+        # reservado, não "running": o lease só começa quando um worker pega o run
+        self.assertEqual(reserved.get().status, AgentRun.Status.QUEUED)
+        self.assertIsNone(reserved.get().started_at)
+
+    def test_run_whose_reservation_was_taken_is_not_executed(self):
+        AgentRun.objects.filter(workspace=self.workspaces["noisy"]).delete()
+        llm = FakeLLM()
+        scheduler = AgentScheduler(workers=1, per_workspace=1, runtime=AgentRuntime(llm=llm))
+        self.assertEqual(scheduler.claim(), 1)
+
+        # a reserva venceu na fila em memória e outro processo reivindicou o run
+        run = AgentRun.objects.get()
+        AgentRun.objects.filter(id=run.id).update(next_attempt_at=run.next_attempt_at + timedelta(seconds=1))
+
+        scheduler.dispatch()
+        scheduler.shutdown()
+
+        self.assertEqual(llm.prompts, [])
+        self.assertEqual(AgentRun.objects.get().status, AgentRun.Status.QUEUED)
+
+
+class AgentApiTests(APITestCase):
+    def setUp(self):
+        core_cache.reset()
+        self.user = User.objects.create_user(username="admin", password="pass")
+        self.workspace = Workspace.objects.create(name="Acme", created_by=self.user)
+        Membership.objects.create(workspace=self.workspace, user=self.user, role=Membership.ROLE_ADMIN)
+        self.client.force_authenticate(self.user)
+        self.headers = {"HTTP_X_WORKSPACE_ID": str(self.workspace.id)}
+
+    def test_single_active_default_agent(self):
+        first = self.client.post("/api/v1/agents/agents/", {"name": "Padrão"}, format="json", **self.headers)
+        second = self.client.post("/api/v1/agents/agents/", {"name": "Outro"}, format="json", **self.headers)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 400)
+
+    def test_channel_from_other_workspace_is_rejected(self):
+        other = make_channel(Workspace.objects.create(name="Other"), name="other-ch")
+        response = self.client.post(
+            "/api/v1/agents/agents/", {"name": "X", "channel": str(other.id)}, format="json", **self.headers)
+        self.assertEqual(response.status_code, 400)
@@ -1,5 +1,9 @@
-from django.urls import path
+from rest_framework.routers import DefaultRouter
 
-urlpatterns = [
-    # Endpoints entrarão aqui depois.
-]
+from apps.agents import views
+
+router = DefaultRouter()
+router.register("agents", views.AgentViewSet, basename="agent")
+router.register("runs", views.AgentRunViewSet, basename="agent-run")
+
+urlpatterns = router.urls
@@ -1,3 +1,42 @@
-from django.shortcuts import render
+from django.db.models import Prefetch
+from rest_framework import viewsets
+from rest_framework.permissions import IsAuthenticated
 
-# Create your views here.
+from apps.agents.models import Agent, AgentRun, AgentRunStep
+from apps.agents.serializers import (AgentRunDetailSerializer,
+                                     AgentRunSerializer, AgentSerializer)
+from apps.tenants.mixins import WorkspaceRequiredMixin
+from apps.tenants.permissions import IsWorkspaceAdmin, IsWorkspaceMember
+
+
+class AgentViewSet(WorkspaceRequiredMixin, viewsets.ModelViewSet):
+    serializer_class = AgentSerializer
+    permission_classes = [IsAuthenticated, IsWorkspaceMember]
+    http_method_names = ["get", "post", "patch", "delete", "head", "options"]
+
+    def get_queryset(self):
+        return Agent.objects.filter(workspace=self.request.workspace).order_by("name")
+
+    def get_permissions(self):
+        if self.action in {"create", "partial_update", "destroy"}:
+            return [IsAuthenticated(), IsWorkspaceAdmin()]
+        return [permission() for permission in self.permission_classes]
+
+    def perform_create(self, serializer):
+        serializer.save(workspace=self.request.workspace)
+
+
+class AgentRunViewSet(WorkspaceRequiredMixin, viewsets.ReadOnlyModelViewSet):
+    permission_classes = [IsAuthenticated, IsWorkspaceMember]
+    filterset_fields = ["agent", "conversation", "status"]
+
+    def get_queryset(self):
+        qs = AgentRun.objects.filter(workspace=self.request.workspace).order_by("-created_at")
+        if self.action == "retrieve":
+            qs = qs.prefetch_related(Prefetch("steps", queryset=AgentRunStep.objects.order_by("attempt", "seq")))
+        return qs
+
+    def get_serializer_class(self):
+        if self.action == "retrieve":
+            return AgentRunDetailSerializer
+        return AgentRunSerializer
@@ -1,3 +1,21 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import AuditEvent, UsageRollup
+
+
+@admin.register(AuditEvent)
+class AuditEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "workspace", "kind", "actor", "tokens", "cost_usd", "occurred_at")
+    list_filter = ("kind",)
+    search_fields = ("id", "correlation_id")
+    list_select_related = ("workspace",)
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(UsageRollup)
+class UsageRollupAdmin(admin.ModelAdmin):
+    list_display = ("workspace", "kind", "granularity", "bucket_start", "events", "tokens", "cost_usd")
+    list_filter = ("granularity", "kind")
+    list_select_related = ("workspace",)
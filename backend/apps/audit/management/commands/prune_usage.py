@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.audit.usage import prune_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove rollups de uso de minuto/hora fora da retenção "
+        "(USAGE_MINUTE_RETENTION_HOURS / USAGE_HOUR_RETENTION_DAYS). Os diários ficam."
+    )
+
+    def handle(self, *args, **opts):
+        for granularity, deleted in prune_rollups().items():
+            self.stdout.write(f"{granularity}: {deleted} removed")
@@ -1,3 +1,95 @@
+import uuid
+
 from django.db import models
 
-# Create your models here.
+
+class AuditEvent(models.Model):
+    """
+    Log append-only de eventos de uso/auditoria (PIPELINE.md, passo 12).
+
+    Gravado só em lote por apps.audit.usage (nunca no caminho do request);
+    dashboards leem UsageRollup, não esta tabela.
+    """
+
+    MESSAGE_PROCESSED = "message.processed"
+    RAG_QUERY = "rag.query"
+    AGENT_RUN = "agent.run"
+    PROVIDER_SEND = "provider.send"
+    # cache semântico de respostas (apps.rag.answer_cache); hit ratio = hit / (hit + miss)
+    ANSWER_CACHE_HIT = "rag.cache_hit"
+    ANSWER_CACHE_MISS = "rag.cache_miss"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    workspace = models.ForeignKey(
+        "tenants.Workspace",
+        on_delete=models.CASCADE,
+        related_name="audit_events",
+    )
+    kind = models.CharField(max_length=64)
+    # "user:<id>", "api-key:<prefix>" ou "system"
+    actor = models.CharField(max_length=100, blank=True, default="")
+    correlation_id = models.CharField(max_length=64, blank=True, default="")
+
+    quantity = models.PositiveIntegerField(default=1)
+    tokens = models.PositiveIntegerField(default=0)
+    cost_usd = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    data = models.JSONField(default=dict, blank=True)
+
+    # momento do fato (não do flush)
+    occurred_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["workspace", "-occurred_at"], name="audit_ws_occurred_idx"),
+            models.Index(fields=["correlation_id"], name="audit_correlation_idx",
+                         condition=~models.Q(correlation_id="")),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("AuditEvent é append-only.")
+        super().save(*args, **kwargs)
+
+    def __str__(self) -> str:
+        return f"AuditEvent(kind={self.kind}, id={self.id})"
+
+
+class UsageRollup(models.Model):
+    """Totais por (workspace, kind, granularidade, início do bucket), somados a cada flush."""
+
+    class Granularity(models.TextChoices):
+        MINUTE = "minute", "minute"
+        HOUR = "hour", "hour"
+        DAY = "day", "day"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    workspace = models.ForeignKey(
+        "tenants.Workspace",
+        on_delete=models.CASCADE,
+        related_name="usage_rollups",
+    )
+    kind = models.CharField(max_length=64)
+    granularity = models.CharField(max_length=6, choices=Granularity.choices)
+    bucket_start = models.DateTimeField()
+
+    events = models.BigIntegerField(default=0)
+    quantity = models.BigIntegerField(default=0)
+    tokens = models.BigIntegerField(default=0)
+    cost_usd = models.DecimalField(max_digits=14, decimal_places=6, default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # alvo do ON CONFLICT ... DO UPDATE SET x = x + EXCLUDED.x
+            models.UniqueConstraint(
+                fields=["workspace", "kind", "granularity", "bucket_start"],
+                name="uniq_usage_rollup_bucket",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["workspace", "granularity", "bucket_start"], name="usage_ws_gran_bucket_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"UsageRollup({self.kind} {self.granularity} {self.bucket_start:%Y-%m-%d %H:%M})"
@@ -0,0 +1,17 @@
+from rest_framework import serializers
+
+from apps.audit.models import UsageRollup
+
+
+class UsageRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UsageRollup
+        fields = ["kind", "granularity", "bucket_start", "events", "quantity", "tokens", "cost_usd"]
+        read_only_fields = fields
+
+
+class UsageQuerySerializer(serializers.Serializer):
+    granularity = serializers.ChoiceField(choices=UsageRollup.Granularity.choices, default="day")
+    kind = serializers.CharField(required=False, max_length=64)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
@@ -1,3 +1,140 @@
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from rest_framework.test import APITestCase
+
+from apps.audit import usage
+from apps.audit.models import AuditEvent, UsageRollup
+from apps.core import cache as core_cache
+from apps.tenants.models import Membership, Workspace
+
+User = get_user_model()
+
+
+class UsageRecordTests(TestCase):
+    def setUp(self):
+        self.workspace = Workspace.objects.create(name="Acme")
+        usage.flush()
+
+    def _record(self, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            usage.record(*args, **kwargs)
+
+    def test_record_is_buffered_until_flush(self):
+        with self.assertNumQueries(0):
+            self._record(usage.RAG_QUERY, self.workspace.id, tokens=10, correlation_id="abcdef0123456789")
+
+        self.assertEqual(usage.pending(), 1)
+        self.assertFalse(AuditEvent.objects.exists())
+
+        self.assertEqual(usage.flush(), 1)
+        event = AuditEvent.objects.get()
+        self.assertEqual((event.kind, event.tokens, event.correlation_id),
+                         (usage.RAG_QUERY, 10, "abcdef0123456789"))
+
+    def test_not_buffered_when_transaction_rolls_back(self):
+        usage.record(usage.RAG_QUERY, self.workspace.id)  # sem commit no TestCase
+        self.assertEqual(usage.pending(), 0)
+
+    def test_flush_maintains_rollups_incrementally(self):
+        at = datetime(2026, 3, 1, 10, 15, 30, tzinfo=dt_timezone.utc)
+        for minute in (0, 0, 1):
+            self._record(usage.RAG_QUERY, self.workspace.id, tokens=100, cost_usd="0.0015",
+                         occurred_at=at + timedelta(minutes=minute))
+
+        # 1 insert dos eventos + 1 upsert dos rollups (+ savepoint e checagem das FKs)
+        with self.assertNumQueries(6):
+            usage.flush()
+
+        rows = {
+            (r.granularity, r.bucket_start): (r.events, r.tokens, r.cost_usd)
+            for r in UsageRollup.objects.filter(workspace=self.workspace)
+        }
+        self.assertEqual(rows[("minute", at.replace(second=0))], (2, 200, Decimal("0.003")))
+        self.assertEqual(rows[("minute", at.replace(minute=16, second=0))], (1, 100, Decimal("0.0015")))
+        self.assertEqual(rows[("hour", at.replace(minute=0, second=0))], (3, 300, Decimal("0.0045")))
+        self.assertEqual(rows[("day", at.replace(hour=0, minute=0, second=0))], (3, 300, Decimal("0.0045")))
+
+        # segundo lote soma nos mesmos buckets
+        self._record(usage.RAG_QUERY, self.workspace.id, tokens=1, occurred_at=at)
+        usage.flush()
+        day = UsageRollup.objects.get(workspace=self.workspace, granularity="day")
+        self.assertEqual((day.events, day.tokens), (4, 301))
+        self.assertEqual(AuditEvent.objects.count(), 4)
+
+    def test_integrity_error_drops_only_the_bad_workspace(self):
+        gone = Workspace.objects.create(name="Gone")
+        self._record(usage.RAG_QUERY, self.workspace.id)
+        self._record(usage.RAG_QUERY, gone.id)
+        self._record(usage.AGENT_RUN, self.workspace.id)
+        gone.delete()
+        dropped = usage.DROPPED.value(reason="integrity")
+
+        with self.assertLogs("apps.audit.usage", "WARNING"):
+            usage.flush()
+
+        self.assertEqual(AuditEvent.objects.filter(workspace=self.workspace).count(), 2)
+        self.assertEqual(usage.DROPPED.value(reason="integrity") - dropped, 1)
+        self.assertEqual(usage.pending(), 0)
+
+    def test_events_are_append_only(self):
+        self._record(usage.RAG_QUERY, self.workspace.id)
+        usage.flush()
+        event = AuditEvent.objects.get()
+        with self.assertRaises(ValueError):
+            event.save()
+
+    def test_estimate_cost(self):
+        self.assertEqual(usage.estimate_cost("gpt-4o-mini", 1_000_000, 1_000_000), Decimal("0.75"))
+        self.assertEqual(usage.estimate_cost("desconhecido", 10, 10), Decimal(0))
+        with self.settings(LLM_PRICES={"desconhecido": [1, 2]}):
+            self.assertEqual(usage.estimate_cost("desconhecido", 1000, 1000), Decimal("0.003"))
+
+    def test_prune_keeps_daily_rollups(self):
+        old = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        self._record(usage.RAG_QUERY, self.workspace.id, occurred_at=old)
+        usage.flush()
+
+        deleted = usage.prune_rollups(now=old + timedelta(days=365))
+
+        self.assertEqual(deleted, {"minute": 1, "hour": 1})
+        self.assertEqual(list(UsageRollup.objects.values_list("granularity", flat=True)), ["day"])
+
+
+class UsageViewTests(APITestCase):
+    def setUp(self):
+        core_cache.reset()
+        self.user = User.objects.create_user(username="user", password="pass")
+        self.workspace = Workspace.objects.create(name="Acme", created_by=self.user)
+        Membership.objects.create(workspace=self.workspace, user=self.user, role=Membership.ROLE_MEMBER)
+        other = Workspace.objects.create(name="Other")
+        usage.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            for ws in (self.workspace, self.workspace, other):
+                usage.record(usage.PROVIDER_SEND, ws.id)
+            usage.record(usage.RAG_QUERY, self.workspace.id, tokens=50, cost_usd="0.01")
+        usage.flush()
+        self.client.force_authenticate(self.user)
+
+    def test_returns_rollups_of_current_workspace(self):
+        response = self.client.get(
+            "/api/v1/audit/usage/?granularity=hour",
+            HTTP_X_WORKSPACE_ID=str(self.workspace.id),
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["totals"][usage.PROVIDER_SEND]["events"], 2)
+        self.assertEqual(response.data["totals"][usage.RAG_QUERY]["cost_usd"], "0.010000")
+        self.assertEqual({r["granularity"] for r in response.data["series"]}, {"hour"})
+
+    def test_filters_by_kind(self):
+        response = self.client.get(
+            f"/api/v1/audit/usage/?kind={usage.RAG_QUERY}",
+            HTTP_X_WORKSPACE_ID=str(self.workspace.id),
+        )
 
-# Create your tests here.
+        self.assertEqual(list(response.data["totals"]), [usage.RAG_QUERY])
+        self.assertEqual(response.data["series"][0]["tokens"], 50)
@@ -1,5 +1,7 @@
 from django.urls import path
 
+from apps.audit.views import UsageView
+
 urlpatterns = [
-    # Endpoints entrarão aqui depois.
+    path("usage/", UsageView.as_view(), name="audit-usage"),
 ]
@@ -0,0 +1,219 @@
+"""
+Registro de uso/auditoria (PIPELINE.md, passo 12).
+
+    from apps.audit import usage
+    usage.record(usage.RAG_QUERY, ws.id, tokens=812, cost_usd=0.0004, actor=usage.actor_for(request))
+
+- `record` não toca o banco: o evento entra num BatchBuffer em memória (só
+  depois do commit da transação que o gerou) e é gravado em lote a cada
+  USAGE_FLUSH_INTERVAL segundos / USAGE_BUFFER_SIZE eventos;
+- o flush grava os AuditEvent (bulk insert) e soma os totais do lote em
+  UsageRollup (minuto/hora/dia) com um único
+  INSERT ... ON CONFLICT DO UPDATE SET x = x + EXCLUDED.x, na mesma transação;
+- o estado do buffer é por processo: no pior caso (processo morto) perde-se
+  um intervalo de eventos, como em apps.core.buffers. Falha transitória (banco
+  fora) volta o lote para o buffer até USAGE_FLUSH_RETRIES vezes;
+  IntegrityError (ex.: workspace apagado com eventos no buffer) regrava o lote
+  por workspace e só descarta os do workspace ruim (usage_events_dropped_total).
+"""
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from apps.audit.models import AuditEvent, UsageRollup
+from apps.core import tracing
+from apps.core.buffers import BatchBuffer
+from apps.core.metrics import registry
+
+MESSAGE_PROCESSED = AuditEvent.MESSAGE_PROCESSED
+RAG_QUERY = AuditEvent.RAG_QUERY
+AGENT_RUN = AuditEvent.AGENT_RUN
+PROVIDER_SEND = AuditEvent.PROVIDER_SEND
+ANSWER_CACHE_HIT = AuditEvent.ANSWER_CACHE_HIT
+ANSWER_CACHE_MISS = AuditEvent.ANSWER_CACHE_MISS
+
+logger = logging.getLogger(__name__)
+
+EVENTS = registry.counter("usage_events_total", "Eventos de uso registrados", ["kind"])
+DROPPED = registry.counter("usage_events_dropped_total", "Eventos de uso descartados no flush", ["reason"])
+
+# USD por 1M tokens (entrada, saída); sobrescrito por settings.LLM_PRICES
+DEFAULT_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+
+_MILLION = Decimal(1_000_000)
+_MICRO = Decimal("0.000001")
+
+
+def estimate_cost(model: str, input_tokens: int = 0, output_tokens: int = 0) -> Decimal:
+    """Custo em USD pela tabela de preços; modelo desconhecido custa 0."""
+    prices = {**DEFAULT_PRICES, **getattr(settings, "LLM_PRICES", {})}
+    price = prices.get(model)
+    if price is None:
+        return Decimal(0)
+    price_in, price_out = (Decimal(str(p)) for p in price)
+    cost = (price_in * int(input_tokens or 0) + price_out * int(output_tokens or 0)) / _MILLION
+    return cost.quantize(_MICRO)
+
+
+def actor_for(request) -> str:
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return ""
+    if getattr(user, "pk", None) is not None:
+        return f"user:{user.pk}"
+    return str(user)  # ApiKeyUser: "api-key:<prefix>"
+
+
+def record(
+    kind: str,
+    workspace_id,
+    *,
+    quantity: int = 1,
+    tokens: int = 0,
+    cost_usd=0,
+    actor: str = "",
+    correlation_id: str | None = None,
+    occurred_at: datetime | None = None,
+    **data,
+):
+    """Enfileira um evento; vira linha só no próximo flush (e só se a transação atual commitar)."""
+    if not workspace_id:
+        return
+    event = AuditEvent(
+        id=uuid.uuid4(),
+        workspace_id=workspace_id,
+        kind=kind,
+        actor=actor[:100],
+        correlation_id=(correlation_id or tracing.correlation_id() or "")[:64],
+        quantity=quantity,
+        tokens=tokens,
+        cost_usd=Decimal(str(cost_usd)).quantize(_MICRO),
+        data=data,
+        occurred_at=occurred_at or timezone.now(),
+    )
+    transaction.on_commit(lambda: _buffer.add(event.id, event))
+
+
+# ---------- flush ----------
+
+def truncate(ts: datetime, granularity: str) -> datetime:
+    ts = ts.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+    if granularity == UsageRollup.Granularity.MINUTE:
+        return ts
+    ts = ts.replace(minute=0)
+    if granularity == UsageRollup.Granularity.HOUR:
+        return ts
+    return ts.replace(hour=0)
+
+
+def _rollup_rows(events) -> list[tuple]:
+    totals: dict[tuple, list] = defaultdict(lambda: [0, 0, 0, Decimal(0)])
+    for ev in events:
+        for granularity in UsageRollup.Granularity.values:
+            key = (str(ev.workspace_id), ev.kind, granularity, truncate(ev.occurred_at, granularity))
+            row = totals[key]
+            row[0] += 1
+            row[1] += ev.quantity
+            row[2] += ev.tokens
+            row[3] += ev.cost_usd
+    # ordem fixa: flushes concorrentes (vários processos) travam as linhas na mesma ordem
+    return [key + tuple(totals[key]) for key in sorted(totals)]
+
+
+def _upsert_rollups(rows: list[tuple]):
+    table = UsageRollup._meta.db_table
+    now = timezone.now()
+    values = []
+    params = []
+    for workspace_id, kind, granularity, bucket, events, quantity, tokens, cost in rows:
+        values.append("(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)")
+        params += [uuid.uuid4(), workspace_id, kind, granularity, bucket, events, quantity, tokens, cost, now]
+    sql = f"""
+        INSERT INTO {table}
+            (id, workspace_id, kind, granularity, bucket_start, events, quantity, tokens, cost_usd, updated_at)
+        VALUES {", ".join(values)}
+        ON CONFLICT (workspace_id, kind, granularity, bucket_start) DO UPDATE SET
+            events = {table}.events + EXCLUDED.events,
+            quantity = {table}.quantity + EXCLUDED.quantity,
+            tokens = {table}.tokens + EXCLUDED.tokens,
+            cost_usd = {table}.cost_usd + EXCLUDED.cost_usd,
+            updated_at = EXCLUDED.updated_at
+    """
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+
+
+def _write_batch(events: list):
+    rows = _rollup_rows(events)
+    with transaction.atomic():
+        AuditEvent.objects.bulk_create(events, batch_size=1000)
+        for i in range(0, len(rows), 500):
+            _upsert_rollups(rows[i:i + 500])
+        # FKs são DEFERRABLE: checa aqui para o erro cair neste bloco (e no
+        # savepoint certo) e não no commit de quem estiver por fora
+        connection.check_constraints()
+    for ev in events:
+        EVENTS.inc(kind=ev.kind)
+
+
+def _write_events(items: dict):
+    events = list(items.values())
+    try:
+        _write_batch(events)
+        return
+    except IntegrityError:
+        logger.warning("usage flush: integrity error in batch of %d, retrying per workspace", len(events))
+
+    by_workspace = defaultdict(list)
+    for ev in events:
+        by_workspace[ev.workspace_id].append(ev)
+    for workspace_id, group in by_workspace.items():
+        try:
+            _write_batch(group)
+        except IntegrityError:
+            logger.exception("usage flush: dropping %d events of workspace %s", len(group), workspace_id)
+            DROPPED.inc(len(group), reason="integrity")
+
+
+_buffer = BatchBuffer(
+    "usage-events",
+    _write_events,
+    interval=float(getattr(settings, "USAGE_FLUSH_INTERVAL", 5)),
+    max_items=int(getattr(settings, "USAGE_BUFFER_SIZE", 2000)),
+    retries=int(getattr(settings, "USAGE_FLUSH_RETRIES", 3)),
+)
+
+
+def flush() -> int:
+    return _buffer.flush()
+
+
+def pending() -> int:
+    return _buffer.pending()
+
+
+def prune_rollups(*, now: datetime | None = None) -> dict[str, int]:
+    """Remove buckets finos antigos (minuto/hora); os diários ficam."""
+    now = now or timezone.now()
+    keep = {
+        UsageRollup.Granularity.MINUTE: timedelta(hours=int(getattr(settings, "USAGE_MINUTE_RETENTION_HOURS", 48))),
+        UsageRollup.Granularity.HOUR: timedelta(days=int(getattr(settings, "USAGE_HOUR_RETENTION_DAYS", 90))),
+    }
+    deleted = {}
+    for granularity, window in keep.items():
+        deleted[granularity] = UsageRollup.objects.filter(
+            granularity=granularity, bucket_start__lt=now - window,
+        ).delete()[0]
+    return deleted
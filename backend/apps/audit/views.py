@@ -1,3 +1,63 @@
-from django.shortcuts import render
+from datetime import timedelta
 
-# Create your views here.
+from django.utils import timezone
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from apps.audit.models import UsageRollup
+from apps.audit.serializers import UsageQuerySerializer, UsageRollupSerializer
+from apps.tenants.mixins import WorkspaceRequiredMixin
+from apps.tenants.permissions import IsWorkspaceMember
+
+# janela padrão por granularidade (sem ?since=)
+_DEFAULT_WINDOW = {
+    UsageRollup.Granularity.MINUTE: timedelta(hours=2),
+    UsageRollup.Granularity.HOUR: timedelta(days=2),
+    UsageRollup.Granularity.DAY: timedelta(days=31),
+}
+MAX_ROWS = 5000
+
+
+class UsageView(WorkspaceRequiredMixin, APIView):
+    """
+    Série de uso do workspace a partir dos rollups (nunca varre AuditEvent).
+    Eventos ainda no buffer aparecem no próximo flush (USAGE_FLUSH_INTERVAL).
+    """
+
+    permission_classes = [IsAuthenticated, IsWorkspaceMember]
+
+    def get(self, request):
+        query = UsageQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        granularity = params["granularity"]
+        until = params.get("until") or timezone.now()
+        since = params.get("since") or until - _DEFAULT_WINDOW[granularity]
+
+        qs = UsageRollup.objects.filter(
+            workspace=request.workspace,
+            granularity=granularity,
+            bucket_start__gte=since,
+            bucket_start__lt=until,
+        )
+        if params.get("kind"):
+            qs = qs.filter(kind=params["kind"])
+        rows = list(qs.order_by("bucket_start", "kind")[:MAX_ROWS])
+
+        totals: dict[str, dict] = {}
+        for row in rows:
+            t = totals.setdefault(row.kind, {"events": 0, "quantity": 0, "tokens": 0, "cost_usd": 0})
+            t["events"] += row.events
+            t["quantity"] += row.quantity
+            t["tokens"] += row.tokens
+            t["cost_usd"] += row.cost_usd
+
+        return Response({
+            "granularity": granularity,
+            "since": since,
+            "until": until,
+            "totals": {k: {**t, "cost_usd": str(t["cost_usd"])} for k, t in totals.items()},
+            "series": UsageRollupSerializer(rows, many=True).data,
+        })
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ChannelsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.channels'
+
+    def ready(self):
+        from apps.channels import reconciler, signals  # noqa: F401
+        from apps.core.metrics import registry
+
+        registry.register_collector(reconciler.collect)
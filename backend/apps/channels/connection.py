@@ -0,0 +1,173 @@
+"""
+Cache do estado de conexão das instâncias da Evolution.
+
+Fonte principal: o webhook CONNECTION_UPDATE (`record_state`). Leituras em lote
+(`GET channels/status/`) saem do cache; só as entradas ausentes/velhas vão à
+Evolution, com concorrência limitada (`refresh_states`).
+
+Chave: evo:conn:{instance} -> {"state", "connected", "checked_at", "source"}
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from apps.channels.models import Channel
+from apps.providers.evolution.client import EvolutionClient
+from django.conf import settings
+from django.core.cache import cache
+
+CONNECTED_STATES = frozenset({"open", "connected", "online"})
+DISCONNECTED_STATES = frozenset({"close", "closed", "disconnected", "logout"})
+
+
+def _key(instance: str) -> str:
+    return f"evo:conn:{instance}"
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def extract_state(obj) -> str:
+    """Estado ("open", "close", "connecting"...) nos formatos de status/webhook da Evolution."""
+    if not isinstance(obj, dict):
+        return ""
+    instance = obj.get("instance") if isinstance(obj.get("instance"), dict) else {}
+    data = obj.get("data") if isinstance(obj.get("data"), dict) else {}
+    state = (
+        obj.get("state")
+        or obj.get("status")
+        or instance.get("state")
+        or instance.get("status")
+        or data.get("state")
+        or ""
+    )
+    return str(state).lower() if isinstance(state, str) else ""
+
+
+def parse_fetch_instances(payload) -> dict[str, str]:
+    """
+    /instance/fetchInstances -> {nome: estado}.
+    v1: [{"instance": {"instanceName", "status"}}]; v2: [{"name", "connectionStatus"}].
+    """
+    items = payload if isinstance(payload, list) else []
+    states = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        inner = item.get("instance") if isinstance(item.get("instance"), dict) else item
+        name = inner.get("instanceName") or inner.get("name")
+        state = inner.get("connectionStatus") or inner.get("state") or inner.get("status")
+        if isinstance(name, str) and isinstance(state, str):
+            states[name] = state.lower()
+    return states
+
+
+def is_connected_state(state: str) -> bool:
+    return (state or "").lower() in CONNECTED_STATES
+
+
+def active_from_state(state: str) -> bool | None:
+    """is_active que o Channel deveria ter; None = estado transitório, não mexe."""
+    state = (state or "").lower()
+    if state in CONNECTED_STATES:
+        return True
+    if state in DISCONNECTED_STATES:
+        return False
+    return None
+
+
+def _entry(state: str, source: str) -> dict:
+    return {
+        "state": state,
+        "connected": is_connected_state(state),
+        "checked_at": time.time(),
+        "source": source,
+    }
+
+
+def record_state(instance: str, state: str, *, source: str = "webhook") -> dict:
+    entry = _entry((state or "").lower(), source)
+    cache.set(_key(instance), entry, timeout=int(_setting("CHANNEL_STATE_TTL", 86400)))
+    return entry
+
+
+def record_states(states: dict[str, str], *, source: str) -> dict[str, dict]:
+    entries = {name: _entry((state or "").lower(), source) for name, state in states.items()}
+    if entries:
+        cache.set_many(
+            {_key(name): entry for name, entry in entries.items()},
+            timeout=int(_setting("CHANNEL_STATE_TTL", 86400)),
+        )
+    return entries
+
+
+def get_states(instances) -> dict[str, dict]:
+    names = [n for n in instances if n]
+    if not names:
+        return {}
+    raw = cache.get_many([_key(n) for n in names])
+    return {n: raw[_key(n)] for n in names if _key(n) in raw}
+
+
+def is_stale(entry: dict | None, *, max_age: float | None = None) -> bool:
+    if not entry:
+        return True
+    if max_age is None:
+        # webhook avisa quando muda: vale mais que uma leitura pontual
+        if entry.get("source") == "webhook":
+            max_age = float(_setting("CHANNEL_STATE_WEBHOOK_MAX_AGE", 900))
+        else:
+            max_age = float(_setting("CHANNEL_STATE_MAX_AGE", 60))
+    return time.time() - entry.get("checked_at", 0) > max_age
+
+
+def refresh_states(
+    client: EvolutionClient,
+    instances,
+    *,
+    concurrency: int | None = None,
+    source: str = "poll",
+) -> dict[str, dict]:
+    """
+    get_status das instâncias em paralelo (no máximo `concurrency` em voo).
+    Falhas ficam de fora do resultado (o chamador mantém o que já tinha).
+    """
+    names = [n for n in dict.fromkeys(instances) if n]
+    if not names:
+        return {}
+    concurrency = concurrency or int(_setting("CHANNEL_STATUS_CONCURRENCY", 16))
+
+    def one(name):
+        try:
+            return name, extract_state(client.get_status(name))
+        except Exception:
+            return name, None
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(names)), thread_name_prefix="evo-status") as pool:
+        fetched = {name: state for name, state in pool.map(one, names) if state is not None}
+
+    return record_states(fetched, source=source)
+
+
+def sync_active_flags(channels, states: dict[str, dict]) -> int:
+    """
+    Alinha Channel.is_active ao estado conhecido em lote (no máximo um UPDATE
+    por valor, só com as linhas que mudaram). Atualiza os objetos em memória.
+    """
+    changes = {}
+    for ch in channels:
+        entry = states.get(ch.external_id)
+        if not entry:
+            continue
+        active = active_from_state(entry["state"])
+        if active is not None and active != ch.is_active:
+            ch.is_active = active
+            changes[ch.id] = active
+
+    if not changes:
+        return 0
+    for active in (True, False):
+        ids = [pk for pk, value in changes.items() if value is active]
+        if ids:
+            Channel.objects.filter(id__in=ids).update(is_active=active)
+    return len(changes)
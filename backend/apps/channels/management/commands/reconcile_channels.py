@@ -0,0 +1,41 @@
+import signal
+import threading
+
+from apps.channels.reconciler import reconcile
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Reconcilia o estado de conexão de todas as instâncias Evolution (cache + Channel.is_active)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=None,
+                            help="Segundos entre rodadas (default: CHANNEL_RECONCILE_INTERVAL).")
+        parser.add_argument("--concurrency", type=int, default=None)
+        parser.add_argument("--once", action="store_true",
+                            help="Roda uma vez e sai.")
+
+    def _run(self, concurrency):
+        result = reconcile(concurrency=concurrency)
+        self.stdout.write(
+            f"servers={result.servers} instances={result.instances} bulk={result.bulk} "
+            f"single={result.single} missing={result.missing} server_errors={result.server_errors} "
+            f"changed={result.changed} seconds={result.seconds}"
+        )
+
+    def handle(self, *args, **opts):
+        if opts["once"]:
+            self._run(opts["concurrency"])
+            return
+
+        interval = opts["interval"] or float(getattr(settings, "CHANNEL_RECONCILE_INTERVAL", 30))
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        signal.signal(signal.SIGINT, lambda *_: stop.set())
+        while not stop.is_set():
+            try:
+                self._run(opts["concurrency"])
+            except Exception as e:  # noqa: BLE001 - o loop não pode morrer por uma rodada ruim
+                self.stderr.write(f"reconcile failed: {e}")
+            stop.wait(interval)
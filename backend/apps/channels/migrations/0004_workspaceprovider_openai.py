@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-19 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channels', '0003_channel_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='workspaceprovider',
+            name='provider',
+            field=models.CharField(choices=[('evolution', 'evolution'), ('openai', 'openai')], db_index=True, max_length=50),
+        ),
+    ]
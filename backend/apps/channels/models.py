@@ -70,6 +70,8 @@ class Channel(models.Model):
 class WorkspaceProvider(models.Model):
     class Provider(models.TextChoices):
         EVOLUTION = "evolution", "evolution"
+        # BYOK: api_key (e base_url opcional) próprios do workspace para o LLM
+        OPENAI = "openai", "openai"
 
     class Status(models.TextChoices):
         READY = "ready", "ready"
@@ -0,0 +1,229 @@
+"""
+Estado de pareamento (QR / pairing code / conexão) de instâncias da Evolution.
+
+O QR chega de forma assíncrona: a Evolution manda QRCODE_UPDATED (e rotaciona
+o QR a cada ~20s) e CONNECTION_UPDATE para o webhook. Em vez de um request
+segurar um worker fazendo polling em /instance/connect, o webhook grava o
+estado versionado no cache e publica no pub/sub; o endpoint
+(`GET channels/{id}/evolution/pairing/?since=<versão>&wait=<s>`) só lê a
+versão — é um short poll barato (uma leitura de cache) a cada
+EVOLUTION_PAIRING_POLL_INTERVAL segundos.
+
+Esperar (`wait`) segura um worker síncrono: fica limitado a
+EVOLUTION_PAIRING_MAX_WAIT segundos (0 = nunca espera, o padrão) e a
+EVOLUTION_PAIRING_MAX_WAITERS esperas simultâneas por processo; acima disso
+a resposta volta na hora.
+
+Chaves:
+  - evo:pair:{instance}   -> {"version", "qr_base64", "pairing_code", "state", ...}
+  - evo:qr:{instance}     -> base64 do último QR (compatibilidade)
+"""
+import re
+import threading
+import time
+
+from apps.channels.connection import is_connected_state
+from apps.core import pubsub
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+
+def _state_key(instance: str) -> str:
+    return f"evo:pair:{instance}"
+
+
+def _version_key(instance: str) -> str:
+    return f"evo:pair:v:{instance}"
+
+
+def _topic(instance: str) -> str:
+    return f"evo:pair:{instance}"
+
+
+def _ttl() -> int:
+    return int(getattr(settings, "EVOLUTION_PAIRING_TTL", 600))
+
+
+_waiters = 0
+_waiters_lock = threading.Lock()
+
+
+def _acquire_waiter() -> bool:
+    global _waiters
+    with _waiters_lock:
+        if _waiters >= int(getattr(settings, "EVOLUTION_PAIRING_MAX_WAITERS", 4)):
+            return False
+        _waiters += 1
+        return True
+
+
+def _release_waiter():
+    global _waiters
+    with _waiters_lock:
+        _waiters -= 1
+
+
+def extract_pairing_code(payload):
+    """Tenta achar pairing code em formatos variados."""
+    if not isinstance(payload, dict):
+        return None
+
+    def pick(d):
+        if not isinstance(d, dict):
+            return None
+        return d.get("pairingCode") or d.get("pairing_code") or d.get("code")
+
+    code = pick(payload)
+    if code:
+        return code
+
+    for key in ("response", "data", "result", "instance"):
+        code = pick(payload.get(key))
+        if code:
+            return code
+
+    return None
+
+
+def extract_qr_data_url(payload):
+    """
+    Evolution pode devolver QR em formatos diferentes:
+      - payload["qrcode"]["base64"] (às vezes já vem com data:image/png;base64,...)
+      - payload["base64"]
+      - payload["code"] (em alguns builds isso NÃO é base64: vem tipo "2@...,1@...")
+    Queremos devolver:
+      - qr_base64 (somente base64)
+      - qr_data_url (data:image/png;base64,...)
+    """
+    if not isinstance(payload, dict):
+        return None, None
+
+    # coletar candidatos em ordem de prioridade (mais confiável primeiro)
+    candidates = []
+
+    qrcode = payload.get("qrcode")
+    if isinstance(qrcode, dict):
+        b64 = qrcode.get("base64")
+        if b64:
+            candidates.append(b64)
+
+    if payload.get("base64"):
+        candidates.append(payload.get("base64"))
+
+    # code é o mais suspeito (às vezes NÃO é base64)
+    if payload.get("code"):
+        candidates.append(payload.get("code"))
+
+    def normalize(v: str):
+        if not isinstance(v, str):
+            return None, None
+        v = v.strip()
+        if not v:
+            return None, None
+
+        # já é data url
+        if v.startswith("data:image"):
+            # extrai base64 se for possível
+            if "base64," in v:
+                return v.split("base64,", 1)[1].strip(), v
+            return None, v
+
+        # se tiver caracteres típicos de "code" (2@..., vírgulas, @), NÃO é base64
+        if ("@" in v) or ("," in v):
+            return None, None
+
+        # valida aparência de base64 (bem permissivo, mas barra coisas bizarras)
+        if not re.fullmatch(r"[A-Za-z0-9+/=\s]+", v):
+            return None, None
+
+        b64 = v.replace("\n", "").replace("\r", "").strip()
+        if len(b64) < 50:
+            return None, None
+
+        return b64, f"data:image/png;base64,{b64}"
+
+    for c in candidates:
+        b64, url = normalize(c)
+        if b64 or url:
+            return b64, url
+
+    return None, None
+
+
+def _next_version(instance: str) -> int:
+    key = _version_key(instance)
+    # versão vive mais que o estado: um QR novo nunca "volta" para uma versão já vista
+    cache.add(key, 0, timeout=_ttl() * 6)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=_ttl() * 6)
+        return 1
+
+
+def get_pairing(instance: str) -> dict | None:
+    return cache.get(_state_key(instance))
+
+
+def publish_pairing(instance: str, **changes) -> dict:
+    """
+    Mescla `changes` (qr_base64, pairing_code, state) no estado atual, sobe a
+    versão e acorda quem está em long-poll.
+    """
+    current = get_pairing(instance) or {}
+    state = {
+        "qr_base64": current.get("qr_base64"),
+        "pairing_code": current.get("pairing_code"),
+        "state": current.get("state") or "",
+        **{k: v for k, v in changes.items() if v is not None},
+    }
+    state["state"] = (state["state"] or "").lower()
+    state["connected"] = is_connected_state(state["state"])
+    if state["connected"]:
+        # conectado: QR/código antigos não servem mais
+        state["qr_base64"] = None
+        state["pairing_code"] = None
+    state["version"] = _next_version(instance)
+    state["updated_at"] = timezone.now().isoformat()
+
+    cache.set(_state_key(instance), state, timeout=_ttl())
+    if state["qr_base64"]:
+        cache.set(f"evo:qr:{instance}", state["qr_base64"], timeout=_ttl())
+    else:
+        cache.delete(f"evo:qr:{instance}")
+
+    pubsub.publish(_topic(instance), str(state["version"]))
+    return state
+
+
+def wait_for_pairing(instance: str, *, since: int = 0, timeout: float = 0) -> dict | None:
+    """
+    Devolve o estado assim que `version > since` (ou o atual, se já for).
+    Sem mudança até `timeout`, devolve o estado atual (pode ser None). Com
+    EVOLUTION_PAIRING_MAX_WAITERS esperas em curso no processo, não espera.
+    """
+    state = get_pairing(instance)
+    if timeout <= 0 or (state and state["version"] > since):
+        return state
+    if not _acquire_waiter():
+        return state
+    try:
+        return _wait(instance, since, timeout)
+    finally:
+        _release_waiter()
+
+
+def _wait(instance: str, since: int, timeout: float) -> dict | None:
+    deadline = time.monotonic() + timeout
+    with pubsub.subscribe(_topic(instance)) as sub:
+        # relê depois de assinar: publish entre o get acima e o subscribe não se perde
+        while True:
+            state = get_pairing(instance)
+            if state and state["version"] > since:
+                return state
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return state
+            # fatias curtas: sem Redis, o webhook pode cair em outro processo
+            sub.wait(min(remaining, 2.0))
@@ -0,0 +1,130 @@
+"""
+Provisionamento de instância da Evolution para o connect de um canal.
+
+Depois do create, settings e webhook não dependem um do outro e rodam em
+paralelo num pool compartilhado; o connect (QR ou pairing code) só vem depois
+deles, senão os primeiros QRCODE_UPDATED/CONNECTION_UPDATE saem antes de o
+webhook existir e se perdem. A detecção de versão do servidor (GET /,
+memoizada por base_url) corre junto com o create, então em regime o connect
+custa ~3 round-trips (create, o mais lento de settings/webhook, connect) em
+vez de 4-5 sequenciais.
+
+Só HTTP roda nos threads; nada aqui toca o banco.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from apps.core import tracing
+from apps.providers.evolution.client import (EvolutionClient,
+                                             EvolutionClientError,
+                                             known_variant)
+from django.conf import settings
+
+WEBHOOK_EVENTS = [
+    "MESSAGES_UPSERT",
+    "CONNECTION_UPDATE",
+    "QRCODE_UPDATED",
+]
+
+QR_SETTINGS = {
+    "preferQr": True,
+    "preferPairingCode": False,  # Baileys em alguns builds não retorna code
+    "linkingMode": "qr",
+    "pairing": False,
+    "qrcode": True,
+    "mode": "qr",
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(getattr(settings, "EVOLUTION_SETUP_WORKERS", 16)),
+                    thread_name_prefix="evo-setup",
+                )
+    return _executor
+
+
+def webhook_url() -> str:
+    return getattr(settings, "PUBLIC_BASE_URL", "http://backend:8000").rstrip("/") + \
+        "/api/v1/providers/evolution/webhook/"
+
+
+@dataclass
+class ProvisionResult:
+    create: dict | None = None
+    settings: dict | None = None
+    webhook: dict | None = None
+    connect: dict | None = None
+    errors: dict[str, EvolutionClientError] = field(default_factory=dict)
+
+
+def _already_exists(error: EvolutionClientError) -> bool:
+    msg = str(error).lower()
+    return "already" in msg and "exist" in msg
+
+
+def provision_instance(
+    client: EvolutionClient,
+    instance_name: str,
+    *,
+    pairing_number: str | None = None,
+    settings_payload: dict | None = None,
+) -> ProvisionResult:
+    """
+    1) create (tolerante a "already exists") + detecção de versão em paralelo;
+    2) settings (best-effort) e webhook em paralelo;
+    3) connect, com o webhook já registrado.
+
+    `pairing_number` pede pairing code no lugar do QR. Erro no create é
+    relançado (sem instância não há o que configurar); os demais ficam em
+    `result.errors[<etapa>]`.
+    """
+    pool = _get_executor()
+    result = ProvisionResult()
+
+    detect = None
+    if known_variant(client.base_url, "webhook") is None:
+        detect = pool.submit(tracing.wrap(client.api_variant))
+
+    try:
+        result.create = client.create_instance(instance_name)
+    except EvolutionClientError as e:
+        if not _already_exists(e):
+            raise
+        result.create = {"warning": "instance already exists"}
+
+    if detect is not None:
+        # o set_webhook abaixo já encontra a variante memoizada
+        detect.result()
+
+    steps = {
+        "settings": lambda: client.set_settings(instance_name, settings_payload or QR_SETTINGS),
+        "webhook": lambda: client.set_webhook(instance_name, url=webhook_url(), events=WEBHOOK_EVENTS),
+    }
+    futures = {name: pool.submit(tracing.wrap(fn)) for name, fn in steps.items()}
+    for name, future in futures.items():
+        try:
+            setattr(result, name, future.result())
+        except EvolutionClientError as e:
+            result.errors[name] = e
+
+    if "settings" in result.errors:
+        result.settings = {"warning": "set_settings failed (best-effort)"}
+
+    try:
+        if pairing_number:
+            result.connect = client.connect_pairing_code(instance_name, number=pairing_number)
+        else:
+            result.connect = client.connect(instance_name)
+    except EvolutionClientError as e:
+        result.errors["connect"] = e
+
+    return result
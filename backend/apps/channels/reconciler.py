@@ -0,0 +1,169 @@
+"""
+Reconciliação periódica do estado de conexão das instâncias da Evolution
+(manage.py reconcile_channels).
+
+Para cada servidor Evolution (base_url + api_key, vindo do WorkspaceProvider):
+  1) uma chamada em /instance/fetchInstances traz o estado de todas;
+  2) instâncias que não vieram (ou servidor sem o endpoint) caem para
+     get_status com concorrência limitada;
+  3) o cache de estado é atualizado e Channel.is_active é gravado em lote,
+     só nas linhas que mudaram.
+
+Com o reconciler rodando, os endpoints de status respondem do cache e não
+consultam a Evolution no request. O reconciler roda num processo próprio,
+cujo registry nenhum scrape enxerga: cada rodada soma seus contadores no cache
+compartilhado (TOTALS_PREFIX, cache.incr) e o resumo da última fica em
+LAST_RUN_KEY; `collect` lê os dois no /metrics dos workers web
+(channel_reconcile_*).
+"""
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+
+from apps.channels.connection import (parse_fetch_instances, record_states,
+                                      refresh_states, sync_active_flags)
+from apps.channels.models import Channel, WorkspaceProvider
+from apps.providers.evolution.client import EvolutionClient
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+LAST_RUN_KEY = "evo:reconcile:last"
+TOTALS_PREFIX = "evo:reconcile:total:"
+_TOTALS = ("runs", "bulk", "single", "missing", "changed", "server_errors", "milliseconds")
+
+
+@dataclass
+class ReconcileResult:
+    servers: int = 0
+    instances: int = 0
+    bulk: int = 0
+    single: int = 0
+    missing: int = 0
+    server_errors: int = 0
+    changed: int = 0
+    seconds: float = 0.0
+
+
+def _group_by_server(channels: list[Channel]) -> dict[tuple[str, str], list[Channel]]:
+    providers = {
+        wp.workspace_id: wp
+        for wp in WorkspaceProvider.objects.filter(
+            workspace_id__in={ch.workspace_id for ch in channels},
+            provider=WorkspaceProvider.Provider.EVOLUTION,
+        )
+    }
+    default_url = getattr(settings, "EVOLUTION_BASE_URL", None) or "http://evolution:8080"
+    default_key = getattr(settings, "EVOLUTION_API_KEY", None) or "dev_key"
+
+    groups = defaultdict(list)
+    for ch in channels:
+        wp = providers.get(ch.workspace_id)
+        base_url = ((wp.base_url if wp else None) or default_url).rstrip("/")
+        api_key = (wp.api_key if wp else None) or default_key
+        groups[(base_url, api_key)].append(ch)
+    return groups
+
+
+def _reconcile_server(client: EvolutionClient, names: list[str], concurrency: int) -> tuple[dict, dict]:
+    """Retorna (entradas de estado por instância, contadores)."""
+    counters = {"bulk": 0, "single": 0, "missing": 0, "server_errors": 0}
+
+    try:
+        listed = parse_fetch_instances(client.fetch_instances())
+    except Exception as e:
+        logger.info("fetchInstances indisponível em %s: %s", client.base_url, e)
+        counters["server_errors"] += 1
+        listed = {}
+
+    found = {name: listed[name] for name in names if name in listed}
+    entries = record_states(found, source="reconcile")
+    counters["bulk"] = len(entries)
+
+    rest = [name for name in names if name not in found]
+    if rest:
+        polled = refresh_states(client, rest, concurrency=concurrency, source="reconcile")
+        entries.update(polled)
+        counters["single"] = len(polled)
+        counters["missing"] = len(rest) - len(polled)
+
+    return entries, counters
+
+
+def reconcile(*, concurrency: int | None = None, server_concurrency: int = 4) -> ReconcileResult:
+    t0 = time.monotonic()
+    concurrency = concurrency or int(getattr(settings, "CHANNEL_STATUS_CONCURRENCY", 16))
+    result = ReconcileResult()
+
+    channels = list(
+        Channel.objects.filter(
+            provider=Channel.Provider.EVOLUTION,
+            external_id__isnull=False,
+            deleted_at__isnull=True,
+        ).only("id", "workspace_id", "external_id", "is_active")
+    )
+    groups = _group_by_server(channels)
+    result.servers = len(groups)
+    result.instances = len(channels)
+
+    def run(item):
+        (base_url, api_key), group = item
+        client = EvolutionClient(base_url=base_url, api_key=api_key)
+        return _reconcile_server(client, [ch.external_id for ch in group], concurrency)
+
+    states = {}
+    if groups:
+        with ThreadPoolExecutor(max_workers=min(server_concurrency, len(groups)),
+                                thread_name_prefix="evo-reconcile") as pool:
+            for entries, counters in pool.map(run, groups.items()):
+                states.update(entries)
+                for name, value in counters.items():
+                    setattr(result, name, getattr(result, name) + value)
+
+    # banco só no thread principal
+    result.changed = sync_active_flags(channels, states)
+    result.seconds = round(time.monotonic() - t0, 3)
+
+    _record_run(result)
+    logger.info("reconcile_channels %s", asdict(result))
+    return result
+
+
+def _record_run(result: ReconcileResult):
+    amounts = {**asdict(result), "runs": 1, "milliseconds": int(result.seconds * 1000)}
+    for name in _TOTALS:
+        if amounts[name]:
+            key = TOTALS_PREFIX + name
+            cache.add(key, 0, timeout=None)
+            cache.incr(key, amounts[name])
+    cache.set(LAST_RUN_KEY, {**asdict(result), "finished_at": time.time()}, timeout=None)
+
+
+def totals() -> dict[str, int]:
+    """Contadores acumulados de todas as rodadas (de qualquer processo)."""
+    found = cache.get_many([TOTALS_PREFIX + name for name in _TOTALS])
+    return {name: int(found.get(TOTALS_PREFIX + name, 0)) for name in _TOTALS}
+
+
+def collect():
+    data = totals()
+    yield ("channel_reconcile_runs_total", "counter", "Rodadas do reconciler",
+           [({}, data["runs"])])
+    yield ("channel_reconcile_instances_total", "counter", "Instâncias examinadas pelo reconciler",
+           [({"source": source}, data[source]) for source in ("bulk", "single", "missing")])
+    yield ("channel_reconcile_fixed_total", "counter",
+           "Channels com is_active divergente do estado real, corrigidos", [({}, data["changed"])])
+    yield ("channel_reconcile_errors_total", "counter",
+           "Servidores Evolution sem fetchInstances na rodada", [({}, data["server_errors"])])
+    yield ("channel_reconcile_seconds_total", "counter", "Duração somada das rodadas do reconciler",
+           [({}, data["milliseconds"] / 1000)])
+
+    last = cache.get(LAST_RUN_KEY)
+    if last:
+        yield ("channel_reconcile_last_run_timestamp_seconds", "gauge",
+               "Fim da última rodada do reconciler (epoch)", [({}, round(last["finished_at"], 3))])
+        yield ("channel_reconcile_last_run_seconds", "gauge",
+               "Duração da última rodada do reconciler", [({}, last["seconds"])])
@@ -0,0 +1,91 @@
+"""
+Cache de resolução: nome da instância (Channel.external_id) -> Channel/Workspace.
+
+Todo evento da Evolution traz o nome da instância
+(`wsp-<workspace>__ch-<channel>`). Em regime, resolver isso não deve custar
+query nenhuma:
+
+  - L1/L2: namespace "chres" de apps.core.cache (cópia por processo por até
+    CACHE_L1_TTL, django cache compartilhado por CHANNEL_RESOLVER_TTL);
+  - miss: uma única query para todos os nomes do lote.
+
+Instâncias desconhecidas também são cacheadas (CHANNEL_RESOLVER_NEGATIVE_TTL).
+Create/soft-delete/hard-delete de Channel invalidam via signals
+(apps.channels.signals).
+"""
+import uuid
+from dataclasses import asdict, dataclass
+
+from apps.channels.models import Channel
+from apps.core.cache import namespace
+from django.conf import settings
+
+# get_many não devolve o None cacheado do namespace; desconhecida usa marcador próprio
+_MISSING = "__missing__"
+
+_cache = namespace("chres", l1=True)
+
+
+@dataclass(frozen=True)
+class ChannelRef:
+    id: uuid.UUID
+    workspace_id: uuid.UUID
+    provider: str
+    external_id: str
+
+
+class ChannelResolver:
+    def resolve(self, instance_name: str) -> ChannelRef | None:
+        if not instance_name:
+            return None
+        return self.resolve_many([instance_name]).get(instance_name)
+
+    def resolve_many(self, instance_names) -> dict[str, ChannelRef]:
+        names = {n for n in instance_names if n}
+        if not names:
+            return {}
+
+        found: dict[str, ChannelRef] = {}
+        cached = _cache.get_many(names)
+        misses = []
+        for name in names:
+            value = cached.get(name)
+            if value is None:
+                misses.append(name)
+            elif value != _MISSING:
+                found[name] = ChannelRef(**value)
+
+        if not misses:
+            return found
+
+        rows = Channel.objects.filter(
+            external_id__in=misses,
+            deleted_at__isnull=True,
+        ).values("id", "workspace_id", "provider", "external_id")
+
+        to_cache = {}
+        for row in rows:
+            ref = ChannelRef(
+                id=row["id"],
+                workspace_id=row["workspace_id"],
+                provider=row["provider"],
+                external_id=row["external_id"],
+            )
+            found[ref.external_id] = ref
+            to_cache[ref.external_id] = asdict(ref)
+        if to_cache:
+            _cache.set_many(to_cache, timeout=int(getattr(settings, "CHANNEL_RESOLVER_TTL", 600)))
+
+        unknown = {name: _MISSING for name in misses if name not in found}
+        if unknown:
+            _cache.set_many(unknown, timeout=int(getattr(settings, "CHANNEL_RESOLVER_NEGATIVE_TTL", 15)))
+
+        return found
+
+    def invalidate(self, *instance_names: str):
+        names = [n for n in instance_names if n]
+        if names:
+            _cache.delete_many(names)
+
+
+channel_resolver = ChannelResolver()
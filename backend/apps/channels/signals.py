@@ -0,0 +1,96 @@
+from apps.channels.models import Channel, WorkspaceProvider
+from apps.channels.resolver import channel_resolver
+from apps.core.buffers import BatchBuffer
+from apps.providers.base.resilience import CLOSED, OPEN, breakers
+from apps.providers.llm.gateway import invalidate_credentials
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+
+def _invalidate(*names):
+    names = [n for n in names if n]
+    if not names:
+        return
+    channel_resolver.invalidate(*names)
+    # de novo após o commit: um leitor concorrente pode ter repopulado o cache
+    # com o estado antigo enquanto a transação estava aberta
+    transaction.on_commit(lambda: channel_resolver.invalidate(*names))
+
+
+@receiver(pre_save, sender=Channel)
+def remember_previous_external_id(sender, instance: Channel, **kwargs):
+    if instance._state.adding:
+        instance._previous_external_id = None
+        return
+    instance._previous_external_id = (
+        Channel.objects.filter(pk=instance.pk).values_list("external_id", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Channel)
+def invalidate_on_save(sender, instance: Channel, **kwargs):
+    # cobre create, revive, soft-delete e troca de external_id
+    _invalidate(instance.external_id, getattr(instance, "_previous_external_id", None))
+
+
+@receiver(post_delete, sender=Channel)
+def invalidate_on_delete(sender, instance: Channel, **kwargs):
+    _invalidate(instance.external_id)
+
+
+@receiver(post_save, sender=WorkspaceProvider)
+@receiver(post_delete, sender=WorkspaceProvider)
+def invalidate_llm_credentials(sender, instance: WorkspaceProvider, **kwargs):
+    if instance.provider != WorkspaceProvider.Provider.OPENAI:
+        return
+    invalidate_credentials(instance.workspace_id)
+    transaction.on_commit(lambda: invalidate_credentials(instance.workspace_id))
+
+
+def _write_provider_status(items: dict):
+    """{base_url: (estado do breaker, último erro)} -> WorkspaceProvider.status."""
+    for base_url, (state, last_error) in items.items():
+        providers = WorkspaceProvider.objects.filter(
+            provider=WorkspaceProvider.Provider.EVOLUTION,
+            base_url__in=[base_url, base_url + "/"],
+        )
+        now = timezone.now()
+        if state == OPEN:
+            providers.exclude(status=WorkspaceProvider.Status.ERROR).update(
+                status=WorkspaceProvider.Status.ERROR,
+                last_error=last_error or "circuit open",
+                updated_at=now,
+            )
+        else:
+            providers.filter(status=WorkspaceProvider.Status.ERROR).update(
+                status=WorkspaceProvider.Status.READY,
+                last_error=None,
+                ready_at=now,
+                updated_at=now,
+            )
+
+
+# o breaker vira no thread de quem chamou (event loop do client async, workers
+# do outbox/fan-out): o listener só anota e o banco fica com a thread do buffer
+provider_status_buffer = BatchBuffer(
+    "provider-status",
+    _write_provider_status,
+    interval=float(getattr(settings, "PROVIDER_STATUS_FLUSH_INTERVAL", 5)),
+    max_items=100_000,
+)
+
+
+def sync_provider_status(breaker, old_state: str, new_state: str):
+    """
+    Circuit breaker do base_url mudou: reflete em WorkspaceProvider.status
+    (aberto -> ERROR com o último erro; fechado de novo -> READY). Gravado em
+    lote por provider_status_buffer; a última transição de cada base_url vence.
+    """
+    if new_state in (OPEN, CLOSED):
+        provider_status_buffer.add(breaker.name, (new_state, breaker.last_error))
+
+
+breakers.add_listener(sync_provider_status)
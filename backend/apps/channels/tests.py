@@ -1,3 +1,331 @@
-from django.test import TestCase
+import threading
+import time
 
-# Create your tests here.
+from apps.channels.connection import get_states, record_state
+from apps.channels.models import Channel, WorkspaceProvider
+from apps.channels.pairing import get_pairing, wait_for_pairing
+from apps.channels.provisioning import provision_instance
+from apps.channels.reconciler import reconcile, totals
+from apps.channels.resolver import channel_resolver
+from apps.core import cache as core_cache
+from apps.core.metrics import registry
+from apps.providers.base.http import http_pool
+from apps.providers.evolution.client import EvolutionClient, forget_variants
+from apps.providers.tests import LocalServerMixin, _EvolutionStub
+from apps.tenants.models import Membership, Workspace
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APITestCase
+
+QR_B64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+
+
+class ChannelResolverTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        core_cache.reset()
+        self.workspace = Workspace.objects.create(name="Acme")
+        self.channel = Channel.objects.create(
+            workspace=self.workspace,
+            name="Suporte",
+            provider=Channel.Provider.EVOLUTION,
+            external_id="wsp-1__ch-1",
+        )
+
+    def test_warm_resolution_hits_no_database(self):
+        ref = channel_resolver.resolve("wsp-1__ch-1")
+        self.assertEqual(ref.id, self.channel.id)
+        self.assertEqual(ref.workspace_id, self.workspace.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(channel_resolver.resolve("wsp-1__ch-1"), ref)
+
+        # L1 frio, L2 quente: continua sem query
+        core_cache.reset()
+        with self.assertNumQueries(0):
+            self.assertEqual(channel_resolver.resolve("wsp-1__ch-1"), ref)
+
+    def test_unknown_instance_is_negatively_cached_until_created(self):
+        self.assertIsNone(channel_resolver.resolve("wsp-1__ch-2"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(channel_resolver.resolve("wsp-1__ch-2"))
+
+        other = Channel.objects.create(
+            workspace=self.workspace,
+            name="Vendas",
+            provider=Channel.Provider.EVOLUTION,
+            external_id="wsp-1__ch-2",
+        )
+        self.assertEqual(channel_resolver.resolve("wsp-1__ch-2").id, other.id)
+
+    def test_soft_and_hard_delete_invalidate(self):
+        channel_resolver.resolve("wsp-1__ch-1")
+
+        self.channel.soft_delete()
+        self.channel.save()
+        self.assertIsNone(channel_resolver.resolve("wsp-1__ch-1"))
+
+        self.channel.deleted_at = None
+        self.channel.save()
+        self.assertIsNotNone(channel_resolver.resolve("wsp-1__ch-1"))
+
+        self.channel.delete()
+        self.assertIsNone(channel_resolver.resolve("wsp-1__ch-1"))
+
+
+class PairingLongPollTests(APITestCase):
+    webhook_url = "/api/v1/providers/evolution/webhook/"
+
+    def setUp(self):
+        cache.clear()
+
+    def _post(self, event, data):
+        return self.client.post(
+            self.webhook_url,
+            {"event": event, "instance": "wsp-1__ch-1", "data": data},
+            format="json",
+        )
+
+    def test_webhook_wakes_waiting_long_poll(self):
+        result = {}
+
+        def waiter():
+            t0 = time.monotonic()
+            result["state"] = wait_for_pairing("wsp-1__ch-1", since=0, timeout=10)
+            result["elapsed"] = time.monotonic() - t0
+
+        t = threading.Thread(target=waiter)
+        t.start()
+        time.sleep(0.2)
+
+        # v2: qrcode é um dict com data URL e o "code" (não base64)
+        r = self._post("qrcode.updated", {
+            "qrcode": {"instance": "wsp-1__ch-1", "code": "2@abc,def", "base64": f"data:image/png;base64,{QR_B64}"},
+        })
+        self.assertEqual(r.status_code, 200)
+        t.join(5)
+
+        self.assertLess(result["elapsed"], 5)
+        self.assertEqual(result["state"]["qr_base64"], QR_B64)
+        self.assertEqual(cache.get("evo:qr:wsp-1__ch-1"), QR_B64)
+
+    @override_settings(EVOLUTION_PAIRING_MAX_WAITERS=1)
+    def test_waiters_are_capped_per_process(self):
+        t = threading.Thread(target=wait_for_pairing, args=("wsp-1__ch-1",), kwargs={"timeout": 1})
+        t.start()
+        time.sleep(0.1)
+
+        # a única vaga está ocupada: o segundo não segura o worker
+        t0 = time.monotonic()
+        self.assertIsNone(wait_for_pairing("wsp-1__ch-2", timeout=5))
+        self.assertLess(time.monotonic() - t0, 0.5)
+        t.join(5)
+
+    def test_connection_update_bumps_version_and_clears_qr(self):
+        self._post("QRCODE_UPDATED", {"qrcode": {"base64": QR_B64}})
+        first = get_pairing("wsp-1__ch-1")
+
+        self._post("CONNECTION_UPDATE", {"instance": "wsp-1__ch-1", "state": "open"})
+        state = wait_for_pairing("wsp-1__ch-1", since=first["version"], timeout=1)
+
+        self.assertGreater(state["version"], first["version"])
+        self.assertTrue(state["connected"])
+        self.assertIsNone(state["qr_base64"])
+        self.assertIsNone(cache.get("evo:qr:wsp-1__ch-1"))
+
+
+class _SlowEvolutionV1(_EvolutionStub):
+    """Evolution 1.x: sem /webhook/instance; cada chamada leva DELAY."""
+    DELAY = 0.3
+    calls: list = []
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        self.calls.append(f"{self.command} {self.path}")
+        if self.path == "/":
+            return self._reply(200, {"status": 200, "version": "1.8.2"})
+        time.sleep(self.DELAY)
+        if self.path == "/webhook/instance":
+            return self._reply(404, {"error": "Not Found"})
+        if self.path.startswith("/instance/connect/"):
+            return self._reply(200, {"base64": "data:image/png;base64," + QR_B64})
+        self._reply(201, {"ok": True})
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class ProvisioningTests(LocalServerMixin, SimpleTestCase):
+    handler = _SlowEvolutionV1
+
+    def setUp(self):
+        super().setUp()
+        _SlowEvolutionV1.calls = []
+        forget_variants()
+        self.addCleanup(forget_variants)
+        self.addCleanup(http_pool.close_all)
+
+    def test_setup_stage_runs_in_parallel_and_memoizes_webhook_variant(self):
+        client = EvolutionClient(base_url=self.base_url, api_key="k")
+
+        t0 = time.monotonic()
+        result = provision_instance(client, "inst-1")
+        elapsed = time.monotonic() - t0
+
+        self.assertEqual(result.errors, {})
+        self.assertIn("base64", result.connect)
+        # create + (settings | webhook) em paralelo + connect: ~3 DELAY, não 4
+        self.assertLess(elapsed, 3.8 * _SlowEvolutionV1.DELAY)
+        # connect só depois do webhook registrado (eventos não se perdem)
+        calls = _SlowEvolutionV1.calls
+        self.assertEqual(calls[-1], "GET /instance/connect/inst-1")
+        # versão 1.x detectada: vai direto em /webhook/set, sem tentar a v2
+        self.assertIn("GET /", _SlowEvolutionV1.calls)
+        self.assertIn("POST /webhook/set/inst-1", _SlowEvolutionV1.calls)
+        self.assertNotIn("POST /webhook/instance", _SlowEvolutionV1.calls)
+
+        _SlowEvolutionV1.calls = []
+        provision_instance(client, "inst-2")
+        self.assertNotIn("GET /", _SlowEvolutionV1.calls)
+        self.assertEqual(len(_SlowEvolutionV1.calls), 4)
+
+
+class _StatusStub(_EvolutionStub):
+    calls: list = []
+
+    def do_GET(self):
+        self.calls.append(self.path)
+        super().do_GET()
+
+
+class BulkStatusTests(LocalServerMixin, APITestCase):
+    handler = _StatusStub
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        _StatusStub.calls = []
+        self.addCleanup(http_pool.close_all)
+
+        self.user = get_user_model().objects.create_user(username="u", password="p")
+        self.workspace = Workspace.objects.create(name="Acme")
+        Membership.objects.create(workspace=self.workspace, user=self.user, role=Membership.ROLE_MEMBER)
+        WorkspaceProvider.objects.create(
+            workspace=self.workspace,
+            provider=WorkspaceProvider.Provider.EVOLUTION,
+            base_url=self.base_url,
+            api_key="k",
+            status=WorkspaceProvider.Status.READY,
+        )
+        self.channels = [
+            Channel.objects.create(
+                workspace=self.workspace,
+                name=f"ch{i}",
+                provider=Channel.Provider.EVOLUTION,
+                external_id=f"inst-{i}",
+                is_active=i == 2,
+            )
+            for i in range(3)
+        ]
+        self.client.force_authenticate(self.user)
+
+    def test_serves_cached_state_and_fans_out_only_stale(self):
+        record_state("inst-0", "open", source="webhook")
+        record_state("inst-2", "close", source="webhook")
+
+        r = self.client.get("/api/v1/channels/status/", HTTP_X_WORKSPACE_ID=str(self.workspace.id))
+        self.assertEqual(r.status_code, 200)
+
+        by_instance = {row["instance"]: row for row in r.data["results"]}
+        self.assertEqual(by_instance["inst-0"]["source"], "webhook")
+        self.assertEqual(by_instance["inst-1"]["source"], "poll")
+        self.assertTrue(all(by_instance[f"inst-{i}"]["state"] for i in range(3)))
+        # só a instância sem estado em cache foi consultada
+        self.assertEqual(_StatusStub.calls, ["/instance/connectionState/inst-1"])
+        self.assertIn("inst-1", get_states(["inst-1"]))
+
+        active = dict(Channel.objects.values_list("external_id", "is_active"))
+        self.assertEqual(active, {"inst-0": True, "inst-1": True, "inst-2": False})
+
+    def test_single_status_is_served_from_cache(self):
+        record_state("inst-0", "open", source="reconcile")
+        ch = self.channels[0]
+
+        r = self.client.get(f"/api/v1/channels/{ch.id}/evolution/status/", HTTP_X_WORKSPACE_ID=str(self.workspace.id))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual((r.data["state"], r.data["is_active"]), ("open", True))
+        self.assertEqual(_StatusStub.calls, [])
+
+
+class _FetchInstancesStub(_StatusStub):
+    def do_GET(self):
+        if self.path == "/instance/fetchInstances":
+            self.calls.append(self.path)
+            return self._reply(200, [
+                {"name": "inst-0", "connectionStatus": "open"},
+                {"name": "inst-1", "connectionStatus": "close"},
+                {"name": "outra-instancia", "connectionStatus": "open"},
+            ])
+        super().do_GET()
+
+
+class ReconcilerTests(LocalServerMixin, TestCase):
+    handler = _FetchInstancesStub
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        _StatusStub.calls = []
+        self.addCleanup(http_pool.close_all)
+
+        workspace = Workspace.objects.create(name="Acme")
+        WorkspaceProvider.objects.create(
+            workspace=workspace,
+            provider=WorkspaceProvider.Provider.EVOLUTION,
+            base_url=self.base_url,
+            api_key="k",
+        )
+        for i in range(3):
+            Channel.objects.create(
+                workspace=workspace,
+                name=f"ch{i}",
+                provider=Channel.Provider.EVOLUTION,
+                external_id=f"inst-{i}",
+                is_active=i == 1,
+            )
+
+    def test_bulk_fetch_with_fallback_and_only_changed_rows(self):
+        result = reconcile()
+
+        self.assertEqual((result.servers, result.instances), (1, 3))
+        self.assertEqual((result.bulk, result.single, result.missing), (2, 1, 0))
+        self.assertEqual(result.changed, 3)
+        self.assertEqual(
+            {k: v for k, v in totals().items() if k != "milliseconds"},
+            {"runs": 1, "bulk": 2, "single": 1, "missing": 0, "changed": 3, "server_errors": 0},
+        )
+        self.assertEqual(
+            _StatusStub.calls,
+            ["/instance/fetchInstances", "/instance/connectionState/inst-2"],
+        )
+        active = dict(Channel.objects.values_list("external_id", "is_active"))
+        self.assertEqual(active, {"inst-0": True, "inst-1": False, "inst-2": True})
+        self.assertEqual(get_states(["inst-0"])["inst-0"]["source"], "reconcile")
+
+        # nada mudou: nenhum UPDATE
+        with self.assertNumQueries(2):
+            self.assertEqual(reconcile().changed, 0)
+
+    def test_run_totals_reach_the_web_metrics_through_the_cache(self):
+        reconcile()
+        reconcile()
+
+        # o /metrics é de outro processo: só vê o que ficou no cache
+        body = registry.render()
+        self.assertIn("channel_reconcile_runs_total 2", body)
+        self.assertIn('channel_reconcile_instances_total{source="bulk"} 4', body)
+        self.assertIn("channel_reconcile_fixed_total 3", body)
+        self.assertIn("channel_reconcile_last_run_timestamp_seconds", body)
@@ -1,14 +1,20 @@
 import re
-import time
 
+from apps.channels.connection import (extract_state, get_states, is_stale,
+                                      record_state, refresh_states,
+                                      sync_active_flags)
 from apps.channels.models import Channel, WorkspaceProvider
+from apps.channels.pairing import (extract_pairing_code, extract_qr_data_url,
+                                   get_pairing, publish_pairing,
+                                   wait_for_pairing)
+from apps.channels.provisioning import provision_instance
 from apps.channels.serializers import (ChannelCreateSerializer,
                                        ChannelSerializer)
 from apps.providers.evolution.client import (EvolutionClient,
-                                             EvolutionClientError)
+                                             EvolutionClientError,
+                                             EvolutionUnavailable)
 from apps.tenants.mixins import WorkspaceRequiredMixin
 from django.conf import settings
-from django.core.cache import cache
 from django.db import IntegrityError, transaction
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
@@ -32,95 +38,6 @@ def normalize_phone_br(raw: str) -> str:
     return digits
 
 
-def extract_pairing_code(payload):
-    """Tenta achar pairing code em formatos variados."""
-    if not isinstance(payload, dict):
-        return None
-
-    def pick(d):
-        if not isinstance(d, dict):
-            return None
-        return d.get("pairingCode") or d.get("pairing_code") or d.get("code")
-
-    code = pick(payload)
-    if code:
-        return code
-
-    for key in ("response", "data", "result", "instance"):
-        code = pick(payload.get(key))
-        if code:
-            return code
-
-    return None
-
-
-def extract_qr_data_url(payload):
-    """
-    Evolution pode devolver QR em formatos diferentes:
-      - payload["qrcode"]["base64"] (às vezes já vem com data:image/png;base64,...)
-      - payload["base64"]
-      - payload["code"] (em alguns builds isso NÃO é base64: vem tipo "2@...,1@...")
-    Queremos devolver:
-      - qr_base64 (somente base64)
-      - qr_data_url (data:image/png;base64,...)
-    """
-    import re
-
-    if not isinstance(payload, dict):
-        return None, None
-
-    # coletar candidatos em ordem de prioridade (mais confiável primeiro)
-    candidates = []
-
-    qrcode = payload.get("qrcode")
-    if isinstance(qrcode, dict):
-        b64 = qrcode.get("base64")
-        if b64:
-            candidates.append(b64)
-
-    if payload.get("base64"):
-        candidates.append(payload.get("base64"))
-
-    # code é o mais suspeito (às vezes NÃO é base64)
-    if payload.get("code"):
-        candidates.append(payload.get("code"))
-
-    def normalize(v: str):
-        if not isinstance(v, str):
-            return None, None
-        v = v.strip()
-        if not v:
-            return None, None
-
-        # já é data url
-        if v.startswith("data:image"):
-            # extrai base64 se for possível
-            if "base64," in v:
-                return v.split("base64,", 1)[1].strip(), v
-            return None, v
-
-        # se tiver caracteres típicos de "code" (2@..., vírgulas, @), NÃO é base64
-        if ("@" in v) or ("," in v):
-            return None, None
-
-        # valida aparência de base64 (bem permissivo, mas barra coisas bizarras)
-        if not re.fullmatch(r"[A-Za-z0-9+/=\s]+", v):
-            return None, None
-
-        b64 = v.replace("\n", "").replace("\r", "").strip()
-        if len(b64) < 50:
-            return None, None
-
-        return b64, f"data:image/png;base64,{b64}"
-
-    for c in candidates:
-        b64, url = normalize(c)
-        if b64 or url:
-            return b64, url
-
-    return None, None
-
-
 class ChannelViewSet(WorkspaceRequiredMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     http_method_names = ["get", "post", "patch", "delete", "head", "options"]
@@ -136,13 +53,24 @@ class ChannelViewSet(WorkspaceRequiredMixin, viewsets.ModelViewSet):
                 "status": WorkspaceProvider.Status.READY,
             },
         )
-
-        if wp.status != WorkspaceProvider.Status.READY:
-            wp.status = WorkspaceProvider.Status.READY
-            wp.save(update_fields=["status", "updated_at"])
-
+        # status depois da criação é do circuit breaker (apps.channels.signals):
+        # ERROR enquanto o servidor estiver fora, READY quando voltar
         return wp
 
+    def handle_exception(self, exc):
+        # servidor Evolution fora / circuito aberto: 503 rápido em vez de 500
+        if isinstance(exc, EvolutionUnavailable):
+            headers = {}
+            if exc.retry_after:
+                headers["Retry-After"] = str(max(1, int(exc.retry_after)))
+            return Response(
+                {"detail": "Evolution indisponível no momento. Tente novamente em instantes.",
+                    "error": str(exc)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers=headers,
+            )
+        return super().handle_exception(exc)
+
     def _client_for_workspace(self, workspace) -> EvolutionClient:
         wp = self._get_or_create_workspace_evolution(workspace)
         return EvolutionClient(base_url=wp.base_url, api_key=wp.api_key)
@@ -224,12 +152,14 @@ class ChannelViewSet(WorkspaceRequiredMixin, viewsets.ModelViewSet):
     @action(detail=True, methods=["post"], url_path="evolution/connect")
     def evolution_connect(self, request, pk=None):
         """
-        Fluxo (robusto para Baileys/QR):
+        Fluxo (robusto para Baileys/QR), sem esperar o QR:
           1) cria instância (tolerante a already exists)
-          2) tenta pairing_code se prefer_pairing=true e number existir
-          3) tenta gerar QR por GET /instance/connect/{instance} (sem number)
-             - alguns builds retornam {"count":0} por alguns segundos -> fazemos retry até qr_timeout_s
-          4) se não veio QR, tenta pairing_code como fallback (se number existir)
+          2) em paralelo (apps.channels.provisioning): settings, webhook e
+             connect — pairing code se prefer_pairing=true e number existir,
+             senão QR por GET /instance/connect/{instance}
+          3) pairing pedido mas sem code: cai para o QR
+             - alguns builds retornam {"count":0} por alguns segundos -> o QR
+               chega pelo webhook e é entregue em evolution/pairing/
         """
         channel = self.get_object()
 
@@ -242,7 +172,6 @@ class ChannelViewSet(WorkspaceRequiredMixin, viewsets.ModelViewSet):
         phone_raw = request.data.get(
             "phone_number") or request.data.get("number") or ""
         prefer_pairing = bool(request.data.get("prefer_pairing"))
-        timeout_s = int(request.data.get("qr_timeout_s") or 45)
 
         number = None
         if phone_raw:
@@ -251,137 +180,94 @@ class ChannelViewSet(WorkspaceRequiredMixin, viewsets.ModelViewSet):
             except ValueError as e:
                 return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 1) cria instância
-        create_payload = None
+        # 1-2) create + estágio paralelo
         try:
-            create_payload = client.create_instance(instance_name)
+            setup = provision_instance(
+                client,
+                instance_name,
+                pairing_number=number if prefer_pairing else None,
+            )
+        except EvolutionUnavailable:
+            raise
         except EvolutionClientError as e:
-            msg = str(e).lower()
-            if "already" in msg and "exist" in msg:
-                create_payload = {"warning": "instance already exists"}
-            else:
-                return Response(
-                    {"detail": "Falha ao criar instância na Evolution.",
-                        "instance": instance_name, "error": str(e)},
-                    status=status.HTTP_502_BAD_GATEWAY,
-                )
+            return Response(
+                {"detail": "Falha ao criar instância na Evolution.",
+                    "instance": instance_name, "error": str(e)},
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
 
-        # 1.5) settings (best-effort)
-        settings_payload = None
-        try:
-            settings_payload = client.set_settings(
-                instance_name,
+        create_payload = setup.create
+        settings_payload = setup.settings
+
+        if "webhook" in setup.errors:
+            # sem webhook não chegam QR novos, conexão nem mensagens
+            return Response(
                 {
-                    "preferQr": True,
-                    "preferPairingCode": False,  # Baileys em alguns builds não retorna code
-                    "linkingMode": "qr",
-                    "pairing": False,
-                    "qrcode": True,
-                    "mode": "qr",
+                    "detail": "Falha ao configurar webhook na Evolution.",
+                    "channel_id": str(channel.id),
+                    "instance": instance_name,
+                    "error": str(setup.errors["webhook"]),
+                    "raw": {"create": create_payload, "settings": settings_payload},
                 },
+                status=status.HTTP_502_BAD_GATEWAY,
             )
-        except EvolutionClientError:
-            settings_payload = {"warning": "set_settings failed (best-effort)"}
-
-        webhook_url = getattr(settings, "PUBLIC_BASE_URL", "http://backend:8000").rstrip("/") + \
-            "/api/v1/providers/evolution/webhook/"
-
-        client.set_webhook(
-            instance_name,
-            url=webhook_url,
-            events=[
-                "MESSAGES_UPSERT",
-                "CONNECTION_UPDATE",
-                "QRCODE_UPDATED",
-            ],
-        )
 
-        # 2) pairing preferencial (se pedido)
         pairing_payload = None
-        pairing_code = None
+        last_qr_payload = setup.connect
         if prefer_pairing and number:
-            try:
-                pairing_payload = client.connect_pairing_code(
-                    instance_name, number=number)
-                pairing_code = extract_pairing_code(pairing_payload)
-            except EvolutionClientError:
-                pairing_payload = {
-                    "warning": "pairing connect failed (ignored)"}
+            pairing_payload = setup.connect or {"warning": "pairing connect failed (ignored)"}
+            pairing_code = extract_pairing_code(setup.connect)
 
             if pairing_code:
+                pairing = publish_pairing(instance_name, pairing_code=pairing_code)
                 return Response(
                     {
                         "channel_id": str(channel.id),
                         "instance": instance_name,
                         "connection_mode": "pairing",
                         "pairing_code": pairing_code,
+                        "version": pairing["version"],
                         "raw": {"create": create_payload, "settings": settings_payload, "pairing": pairing_payload},
                     },
                     status=status.HTTP_200_OK,
                 )
 
-        # 3) QR FLOW: retry até timeout_s
-        last_qr_payload = None
-        qr_base64 = None
-        qr_data_url = None
-
-        t0 = time.time()
-        while time.time() - t0 < timeout_s:
+            # 3) sem pairing code: QR
             try:
-                last_qr_payload = client._request(
-                    "GET", f"/instance/connect/{instance_name}")
+                last_qr_payload = client.connect(instance_name)
             except EvolutionClientError as e:
-                return Response(
-                    {
-                        "detail": "Falha ao gerar QR Code na Evolution.",
-                        "channel_id": str(channel.id),
-                        "instance": instance_name,
-                        "error": str(e),
-                        "raw": {"create": create_payload, "settings": settings_payload, "pairing": pairing_payload},
-                    },
-                    status=status.HTTP_502_BAD_GATEWAY,
-                )
-
-            qr_base64, qr_data_url = extract_qr_data_url(last_qr_payload)
-
-            if qr_base64 or qr_data_url:
-                break
-
-            # fallback extra: se algum webhook seu salvar no cache
-            cached = cache.get(f"evo:qr:{instance_name}")
-            if cached:
-                qr_base64 = cached
-                qr_data_url = f"data:image/png;base64,{cached}"
-                break
+                setup.errors["connect"] = e
 
-            time.sleep(2)
-
-        # 4) se ainda não veio QR, tenta pairing (se tiver number)
-        if not qr_base64 and not qr_data_url and number:
-            try:
-                pairing_payload2 = client.connect_pairing_code(
-                    instance_name, number=number)
-                pairing_code2 = extract_pairing_code(pairing_payload2)
-                if pairing_code2:
-                    return Response(
-                        {
-                            "channel_id": str(channel.id),
-                            "instance": instance_name,
-                            "connection_mode": "pairing",
-                            "pairing_code": pairing_code2,
-                            "raw": {
-                                "create": create_payload,
-                                "settings": settings_payload,
-                                "pairing_fallback": pairing_payload2,
-                                "connect": last_qr_payload,
-                            },
-                        },
-                        status=status.HTTP_200_OK,
-                    )
-            except EvolutionClientError:
-                pass
+        # QR: uma chamada só. Se ainda não veio, ele chega pelo webhook
+        # (QRCODE_UPDATED) e o frontend espera em evolution/pairing/ (long-poll),
+        # sem prender este worker.
+        if "connect" in setup.errors:
+            return Response(
+                {
+                    "detail": "Falha ao gerar QR Code na Evolution.",
+                    "channel_id": str(channel.id),
+                    "instance": instance_name,
+                    "error": str(setup.errors["connect"]),
+                    "raw": {"create": create_payload, "settings": settings_payload, "pairing": pairing_payload},
+                },
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
 
-        # Mesmo sem QR, devolve 200 (frontend pode re-chamar /connect/).
+        qr_base64, qr_data_url = extract_qr_data_url(last_qr_payload)
+        if not (qr_base64 or qr_data_url):
+            # v1 já devolve o QR no próprio create (qrcode=true)
+            qr_base64, qr_data_url = extract_qr_data_url(create_payload)
+
+        if qr_base64:
+            pairing = publish_pairing(instance_name, qr_base64=qr_base64)
+        else:
+            # o webhook pode ter chegado antes da resposta do connect
+            pairing = get_pairing(instance_name) or {}
+            if not qr_data_url and pairing.get("qr_base64"):
+                qr_base64 = pairing["qr_base64"]
+                qr_data_url = f"data:image/png;base64,{qr_base64}"
+
+        # Mesmo sem QR, devolve 200: o QR vem por evolution/pairing/?since=<version>.
         return Response(
             {
                 "channel_id": str(channel.id),
@@ -389,6 +275,7 @@ class ChannelViewSet(WorkspaceRequiredMixin, viewsets.ModelViewSet):
                 "connection_mode": "qr",
                 "qr_base64": qr_base64,
                 "qr_data_url": qr_data_url,
+                "version": pairing.get("version", 0),
                 "raw": {
                     "create": create_payload,
                     "settings": settings_payload,
@@ -399,6 +286,44 @@ class ChannelViewSet(WorkspaceRequiredMixin, viewsets.ModelViewSet):
             status=status.HTTP_200_OK,
         )
 
+    @action(detail=True, methods=["get"], url_path="evolution/pairing")
+    def evolution_pairing(self, request, pk=None):
+        """
+        Estado do pareamento (QR novo, pairing code ou conexão) com versão.
+        Short poll: o cliente repete a cada `poll_after` segundos com
+        `since=<versão>`. `wait` só segura o request se EVOLUTION_PAIRING_MAX_WAIT
+        permitir (acordado pelo webhook via pub/sub; ver apps.channels.pairing).
+        """
+        channel = self.get_object()
+
+        if channel.provider != Channel.Provider.EVOLUTION or not channel.external_id:
+            return Response({"detail": "Evolution not initialized for this channel."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            since = int(request.query_params.get("since") or 0)
+            wait = float(request.query_params.get("wait") or 0)
+        except ValueError:
+            return Response({"detail": "since/wait inválidos."}, status=status.HTTP_400_BAD_REQUEST)
+        wait = max(0.0, min(wait, float(getattr(settings, "EVOLUTION_PAIRING_MAX_WAIT", 0))))
+
+        state = wait_for_pairing(channel.external_id, since=since, timeout=wait) or {}
+        qr_base64 = state.get("qr_base64")
+
+        return Response(
+            {
+                "channel_id": str(channel.id),
+                "instance": channel.external_id,
+                "version": state.get("version", since),
+                "changed": state.get("version", 0) > since,
+                "poll_after": float(getattr(settings, "EVOLUTION_PAIRING_POLL_INTERVAL", 2)),
+                "state": state.get("state", ""),
+                "connected": bool(state.get("connected")),
+                "qr_base64": qr_base64,
+                "qr_data_url": f"data:image/png;base64,{qr_base64}" if qr_base64 else None,
+                "pairing_code": state.get("pairing_code"),
+            }
+        )
+
     @action(detail=True, methods=["get"], url_path="evolution/status")
     def evolution_status(self, request, pk=None):
         channel = self.get_object()
@@ -406,37 +331,72 @@ class ChannelViewSet(WorkspaceRequiredMixin, viewsets.ModelViewSet):
         if channel.provider != Channel.Provider.EVOLUTION or not channel.external_id:
             return Response({"detail": "Evolution not initialized for this channel."}, status=status.HTTP_400_BAD_REQUEST)
 
-        client = self._client_for_workspace(request.workspace)
-        st = client.get_status(channel.external_id)
-
-        def pick_state(obj):
-            if not isinstance(obj, dict):
-                return ""
-            return (
-                obj.get("state")
-                or obj.get("status")
-                or (obj.get("instance") or {}).get("state")
-                or (obj.get("instance") or {}).get("status")
-                or ""
-            )
+        # estado vem do cache (webhook/reconcile_channels); Evolution só se
+        # não houver estado recente ou com ?refresh=1
+        entry = get_states([channel.external_id]).get(channel.external_id)
+        force = request.query_params.get("refresh", "").strip().lower() in {"1", "true", "yes", "y"}
 
-        state = (pick_state(st) or "").lower()
-        connected = state in {"open", "connected", "online"}
+        st = None
+        if force or is_stale(entry):
+            client = self._client_for_workspace(request.workspace)
+            st = client.get_status(channel.external_id)
+            entry = record_state(channel.external_id, extract_state(st), source="poll")
 
-        if connected and not channel.is_active:
-            channel.is_active = True
-            channel.save(update_fields=["is_active"])
+        sync_active_flags([channel], {channel.external_id: entry})
 
         return Response(
             {
                 "channel_id": str(channel.id),
                 "instance": channel.external_id,
-                "state": state,
-                "status": st,
+                "state": entry["state"],
+                "status": st if st is not None else entry,
                 "is_active": channel.is_active,
             }
         )
 
+    @action(detail=False, methods=["get"], url_path="status")
+    def bulk_status(self, request):
+        """
+        Status de todos os canais do workspace numa chamada.
+        Estado vem do cache (mantido pelo webhook CONNECTION_UPDATE); só as
+        instâncias sem estado ou com estado velho vão à Evolution, em paralelo
+        com concorrência limitada. `?refresh=0` não consulta a Evolution.
+        """
+        channels = list(self.get_queryset().filter(deleted_at__isnull=True))
+        evolution = [
+            ch for ch in channels
+            if ch.provider == Channel.Provider.EVOLUTION and ch.external_id
+        ]
+
+        states = get_states(ch.external_id for ch in evolution)
+        stale = [ch.external_id for ch in evolution if is_stale(states.get(ch.external_id))]
+
+        refresh = request.query_params.get("refresh", "1").strip().lower() not in {"0", "false", "no", "n"}
+        if stale and refresh:
+            client = self._client_for_workspace(request.workspace)
+            states.update(refresh_states(client, stale))
+
+        sync_active_flags(evolution, states)
+
+        results = []
+        for ch in channels:
+            entry = states.get(ch.external_id) if ch.external_id else None
+            results.append(
+                {
+                    "channel_id": str(ch.id),
+                    "name": ch.name,
+                    "provider": ch.provider,
+                    "instance": ch.external_id,
+                    "state": entry["state"] if entry else None,
+                    "connected": entry["connected"] if entry else None,
+                    "checked_at": entry["checked_at"] if entry else None,
+                    "source": entry["source"] if entry else None,
+                    "stale": ch in evolution and is_stale(entry),
+                    "is_active": ch.is_active,
+                }
+            )
+        return Response({"results": results})
+
     @action(detail=False, methods=["get"], url_path="workspace/evolution")
     def workspace_evolution_status(self, request):
         wp = self._get_or_create_workspace_evolution(request.workspace)
@@ -1,3 +1,16 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Contact, Conversation
+
+
+@admin.register(Contact)
+class ContactAdmin(admin.ModelAdmin):
+    list_display = ("id", "external_id", "name", "channel", "updated_at")
+    search_fields = ("id", "external_id", "name")
+
+
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ("id", "channel", "contact", "status", "last_message_at")
+    list_filter = ("status",)
+    list_select_related = ("channel", "contact")
@@ -0,0 +1,121 @@
+"""
+Janela de histórico por conversa (últimas mensagens para o prompt).
+
+`Conversation.recent_messages` é um ring buffer JSON com as últimas
+CONVERSATION_HISTORY_SIZE mensagens com texto, em ordem cronológica:
+
+    [{"id": "<message uuid>", "d": "in" | "out", "t": "texto", "n": <tokens>}, ...]
+
+- escrito por quem cria Messages (ingest em lote, enqueue_outbound) com um
+  único UPDATE ... FROM (VALUES ...) que concatena e corta no banco — atômico
+  por linha, sem read-modify-write em Python;
+- lido junto com a Conversation (o run do agent já a carrega): montar o
+  histórico não toca a tabela de mensagens;
+- `n` é a estimativa de tokens (~4 caracteres por token), calculada uma vez
+  na escrita, para cortar a janela por orçamento de tokens.
+"""
+import json
+
+from django.conf import settings
+from django.db import connection
+
+from apps.conversations.models import Conversation
+
+# texto longo não vira histórico inteiro: o ring buffer fica compacto
+MAX_ENTRY_CHARS = 2000
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, (len(text) + 3) // 4) if text else 0
+
+
+def window_size() -> int:
+    return int(getattr(settings, "CONVERSATION_HISTORY_SIZE", 20))
+
+
+def entry_for(message) -> dict | None:
+    text = (message.text or "").strip()
+    if not text:
+        return None
+    text = text[:MAX_ENTRY_CHARS]
+    return {"id": str(message.id), "d": message.direction, "t": text, "n": estimate_tokens(text)}
+
+
+def append(messages) -> int:
+    """
+    Acrescenta as mensagens (já ordenadas cronologicamente) às janelas das
+    suas conversas. Uma query para o lote todo.
+    """
+    by_conversation: dict = {}
+    for msg in messages:
+        entry = entry_for(msg)
+        if entry is not None:
+            by_conversation.setdefault(msg.conversation_id, []).append(entry)
+    if not by_conversation:
+        return 0
+
+    table = Conversation._meta.db_table
+    values = ", ".join(["(%s::uuid, %s::jsonb)"] * len(by_conversation))
+    params = []
+    for conversation_id, entries in by_conversation.items():
+        params += [str(conversation_id), json.dumps(entries)]
+    sql = f"""
+        UPDATE {table} AS c SET recent_messages = (
+            SELECT COALESCE(jsonb_agg(e ORDER BY i), '[]'::jsonb) FROM (
+                SELECT e, i
+                FROM jsonb_array_elements(c.recent_messages || v.entries) WITH ORDINALITY AS t(e, i)
+                ORDER BY i DESC
+                LIMIT %s
+            ) AS last_n
+        )
+        FROM (VALUES {values}) AS v(id, entries)
+        WHERE c.id = v.id
+    """
+    with connection.cursor() as cur:
+        cur.execute(sql, [window_size()] + params)
+        return cur.rowcount
+
+
+def within_budget(entries: list[dict], max_tokens: int | None) -> tuple[list[dict], bool]:
+    """
+    Sufixo mais recente de `entries` (cronológicas) cuja soma de `n` cabe em
+    `max_tokens` — a última entrada sempre entra, mesmo maior que o orçamento.
+    Devolve (entradas em ordem cronológica, se o orçamento cortou alguma).
+    """
+    picked = []
+    budget = max_tokens
+    for entry in reversed(entries):
+        if budget is not None:
+            if picked and entry["n"] > budget:
+                picked.reverse()
+                return picked, True
+            budget -= entry["n"]
+        picked.append(entry)
+    picked.reverse()
+    return picked, False
+
+
+def recent(conversation: Conversation, *, limit: int, max_tokens: int | None = None,
+           until_message_id=None) -> list[dict] | None:
+    """
+    Últimas `limit` entradas (até `until_message_id`, inclusive) que cabem em
+    `max_tokens`. None se a janela não cobre o pedido (conversa anterior ao
+    ring buffer, mensagem já fora da janela ou `limit` maior que o que sobrou
+    numa janela cheia): o chamador cai para o banco.
+    """
+    entries = conversation.recent_messages or []
+    # janela cheia: pode haver mensagens mais antigas que já saíram do ring buffer
+    truncated = len(entries) >= window_size()
+    if until_message_id is not None:
+        ids = [e["id"] for e in entries]
+        try:
+            entries = entries[:ids.index(str(until_message_id)) + 1]
+        except ValueError:
+            return None
+    if not entries:
+        return None
+
+    picked, cut = within_budget(entries[-limit:] if limit else [], max_tokens)
+    if not cut and truncated and len(picked) < limit:
+        return None
+    return picked
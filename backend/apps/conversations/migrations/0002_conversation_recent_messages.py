@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-19 08:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='recent_messages',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
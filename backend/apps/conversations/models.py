@@ -1,3 +1,88 @@
+import uuid
+
 from django.db import models
 
-# Create your models here.
+
+class Contact(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    workspace = models.ForeignKey(
+        "tenants.Workspace",
+        on_delete=models.CASCADE,
+        related_name="contacts",
+    )
+    channel = models.ForeignKey(
+        "channels.Channel",
+        on_delete=models.CASCADE,
+        related_name="contacts",
+    )
+
+    # telefone (ou jid, p/ grupos) do lado do provider
+    external_id = models.CharField(max_length=200)
+    name = models.CharField(max_length=255, blank=True, default="")
+
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # chave do upsert no ingest (ON CONFLICT)
+            models.UniqueConstraint(
+                fields=["channel", "external_id"],
+                name="uniq_contact_external_per_channel",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["workspace", "external_id"], name="contact_ws_external_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return self.name or self.external_id
+
+
+class Conversation(models.Model):
+    class Status(models.TextChoices):
+        OPEN = "open", "open"
+        CLOSED = "closed", "closed"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    workspace = models.ForeignKey(
+        "tenants.Workspace",
+        on_delete=models.CASCADE,
+        related_name="conversations",
+    )
+    channel = models.ForeignKey(
+        "channels.Channel",
+        on_delete=models.CASCADE,
+        related_name="conversations",
+    )
+    contact = models.ForeignKey(
+        Contact,
+        on_delete=models.CASCADE,
+        related_name="conversations",
+    )
+
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.OPEN)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    # ring buffer das últimas mensagens para o prompt (apps.conversations.history)
+    recent_messages = models.JSONField(default=list, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # uma conversa por (channel, contact): chave do upsert no ingest
+            models.UniqueConstraint(
+                fields=["channel", "contact"],
+                name="uniq_conversation_per_channel_contact",
+            ),
+        ]
+        indexes = [
+            # inbox: conversas do workspace mais recentes primeiro
+            models.Index(fields=["workspace", "-last_message_at"], name="conv_ws_last_msg_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Conversation(channel={self.channel_id}, contact={self.contact_id})"
@@ -1,3 +1,81 @@
 from django.test import TestCase
 
-# Create your tests here.
+from apps.channels.models import Channel
+from apps.conversations import history
+from apps.conversations.models import Contact, Conversation
+from apps.messages.ingest import process_pending_events
+from apps.messages.models import Message
+from apps.messages.tests import upsert_payload
+from apps.tenants.models import Workspace
+from apps.webhooks.models import WebhookEvent
+
+
+class HistoryWindowTests(TestCase):
+    def setUp(self):
+        self.workspace = Workspace.objects.create(name="Acme")
+        self.channel = Channel.objects.create(
+            workspace=self.workspace, name="Suporte", provider=Channel.Provider.EVOLUTION, external_id="wsp-1__ch-1")
+        self.conversations = []
+        for phone in ("5516999990001", "5516999990002"):
+            contact = Contact.objects.create(workspace=self.workspace, channel=self.channel, external_id=phone)
+            self.conversations.append(
+                Conversation.objects.create(workspace=self.workspace, channel=self.channel, contact=contact))
+
+    def _message(self, conversation, text, direction="in"):
+        return Message.objects.create(
+            workspace=self.workspace, channel=self.channel, conversation=conversation,
+            direction=direction, status="received", text=text,
+        )
+
+    def test_append_keeps_last_n_in_order_with_one_query(self):
+        first, second = self.conversations
+        batch = [self._message(first, f"m{i}") for i in range(5)] + [self._message(second, "outra")]
+
+        with self.settings(CONVERSATION_HISTORY_SIZE=3), self.assertNumQueries(1):
+            history.append(batch)
+        with self.settings(CONVERSATION_HISTORY_SIZE=3):
+            history.append([self._message(first, "resposta", direction="out"), self._message(first, "")])
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual([(e["d"], e["t"]) for e in first.recent_messages],
+                         [("in", "m3"), ("in", "m4"), ("out", "resposta")])
+        self.assertEqual([e["t"] for e in second.recent_messages], ["outra"])
+
+    def test_recent_respects_limit_budget_and_trigger(self):
+        conversation = self.conversations[0]
+        messages = [self._message(conversation, text) for text in ("a" * 40, "b" * 8, "c" * 8, "d" * 8)]
+        history.append(messages)
+        conversation.refresh_from_db()
+
+        tail = history.recent(conversation, limit=10, until_message_id=messages[2].id)
+        self.assertEqual([e["t"][0] for e in tail], ["a", "b", "c"])
+        self.assertEqual([e["t"][0] for e in history.recent(conversation, limit=2)], ["c", "d"])
+        # 40 chars ~ 10 tokens: não cabe num orçamento de 8
+        self.assertEqual([e["t"][0] for e in history.recent(conversation, limit=10, max_tokens=8)],
+                         ["b", "c", "d"])
+        self.assertIsNone(history.recent(conversation, limit=10, until_message_id="fora-da-janela"))
+
+    def test_limit_beyond_full_window_falls_back_to_database(self):
+        conversation = self.conversations[0]
+        with self.settings(CONVERSATION_HISTORY_SIZE=3):
+            history.append([self._message(conversation, f"m{i}") for i in range(5)])
+            conversation.refresh_from_db()
+
+            self.assertEqual([e["t"] for e in history.recent(conversation, limit=3)], ["m2", "m3", "m4"])
+            self.assertIsNone(history.recent(conversation, limit=5))
+            # o orçamento de tokens corta antes do começo da janela: ela basta
+            self.assertEqual([e["t"] for e in history.recent(conversation, limit=5, max_tokens=1)], ["m4"])
+
+    def test_ingest_fills_window_once_per_message(self):
+        for key, payload in (
+            ("1", upsert_payload("wsp-1__ch-1", "A1", "oi")),
+            ("2", upsert_payload("wsp-1__ch-1", "A2", "tudo bem?")),
+            ("3", {**upsert_payload("wsp-1__ch-1", "A1", "oi"), "date_time": "x"}),
+        ):
+            WebhookEvent.objects.create(provider="evolution", idempotency_key=key, raw_payload=payload)
+
+        process_pending_events()
+
+        conversation = Conversation.objects.get(contact__external_id="5516999990000")
+        self.assertEqual([e["t"] for e in conversation.recent_messages], ["oi", "tudo bem?"])
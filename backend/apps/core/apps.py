@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.core'
+
+    def ready(self):
+        from apps.core import cache, db
+        from apps.core.metrics import registry
+
+        db.check_timezone()
+        registry.register_collector(db.collect)
+        registry.register_collector(cache.collect)
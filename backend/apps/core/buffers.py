@@ -0,0 +1,103 @@
+"""
+Buffer de escritas em lote.
+
+Para dados "quentes" que não precisam ser gravados a cada request (ex.:
+ApiKey.last_used_at): acumula por chave (última escrita vence) e descarrega
+tudo de uma vez — a cada `interval` segundos numa thread de fundo ou quando
+o buffer passa de `max_items`.
+
+O estado é por processo; no pior caso (processo morto) perde-se no máximo um
+intervalo de atualizações. Flush que falha volta para o buffer (escritas mais
+novas da mesma chave vencem) e é tentado de novo nos próximos flushes; depois
+de `retries` falhas seguidas o lote é descartado e contado em
+batch_buffer_dropped_total.
+"""
+import atexit
+import logging
+import threading
+
+from django.db import close_old_connections
+
+from apps.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+DROPPED = registry.counter(
+    "batch_buffer_dropped_total", "Itens descartados após falhas seguidas de flush", ["buffer"])
+
+
+class BatchBuffer:
+    def __init__(self, name: str, flush_fn, *, interval: float = 10.0, max_items: int = 1000,
+                 retries: int = 0):
+        """flush_fn(items: dict) grava o lote; roda fora do lock."""
+        self.name = name
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_items = max_items
+        self.retries = retries
+        self._failures = 0
+
+        self._items: dict = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def add(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            full = len(self._items) >= self.max_items
+        self._ensure_started()
+        if full:
+            self.flush()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def flush(self) -> int:
+        with self._lock:
+            items, self._items = self._items, {}
+        if not items:
+            return 0
+        # um flush por vez: lotes não se atropelam no banco
+        with self._flush_lock:
+            try:
+                self.flush_fn(items)
+            except Exception:
+                self._failed(items)
+                return 0
+            self._failures = 0
+        return len(items)
+
+    def _failed(self, items: dict):
+        self._failures += 1
+        if self._failures <= self.retries:
+            logger.warning("batch buffer %s: flush failed (%d items), attempt %d/%d, requeued",
+                           self.name, len(items), self._failures, self.retries + 1, exc_info=True)
+            with self._lock:
+                self._items = {**items, **self._items}
+            return
+        logger.exception("batch buffer %s: flush failed (%d items), dropped", self.name, len(items))
+        DROPPED.inc(len(items), buffer=self.name)
+        self._failures = 0
+
+    def _ensure_started(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=f"buffer-{self.name}", daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+            # conexão da thread de fundo segue CONN_MAX_AGE como a de um request
+            close_old_connections()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
@@ -0,0 +1,320 @@
+"""
+Camada de cache compartilhada.
+
+Em cima do `django.core.cache.cache` (Redis com REDIS_URL, LocMem sem) adiciona:
+
+  - namespace: toda chave vira "{namespace}:{chave}"; `tenant(workspace_id, nome)`
+    isola as chaves de um workspace ("t:{workspace_id}:{nome}:...");
+  - L1 opcional: cópia em memória do processo por até CACHE_L1_TTL segundos
+    para chaves lidas a todo request (auth, acesso ao workspace). Deletes no
+    mesmo processo limpam o L1 na hora; nos outros, a cópia expira sozinha;
+  - stampede: `get_or_set` carrega uma vez só por chave — threads do mesmo
+    processo esperam no Future da carga em curso (o lock local só protege o
+    registro dele, nunca o loader) e processos diferentes num lock no cache
+    (cache.add); quem espera relê o valor em vez de chamar o loader;
+  - cache negativo: loader que devolve None pode ser guardado (`none_timeout`);
+  - métricas: hits/misses/loads por namespace (`stats()`).
+
+    access = namespace("apikey", l1=True)
+    key = access.get_or_set(key_hash, load, timeout=300, none_timeout=30)
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from apps.core.instrumentation import record_cache
+
+_MISS = object()
+_NONE = "__none__"
+_LOCK_STRIPES = 64
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _is_none(value) -> bool:
+    return isinstance(value, str) and value == _NONE
+
+
+class _Stats:
+    FIELDS = ("hits", "l1_hits", "misses", "loads", "lock_waits")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+
+    def incr(self, namespace: str, field: str, n: int = 1):
+        with self._lock:
+            self._counters[namespace][field] += n
+        if field in ("hits", "l1_hits"):
+            record_cache(hits=n)
+        elif field == "misses":
+            record_cache(misses=n)
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            out = {}
+            for name, counters in self._counters.items():
+                hits = counters["hits"] + counters["l1_hits"]
+                total = hits + counters["misses"]
+                out[name] = {**counters, "hit_ratio": round(hits / total, 4) if total else None}
+            return out
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+class _L1:
+    """LRU com expiração, por processo. Guarda o valor serializado (cada leitura é uma cópia)."""
+
+    def __init__(self):
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISS
+            expires, raw = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return _MISS
+            self._data.move_to_end(key)
+        return pickle.loads(raw)
+
+    def set(self, key: str, value, ttl: float):
+        if ttl <= 0:
+            return
+        raw = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        max_items = int(_setting("CACHE_L1_MAX_ITEMS", 2000))
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, raw)
+            self._data.move_to_end(key)
+            while len(self._data) > max_items:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_stats = _Stats()
+_l1 = _L1()
+_local_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+# chave -> Future da carga em curso neste processo (protegido pelo stripe da chave)
+_inflight: dict[str, Future] = {}
+
+
+class CacheNamespace:
+    def __init__(self, name: str, *, l1: bool = False, stats_name: str | None = None, backend=None):
+        self.name = name
+        self.l1 = l1
+        self.stats_name = stats_name or name
+        self.backend = backend or default_cache
+
+    def key(self, key) -> str:
+        return f"{self.name}:{key}"
+
+    def _l1_ttl(self, timeout=None) -> float:
+        ttl = float(_setting("CACHE_L1_TTL", 5))
+        if timeout is None or timeout is DEFAULT_TIMEOUT:
+            return ttl
+        return min(ttl, timeout)
+
+    def _get_raw(self, full_key: str):
+        if self.l1:
+            value = _l1.get(full_key)
+            if value is not _MISS:
+                _stats.incr(self.stats_name, "l1_hits")
+                return value
+        value = self.backend.get(full_key, _MISS)
+        if value is _MISS:
+            _stats.incr(self.stats_name, "misses")
+            return _MISS
+        _stats.incr(self.stats_name, "hits")
+        if self.l1:
+            _l1.set(full_key, value, self._l1_ttl())
+        return value
+
+    def _set_raw(self, full_key: str, value, timeout):
+        self.backend.set(full_key, value, timeout=timeout)
+        if self.l1:
+            _l1.set(full_key, value, self._l1_ttl(timeout))
+
+    def get(self, key, default=None):
+        value = self._get_raw(self.key(key))
+        return default if value is _MISS or _is_none(value) else value
+
+    def get_many(self, keys) -> dict:
+        out = {}
+        full = {}
+        for k in keys:
+            full_key = self.key(k)
+            if self.l1:
+                value = _l1.get(full_key)
+                if value is not _MISS:
+                    _stats.incr(self.stats_name, "l1_hits")
+                    if not _is_none(value):
+                        out[k] = value
+                    continue
+            full[full_key] = k
+        if not full:
+            return out
+        found = self.backend.get_many(list(full))
+        _stats.incr(self.stats_name, "hits", len(found))
+        _stats.incr(self.stats_name, "misses", len(full) - len(found))
+        for full_key, value in found.items():
+            if self.l1:
+                _l1.set(full_key, value, self._l1_ttl())
+            if not _is_none(value):
+                out[full[full_key]] = value
+        return out
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self._set_raw(self.key(key), value, timeout)
+
+    def set_many(self, mapping: dict, timeout=DEFAULT_TIMEOUT):
+        self.backend.set_many({self.key(k): v for k, v in mapping.items()}, timeout=timeout)
+        if self.l1:
+            for k, v in mapping.items():
+                _l1.set(self.key(k), v, self._l1_ttl(timeout))
+
+    def delete(self, key):
+        full_key = self.key(key)
+        _l1.delete(full_key)
+        self.backend.delete(full_key)
+
+    def delete_many(self, keys):
+        full = [self.key(k) for k in keys]
+        for full_key in full:
+            _l1.delete(full_key)
+        if full:
+            self.backend.delete_many(full)
+
+    def get_or_set(self, key, loader, *, timeout=DEFAULT_TIMEOUT, none_timeout=None):
+        """
+        Valor em cache ou `loader()` (chamado uma vez só por chave, mesmo com
+        vários requests concorrentes). None só é cacheado com `none_timeout`.
+        """
+        full_key = self.key(key)
+        value = self._get_raw(full_key)
+        if value is not _MISS:
+            return None if _is_none(value) else value
+
+        stripe = _local_locks[hash(full_key) % _LOCK_STRIPES]
+        with stripe:
+            future = _inflight.get(full_key)
+            leader = future is None
+            if leader:
+                future = _inflight[full_key] = Future()
+
+        if not leader:
+            return self._follow(full_key, future, loader, timeout, none_timeout)
+
+        try:
+            value = self._load(full_key, loader, timeout, none_timeout)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            with stripe:
+                _inflight.pop(full_key, None)
+
+    def _follow(self, full_key: str, future: Future, loader, timeout, none_timeout):
+        """Espera a carga de outro thread do processo; relê do cache (cópia)."""
+        _stats.incr(self.stats_name, "lock_waits")
+        try:
+            result = future.result(timeout=float(_setting("CACHE_LOCK_WAIT", 2)))
+        except Exception:
+            # o loader do outro thread falhou ou demorou demais: tenta por conta própria
+            return self._load(full_key, loader, timeout, none_timeout)
+        value = self._get_raw(full_key)
+        if value is _MISS:
+            return result
+        return None if _is_none(value) else value
+
+    def _load(self, full_key: str, loader, timeout, none_timeout):
+        # outro thread pode ter carregado entre o primeiro get e o registro da carga
+        value = self._get_raw(full_key)
+        if value is not _MISS:
+            return None if _is_none(value) else value
+
+        lock_key = f"{full_key}:lock"
+        owner = self.backend.add(lock_key, 1, timeout=_setting("CACHE_LOCK_TIMEOUT", 10))
+        if not owner:
+            value = self._wait_for(full_key, lock_key)
+            if value is not _MISS:
+                return None if _is_none(value) else value
+        try:
+            value = loader()
+            _stats.incr(self.stats_name, "loads")
+            if value is not None:
+                self._set_raw(full_key, value, timeout)
+            elif none_timeout:
+                self._set_raw(full_key, _NONE, none_timeout)
+            return value
+        finally:
+            if owner:
+                self.backend.delete(lock_key)
+
+    def _wait_for(self, full_key: str, lock_key: str):
+        _stats.incr(self.stats_name, "lock_waits")
+        deadline = time.monotonic() + float(_setting("CACHE_LOCK_WAIT", 2))
+        delay = 0.01
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            value = self.backend.get(full_key, _MISS)
+            if value is not _MISS:
+                if self.l1:
+                    _l1.set(full_key, value, self._l1_ttl())
+                return value
+            if self.backend.get(lock_key) is None:
+                # dono terminou sem gravar (ex.: None sem none_timeout)
+                break
+            delay = min(delay * 2, 0.2)
+        # dono do lock morreu/demorou demais: carrega por conta própria
+        return _MISS
+
+
+def namespace(name: str, *, l1: bool = False) -> CacheNamespace:
+    return CacheNamespace(name, l1=l1)
+
+
+def tenant(workspace_id, name: str, *, l1: bool = False) -> CacheNamespace:
+    """Namespace isolado por workspace; as métricas agregam por `name`."""
+    return CacheNamespace(f"t:{workspace_id}:{name}", l1=l1, stats_name=f"t:{name}")
+
+
+def stats() -> dict[str, dict]:
+    return _stats.snapshot()
+
+
+def collect():
+    data = stats()
+    for field in _Stats.FIELDS:
+        yield (
+            f"cache_{field}_total", "counter", f"Cache: {field} por namespace",
+            [({"namespace": name}, counters[field]) for name, counters in sorted(data.items())],
+        )
+
+
+def reset():
+    """Zera métricas e o L1 do processo (testes)."""
+    _stats.reset()
+    _l1.clear()
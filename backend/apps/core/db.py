@@ -0,0 +1,89 @@
+"""
+Métricas de reaproveitamento de conexões com o Postgres (por processo).
+
+  - connections_opened: conexões novas abertas (signal connection_created);
+  - requests / requests_reused: requests que começaram com a conexão do
+    request anterior ainda aberta (CONN_MAX_AGE > 0 funcionando).
+
+Com DB_CONN_MAX_AGE=0 reuse_ratio fica em 0: cada request paga o connect.
+
+Em DB_POOL_MODE=transaction não há sessão: o SET TIME ZONE que o Django faz ao
+conectar ficaria num backend do PgBouncer qualquer. `check_timezone` (no
+ready do core) exige o timezone no startup da conexão (OPTIONS["options"]).
+"""
+import re
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_lock = threading.Lock()
+_counters = {"connections_opened": 0, "requests": 0, "requests_reused": 0}
+
+
+def _incr(**fields):
+    with _lock:
+        for name, n in fields.items():
+            _counters[name] += n
+
+
+@receiver(connection_created)
+def _on_connection_created(sender, connection, **kwargs):
+    _incr(connections_opened=1)
+
+
+@receiver(request_started)
+def _on_request_started(sender, **kwargs):
+    # roda depois do close_old_connections do Django (registrado antes):
+    # se a conexão ainda está aberta aqui, este request vai reaproveitá-la
+    conn = connections[DEFAULT_DB_ALIAS]
+    _incr(requests=1, requests_reused=int(conn.connection is not None))
+
+
+def check_timezone(alias: str = DEFAULT_DB_ALIAS):
+    if getattr(settings, "DB_POOL_MODE", "session") != "transaction" or not settings.USE_TZ:
+        return
+    options = settings.DATABASES[alias].get("OPTIONS", {}).get("options", "")
+    found = re.search(r"-c\s*timezone=(\S+)", options, re.IGNORECASE)
+    if not found or found.group(1) != settings.TIME_ZONE:
+        raise ImproperlyConfigured(
+            f"DB_POOL_MODE=transaction requer DATABASES['{alias}']['OPTIONS']['options'] "
+            f"com '-c timezone={settings.TIME_ZONE}' (sem sessão, o SET TIME ZONE se perde)."
+        )
+
+
+def stats(alias: str = DEFAULT_DB_ALIAS) -> dict:
+    db = settings.DATABASES[alias]
+    with _lock:
+        counters = dict(_counters)
+    requests = counters["requests"]
+    return {
+        "alias": alias,
+        "pool_mode": getattr(settings, "DB_POOL_MODE", "session"),
+        "conn_max_age": db.get("CONN_MAX_AGE", 0),
+        "health_checks": db.get("CONN_HEALTH_CHECKS", False),
+        "server_side_cursors": not db.get("DISABLE_SERVER_SIDE_CURSORS", False),
+        **counters,
+        "reuse_ratio": round(counters["requests_reused"] / requests, 4) if requests else None,
+    }
+
+
+def reset():
+    with _lock:
+        for name in _counters:
+            _counters[name] = 0
+
+
+def collect():
+    data = stats()
+    labels = {"alias": data["alias"], "pool_mode": data["pool_mode"]}
+    yield ("db_connections_opened_total", "counter", "Conexões abertas com o banco",
+           [(labels, data["connections_opened"])])
+    yield ("db_requests_total", "counter", "Requests observados pelo contador de conexões",
+           [(labels, data["requests"])])
+    yield ("db_requests_reused_total", "counter", "Requests que reaproveitaram a conexão",
+           [(labels, data["requests_reused"])])
@@ -0,0 +1,96 @@
+"""
+Instrumentação por request.
+
+O PerformanceMiddleware abre um `RequestTimings` num contextvar; o resto do
+código só chama `record_http` / `record_cache` (baratos: sem request ativo
+vira só a métrica agregada). Queries são contadas via
+`connection.execute_wrapper` — apenas nos requests amostrados
+(PERF_SAMPLE_RATE), para o overhead ficar desprezível.
+"""
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from apps.core.metrics import registry
+
+REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Latência dos requests HTTP", ["method", "route"],
+)
+REQUESTS = registry.counter("http_requests_total", "Requests HTTP atendidos", ["method", "route", "status"])
+DB_QUERIES = registry.histogram(
+    "http_request_db_queries", "Queries por request (amostrado)", ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+DB_SECONDS = registry.histogram(
+    "http_request_db_seconds", "Tempo de banco por request (amostrado)", ["route"],
+)
+UPSTREAM_SECONDS = registry.histogram(
+    "upstream_request_duration_seconds", "Latência das chamadas HTTP de saída", ["upstream"],
+)
+UPSTREAM_ERRORS = registry.counter(
+    "upstream_request_errors_total", "Chamadas de saída com erro (conexão/5xx)", ["upstream"],
+)
+
+
+@dataclass
+class RequestTimings:
+    sampled: bool = False
+    started: float = field(default_factory=time.perf_counter)
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    http_calls: int = 0
+    http_seconds: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_seconds += time.perf_counter() - t0
+
+    def server_timing(self, total: float) -> str:
+        parts = []
+        if self.sampled:
+            parts.append(f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"')
+        if self.http_calls:
+            parts.append(f'http;dur={self.http_seconds * 1000:.1f};desc="{self.http_calls} calls"')
+        if self.cache_hits or self.cache_misses:
+            parts.append(f'cache;desc="hits={self.cache_hits} misses={self.cache_misses}"')
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+
+def current() -> RequestTimings | None:
+    return _current.get()
+
+
+def start(*, sampled: bool) -> tuple[RequestTimings, object]:
+    timings = RequestTimings(sampled=sampled)
+    return timings, _current.set(timings)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+def record_http(upstream: str, seconds: float, *, failed: bool = False):
+    UPSTREAM_SECONDS.observe(seconds, upstream=upstream)
+    if failed:
+        UPSTREAM_ERRORS.inc(upstream=upstream)
+    timings = _current.get()
+    if timings is not None:
+        timings.http_calls += 1
+        timings.http_seconds += seconds
+
+
+def record_cache(hits: int = 0, misses: int = 0):
+    timings = _current.get()
+    if timings is not None:
+        timings.cache_hits += hits
+        timings.cache_misses += misses
@@ -0,0 +1,65 @@
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from apps.core import instrumentation, tracing
+
+
+class PerformanceMiddleware:
+    """
+    Latência total e contagem por rota em todo request; queries (contagem e
+    tempo) só numa amostra (PERF_SAMPLE_RATE). Devolve o resumo no header
+    Server-Timing e alimenta as métricas de /metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = float(getattr(settings, "PERF_SAMPLE_RATE", 0.05))
+        sampled = rate > 0 and (rate >= 1 or random.random() < rate)
+        timings, token = instrumentation.start(sampled=sampled)
+        try:
+            if sampled:
+                with connection.execute_wrapper(timings.db_wrapper):
+                    response = self.get_response(request)
+            else:
+                response = self.get_response(request)
+        finally:
+            instrumentation.finish(token)
+
+        total = time.perf_counter() - timings.started
+        match = getattr(request, "resolver_match", None)
+        route = (match.route if match else "") or "unmatched"
+        instrumentation.REQUEST_SECONDS.observe(total, method=request.method, route=route)
+        instrumentation.REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+        if sampled:
+            instrumentation.DB_QUERIES.observe(timings.db_queries, route=route)
+            instrumentation.DB_SECONDS.observe(timings.db_seconds, route=route)
+
+        if getattr(settings, "PERF_SERVER_TIMING", True):
+            response["Server-Timing"] = timings.server_timing(total)
+        return response
+
+
+class CorrelationIdMiddleware:
+    """
+    Abre o trace do request: usa o X-Correlation-ID recebido (se válido) ou
+    gera um novo, envolve o request num span "http.request" e devolve o id no
+    header da resposta.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with tracing.bind(request.headers.get(tracing.TRACE_HEADER)) as cid:
+            request.correlation_id = cid
+            with tracing.span("http.request", method=request.method) as sp:
+                response = self.get_response(request)
+                match = getattr(request, "resolver_match", None)
+                sp.set(route=(match.route if match else "") or "unmatched", status=response.status_code)
+        response[tracing.TRACE_HEADER] = cid
+        return response
@@ -0,0 +1,121 @@
+"""
+Pub/sub mínimo para acordar requests em espera (long-poll).
+
+  - com `REDIS_URL`: Redis PUBLISH/SUBSCRIBE, funciona entre processos/hosts;
+  - sem Redis: notificação em memória (threading.Event por assinante), válida
+    só dentro do processo — suficiente para dev/testes com um único runserver.
+
+A mensagem é só um "acorde": quem espera sempre relê o estado de verdade
+(cache/banco) depois de acordar, então perder uma notificação custa no
+máximo um timeout, nunca um dado.
+
+Uso:
+    with pubsub.subscribe("evo:pair:inst") as sub:
+        while not pronto():
+            if not sub.wait(restante):
+                break
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+
+class _LocalSubscription:
+    def __init__(self, backend: "LocalPubSub", topic: str):
+        self._backend = backend
+        self._topic = topic
+        self._event = threading.Event()
+
+    def __enter__(self):
+        with self._backend._lock:
+            self._backend._subscribers[self._topic].add(self._event)
+        return self
+
+    def __exit__(self, *exc):
+        with self._backend._lock:
+            subs = self._backend._subscribers.get(self._topic)
+            if subs is not None:
+                subs.discard(self._event)
+                if not subs:
+                    self._backend._subscribers.pop(self._topic, None)
+
+    def wait(self, timeout: float) -> bool:
+        woke = self._event.wait(max(timeout, 0))
+        self._event.clear()
+        return woke
+
+
+class LocalPubSub:
+    def __init__(self):
+        self._subscribers: dict[str, set[threading.Event]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, topic: str, message: str = "1") -> int:
+        with self._lock:
+            events = list(self._subscribers.get(topic, ()))
+        for event in events:
+            event.set()
+        return len(events)
+
+    def subscribe(self, topic: str) -> _LocalSubscription:
+        return _LocalSubscription(self, topic)
+
+
+class _RedisSubscription:
+    def __init__(self, client, topic: str):
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._topic = topic
+
+    def __enter__(self):
+        self._pubsub.subscribe(self._topic)
+        return self
+
+    def __exit__(self, *exc):
+        self._pubsub.close()
+
+    def wait(self, timeout: float) -> bool:
+        # a confirmação do SUBSCRIBE também "acorda" o get_message (e volta None)
+        deadline = time.monotonic() + max(timeout, 0)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if self._pubsub.get_message(timeout=remaining) is not None:
+                return True
+
+
+class RedisPubSub:
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+
+    def publish(self, topic: str, message: str = "1") -> int:
+        return self._client.publish(topic, message)
+
+    def subscribe(self, topic: str) -> _RedisSubscription:
+        return _RedisSubscription(self._client, topic)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_pubsub():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                url = getattr(settings, "REDIS_URL", "")
+                _backend = RedisPubSub(url) if url else LocalPubSub()
+    return _backend
+
+
+def publish(topic: str, message: str = "1") -> int:
+    return get_pubsub().publish(topic, message)
+
+
+def subscribe(topic: str):
+    return get_pubsub().subscribe(topic)
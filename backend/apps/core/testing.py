@@ -0,0 +1,46 @@
+"""
+Utilitários de teste compartilhados entre os apps.
+
+QueryCountMixin: regressão de N+1 em viewsets. A ideia é medir o mesmo
+request com poucas e com muitas linhas — o número de queries não pode crescer
+junto com os dados.
+
+    class MinhaViewTests(QueryCountMixin, APITestCase):
+        def test_list_sem_n_mais_1(self):
+            self.assertConstantQueries(
+                lambda: self.client.get("/api/v1/..."),
+                grow=lambda: Model.objects.create(...),
+            )
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+def count_queries(fn, *, using: str = DEFAULT_DB_ALIAS) -> tuple[int, object]:
+    """Executa fn() e devolve (número de queries, retorno)."""
+    with CaptureQueriesContext(connections[using]) as ctx:
+        result = fn()
+    return len(ctx.captured_queries), result
+
+
+class QueryCountMixin:
+    def assertConstantQueries(self, fn, *, grow, times: int = 3, expected: int | None = None,
+                              using: str = DEFAULT_DB_ALIAS):
+        """
+        Roda fn(), chama grow() `times` vezes e roda fn() de novo: as duas
+        medições têm que bater (e valer `expected`, se informado).
+        A primeira chamada de fn() é descartada (aquece caches de request).
+        """
+        fn()
+        before, _ = count_queries(fn, using=using)
+        for _ in range(times):
+            grow()
+        after, result = count_queries(fn, using=using)
+
+        self.assertEqual(
+            before, after,
+            f"queries cresceram com os dados: {before} -> {after} (N+1?)",
+        )
+        if expected is not None:
+            self.assertEqual(after, expected, f"esperado {expected} queries, executou {after}")
+        return result
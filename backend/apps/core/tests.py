@@ -1,3 +1,328 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APITestCase
+
+from apps.core import buffers
+from apps.core import cache as core_cache
+from apps.core import db as core_db
+from apps.core import tracing
+from apps.core.buffers import BatchBuffer
+from apps.core.metrics import Registry
+
+
+class BatchBufferTests(SimpleTestCase):
+    def test_dedups_by_key_and_flushes_when_full(self):
+        batches = []
+        buffer = BatchBuffer("test", batches.append, interval=0, max_items=3)
+
+        buffer.add("a", 1)
+        buffer.add("a", 2)
+        buffer.add("b", 1)
+        self.assertEqual(buffer.pending(), 2)
+        self.assertEqual(batches, [])
+
+        buffer.add("c", 1)
+        self.assertEqual(batches, [{"a": 2, "b": 1, "c": 1}])
+        self.assertEqual(buffer.pending(), 0)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_failed_flush_is_logged_not_raised(self):
+        def boom(items):
+            raise RuntimeError("db down")
+
+        buffer = BatchBuffer("test", boom, interval=0)
+        buffer.add("a", 1)
+        with self.assertLogs("apps.core.buffers", "ERROR"):
+            self.assertEqual(buffer.flush(), 0)
+
+
+    def test_failed_flush_is_requeued_then_dropped_and_counted(self):
+        attempts = []
+
+        def flaky(items):
+            attempts.append(dict(items))
+            raise RuntimeError("db down")
+
+        buffer = BatchBuffer("flaky", flaky, interval=0, retries=1)
+        buffer.add("a", 1)
+        dropped = buffers.DROPPED.value(buffer="flaky")
+
+        with self.assertLogs("apps.core.buffers", "WARNING"):
+            buffer.flush()
+        buffer.add("a", 2)  # escrita mais nova vence a que voltou
+        buffer.add("b", 1)
+        self.assertEqual(buffer.pending(), 2)
+
+        with self.assertLogs("apps.core.buffers", "ERROR"):
+            buffer.flush()
+        self.assertEqual(attempts, [{"a": 1}, {"a": 2, "b": 1}])
+        self.assertEqual(buffer.pending(), 0)
+        self.assertEqual(buffers.DROPPED.value(buffer="flaky") - dropped, 2)
+
+
+class CacheLayerTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        core_cache.reset()
+
+    def test_tenant_namespaces_are_isolated(self):
+        a = core_cache.tenant("ws-a", "access")
+        b = core_cache.tenant("ws-b", "access")
+        a.set("k", 1)
+        self.assertEqual(a.get("k"), 1)
+        self.assertIsNone(b.get("k"))
+        self.assertEqual(cache.get("t:ws-a:access:k"), 1)
+
+        stats = core_cache.stats()["t:access"]
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+    def test_get_or_set_caches_none_only_with_none_timeout(self):
+        ns = core_cache.namespace("neg")
+        calls = []
+
+        def load():
+            calls.append(1)
+            return None
+
+        self.assertIsNone(ns.get_or_set("x", load))
+        self.assertIsNone(ns.get_or_set("x", load))
+        self.assertEqual(len(calls), 2)
+
+        self.assertIsNone(ns.get_or_set("y", load, none_timeout=30))
+        self.assertIsNone(ns.get_or_set("y", load, none_timeout=30))
+        self.assertEqual(len(calls), 3)
+
+    def test_concurrent_misses_load_once(self):
+        ns = core_cache.namespace("stampede")
+        calls = []
+
+        def load():
+            calls.append(1)
+            time.sleep(0.2)
+            return "value"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(ns.get_or_set("k", load, timeout=60)))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 8)
+        self.assertEqual(core_cache.stats()["stampede"]["loads"], 1)
+
+    def test_slow_load_does_not_block_other_keys_on_the_same_stripe(self):
+        ns = core_cache.namespace("stripe")
+        stripe = hash(ns.key("slow")) % core_cache._LOCK_STRIPES
+        other = next(
+            f"k{i}" for i in range(10_000)
+            if hash(ns.key(f"k{i}")) % core_cache._LOCK_STRIPES == stripe
+        )
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return "slow"
+
+        t = threading.Thread(target=lambda: ns.get_or_set("slow", slow, timeout=60))
+        t.start()
+        started.wait(5)
+        try:
+            t0 = time.monotonic()
+            self.assertEqual(ns.get_or_set(other, lambda: "fast", timeout=60), "fast")
+            self.assertLess(time.monotonic() - t0, 0.5)
+        finally:
+            release.set()
+            t.join(5)
+        self.assertEqual(ns.get("slow"), "slow")
+
+    def test_waits_for_lock_held_by_other_process(self):
+        ns = core_cache.namespace("remote")
+        cache.add("remote:k:lock", 1, timeout=10)
+        threading.Timer(0.1, lambda: cache.set("remote:k", "theirs")).start()
+
+        self.assertEqual(ns.get_or_set("k", lambda: "ours"), "theirs")
+
+    def test_l1_serves_hot_keys_and_delete_clears_it(self):
+        ns = core_cache.namespace("hot", l1=True)
+        ns.set("k", {"v": 1})
+        cache.delete("hot:k")  # outro processo apagou só no L2
+
+        value = ns.get("k")
+        self.assertEqual(value, {"v": 1})
+        value["v"] = 2  # leitura é cópia
+        self.assertEqual(ns.get("k"), {"v": 1})
+        self.assertEqual(core_cache.stats()["hot"]["l1_hits"], 2)
+
+        ns.delete("k")
+        self.assertIsNone(ns.get("k"))
+
+
+class RuntimeStatsTests(APITestCase):
+    url = "/api/v1/core/stats/"
+
+    def setUp(self):
+        core_db.reset()
+        self.user = get_user_model().objects.create_user(username="u", password="p")
+
+    def test_requires_staff(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_reports_connection_reuse(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_authenticate(self.user)
+
+        self.client.get(self.url)
+        data = self.client.get(self.url).json()["db"]
+        self.assertEqual(data["requests"], 2)
+        # TestCase segura a conexão aberta: todo request reaproveita
+        self.assertEqual(data["requests_reused"], 2)
+        self.assertEqual(data["reuse_ratio"], 1.0)
+        self.assertIn(data["pool_mode"], {"session", "transaction"})
+        self.assertIn("cache", self.client.get(self.url).json())
+
+
+class DbTimezoneTests(SimpleTestCase):
+    def _databases(self, options):
+        return {"default": {**settings.DATABASES["default"], "OPTIONS": options}}
+
+    def test_transaction_pooling_requires_timezone_in_startup_options(self):
+        with override_settings(DB_POOL_MODE="transaction", DATABASES=self._databases({})):
+            with self.assertRaises(ImproperlyConfigured):
+                core_db.check_timezone()
+        with override_settings(DB_POOL_MODE="transaction",
+                               DATABASES=self._databases({"options": "-c timezone=America/Sao_Paulo"})):
+            with self.assertRaises(ImproperlyConfigured):
+                core_db.check_timezone()
+        with override_settings(DB_POOL_MODE="transaction",
+                               DATABASES=self._databases({"options": "-c timezone=UTC"})):
+            core_db.check_timezone()
+        with override_settings(DB_POOL_MODE="session", DATABASES=self._databases({})):
+            core_db.check_timezone()
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    def test_renders_prometheus_text(self):
+        registry = Registry()
+        registry.counter("jobs_total", "Jobs", ["kind"]).inc(kind='a"b')
+        hist = registry.histogram("job_seconds", "Duração", buckets=(0.1, 1))
+        hist.observe(0.1)
+        hist.observe(0.5)
+        hist.observe(3)
+        registry.register_collector(lambda: [("up", "gauge", "Vivo", [({}, 1)])])
+
+        text = registry.render()
+        self.assertIn('jobs_total{kind="a\\"b"} 1', text)
+        self.assertIn('job_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('job_seconds_bucket{le="1"} 2', text)
+        self.assertIn('job_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn("job_seconds_count 3", text)
+        self.assertIn("# TYPE up gauge\nup 1", text)
+
+
+class PerformanceMiddlewareTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        core_cache.reset()
+        self.user = get_user_model().objects.create_user(username="u", password="p", is_staff=True)
+        self.client.force_authenticate(self.user)
+
+    @override_settings(PERF_SAMPLE_RATE=1)
+    def test_sampled_request_reports_server_timing(self):
+        core_cache.namespace("mw").get("k")
+        response = self.client.get("/api/v1/core/stats/")
+        header = response["Server-Timing"]
+        self.assertRegex(header, r'^db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn("total;dur=", header)
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_unsampled_request_only_reports_total(self):
+        response = self.client.get("/api/v1/core/stats/")
+        self.assertTrue(response["Server-Timing"].startswith("total;dur="))
+
+    @override_settings(METRICS_TOKEN="", METRICS_REQUIRE_TOKEN=True)
+    def test_metrics_endpoint_closed_without_token_when_required(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_metrics_endpoint(self):
+        self.client.get("/api/v1/core/stats/")
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer sêcret").status_code, 401)
+
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('http_requests_total{method="GET",route="api/v1/core/stats/",status="200"}', text)
+        self.assertIn("db_connections_opened_total", text)
+        self.assertIn("cache_hits_total", text)
+
+
+class TracingTests(SimpleTestCase):
+    @staticmethod
+    def _child_span():
+        with tracing.span("in-thread"):
+            pass
+
+    def test_nested_spans_share_trace_and_link_parents(self):
+        with tracing.capture() as spans:
+            with tracing.bind("req-12345678") as cid:
+                with tracing.span("outer") as outer:
+                    with tracing.span("inner", step=1):
+                        pass
+                    with ThreadPoolExecutor(1) as pool:
+                        pool.submit(tracing.wrap(self._child_span)).result()
+            self.assertIsNone(tracing.correlation_id())
+
+        by_name = {sp.name: sp for sp in spans}
+        self.assertEqual(cid, "req-12345678")
+        self.assertEqual({sp.correlation_id for sp in spans}, {cid})
+        self.assertEqual(by_name["inner"].parent_id, outer.span_id)
+        self.assertEqual(by_name["in-thread"].parent_id, outer.span_id)
+        self.assertIsNone(outer.parent_id)
+
+    def test_errors_are_recorded_and_reraised(self):
+        with tracing.capture() as spans:
+            with self.assertRaises(ValueError):
+                with tracing.span("boom"):
+                    raise ValueError("bad")
+        self.assertEqual(spans[0].error, "ValueError: bad")
+        self.assertEqual(spans[0].to_otlp()["status"]["code"], 2)
+
+    def test_invalid_incoming_ids_are_replaced(self):
+        with tracing.bind("bad id with spaces") as cid:
+            self.assertRegex(cid, r"^[0-9a-f]{32}$")
+
+    def test_file_export_is_otlp_json(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "traces.jsonl"
+            with self.settings(TRACING_FILE=str(path)), tracing.capture() as spans:
+                with tracing.bind("abc-12345678"), tracing.span("op", n=3):
+                    pass
+                tracing._write_file({sp.span_id: sp for sp in spans})
+
+            doc = json.loads(path.read_text().splitlines()[0])
+            span = doc["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+            self.assertEqual(span["name"], "op")
+            self.assertRegex(span["traceId"], r"^[0-9a-f]{32}$")
+            self.assertIn({"key": "n", "value": {"intValue": "3"}}, span["attributes"])
+            self.assertIn({"key": "correlation_id", "value": {"stringValue": "abc-12345678"}}, span["attributes"])
@@ -0,0 +1,257 @@
+"""
+Tracing leve por `correlation_id` (PIPELINE.md: todo processamento rastreável).
+
+    with tracing.bind(cid):                    # define/propaga o correlation_id
+        with tracing.span("rag.search", top_k=5) as sp:
+            ...
+            sp.set(results=len(rows))
+
+    @tracing.traced("rag.index_document")
+    def index_document(doc): ...
+
+- contexto em contextvars: vale para threads/tasks que copiam o contexto
+  (`tracing.wrap(fn)` para executors);
+- o correlation_id vira o trace_id (32 hex, compatível com OpenTelemetry);
+  entre processos ele viaja persistido (header X-Correlation-ID no
+  WebhookEvent, Message.correlation_id);
+- exportação (TRACING_EXPORTER=file): spans em lote, uma linha OTLP/JSON por
+  flush em TRACING_FILE — lido pelo receiver `otlpjsonfile` do OTel Collector;
+- spans acima de TRACING_SLOW_MS vão para o log (achar outliers de p99 sem
+  precisar do collector).
+"""
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import re
+import secrets
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from apps.core.buffers import BatchBuffer
+
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = "X-Correlation-ID"
+_VALID_ID = re.compile(r"^[A-Za-z0-9._:-]{8,64}$")
+_HEX32 = re.compile(r"^[0-9a-f]{32}$")
+
+_correlation: contextvars.ContextVar[str | None] = contextvars.ContextVar("correlation_id", default=None)
+_parent: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("trace_parent", default=None)
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex
+
+
+def clean_correlation_id(value) -> str | None:
+    """Valor vindo de fora (header/banco) se tiver formato aceitável; senão None."""
+    value = (value or "").strip() if isinstance(value, str) else ""
+    return value if _VALID_ID.match(value) else None
+
+
+def correlation_id() -> str | None:
+    return _correlation.get()
+
+
+def trace_id_for(cid: str) -> str:
+    return cid if _HEX32.match(cid) else hashlib.md5(cid.encode()).hexdigest()
+
+
+@contextmanager
+def bind(cid: str | None = None):
+    """Abre um trace (novo id se `cid` for vazio/inválido) e devolve o correlation_id."""
+    cid = clean_correlation_id(cid) or new_correlation_id()
+    t1 = _correlation.set(cid)
+    t2 = _parent.set(None)
+    try:
+        yield cid
+    finally:
+        _parent.reset(t2)
+        _correlation.reset(t1)
+
+
+def wrap(fn):
+    """fn presa ao contexto atual (correlation_id + span pai) — para submit em executors."""
+    ctx = contextvars.copy_context()
+    return functools.partial(ctx.run, fn)
+
+
+class Span:
+    __slots__ = ("name", "correlation_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "error")
+
+    def __init__(self, name: str, cid: str, parent: "Span | None", attributes: dict):
+        self.name = name
+        self.correlation_id = cid
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_otlp(self) -> dict:
+        attributes = {"correlation_id": self.correlation_id, **self.attributes}
+        out = {
+            "traceId": trace_id_for(self.correlation_id),
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            out["parentSpanId"] = self.parent_id
+        return out
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+# ---------- exportação ----------
+
+_exporters: list = []
+_exporters_lock = threading.Lock()
+_configured = False
+
+
+def _write_file(items: dict):
+    spans = [s.to_otlp() for s in items.values()]
+    line = json.dumps({
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": _setting("TRACING_SERVICE_NAME", "omnichat")}},
+            ]},
+            "scopeSpans": [{"scope": {"name": "apps.core.tracing"}, "spans": spans}],
+        }]
+    }, separators=(",", ":"))
+    with open(_setting("TRACING_FILE", "traces.jsonl"), "a", encoding="utf-8") as fh:
+        fh.write(line + "\n")
+
+
+def _configure():
+    global _configured
+    with _exporters_lock:
+        if _configured:
+            return
+        _configured = True
+        if _setting("TRACING_EXPORTER", "") == "file":
+            buffer = BatchBuffer(
+                "traces",
+                _write_file,
+                interval=float(_setting("TRACING_FLUSH_INTERVAL", 2)),
+                max_items=int(_setting("TRACING_BATCH_SIZE", 512)),
+            )
+            _exporters.append(lambda sp: buffer.add(sp.span_id, sp))
+
+
+def add_exporter(fn):
+    """fn(span) a cada span finalizado (roda no thread que fechou o span)."""
+    _configure()
+    with _exporters_lock:
+        _exporters.append(fn)
+
+
+def remove_exporter(fn):
+    with _exporters_lock:
+        if fn in _exporters:
+            _exporters.remove(fn)
+
+
+@contextmanager
+def capture():
+    """Coleta os spans finalizados dentro do bloco (testes)."""
+    spans: list[Span] = []
+    add_exporter(spans.append)
+    try:
+        yield spans
+    finally:
+        remove_exporter(spans.append)
+
+
+def _finish(span: Span):
+    if not _configured:
+        _configure()
+    slow_ms = float(_setting("TRACING_SLOW_MS", 0))
+    if slow_ms and span.duration_ms >= slow_ms:
+        logger.warning("slow span %s %.1fms correlation_id=%s %s",
+                       span.name, span.duration_ms, span.correlation_id, span.attributes)
+    for fn in list(_exporters):
+        try:
+            fn(span)
+        except Exception:
+            logger.exception("trace exporter failed")
+
+
+# ---------- API ----------
+
+@contextmanager
+def span(name: str, **attributes):
+    cid = _correlation.get()
+    token_cid = None
+    if cid is None:
+        # span fora de um trace: vira raiz de um trace novo
+        cid = new_correlation_id()
+        token_cid = _correlation.set(cid)
+    sp = Span(name, cid, _parent.get(), attributes)
+    token = _parent.set(sp)
+    try:
+        yield sp
+    except BaseException as e:
+        sp.error = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        sp.end_ns = time.time_ns()
+        _parent.reset(token)
+        if token_cid is not None:
+            _correlation.reset(token_cid)
+        _finish(sp)
+
+
+def record_span(name: str, cid: str, *, start_ns: int, end_ns: int | None = None, **attributes) -> Span:
+    """Span já medido (ex.: espera na fila entre o webhook e o ingest) num trace existente."""
+    sp = Span(name, clean_correlation_id(cid) or new_correlation_id(), None, attributes)
+    sp.start_ns = start_ns
+    sp.end_ns = end_ns or time.time_ns()
+    _finish(sp)
+    return sp
+
+
+def traced(name: str | None = None):
+    def decorator(fn):
+        span_name = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,5 +1,7 @@
 from django.urls import path
 
+from apps.core.views import RuntimeStatsView
+
 urlpatterns = [
-    # Endpoints entrarão aqui depois.
+    path("stats/", RuntimeStatsView.as_view(), name="core-stats"),
 ]
@@ -1,3 +1,36 @@
-from django.shortcuts import render
+import hmac
 
-# Create your views here.
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from apps.core import cache, db
+from apps.core.metrics import registry
+
+
+class RuntimeStatsView(APIView):
+    """Estatísticas do processo que atendeu o request (conexões com o banco e cache)."""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"db": db.stats(), "cache": cache.stats()})
+
+
+def metrics_view(request):
+    """
+    Métricas do processo no formato do Prometheus. Com METRICS_TOKEN
+    configurado exige `Authorization: Bearer <token>`; sem token e com
+    METRICS_REQUIRE_TOKEN (padrão em prod) o endpoint fica fechado.
+    """
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token:
+        given = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        # bytes: compare_digest com str não-ASCII levanta TypeError
+        if not hmac.compare_digest(given.encode(), token.encode()):
+            return HttpResponse(status=401)
+    elif getattr(settings, "METRICS_REQUIRE_TOKEN", False):
+        return HttpResponse(status=403)
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
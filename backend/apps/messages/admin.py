@@ -1,3 +1,11 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Message
+
+
+@admin.register(Message)
+class MessageAdmin(admin.ModelAdmin):
+    list_display = ("id", "conversation", "direction", "status", "message_type", "created_at")
+    list_filter = ("direction", "status", "message_type")
+    search_fields = ("id", "provider_message_id")
+    raw_id_fields = ("conversation",)
@@ -0,0 +1,270 @@
+"""
+Ingest de mensagens (PIPELINE.md, passos 4-6).
+
+Processa WebhookEvents em lote:
+  1) normaliza cada evento (grava em `WebhookEvent.normalized`);
+  2) resolve o Channel pelo `external_id` (nome da instância, via cache);
+  3) upsert de Contact e Conversation com ON CONFLICT (last_message_at só
+     avança; só mensagem IN reabre conversa fechada);
+  4) insere as Messages em bulk (ON CONFLICT DO NOTHING => idempotente);
+  5) acrescenta as mensagens novas à janela de histórico das conversas
+     (apps.conversations.history) e cria os AgentRuns das IN
+     (apps.agents.runtime.enqueue_runs).
+
+Mensagens IN viram eventos de uso message.processed (apps.audit.usage,
+gravados fora daqui, em lote).
+
+O número de queries por lote é constante, independente da quantidade de
+eventos.
+
+Tracing: o correlation_id gravado pelo webhook (header X-Correlation-ID do
+evento) passa para `normalized` e para as Messages; cada evento ganha um span
+"ingest.event" do recebimento até o fim do lote (inclui a espera na fila).
+"""
+from dataclasses import dataclass
+from datetime import datetime
+
+from apps.agents.runtime import enqueue_runs
+from apps.audit import usage
+from apps.channels.models import Channel
+from apps.channels.resolver import ChannelRef, channel_resolver
+from apps.core import tracing
+from apps.conversations import history
+from apps.conversations.models import Contact, Conversation
+from apps.messages.models import Message
+from apps.providers.evolution.normalizer import normalize_payload
+from apps.webhooks.models import WebhookEvent
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+@dataclass
+class IngestResult:
+    events: int = 0
+    messages: int = 0
+    unresolved: int = 0
+    runs: int = 0
+
+
+def _event_correlation_id(ev: WebhookEvent) -> str | None:
+    headers = ev.raw_headers if isinstance(ev.raw_headers, dict) else {}
+    for name, value in headers.items():
+        if str(name).lower() == "x-correlation-id":
+            return tracing.clean_correlation_id(value)
+    return None
+
+
+def _resolve_channels(external_ids: set[str]) -> dict[str, ChannelRef]:
+    refs = channel_resolver.resolve_many(external_ids)
+    return {name: ref for name, ref in refs.items() if ref.provider == Channel.Provider.EVOLUTION}
+
+
+def _upsert_contacts(items: list[dict], now: datetime) -> dict[tuple, Contact]:
+    # um objeto por (channel, contato): ON CONFLICT não aceita a mesma linha 2x
+    by_key: dict[tuple, Contact] = {}
+    for item in items:
+        ch = item["_channel"]
+        key = (ch.id, item["contact_external_id"])
+        # pushName de mensagem fromMe é o nome do próprio número, não do contato
+        name = "" if item["from_me"] else (item.get("contact_name") or "")
+        contact = by_key.get(key)
+        if contact is None:
+            by_key[key] = Contact(
+                workspace_id=ch.workspace_id,
+                channel_id=ch.id,
+                external_id=item["contact_external_id"],
+                name=name,
+                last_seen_at=now,
+            )
+        elif name:
+            contact.name = name
+
+    # sem nome no lote => não sobrescreve o nome já conhecido
+    named = [c for c in by_key.values() if c.name]
+    unnamed = [c for c in by_key.values() if not c.name]
+    for objs, update_fields in (
+        (named, ["name", "last_seen_at", "updated_at"]),
+        (unnamed, ["last_seen_at", "updated_at"]),
+    ):
+        if objs:
+            Contact.objects.bulk_create(
+                objs,
+                update_conflicts=True,
+                unique_fields=["channel", "external_id"],
+                update_fields=update_fields,
+            )
+
+    # no Django 4.2 o bulk_create com update_conflicts não devolve as PKs
+    rows = Contact.objects.filter(
+        channel_id__in={k[0] for k in by_key},
+        external_id__in={k[1] for k in by_key},
+    ).only("id", "channel_id", "external_id")
+    return {(c.channel_id, c.external_id): c for c in rows if (c.channel_id, c.external_id) in by_key}
+
+
+def _upsert_conversations(items: list[dict], contacts: dict[tuple, Contact], now: datetime) -> dict[tuple, Conversation]:
+    by_key: dict[tuple, Conversation] = {}
+    inbound: set[tuple] = set()
+    for item in items:
+        ch = item["_channel"]
+        contact = contacts[(ch.id, item["contact_external_id"])]
+        key = (ch.id, contact.id)
+        ts = item["_ts"]
+        if not item["from_me"]:
+            inbound.add(key)
+        conv = by_key.get(key)
+        if conv is None:
+            by_key[key] = Conversation(
+                workspace_id=ch.workspace_id,
+                channel_id=ch.id,
+                contact_id=contact.id,
+                status=Conversation.Status.OPEN,
+                last_message_at=ts,
+            )
+        elif ts > conv.last_message_at:
+            conv.last_message_at = ts
+
+    Conversation.objects.bulk_create(list(by_key.values()), ignore_conflicts=True)
+
+    rows = Conversation.objects.filter(
+        channel_id__in={k[0] for k in by_key},
+        contact_id__in={k[1] for k in by_key},
+    ).only("id", "channel_id", "contact_id")
+    found = {(c.channel_id, c.contact_id): c for c in rows if (c.channel_id, c.contact_id) in by_key}
+    if not found:
+        return found
+
+    # conversas que já existiam: last_message_at só avança (reentrega/evento
+    # atrasado não volta o relógio) e só mensagem IN reabre conversa fechada
+    table = Conversation._meta.db_table
+    values = ", ".join(["(%s::uuid, %s::timestamptz, %s::boolean)"] * len(found))
+    params = [now, Conversation.Status.OPEN]
+    for key, conv in found.items():
+        params += [str(conv.id), by_key[key].last_message_at, key in inbound]
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            UPDATE {table} AS c SET
+                last_message_at = GREATEST(c.last_message_at, v.ts),
+                updated_at = %s,
+                status = CASE WHEN v.inbound THEN %s ELSE c.status END
+            FROM (VALUES {values}) AS v(id, ts, inbound)
+            WHERE c.id = v.id
+            """,
+            params,
+        )
+    return found
+
+
+def ingest_events(events: list[WebhookEvent]) -> IngestResult:
+    with tracing.span("ingest.batch", events=len(events)) as sp:
+        result = _ingest_events(events)
+        sp.set(messages=result.messages, unresolved=result.unresolved)
+
+    for ev in events:
+        cid = (ev.normalized or {}).get("correlation_id")
+        if cid:
+            tracing.record_span(
+                "ingest.event", cid,
+                start_ns=int(ev.created_at.timestamp() * 1e9),
+                event_id=str(ev.id),
+                messages=len(ev.normalized.get("messages", [])),
+                status=ev.normalized.get("status"),
+            )
+    return result
+
+
+def _ingest_events(events: list[WebhookEvent]) -> IngestResult:
+    result = IngestResult(events=len(events))
+    now = timezone.now()
+
+    items: list[dict] = []
+    for ev in events:
+        normalized = normalize_payload(ev.raw_payload)
+        cid = _event_correlation_id(ev)
+        if cid:
+            normalized["correlation_id"] = cid
+        ev.normalized = normalized
+        for msg in normalized.get("messages", []):
+            items.append({**msg, "_event": ev})
+
+    channels = _resolve_channels({i["channel_external_id"] for i in items})
+
+    resolved = []
+    for item in items:
+        ch = channels.get(item["channel_external_id"])
+        if ch is None:
+            # PIPELINE passo 5: sem channel => aceito e registrado para análise
+            item["_event"].normalized["status"] = "unresolved"
+            result.unresolved += 1
+            continue
+        item["_channel"] = ch
+        item["_ts"] = parse_datetime(item["timestamp"]) if item.get("timestamp") else now
+        resolved.append(item)
+
+    if resolved:
+        contacts = _upsert_contacts(resolved, now)
+        conversations = _upsert_conversations(resolved, contacts, now)
+
+        messages = []
+        for item in resolved:
+            ch = item["_channel"]
+            contact = contacts[(ch.id, item["contact_external_id"])]
+            conv = conversations[(ch.id, contact.id)]
+            from_me = item["from_me"]
+            messages.append(
+                Message(
+                    workspace_id=ch.workspace_id,
+                    channel_id=ch.id,
+                    conversation_id=conv.id,
+                    direction=Message.Direction.OUT if from_me else Message.Direction.IN,
+                    status=Message.Status.SENT if from_me else Message.Status.RECEIVED,
+                    message_type=item["message_type"],
+                    text=item["message_text"] or "",
+                    media=item["media"],
+                    provider_message_id=item["provider_event_id"],
+                    provider_timestamp=item["_ts"],
+                    webhook_event_id=item["_event"].id,
+                    correlation_id=item["_event"].normalized.get("correlation_id", ""),
+                )
+            )
+        Message.objects.bulk_create(messages, ignore_conflicts=True)
+
+        # reentregas caem no ON CONFLICT: daqui em diante só as que entraram
+        inserted_ids = set(
+            Message.objects.filter(id__in=[m.id for m in messages]).values_list("id", flat=True))
+        inserted = sorted((m for m in messages if m.id in inserted_ids), key=lambda m: m.provider_timestamp)
+        result.messages = len(inserted)
+
+        history.append(inserted)
+        # PIPELINE passo 7: routing + AgentRun "queued" (manage.py agent_worker executa)
+        result.runs = enqueue_runs(inserted)
+
+        # PIPELINE passo 12: entra no buffer só se a transação do lote commitar
+        for msg in inserted:
+            if msg.direction == Message.Direction.IN:
+                usage.record(
+                    usage.MESSAGE_PROCESSED, msg.workspace_id,
+                    actor="system", correlation_id=msg.correlation_id,
+                    channel_id=str(msg.channel_id), message_type=msg.message_type,
+                )
+
+    if events:
+        WebhookEvent.objects.bulk_update(events, ["normalized"])
+
+    return result
+
+
+def process_pending_events(*, batch_size: int = 500, provider: str = "evolution") -> IngestResult:
+    """
+    Pega um lote de eventos ainda não normalizados (SKIP LOCKED: vários
+    workers podem drenar em paralelo) e processa numa transação.
+    """
+    with transaction.atomic():
+        events = list(
+            WebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(provider=provider, normalized__isnull=True)
+            .order_by("created_at")[:batch_size]
+        )
+        return ingest_events(events)
@@ -0,0 +1,27 @@
+import time
+
+from apps.messages.ingest import process_pending_events
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Drena WebhookEvents pendentes em lotes (normaliza + persiste Contact/Conversation/Message)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--idle-sleep", type=float, default=0.5,
+                            help="Pausa (s) quando a fila está vazia.")
+        parser.add_argument("--once", action="store_true",
+                            help="Drena o que houver e sai.")
+
+    def handle(self, *args, **opts):
+        while True:
+            result = process_pending_events(batch_size=opts["batch_size"])
+            if result.events:
+                self.stdout.write(
+                    f"events={result.events} messages={result.messages} unresolved={result.unresolved} "
+                    f"runs={result.runs}")
+                continue
+            if opts["once"]:
+                return
+            time.sleep(opts["idle_sleep"])
@@ -0,0 +1,28 @@
+import signal
+import threading
+
+from apps.messages.outbox import OutboxDispatcher
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Envia as Messages OUT enfileiradas (filas por instância + rate limit + retries)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--once", action="store_true",
+                            help="Drena a fila atual e sai.")
+
+    def handle(self, *args, **opts):
+        dispatcher = OutboxDispatcher(workers=opts["workers"], batch_size=opts["batch_size"])
+
+        if opts["once"]:
+            dispatcher.drain(timeout=float("inf"))
+            dispatcher.shutdown()
+            return
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        signal.signal(signal.SIGINT, lambda *_: stop.set())
+        dispatcher.run_forever(stop)
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.28 on 2026-10-19 07:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('channels', '0003_channel_deleted_at'),
+        ('conversations', '0001_initial'),
+        ('tenants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Message',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('direction', models.CharField(choices=[('in', 'in'), ('out', 'out')], max_length=3)),
+                ('status', models.CharField(choices=[('received', 'received'), ('queued', 'queued'), ('sent', 'sent'), ('failed', 'failed')], max_length=20)),
+                ('message_type', models.CharField(default='text', max_length=30)),
+                ('text', models.TextField(blank=True, default='')),
+                ('media', models.JSONField(blank=True, null=True)),
+                ('provider_message_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('provider_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('webhook_event_id', models.UUIDField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='channels.channel')),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='conversations.conversation')),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='tenants.workspace')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['conversation', 'created_at'], name='msg_conv_created_idx'), models.Index(fields=['workspace', '-created_at'], name='msg_ws_created_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(condition=models.Q(('provider_message_id__isnull', False)), fields=('channel', 'provider_message_id'), name='uniq_message_provider_id_per_channel'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-19 08:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_messages', '0002_message_outbox_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='correlation_id',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
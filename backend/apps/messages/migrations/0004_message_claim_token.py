@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-19 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_messages', '0003_message_correlation_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='claim_token',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+    ]
@@ -1,3 +1,84 @@
+import uuid
+
 from django.db import models
 
-# Create your models here.
+
+class Message(models.Model):
+    class Direction(models.TextChoices):
+        IN = "in", "in"
+        OUT = "out", "out"
+
+    class Status(models.TextChoices):
+        RECEIVED = "received", "received"
+        QUEUED = "queued", "queued"
+        SENDING = "sending", "sending"
+        SENT = "sent", "sent"
+        FAILED = "failed", "failed"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    workspace = models.ForeignKey(
+        "tenants.Workspace",
+        on_delete=models.CASCADE,
+        related_name="messages",
+    )
+    channel = models.ForeignKey(
+        "channels.Channel",
+        on_delete=models.CASCADE,
+        related_name="messages",
+    )
+    conversation = models.ForeignKey(
+        "conversations.Conversation",
+        on_delete=models.CASCADE,
+        related_name="messages",
+    )
+
+    direction = models.CharField(max_length=3, choices=Direction.choices)
+    status = models.CharField(max_length=20, choices=Status.choices)
+
+    message_type = models.CharField(max_length=30, default="text")
+    text = models.TextField(blank=True, default="")
+    # metadados da mídia; o conteúdo fica no blob storage (apps.webhooks.blobs)
+    media = models.JSONField(null=True, blank=True)
+
+    provider_message_id = models.CharField(max_length=255, null=True, blank=True)
+    provider_timestamp = models.DateTimeField(null=True, blank=True)
+
+    # outbox (direction=out)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # dono do lease (status "sending"): o resultado só é gravado por quem ainda o tem
+    claim_token = models.UUIDField(null=True, blank=True)
+
+    # sem FK: WebhookEvent é particionada e a PK no banco é (id, created_at)
+    webhook_event_id = models.UUIDField(null=True, blank=True)
+    # trace de ponta a ponta (apps.core.tracing): webhook -> ingest -> envio
+    correlation_id = models.CharField(max_length=64, blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # idempotência do ingest (ON CONFLICT DO NOTHING)
+            models.UniqueConstraint(
+                fields=["channel", "provider_message_id"],
+                name="uniq_message_provider_id_per_channel",
+                condition=models.Q(provider_message_id__isnull=False),
+            ),
+        ]
+        indexes = [
+            # histórico da conversa
+            models.Index(fields=["conversation", "created_at"], name="msg_conv_created_idx"),
+            models.Index(fields=["workspace", "-created_at"], name="msg_ws_created_idx"),
+            # fila do outbox: só as OUT ainda pendentes
+            models.Index(
+                fields=["next_attempt_at"],
+                name="msg_outbox_pending_idx",
+                condition=models.Q(direction="out", status__in=["queued", "sending"]),
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Message(direction={self.direction}, id={self.id})"
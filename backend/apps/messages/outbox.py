@@ -0,0 +1,464 @@
+"""
+Outbox de mensagens (PIPELINE.md, passos 10-11).
+
+Messages OUT nascem com status "queued" (`enqueue_outbound`). O
+`OutboxDispatcher` (manage.py outbox_worker):
+
+  - reivindica com SKIP LOCKED só o que os workers livres começam já: no
+    máximo uma mensagem por canal e nenhuma de canal que tem envio em voo
+    (em qualquer processo), então uma instância lenta ocupa um worker e não
+    segura na memória a fila que outro dispatcher poderia enviar;
+  - o claim grava status "sending" + claim_token; o lease (updated_at) é
+    renovado enquanto o item está na fila local ou em voo. Lease vencido
+    volta a ser reivindicável com token novo: o dono antigo perde a renovação,
+    descarta o que não começou e o resultado dele não é gravado;
+  - cada instância tem no máximo 1 envio em voo (ordem preservada) e um token
+    bucket próprio;
+  - falhas transitórias voltam para "queued" com backoff exponencial + jitter;
+  - os status são gravados de volta em lote (bulk_update); cada envio
+    confirmado vira um evento de uso provider.send (apps.audit.usage).
+
+Só o thread do dispatcher toca o banco; os workers só fazem HTTP.
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from apps.audit import usage
+from apps.channels.models import Channel, WorkspaceProvider
+from apps.conversations import history
+from apps.core import tracing
+from apps.messages.models import Message
+from apps.providers.evolution.client import (EvolutionClient,
+                                             EvolutionClientError)
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_RESULT_FIELDS = [
+    "status",
+    "attempts",
+    "next_attempt_at",
+    "last_error",
+    "provider_message_id",
+    "sent_at",
+    "claim_token",
+    "updated_at",
+]
+
+
+def enqueue_outbound(conversation, text: str, *, message_type: str = "text") -> Message:
+    # herda o trace de quem gerou a resposta (webhook/agent run)
+    msg = Message.objects.create(
+        workspace_id=conversation.workspace_id,
+        channel_id=conversation.channel_id,
+        conversation=conversation,
+        direction=Message.Direction.OUT,
+        status=Message.Status.QUEUED,
+        message_type=message_type,
+        text=text,
+        next_attempt_at=timezone.now(),
+        correlation_id=tracing.correlation_id() or "",
+    )
+    # a resposta entra no histórico já na fila: o próximo run a enxerga
+    history.append([msg])
+    return msg
+
+
+def retry_delay(attempt: int, *, base: float = 2.0, cap: float = 300.0) -> float:
+    """Backoff exponencial com full jitter (evita rajadas sincronizadas)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self) -> float:
+        """0.0 se pegou um token; senão, quantos segundos faltam para o próximo."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+@dataclass
+class OutboxItem:
+    message_id: object
+    instance: str
+    number: str
+    text: str
+    attempts: int
+    base_url: str | None
+    api_key: str | None
+    correlation_id: str = ""
+    workspace_id: object = None
+    claim_token: object = None
+
+
+@dataclass
+class _InstanceQueue:
+    bucket: TokenBucket
+    items: deque = field(default_factory=deque)
+    busy: bool = False
+    not_before: float = 0.0
+
+
+class _NonRetryable(Exception):
+    pass
+
+
+class OutboxDispatcher:
+    def __init__(
+        self,
+        *,
+        workers: int | None = None,
+        batch_size: int = 200,
+        rate_per_second: float | None = None,
+        burst: float | None = None,
+        max_attempts: int | None = None,
+        lease_seconds: int = 300,
+        client_factory=None,
+    ):
+        self.workers = workers or int(getattr(settings, "OUTBOX_WORKERS", 8))
+        self.batch_size = batch_size
+        self.rate = rate_per_second or float(getattr(settings, "OUTBOX_RATE_PER_SECOND", 1.0))
+        self.burst = burst or float(getattr(settings, "OUTBOX_BURST", 5))
+        self.max_attempts = max_attempts or int(getattr(settings, "OUTBOX_MAX_ATTEMPTS", 5))
+        self.lease = timedelta(seconds=lease_seconds)
+        self.client_factory = client_factory or (
+            lambda base_url, api_key: EvolutionClient(base_url=base_url, api_key=api_key))
+
+        self._queues: dict[str, _InstanceQueue] = {}
+        self._pending = 0
+        # message_id -> claim_token do que foi reivindicado e ainda não teve o resultado gravado
+        self._leases: dict = {}
+        self._renewed = 0.0
+        self._results: list[tuple[object, Message]] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="outbox")
+
+    # ---------- DB (thread do dispatcher) ----------
+
+    def _claimable(self, now, stale_before) -> Q:
+        due = Q(status=Message.Status.QUEUED) & (Q(next_attempt_at__lte=now) | Q(next_attempt_at__isnull=True))
+        # worker que morreu no meio do envio: lease vencido volta para a fila
+        stale = Q(status=Message.Status.SENDING, updated_at__lt=stale_before)
+        return Q(direction=Message.Direction.OUT) & (due | stale)
+
+    def _candidates(self, now, stale_before, limit: int) -> list:
+        """A próxima mensagem de cada canal sem envio em voo (lease válido), mais antigas primeiro."""
+        table = Message._meta.db_table
+        out, sending = Message.Direction.OUT, Message.Status.SENDING
+        with connection.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT id FROM (
+                    SELECT DISTINCT ON (m.channel_id) m.id, m.next_attempt_at, m.created_at
+                    FROM {table} AS m
+                    WHERE m.direction = %s
+                      AND ((m.status = %s AND (m.next_attempt_at IS NULL OR m.next_attempt_at <= %s))
+                           OR (m.status = %s AND m.updated_at < %s))
+                      AND NOT EXISTS (
+                          SELECT 1 FROM {table} AS f
+                          WHERE f.channel_id = m.channel_id AND f.direction = %s
+                            AND f.status = %s AND f.updated_at >= %s
+                      )
+                    ORDER BY m.channel_id, m.next_attempt_at, m.created_at
+                ) AS heads
+                ORDER BY next_attempt_at, created_at
+                LIMIT %s
+                """,
+                [out, Message.Status.QUEUED, now, sending, stale_before, out, sending, stale_before, limit],
+            )
+            return [row[0] for row in cur.fetchall()]
+
+    def claim(self) -> int:
+        with self._lock:
+            room = min(self.batch_size, self.workers - self._pending)
+        if room <= 0:
+            return 0
+
+        now = timezone.now()
+        stale_before = now - self.lease
+        candidates = self._candidates(now, stale_before, room)
+        if not candidates:
+            return 0
+
+        token = uuid.uuid4()
+        with transaction.atomic():
+            # a condição é checada de novo sob o lock: outro dispatcher pode ter levado antes
+            ids = list(
+                Message.objects.select_for_update(skip_locked=True)
+                .filter(self._claimable(now, stale_before), id__in=candidates)
+                .values_list("id", flat=True)
+            )
+            if not ids:
+                return 0
+            Message.objects.filter(id__in=ids).update(
+                status=Message.Status.SENDING, claim_token=token, updated_at=now)
+
+        rows = list(
+            Message.objects.filter(id__in=ids)
+            .select_related("channel", "conversation__contact")
+            .order_by("created_at")
+        )
+        providers = {
+            wp.workspace_id: wp
+            for wp in WorkspaceProvider.objects.filter(
+                workspace_id__in={m.workspace_id for m in rows},
+                provider=WorkspaceProvider.Provider.EVOLUTION,
+            )
+        }
+
+        for msg in rows:
+            channel = msg.channel
+            if channel.provider != Channel.Provider.EVOLUTION or not channel.external_id:
+                with self._lock:
+                    self._leases[msg.id] = token
+                self._record_failure(msg.id, token, msg.attempts, "canal sem instância Evolution", retry=False)
+                continue
+            wp = providers.get(msg.workspace_id)
+            self._enqueue(
+                OutboxItem(
+                    message_id=msg.id,
+                    instance=channel.external_id,
+                    number=msg.conversation.contact.external_id,
+                    text=msg.text,
+                    attempts=msg.attempts,
+                    base_url=wp.base_url if wp else None,
+                    api_key=wp.api_key if wp else None,
+                    correlation_id=msg.correlation_id,
+                    workspace_id=msg.workspace_id,
+                    claim_token=token,
+                )
+            )
+        return len(rows)
+
+    def renew(self, *, force: bool = False) -> int:
+        """
+        Renova o lease do que está na fila local ou em voo (a cada lease/3).
+        Itens cujo lease foi tomado por outro dispatcher saem da fila local;
+        devolve quantos foram perdidos.
+        """
+        if not force and time.monotonic() - self._renewed < self.lease.total_seconds() / 3:
+            return 0
+        self._renewed = time.monotonic()
+        with self._lock:
+            leases = dict(self._leases)
+        by_token = defaultdict(list)
+        for message_id, token in leases.items():
+            by_token[token].append(message_id)
+
+        now = timezone.now()
+        lost = set()
+        for token, ids in by_token.items():
+            owned = Message.objects.filter(id__in=ids, claim_token=token, status=Message.Status.SENDING)
+            if owned.update(updated_at=now) < len(ids):
+                lost |= set(ids) - set(owned.values_list("id", flat=True))
+        if lost:
+            logger.warning("outbox: lease perdido para %d mensagens", len(lost))
+            self._drop(lost)
+        return len(lost)
+
+    def _drop(self, message_ids: set):
+        with self._lock:
+            for message_id in message_ids:
+                self._leases.pop(message_id, None)
+            for q in self._queues.values():
+                kept = deque(item for item in q.items if item.message_id not in message_ids)
+                self._pending -= len(q.items) - len(kept)
+                q.items = kept
+
+    def flush(self) -> int:
+        with self._lock:
+            results, self._results = self._results, []
+        if not results:
+            return 0
+
+        by_token = defaultdict(list)
+        for token, m in results:
+            by_token[token].append(m)
+        with transaction.atomic():
+            applied = []
+            for token, messages in by_token.items():
+                # lease tomado por outro dispatcher: o resultado dele é o que vale
+                owned = set(
+                    Message.objects.select_for_update()
+                    .filter(id__in=[m.id for m in messages], claim_token=token, status=Message.Status.SENDING)
+                    .values_list("id", flat=True)
+                )
+                applied += [m for m in messages if m.id in owned]
+            if len(applied) < len(results):
+                logger.warning("outbox: %d resultados descartados (lease perdido)", len(results) - len(applied))
+
+            # o eco (MESSAGES_UPSERT fromMe) da mensagem enviada pode ter sido
+            # ingerido antes deste flush: remove a cópia para não violar o unique
+            sent_ids = [m.provider_message_id for m in applied if m.provider_message_id]
+            if sent_ids:
+                Message.objects.filter(
+                    direction=Message.Direction.OUT,
+                    provider_message_id__in=sent_ids,
+                ).exclude(id__in=[m.id for m in applied]).delete()
+            Message.objects.bulk_update(applied, _RESULT_FIELDS, batch_size=500)
+            for m in applied:
+                if m.status == Message.Status.SENT:
+                    usage.record(
+                        usage.PROVIDER_SEND, m.workspace_id,
+                        actor="system", correlation_id=m.correlation_id,
+                        provider="evolution", message_id=str(m.id),
+                    )
+        with self._lock:
+            for _, m in results:
+                self._leases.pop(m.id, None)
+        return len(applied)
+
+    # ---------- scheduling ----------
+
+    def _enqueue(self, item: OutboxItem):
+        with self._lock:
+            q = self._queues.get(item.instance)
+            if q is None:
+                q = self._queues[item.instance] = _InstanceQueue(bucket=TokenBucket(self.rate, self.burst))
+            q.items.append(item)
+            self._leases[item.message_id] = item.claim_token
+            self._pending += 1
+
+    def dispatch(self) -> float:
+        """
+        Submete 1 envio por instância livre com token disponível.
+        Retorna quanto tempo (s) dá para dormir até algo ficar pronto.
+        """
+        now = time.monotonic()
+        wait = 1.0
+        with self._lock:
+            for q in self._queues.values():
+                if q.busy or not q.items:
+                    continue
+                if q.not_before > now:
+                    wait = min(wait, q.not_before - now)
+                    continue
+                delay = q.bucket.try_acquire()
+                if delay:
+                    q.not_before = now + delay
+                    wait = min(wait, delay)
+                    continue
+                q.busy = True
+                self._executor.submit(self._send, q, q.items.popleft())
+        return max(wait, 0.01)
+
+    @property
+    def idle(self) -> bool:
+        with self._lock:
+            return self._pending == 0 and not self._results
+
+    # ---------- workers ----------
+
+    def _send(self, q: _InstanceQueue, item: OutboxItem):
+        try:
+            client = self.client_factory(item.base_url, item.api_key)
+            with tracing.bind(item.correlation_id), \
+                    tracing.span("outbox.send", instance=item.instance, attempt=item.attempts + 1):
+                try:
+                    resp = client.send_text(item.instance, number=item.number, text=item.text)
+                except EvolutionClientError as e:
+                    # 4xx (exceto 429) não melhora com retry
+                    if e.status_code and 400 <= e.status_code < 500 and e.status_code != 429:
+                        raise _NonRetryable(str(e)) from e
+                    raise
+            key = (resp or {}).get("key") or {}
+            self._record_success(item, key.get("id"))
+        except _NonRetryable as e:
+            self._record_failure(item.message_id, item.claim_token, item.attempts + 1, str(e), retry=False)
+        except Exception as e:
+            logger.warning("outbox send failed instance=%s: %s", item.instance, e)
+            self._record_failure(item.message_id, item.claim_token, item.attempts + 1, str(e), retry=True)
+        finally:
+            with self._lock:
+                q.busy = False
+                self._pending -= 1
+
+    def _record_success(self, item: OutboxItem, provider_message_id):
+        now = timezone.now()
+        msg = Message(
+            id=item.message_id,
+            # workspace/correlation_id só para o registro de uso no flush (fora de _RESULT_FIELDS)
+            workspace_id=item.workspace_id,
+            correlation_id=item.correlation_id,
+            status=Message.Status.SENT,
+            attempts=item.attempts + 1,
+            next_attempt_at=None,
+            last_error=None,
+            provider_message_id=provider_message_id,
+            sent_at=now,
+            claim_token=None,
+            updated_at=now,
+        )
+        with self._lock:
+            self._results.append((item.claim_token, msg))
+
+    def _record_failure(self, message_id, claim_token, attempts: int, error: str, *, retry: bool):
+        now = timezone.now()
+        give_up = not retry or attempts >= self.max_attempts
+        msg = Message(
+            id=message_id,
+            status=Message.Status.FAILED if give_up else Message.Status.QUEUED,
+            attempts=attempts,
+            next_attempt_at=None if give_up else now + timedelta(seconds=retry_delay(attempts)),
+            last_error=error[:2000],
+            provider_message_id=None,
+            sent_at=None,
+            claim_token=None,
+            updated_at=now,
+        )
+        with self._lock:
+            self._results.append((claim_token, msg))
+
+    # ---------- loop ----------
+
+    def run_once(self) -> float:
+        self.claim()
+        self.renew()
+        wait = self.dispatch()
+        self.flush()
+        return wait
+
+    def drain(self, *, timeout: float = 30.0):
+        """Processa até não sobrar nada reivindicável nem em voo."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            claimed = self.claim()
+            self.renew()
+            wait = self.dispatch()
+            # resultado gravado libera o canal: a próxima mensagem dele fica reivindicável
+            flushed = self.flush()
+            if not claimed and not flushed and self.idle:
+                return
+            time.sleep(min(wait, 0.05))
+        self.flush()
+
+    def run_forever(self, stop_event: threading.Event | None = None, *, poll_interval: float = 0.5):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            wait = self.run_once()
+            stop_event.wait(min(wait, poll_interval))
+        self.shutdown()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        self.flush()
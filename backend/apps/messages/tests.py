@@ -1,3 +1,261 @@
+from datetime import timedelta
+
+from apps.audit import usage
+from apps.audit.models import AuditEvent
+from apps.channels.models import Channel
+from apps.core import tracing
+from apps.conversations.models import Contact, Conversation
+from apps.providers.evolution.client import EvolutionClientError
+from apps.tenants.models import Workspace
+from apps.webhooks.models import WebhookEvent
 from django.test import TestCase
+from django.utils import timezone
+
+from .ingest import process_pending_events
+from .models import Message
+from .outbox import OutboxDispatcher, enqueue_outbound
+
+
+def upsert_payload(instance, message_id, text, *, jid="5516999990000@s.whatsapp.net", from_me=False,
+                   timestamp=1760000000):
+    return {
+        "event": "messages.upsert",
+        "instance": instance,
+        "data": {
+            "key": {"remoteJid": jid, "fromMe": from_me, "id": message_id},
+            "pushName": "Maria",
+            "message": {"conversation": text},
+            "messageType": "conversation",
+            "messageTimestamp": timestamp,
+        },
+    }
+
+
+class MessageIngestTests(TestCase):
+    def setUp(self):
+        self.workspace = Workspace.objects.create(name="Acme")
+        self.channel = Channel.objects.create(
+            workspace=self.workspace,
+            name="Suporte",
+            provider=Channel.Provider.EVOLUTION,
+            external_id="wsp-1__ch-1",
+        )
+
+    def _event(self, payload, key):
+        return WebhookEvent.objects.create(provider="evolution", idempotency_key=key, raw_payload=payload)
+
+    def test_batch_upserts_contact_conversation_and_messages(self):
+        self._event(upsert_payload("wsp-1__ch-1", "A1", "oi"), "1")
+        self._event(upsert_payload("wsp-1__ch-1", "A2", "tudo bem?"), "2")
+        # reentrega da Evolution com outro envelope: não duplica a mensagem
+        self._event({**upsert_payload("wsp-1__ch-1", "A1", "oi"), "date_time": "x"}, "3")
+        self._event(upsert_payload("unknown", "B1", "?"), "4")
+        self._event({"event": "connection.update", "instance": "wsp-1__ch-1"}, "5")
+
+        result = process_pending_events()
+
+        self.assertEqual(result.events, 5)
+        self.assertEqual(result.messages, 2)  # a reentrega não conta
+        self.assertEqual(result.unresolved, 1)
+        self.assertEqual(Contact.objects.get().name, "Maria")
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.contact.external_id, "5516999990000")
+        self.assertEqual(
+            list(Message.objects.order_by("provider_message_id").values_list("text", "direction")),
+            [("oi", "in"), ("tudo bem?", "in")],
+        )
+        self.assertFalse(WebhookEvent.objects.filter(normalized__isnull=True).exists())
+
+    def test_second_batch_reuses_rows(self):
+        self._event(upsert_payload("wsp-1__ch-1", "A1", "oi"), "1")
+        process_pending_events()
+        self._event(upsert_payload("wsp-1__ch-1", "A2", "eu", from_me=True), "2")
+        process_pending_events()
+
+        self.assertEqual(Contact.objects.count(), 1)
+        self.assertEqual(Contact.objects.get().name, "Maria")
+        self.assertEqual(Conversation.objects.count(), 1)
+        self.assertEqual(Message.objects.filter(direction=Message.Direction.OUT).count(), 1)
+
+    def test_last_message_at_only_moves_forward_and_only_inbound_reopens(self):
+        self._event(upsert_payload("wsp-1__ch-1", "A1", "oi", timestamp=1760000100), "1")
+        process_pending_events()
+        conversation = Conversation.objects.get()
+        latest = conversation.last_message_at
+        Conversation.objects.filter(id=conversation.id).update(status=Conversation.Status.CLOSED)
+
+        # evento atrasado (mais velho) e mensagem nossa: nem volta o relógio nem reabre
+        self._event(upsert_payload("wsp-1__ch-1", "A0", "antiga", timestamp=1760000000, from_me=True), "2")
+        process_pending_events()
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.last_message_at, conversation.status), (latest, Conversation.Status.CLOSED))
+
+        self._event(upsert_payload("wsp-1__ch-1", "A2", "voltei", timestamp=1760000200), "3")
+        process_pending_events()
+        conversation.refresh_from_db()
+        self.assertGreater(conversation.last_message_at, latest)
+        self.assertEqual(conversation.status, Conversation.Status.OPEN)
+
+
+class FakeEvolution:
+    def __init__(self, fail_instances=(), status_code=None):
+        self.sent = []
+        self.fail_instances = set(fail_instances)
+        self.status_code = status_code
+
+    def __call__(self, base_url, api_key):
+        return self
+
+    def send_text(self, instance_name, *, number, text):
+        if instance_name in self.fail_instances:
+            raise EvolutionClientError("boom", status_code=self.status_code)
+        self.sent.append((instance_name, number, text))
+        return {"key": {"id": f"OUT-{len(self.sent)}"}}
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.workspace = Workspace.objects.create(name="Acme")
+        self.conversations = []
+        for i in (1, 2):
+            channel = Channel.objects.create(
+                workspace=self.workspace,
+                name=f"Canal {i}",
+                provider=Channel.Provider.EVOLUTION,
+                external_id=f"wsp-1__ch-{i}",
+            )
+            contact = Contact.objects.create(
+                workspace=self.workspace, channel=channel, external_id=f"551699999000{i}")
+            self.conversations.append(
+                Conversation.objects.create(workspace=self.workspace, channel=channel, contact=contact))
+
+    def test_sends_in_order_per_instance(self):
+        fake = FakeEvolution()
+        for text in ("um", "dois", "três"):
+            enqueue_outbound(self.conversations[0], text)
+        enqueue_outbound(self.conversations[1], "outro canal")
+
+        dispatcher = OutboxDispatcher(workers=4, rate_per_second=1000, burst=10, client_factory=fake)
+        dispatcher.drain()
+        dispatcher.shutdown()
+
+        self.assertEqual(
+            [text for instance, _, text in fake.sent if instance == "wsp-1__ch-1"],
+            ["um", "dois", "três"],
+        )
+        self.assertEqual(Message.objects.filter(status=Message.Status.SENT).count(), 4)
+        self.assertFalse(Message.objects.filter(provider_message_id__isnull=True).exists())
+
+    def test_sent_messages_are_recorded_as_usage(self):
+        fake = FakeEvolution(fail_instances={"wsp-1__ch-2"}, status_code=400)
+        enqueue_outbound(self.conversations[0], "ok")
+        enqueue_outbound(self.conversations[1], "falha")
+        usage.flush()
+
+        dispatcher = OutboxDispatcher(workers=2, rate_per_second=1000, burst=10, client_factory=fake)
+        with self.captureOnCommitCallbacks(execute=True):
+            dispatcher.drain()
+            dispatcher.shutdown()
+        usage.flush()
+
+        event = AuditEvent.objects.get()
+        self.assertEqual((event.kind, event.workspace_id), (usage.PROVIDER_SEND, self.workspace.id))
+
+    def test_failing_instance_is_retried_without_blocking_others(self):
+        fake = FakeEvolution(fail_instances={"wsp-1__ch-1"}, status_code=503)
+        failing = enqueue_outbound(self.conversations[0], "vai falhar")
+        ok = enqueue_outbound(self.conversations[1], "vai")
+
+        dispatcher = OutboxDispatcher(workers=2, rate_per_second=1000, burst=10, client_factory=fake)
+        dispatcher.drain()
+        dispatcher.shutdown()
+
+        failing.refresh_from_db()
+        ok.refresh_from_db()
+        self.assertEqual(ok.status, Message.Status.SENT)
+        self.assertEqual(failing.status, Message.Status.QUEUED)
+        self.assertEqual(failing.attempts, 1)
+        self.assertIsNotNone(failing.next_attempt_at)
+
+    def test_claims_only_what_free_workers_can_start(self):
+        for text in ("um", "dois"):
+            enqueue_outbound(self.conversations[0], text)
+        enqueue_outbound(self.conversations[1], "outro canal")
+
+        # um worker: uma mensagem; o resto fica no banco para outro dispatcher
+        self.assertEqual(OutboxDispatcher(workers=1, client_factory=FakeEvolution()).claim(), 1)
+        # canal com envio em voo fica de fora; o outro canal ainda sai
+        other = OutboxDispatcher(workers=4, client_factory=FakeEvolution())
+        self.assertEqual(other.claim(), 1)
+        self.assertEqual(Message.objects.filter(status=Message.Status.QUEUED).count(), 1)
+
+    def test_reclaimed_stale_lease_is_not_sent_twice(self):
+        msg = enqueue_outbound(self.conversations[0], "uma vez só")
+        first_fake, second_fake = FakeEvolution(), FakeEvolution()
+        first = OutboxDispatcher(workers=1, rate_per_second=1000, client_factory=first_fake, lease_seconds=60)
+        self.assertEqual(first.claim(), 1)
+
+        # o primeiro travou além do lease: outro dispatcher reivindica e envia
+        Message.objects.filter(id=msg.id).update(updated_at=timezone.now() - timedelta(minutes=5))
+        second = OutboxDispatcher(workers=1, rate_per_second=1000, client_factory=second_fake, lease_seconds=60)
+        second.drain()
+        second.shutdown()
+
+        self.assertEqual(first.renew(force=True), 1)
+        first.drain()
+        first.shutdown()
+
+        self.assertEqual(first_fake.sent, [])
+        self.assertEqual(len(second_fake.sent), 1)
+        msg.refresh_from_db()
+        self.assertEqual((msg.status, msg.claim_token), (Message.Status.SENT, None))
+
+    def test_client_errors_fail_without_retry(self):
+        fake = FakeEvolution(fail_instances={"wsp-1__ch-1"}, status_code=400)
+        msg = enqueue_outbound(self.conversations[0], "número inválido")
+
+        dispatcher = OutboxDispatcher(workers=1, client_factory=fake)
+        dispatcher.drain()
+        dispatcher.shutdown()
+
+        msg.refresh_from_db()
+        self.assertEqual(msg.status, Message.Status.FAILED)
+
+
+class CorrelationTracingTests(TestCase):
+    def setUp(self):
+        self.workspace = Workspace.objects.create(name="Acme")
+        Channel.objects.create(
+            workspace=self.workspace,
+            name="Suporte",
+            provider=Channel.Provider.EVOLUTION,
+            external_id="wsp-1__ch-1",
+        )
+
+    def test_correlation_id_follows_webhook_ingest_and_send(self):
+        response = self.client.post(
+            "/api/v1/providers/evolution/webhook/",
+            upsert_payload("wsp-1__ch-1", "A1", "oi"),
+            content_type="application/json",
+            HTTP_X_CORRELATION_ID="trace-abc-123",
+        )
+        self.assertEqual(response["X-Correlation-ID"], "trace-abc-123")
+
+        with tracing.capture() as spans:
+            process_pending_events()
+        msg = Message.objects.get()
+        self.assertEqual(msg.correlation_id, "trace-abc-123")
+        event_span = next(sp for sp in spans if sp.name == "ingest.event")
+        self.assertEqual(event_span.correlation_id, "trace-abc-123")
+
+        with tracing.bind(msg.correlation_id):
+            reply = enqueue_outbound(msg.conversation, "olá!")
+        self.assertEqual(reply.correlation_id, "trace-abc-123")
 
-# Create your tests here.
+        with tracing.capture() as spans:
+            dispatcher = OutboxDispatcher(workers=1, client_factory=FakeEvolution())
+            dispatcher.drain()
+            dispatcher.shutdown()
+        send = next(sp for sp in spans if sp.name == "outbox.send")
+        self.assertEqual(send.correlation_id, "trace-abc-123")
+        self.assertIsNone(send.error)
@@ -0,0 +1,200 @@
+"""
+Transporte HTTP compartilhado pelos providers.
+
+Um `requests.Session` por base_url, reutilizado pelo processo inteiro:
+keep-alive (sem TCP/TLS handshake a cada chamada), pool de conexões
+dimensionado por settings, timeouts (connect, read) separados e retry só onde
+é seguro (erros de conexão sempre; 502/503/504 apenas em métodos idempotentes).
+Timeout de leitura não é repetido: upstream lento fica a cargo do circuit
+breaker (apps.providers.base.resilience), sem prender quem chamou por N x read.
+
+Métricas por base_url ficam em `http_pool.stats()`; cada chamada também vai
+para a instrumentação do request (Server-Timing) e para /metrics.
+"""
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from apps.core.instrumentation import record_http
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def default_timeout() -> tuple[float, float]:
+    return (
+        float(_setting("HTTP_CONNECT_TIMEOUT", 3.05)),
+        float(_setting("HTTP_READ_TIMEOUT", 20)),
+    )
+
+
+def _retry_policy() -> Retry:
+    retries = int(_setting("HTTP_RETRIES", 2))
+    return Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        allowed_methods=IDEMPOTENT_METHODS,
+        status_forcelist=(502, 503, 504),
+        backoff_factor=0.2,
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+
+
+def _connections_opened(session: requests.Session) -> int:
+    total = 0
+    # o mesmo adapter fica montado em http:// e https://
+    for adapter in {id(a): a for a in session.adapters.values()}.values():
+        pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+        for pool in list(getattr(pools, "_container", {}).values()):
+            total += getattr(pool, "num_connections", 0)
+    return total
+
+
+class SessionPool:
+    def __init__(self):
+        self._sessions: dict[str, requests.Session] = {}
+        self._stats: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(base_url: str) -> str:
+        return (base_url or "").rstrip("/")
+
+    def _build(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=int(_setting("HTTP_POOL_CONNECTIONS", 10)),
+            pool_maxsize=int(_setting("HTTP_POOL_MAXSIZE", 32)),
+            max_retries=_retry_policy(),
+            # sem pool_block: em pico abre conexão extra em vez de enfileirar
+            pool_block=False,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get(self, base_url: str) -> requests.Session:
+        key = self._key(base_url)
+        session = self._sessions.get(key)
+        if session is not None:
+            return session
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = self._build()
+                self._stats[key] = {"requests": 0, "errors": 0, "seconds": 0.0}
+        return session
+
+    def request(self, method: str, url: str, *, base_url: str, timeout=None, **kwargs) -> requests.Response:
+        key = self._key(base_url)
+        session = self.get(key)
+        if timeout is None:
+            timeout = default_timeout()
+        elif isinstance(timeout, (int, float)):
+            timeout = (default_timeout()[0], float(timeout))
+
+        t0 = time.perf_counter()
+        failed = True
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            elapsed = time.perf_counter() - t0
+            record_http(key, elapsed, failed=failed)
+            with self._lock:
+                st = self._stats.setdefault(key, {"requests": 0, "errors": 0, "seconds": 0.0})
+                st["requests"] += 1
+                st["seconds"] += elapsed
+                if failed:
+                    st["errors"] += 1
+
+    def stats(self) -> dict[str, dict]:
+        with self._lock:
+            items = [(k, dict(v), self._sessions[k]) for k, v in self._stats.items() if k in self._sessions]
+        out = {}
+        for key, st, session in items:
+            st["connections_opened"] = _connections_opened(session)
+            st["avg_ms"] = round(1000 * st["seconds"] / st["requests"], 2) if st["requests"] else 0.0
+            out[key] = st
+        return out
+
+    def close_all(self):
+        with self._lock:
+            sessions, self._sessions, self._stats = list(self._sessions.values()), {}, {}
+        for session in sessions:
+            session.close()
+
+
+http_pool = SessionPool()
+
+
+class AsyncClientPool:
+    """
+    Equivalente async: um `httpx.AsyncClient` por (event loop, base_url).
+    O client do httpx fica preso ao loop em que foi criado, por isso a chave
+    é o próprio loop; dentro de um worker/ASGI o loop é um só e o pool é único.
+    Cada `asyncio.run` (bulk_status, management commands) cria um loop novo:
+    os clients de loops já fechados são descartados no próximo `get`.
+    """
+
+    def __init__(self):
+        self._clients: dict[tuple[object, str], object] = {}
+        self._lock = threading.Lock()
+
+    def _evict_closed_loops(self):
+        # chamado com o lock; o loop morto não tem como rodar aclose(), os
+        # sockets fecham com o transport quando o client é coletado
+        for key in [k for k in self._clients if k[0].is_closed()]:
+            self._clients.pop(key, None)
+
+    def get(self, base_url: str):
+        import asyncio
+
+        import httpx
+
+        key = (asyncio.get_running_loop(), SessionPool._key(base_url))
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            with self._lock:
+                self._evict_closed_loops()
+                client = self._clients.get(key)
+                if client is None or client.is_closed:
+                    connect, read = default_timeout()
+                    client = self._clients[key] = httpx.AsyncClient(
+                        timeout=httpx.Timeout(read, connect=connect),
+                        # com transport explícito o httpx ignora `limits=` do client:
+                        # os limites do pool vão no próprio transport
+                        transport=httpx.AsyncHTTPTransport(
+                            limits=httpx.Limits(
+                                max_connections=int(_setting("HTTP_ASYNC_MAX_CONNECTIONS", 1000)),
+                                max_keepalive_connections=int(_setting("HTTP_POOL_MAXSIZE", 32)),
+                            ),
+                            # erros de conexão: o request nem saiu, é seguro repetir
+                            retries=int(_setting("HTTP_RETRIES", 2)),
+                        ),
+                    )
+        return client
+
+    async def aclose(self):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            keys = [k for k in self._clients if k[0] is loop]
+            clients = [self._clients.pop(k) for k in keys]
+        for client in clients:
+            await client.aclose()
+
+
+async_http_pool = AsyncClientPool()
@@ -0,0 +1,248 @@
+"""
+Circuit breaker + bulkhead por upstream (base_url).
+
+Um servidor Evolution travado não pode segurar os workers que atendem os
+outros workspaces:
+
+  - bulkhead: no máximo N chamadas simultâneas por base_url; quem não
+    consegue vaga em `acquire_timeout` falha na hora (BulkheadFull);
+  - circuit breaker: depois de `failure_threshold` falhas seguidas
+    (conexão/timeout/5xx) o circuito abre e as chamadas falham na hora
+    (CircuitOpen) por `reset_timeout` segundos; depois disso deixa passar
+    `half_open_max` chamadas de teste — sucesso fecha, falha reabre.
+
+O estado é por processo. Mudanças de estado são avisadas aos listeners
+(`breakers.add_listener`) — ex.: atualizar WorkspaceProvider.status.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class UpstreamUnavailable(RuntimeError):
+    """Upstream marcado como indisponível sem nem tentar a chamada."""
+
+    def __init__(self, message: str, *, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+class BulkheadFull(UpstreamUnavailable):
+    pass
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _key(base_url: str) -> str:
+    return (base_url or "").rstrip("/")
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_max: int = 1,
+        on_change=None,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self._on_change = on_change
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error = ""
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _transition(self, new_state: str):
+        # chamado com o lock; o listener roda fora dele
+        old, self.state = self.state, new_state
+        if new_state == OPEN:
+            self.opened_at = time.monotonic()
+        if new_state != HALF_OPEN:
+            self._probes = 0
+        return (old, new_state) if old != new_state else None
+
+    def _notify(self, change):
+        if change and self._on_change:
+            try:
+                self._on_change(self, *change)
+            except Exception:
+                logger.exception("circuit breaker listener failed (%s)", self.name)
+
+    def before_call(self):
+        """Levanta CircuitOpen se a chamada não deve sair."""
+        change = None
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+                if remaining > 0:
+                    raise CircuitOpen(
+                        f"circuit open for {self.name}: {self.last_error}",
+                        retry_after=remaining,
+                    )
+                change = self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_max:
+                    raise CircuitOpen(f"circuit half-open for {self.name} (probe in flight)",
+                                      retry_after=1.0)
+                self._probes += 1
+        self._notify(change)
+
+    def release_probe(self):
+        """Chamada abortada sem resultado (cancelamento): devolve a vaga de teste."""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            change = self._transition(CLOSED) if self.state != CLOSED else None
+        self._notify(change)
+
+    def record_failure(self, error: str = ""):
+        with self._lock:
+            self.failures += 1
+            self.last_error = (error or "")[:500]
+            change = None
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                change = self._transition(OPEN)
+                self.opened_at = time.monotonic()
+        self._notify(change)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "last_error": self.last_error,
+            }
+
+
+class Bulkhead:
+    def __init__(self, name: str, *, limit: int = 16, acquire_timeout: float = 0.5):
+        self.name = name
+        self.limit = limit
+        self.acquire_timeout = acquire_timeout
+        self._sem = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    @contextmanager
+    def slot(self):
+        if not self._sem.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise BulkheadFull(f"bulkhead full for {self.name} ({self.limit} in flight)",
+                               retry_after=1.0)
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._sem.release()
+
+
+class BreakerRegistry:
+    def __init__(self):
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._bulkheads: dict[str, Bulkhead] = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, fn):
+        """fn(breaker, old_state, new_state) a cada transição."""
+        if fn not in self._listeners:
+            self._listeners.append(fn)
+
+    def _dispatch(self, breaker, old, new):
+        logger.warning("circuit %s: %s -> %s (%s)", breaker.name, old, new, breaker.last_error)
+        for fn in list(self._listeners):
+            fn(breaker, old, new)
+
+    def breaker(self, base_url: str) -> CircuitBreaker:
+        key = _key(base_url)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(key)
+                if breaker is None:
+                    breaker = self._breakers[key] = CircuitBreaker(
+                        key,
+                        failure_threshold=int(_setting("UPSTREAM_BREAKER_FAILURES", 5)),
+                        reset_timeout=float(_setting("UPSTREAM_BREAKER_RESET_SECONDS", 30)),
+                        on_change=self._dispatch,
+                    )
+        return breaker
+
+    def bulkhead(self, base_url: str) -> Bulkhead:
+        key = _key(base_url)
+        bulkhead = self._bulkheads.get(key)
+        if bulkhead is None:
+            with self._lock:
+                bulkhead = self._bulkheads.get(key)
+                if bulkhead is None:
+                    bulkhead = self._bulkheads[key] = Bulkhead(
+                        key,
+                        limit=int(_setting("UPSTREAM_BULKHEAD_SIZE", 16)),
+                        acquire_timeout=float(_setting("UPSTREAM_BULKHEAD_WAIT", 0.5)),
+                    )
+        return bulkhead
+
+    @contextmanager
+    def guard(self, base_url: str):
+        """
+        Vaga no bulkhead + permissão do breaker. Quem usa chama
+        `record_success`/`record_failure` no breaker devolvido.
+        """
+        with self.bulkhead(base_url).slot():
+            breaker = self.breaker(base_url)
+            breaker.before_call()
+            yield breaker
+
+    def stats(self) -> dict[str, dict]:
+        with self._lock:
+            keys = set(self._breakers) | set(self._bulkheads)
+        out = {}
+        for key in keys:
+            entry = {}
+            if key in self._breakers:
+                entry.update(self._breakers[key].snapshot())
+            if key in self._bulkheads:
+                bh = self._bulkheads[key]
+                entry.update({"in_flight": bh.in_flight, "rejected": bh.rejected, "limit": bh.limit})
+            out[key] = entry
+        return out
+
+    def reset(self):
+        with self._lock:
+            self._breakers.clear()
+            self._bulkheads.clear()
+
+
+breakers = BreakerRegistry()
@@ -0,0 +1,185 @@
+"""
+Client async da Evolution (mesma superfície de `EvolutionClient`).
+
+Pensado para ASGI e workers: fan-out de status e envios podem ter milhares de
+requests concorrentes num único processo, todos sobre o pool compartilhado
+`async_http_pool` (keep-alive por base_url).
+"""
+import asyncio
+import time
+
+from apps.core.instrumentation import record_http
+from apps.providers.base.http import async_http_pool
+from apps.providers.base.resilience import UpstreamUnavailable, breakers
+from apps.providers.evolution.client import (EvolutionClientError,
+                                             EvolutionUnavailable,
+                                             api_variant_from_info,
+                                             create_instance_body,
+                                             evolution_timeout, known_variant,
+                                             parse_response, remember_variant,
+                                             send_text_bodies, webhook_bodies)
+from django.conf import settings
+
+
+class AsyncEvolutionClient:
+    def __init__(self, base_url=None, api_key=None):
+        self.base_url = (base_url or settings.EVOLUTION_BASE_URL).rstrip("/")
+        self.api_key = api_key or settings.EVOLUTION_API_KEY
+
+    def _headers(self):
+        return {
+            "Content-Type": "application/json",
+            "apikey": self.api_key,
+        }
+
+    async def _request(self, method: str, path: str, *, json=None, timeout=None):
+        import httpx
+
+        connect, read = evolution_timeout()
+        if timeout is not None:
+            read = float(timeout)
+
+        # mesmo breaker do client sync; o limite de concorrência aqui é do
+        # chamador (ex.: semáforo do get_status_many), não o bulkhead de threads
+        breaker = breakers.breaker(self.base_url)
+        try:
+            breaker.before_call()
+        except UpstreamUnavailable as e:
+            raise EvolutionUnavailable(str(e), retry_after=e.retry_after) from e
+
+        client = async_http_pool.get(self.base_url)
+        t0 = time.perf_counter()
+        try:
+            r = await client.request(
+                method,
+                f"{self.base_url}{path}",
+                json=json,
+                headers=self._headers(),
+                timeout=httpx.Timeout(read, connect=connect),
+            )
+        except httpx.HTTPError as e:
+            record_http(self.base_url, time.perf_counter() - t0, failed=True)
+            breaker.record_failure(f"{type(e).__name__}: {e}")
+            raise EvolutionUnavailable(f"Evolution unreachable on {method} {path}: {e}") from e
+        except BaseException:
+            # cancelamento etc.: não conta como falha nem sucesso
+            breaker.release_probe()
+            raise
+
+        record_http(self.base_url, time.perf_counter() - t0, failed=r.status_code >= 500)
+        if r.status_code >= 500:
+            breaker.record_failure(f"HTTP {r.status_code} on {method} {path}")
+        else:
+            breaker.record_success()
+
+        try:
+            data = r.json()
+        except Exception:
+            data = None
+
+        return parse_response(method, path, r.status_code, r.text, data)
+
+    # ---------- SERVER ----------
+
+    async def server_info(self):
+        return await self._request("GET", "/")
+
+    async def api_variant(self) -> str | None:
+        variant = known_variant(self.base_url, "api")
+        if variant is None:
+            try:
+                variant = api_variant_from_info(await self.server_info())
+            except Exception:
+                variant = None
+            if variant:
+                remember_variant(self.base_url, "api", variant)
+        return variant
+
+    # ---------- INSTANCES ----------
+
+    async def create_instance(self, instance_name: str, *, integration: str = "WHATSAPP-BAILEYS"):
+        return await self._request("POST", "/instance/create", json=create_instance_body(instance_name, integration))
+
+    async def get_status(self, instance_name: str):
+        return await self._request("GET", f"/instance/connectionState/{instance_name}")
+
+    async def fetch_instances(self):
+        return await self._request("GET", "/instance/fetchInstances")
+
+    async def logout_instance(self, instance_name: str):
+        return await self._request("POST", f"/instance/logout/{instance_name}")
+
+    async def delete_instance(self, instance_name: str):
+        return await self._request("DELETE", f"/instance/delete/{instance_name}")
+
+    async def connect(self, instance_name: str):
+        return await self._request("GET", f"/instance/connect/{instance_name}")
+
+    async def connect_pairing_code(self, instance_name: str, *, number: str):
+        return await self._request("GET", f"/instance/connect/{instance_name}?number={number}")
+
+    async def set_settings(self, instance_name: str, settings_payload: dict):
+        return await self._request("POST", f"/settings/set/{instance_name}", json=settings_payload)
+
+    # ---------- WEBHOOK ----------
+
+    async def set_webhook(self, instance_name: str, *, url: str, events: list[str], enabled: bool = True):
+        payload_v2, payload_v1 = webhook_bodies(instance_name, url=url, events=events, enabled=enabled)
+        attempts = {
+            "v2": ("/webhook/instance", payload_v2),
+            "v1": (f"/webhook/set/{instance_name}", payload_v1),
+        }
+
+        variant = known_variant(self.base_url, "webhook") or await self.api_variant()
+        order = [variant, *(v for v in ("v2", "v1") if v != variant)] if variant else ["v2", "v1"]
+
+        last_error = None
+        for candidate in order:
+            path, payload = attempts[candidate]
+            try:
+                resp = await self._request("POST", path, json=payload)
+            except EvolutionClientError as e:
+                last_error = e
+                continue
+            remember_variant(self.base_url, "webhook", candidate)
+            return resp
+
+        remember_variant(self.base_url, "webhook", None)
+        raise last_error
+
+    # ---------- MESSAGES ----------
+
+    async def send_text(self, instance_name: str, *, number: str, text: str):
+        path = f"/message/sendText/{instance_name}"
+        bodies = dict(zip(("v1", "v2"), send_text_bodies(number, text)))
+        variant = known_variant(self.base_url, "send") or await self.api_variant()
+        if variant:
+            return await self._request("POST", path, json=bodies[variant])
+        try:
+            resp = await self._request("POST", path, json=bodies["v1"])
+            variant = "v1"
+        except EvolutionClientError as e:
+            if e.status_code != 400:
+                raise
+            resp = await self._request("POST", path, json=bodies["v2"])
+            variant = "v2"
+        remember_variant(self.base_url, "send", variant)
+        return resp
+
+    # ---------- FAN-OUT ----------
+
+    async def get_status_many(self, instance_names, *, concurrency: int = 50) -> dict:
+        """
+        Status de várias instâncias com concorrência limitada.
+        Erros voltam como a própria exceção no dict (não derrubam o lote).
+        """
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(name):
+            async with sem:
+                try:
+                    return name, await self.get_status(name)
+                except Exception as e:  # noqa: BLE001
+                    return name, e
+
+        return dict(await asyncio.gather(*(one(n) for n in instance_names)))
@@ -1,4 +1,10 @@
+import re
+import threading
+
 import requests
+from apps.core import tracing
+from apps.providers.base.http import http_pool
+from apps.providers.base.resilience import UpstreamUnavailable, breakers
 from django.conf import settings
 
 
@@ -10,6 +16,104 @@ class EvolutionClientError(RuntimeError):
         self.text = text
 
 
+class EvolutionUnavailable(EvolutionClientError):
+    """
+    Servidor Evolution fora (conexão/timeout) ou isolado pelo circuit
+    breaker/bulkhead. Equivale a um 503: vale tentar de novo mais tarde.
+    """
+
+    def __init__(self, message: str, *, retry_after: float | None = None):
+        super().__init__(message, status_code=503)
+        self.retry_after = retry_after
+
+
+def evolution_timeout() -> tuple[float, float]:
+    return (
+        float(getattr(settings, "EVOLUTION_CONNECT_TIMEOUT", 3.05)),
+        float(getattr(settings, "EVOLUTION_READ_TIMEOUT", 20)),
+    )
+
+
+def parse_response(method: str, path: str, status_code: int, text: str, data):
+    """Regra comum aos clients sync/async: erro HTTP vira EvolutionClientError."""
+    if status_code >= 400:
+        raise EvolutionClientError(
+            f"Evolution error {status_code} on {method} {path} | body={text[:500]}",
+            status_code=status_code,
+            data=data,
+            text=text,
+        )
+    return data if data is not None else {"_raw": text}
+
+
+def create_instance_body(instance_name: str, integration: str) -> dict:
+    return {
+        "instanceName": instance_name,
+        "qrcode": True,
+        "integration": integration,  # <- obrigatório
+    }
+
+
+def webhook_bodies(instance_name: str, *, url: str, events: list[str], enabled: bool) -> tuple[dict, dict]:
+    """(payload v2 p/ /webhook/instance, payload v1 p/ /webhook/set/{instance})"""
+    payload_v2 = {
+        "enabled": enabled,
+        "url": url,
+        "events": events,
+        "instance": instance_name,
+        # opções que algumas builds aceitam/ignoram
+        "webhook_by_events": False,
+        "webhook_base64": False,
+    }
+    payload_v1 = {
+        "enabled": enabled,
+        "url": url,
+        "events": events,
+    }
+    return payload_v2, payload_v1
+
+
+# ---------- variantes de API por base_url ----------
+# Cada servidor Evolution é v1 ou v2 para sempre (até um upgrade): descobrimos
+# uma vez por processo e pulamos a tentativa errada nas chamadas seguintes.
+
+_variants: dict[tuple[str, str], str] = {}
+_variants_lock = threading.Lock()
+
+
+def known_variant(base_url: str, kind: str) -> str | None:
+    return _variants.get((base_url.rstrip("/"), kind))
+
+
+def remember_variant(base_url: str, kind: str, variant: str | None):
+    key = (base_url.rstrip("/"), kind)
+    with _variants_lock:
+        if variant is None:
+            _variants.pop(key, None)
+        else:
+            _variants[key] = variant
+
+
+def forget_variants(base_url: str | None = None):
+    with _variants_lock:
+        for key in [k for k in _variants if base_url is None or k[0] == base_url.rstrip("/")]:
+            _variants.pop(key, None)
+
+
+def api_variant_from_info(info) -> str | None:
+    """GET / da Evolution -> {"version": "1.8.2", ...}; devolve "v1"/"v2"."""
+    version = info.get("version") if isinstance(info, dict) else None
+    match = re.match(r"\s*v?(\d+)", str(version or ""))
+    if not match:
+        return None
+    return "v2" if int(match.group(1)) >= 2 else "v1"
+
+
+def send_text_bodies(number: str, text: str) -> tuple[dict, dict]:
+    """(payload v1, payload v2) de /message/sendText/{instance}"""
+    return {"number": number, "textMessage": {"text": text}}, {"number": number, "text": text}
+
+
 class EvolutionClient:
     def __init__(self, base_url=None, api_key=None):
         self.base_url = (base_url or settings.EVOLUTION_BASE_URL).rstrip("/")
@@ -21,47 +125,81 @@ class EvolutionClient:
             "apikey": self.api_key,
         }
 
-    def _request(self, method: str, path: str, *, json=None, timeout=20):
+    def _request(self, method: str, path: str, *, json=None, timeout=None):
+        with tracing.span("evolution.request", method=method, path=path) as sp:
+            status_code, text, data = self._call(method, path, json=json, timeout=timeout)
+            sp.set(status=status_code)
+        return parse_response(method, path, status_code, text, data)
+
+    def _call(self, method: str, path: str, *, json=None, timeout=None):
+        # sessão keep-alive compartilhada por base_url (apps.providers.base.http),
+        # isolada por bulkhead + circuit breaker (apps.providers.base.resilience)
         url = f"{self.base_url}{path}"
-        r = requests.request(
-            method,
-            url,
-            json=json,
-            headers=self._headers(),
-            timeout=timeout,
-        )
+        try:
+            with breakers.guard(self.base_url) as breaker:
+                try:
+                    r = http_pool.request(
+                        method,
+                        url,
+                        base_url=self.base_url,
+                        json=json,
+                        headers=self._headers(),
+                        timeout=timeout or evolution_timeout(),
+                    )
+                except requests.RequestException as e:
+                    breaker.record_failure(f"{type(e).__name__}: {e}")
+                    raise EvolutionUnavailable(f"Evolution unreachable on {method} {path}: {e}") from e
+                except BaseException:
+                    breaker.release_probe()
+                    raise
+
+                if r.status_code >= 500:
+                    breaker.record_failure(f"HTTP {r.status_code} on {method} {path}")
+                else:
+                    breaker.record_success()
+        except UpstreamUnavailable as e:
+            raise EvolutionUnavailable(str(e), retry_after=e.retry_after) from e
 
         try:
             data = r.json()
         except Exception:
             data = None
 
-        if not r.ok:
-            raise EvolutionClientError(
-                f"Evolution error {r.status_code} on {method} {path} | body={r.text[:500]}",
-                status_code=r.status_code,
-                data=data,
-                text=r.text,
-            )
+        return r.status_code, r.text, data
+
+    # ---------- SERVER ----------
 
-        return data if data is not None else {"_raw": r.text}
+    def server_info(self):
+        """GET / -> {"status", "message", "version", ...}"""
+        return self._request("GET", "/")
+
+    def api_variant(self) -> str | None:
+        """"v1"/"v2" do servidor (memoizado por base_url); None se não der para saber."""
+        variant = known_variant(self.base_url, "api")
+        if variant is None:
+            try:
+                variant = api_variant_from_info(self.server_info())
+            except Exception:
+                variant = None
+            if variant:
+                remember_variant(self.base_url, "api", variant)
+        return variant
 
     # ---------- INSTANCES ----------
 
     def create_instance(self, instance_name: str, *, integration: str = "WHATSAPP-BAILEYS"):
-        return self._request(
-            "POST",
-            "/instance/create",
-            json={
-                "instanceName": instance_name,
-                "qrcode": True,
-                "integration": integration,  # <- obrigatório
-            },
-        )
+        return self._request("POST", "/instance/create", json=create_instance_body(instance_name, integration))
 
     def get_status(self, instance_name: str):
         return self._request("GET", f"/instance/connectionState/{instance_name}")
 
+    def fetch_instances(self):
+        """
+        Todas as instâncias do servidor com o estado de conexão, numa chamada.
+        GET /instance/fetchInstances
+        """
+        return self._request("GET", "/instance/fetchInstances")
+
     def logout_instance(self, instance_name: str):
         """
         Logout / disconnect (dependendo da Evolution, isso derruba a sessão).
@@ -76,6 +214,13 @@ class EvolutionClient:
         """
         return self._request("DELETE", f"/instance/delete/{instance_name}")
 
+    def connect(self, instance_name: str):
+        """
+        QR Code:
+        GET /instance/connect/{instance}
+        """
+        return self._request("GET", f"/instance/connect/{instance_name}")
+
     # ---------- PAIRING CODE (ONLY) ----------
 
     def connect_pairing_code(self, instance_name: str, *, number: str):
@@ -93,34 +238,61 @@ class EvolutionClient:
         # POST /settings/set/{instance}
         return self._request("POST", f"/settings/set/{instance_name}", json=settings_payload)
 
-        # ---------- WEBHOOK ----------
+    # ---------- WEBHOOK ----------
+
     def set_webhook(self, instance_name: str, *, url: str, events: list[str], enabled: bool = True):
         """
         Configura webhook para a instância.
         Algumas versões da Evolution usam /webhook/instance (v2) e outras /webhook/set/{instance}.
-        Tentamos os dois para ser compatível.
+        A variante que funcionou fica memoizada por base_url (ou vem da versão
+        do servidor); sem memo, tentamos as duas.
         """
-
-        payload_v2 = {
-            "enabled": enabled,
-            "url": url,
-            "events": events,
-            "instance": instance_name,
-            # opções que algumas builds aceitam/ignoram
-            "webhook_by_events": False,
-            "webhook_base64": False,
+        payload_v2, payload_v1 = webhook_bodies(instance_name, url=url, events=events, enabled=enabled)
+        attempts = {
+            "v2": ("/webhook/instance", payload_v2),
+            "v1": (f"/webhook/set/{instance_name}", payload_v1),
         }
 
-        # Tentativa 1 (comum em v2)
+        variant = known_variant(self.base_url, "webhook") or self.api_variant()
+        order = [variant, *(v for v in ("v2", "v1") if v != variant)] if variant else ["v2", "v1"]
+
+        last_error = None
+        for candidate in order:
+            path, payload = attempts[candidate]
+            try:
+                resp = self._request("POST", path, json=payload)
+            except EvolutionClientError as e:
+                last_error = e
+                continue
+            remember_variant(self.base_url, "webhook", candidate)
+            return resp
+
+        remember_variant(self.base_url, "webhook", None)
+        raise last_error
+
+    # ---------- MESSAGES ----------
+
+    def send_text(self, instance_name: str, *, number: str, text: str):
+        """
+        Envia texto.
+        v1: POST /message/sendText/{instance} {"number", "textMessage": {"text"}}
+        v2: POST /message/sendText/{instance} {"number", "text"}
+        Com a variante conhecida (memo por base_url ou versão do servidor) vai
+        um corpo só e um 400 é erro de verdade. Sem ela, um 400 no formato v1
+        indica build v2: tenta de novo e memoiza a que passou.
+        """
+        path = f"/message/sendText/{instance_name}"
+        bodies = dict(zip(("v1", "v2"), send_text_bodies(number, text)))
+        variant = known_variant(self.base_url, "send") or self.api_variant()
+        if variant:
+            return self._request("POST", path, json=bodies[variant])
         try:
-            return self._request("POST", "/webhook/instance", json=payload_v2, timeout=20)
-        except EvolutionClientError:
-            pass
-
-        # Tentativa 2 (comum em outras builds)
-        payload_v1 = {
-            "enabled": enabled,
-            "url": url,
-            "events": events,
-        }
-        return self._request("POST", f"/webhook/set/{instance_name}", json=payload_v1, timeout=20)
+            resp = self._request("POST", path, json=bodies["v1"])
+            variant = "v1"
+        except EvolutionClientError as e:
+            if e.status_code != 400:
+                raise
+            resp = self._request("POST", path, json=bodies["v2"])
+            variant = "v2"
+        remember_variant(self.base_url, "send", variant)
+        return resp
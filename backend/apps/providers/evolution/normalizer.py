@@ -0,0 +1,147 @@
+"""
+Normalização de eventos da Evolution para o formato interno (PIPELINE.md, passo 4).
+
+Só MESSAGES_UPSERT vira mensagem; os demais eventos são marcados como
+"ignored" para não voltarem à fila de ingest.
+"""
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+PROVIDER = "evolution"
+
+_MEDIA_TYPES = {
+    "imageMessage": "image",
+    "videoMessage": "video",
+    "audioMessage": "audio",
+    "documentMessage": "document",
+    "stickerMessage": "sticker",
+}
+
+
+def normalize_event_name(raw) -> str:
+    """'messages.upsert' / 'MESSAGES_UPSERT' -> 'MESSAGES_UPSERT'."""
+    return str(raw or "").strip().upper().replace(".", "_")
+
+
+def get_event(payload: dict) -> str:
+    return normalize_event_name(payload.get("event") or payload.get("type"))
+
+
+def get_instance(payload: dict) -> str | None:
+    if payload.get("instance"):
+        return payload.get("instance")
+    if payload.get("instanceName"):
+        return payload.get("instanceName")
+    data = payload.get("data")
+    if isinstance(data, dict):
+        return data.get("instance") or data.get("instanceName")
+    return None
+
+
+def _contact_id(remote_jid: str) -> str:
+    # 5516999999999@s.whatsapp.net -> 5516999999999 (grupos mantêm o jid inteiro)
+    if remote_jid.endswith("@s.whatsapp.net"):
+        return remote_jid.split("@", 1)[0].split(":", 1)[0]
+    return remote_jid
+
+
+def _timestamp(value) -> str | None:
+    try:
+        ts = int(value)
+    except (TypeError, ValueError):
+        return None
+    return datetime.fromtimestamp(ts, tz=dt_timezone.utc).isoformat()
+
+
+def _extract_content(message: dict) -> tuple[str, str, dict | None]:
+    """Retorna (message_type, text, media)."""
+    if not isinstance(message, dict):
+        return "unknown", "", None
+
+    if message.get("conversation"):
+        return "text", message["conversation"], None
+
+    ext = message.get("extendedTextMessage")
+    if isinstance(ext, dict) and ext.get("text"):
+        return "text", ext["text"], None
+
+    for key, media_type in _MEDIA_TYPES.items():
+        body = message.get(key)
+        if isinstance(body, dict):
+            media = {
+                "type": media_type,
+                "mimetype": body.get("mimetype"),
+                "file_name": body.get("fileName"),
+            }
+            # quando o webhook vem com base64, o blob já foi offloadado no ingest
+            # (apps.webhooks.blobs) e aqui só circula a referência
+            if message.get("base64") is not None:
+                media["blob"] = message.get("base64")
+            return media_type, body.get("caption") or "", media
+
+    buttons = message.get("buttonsResponseMessage")
+    if isinstance(buttons, dict):
+        return "text", buttons.get("selectedDisplayText") or "", None
+
+    list_resp = message.get("listResponseMessage")
+    if isinstance(list_resp, dict):
+        return "text", list_resp.get("title") or "", None
+
+    return "unknown", "", None
+
+
+def _normalize_message(instance: str, item: dict) -> dict | None:
+    key = item.get("key") or {}
+    remote_jid = key.get("remoteJid") or ""
+    message_id = key.get("id")
+    if not remote_jid or not message_id or remote_jid == "status@broadcast":
+        return None
+
+    message_type, text, media = _extract_content(item.get("message"))
+    return {
+        "event_type": "message.received",
+        "provider": PROVIDER,
+        "provider_event_id": message_id,
+        "channel_external_id": instance,
+        "contact_external_id": _contact_id(remote_jid),
+        "contact_name": item.get("pushName") or "",
+        "from_me": bool(key.get("fromMe")),
+        "message_type": message_type,
+        "message_text": text,
+        "media": media,
+        "timestamp": _timestamp(item.get("messageTimestamp")),
+    }
+
+
+def normalize_payload(payload: dict) -> dict:
+    """
+    Retorna {"event_type": ..., "messages": [...]} para MESSAGES_UPSERT e
+    {"event_type": "ignored", ...} para o resto.
+    """
+    event = get_event(payload)
+    instance = get_instance(payload)
+
+    if event != "MESSAGES_UPSERT" or not instance:
+        return {"event_type": "ignored", "provider": PROVIDER, "event": event}
+
+    data = payload.get("data")
+    if isinstance(data, dict) and isinstance(data.get("messages"), list):
+        items = data["messages"]
+    elif isinstance(data, list):
+        items = data
+    else:
+        items = [data]
+
+    messages = []
+    for item in items:
+        if isinstance(item, dict):
+            msg = _normalize_message(instance, item)
+            if msg:
+                messages.append(msg)
+
+    return {
+        "event_type": "messages.upsert",
+        "provider": PROVIDER,
+        "channel_external_id": instance,
+        "messages": messages,
+    }
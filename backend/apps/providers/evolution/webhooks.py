@@ -1,42 +1,57 @@
 import hashlib
 import json
 
+from apps.channels.connection import record_state
+from apps.channels.pairing import extract_qr_data_url, publish_pairing
+from apps.core import tracing
+from apps.providers.evolution.normalizer import get_event, get_instance
+from apps.webhooks.blobs import slim_headers, strip_payload
 from apps.webhooks.models import WebhookEvent
-from django.core.cache import cache
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 
 
-def _get_event(payload: dict) -> str:
-    return (payload.get("event") or payload.get("type") or "").upper()
+def _event_data(payload: dict) -> dict:
+    data = payload.get("data")
+    return data if isinstance(data, dict) else payload
 
 
-def _get_instance(payload: dict) -> str | None:
-    if payload.get("instance"):
-        return payload.get("instance")
-    if payload.get("instanceName"):
-        return payload.get("instanceName")
-    data = payload.get("data")
-    if isinstance(data, dict):
-        return data.get("instance") or data.get("instanceName")
+def _get_qr_base64(payload: dict) -> str | None:
+    data = _event_data(payload)
+
+    # v1/v2: data.qrcode = {"base64": "data:image/png;base64,...", "code": "2@...", "pairingCode": ...}
+    qrcode = data.get("qrcode")
+    if isinstance(qrcode, dict):
+        b64, _ = extract_qr_data_url(qrcode)
+        if b64:
+            return b64
+
+    b64, _ = extract_qr_data_url(data)
+    if b64:
+        return b64
+
+    # builds antigos: data.qr / data.qrcode como string
+    for key in ("qr", "qrcode"):
+        b64, _ = extract_qr_data_url({"base64": data.get(key)})
+        if b64:
+            return b64
     return None
 
 
-def _get_qr_base64(payload: dict) -> str | None:
-    data = payload.get("data") if isinstance(
-        payload.get("data"), dict) else payload
-    if not isinstance(data, dict):
-        return None
+def _get_pairing_code(payload: dict) -> str | None:
+    qrcode = _event_data(payload).get("qrcode")
+    if isinstance(qrcode, dict):
+        return qrcode.get("pairingCode") or None
+    return None
 
-    v = data.get("base64") or data.get(
-        "qrcode") or data.get("qr") or data.get("code")
-    if not isinstance(v, str) or not v:
-        return None
 
-    if v.startswith("data:image"):
-        return v.split(",", 1)[-1]
-    return v
+def _get_connection_state(payload: dict) -> str | None:
+    data = _event_data(payload)
+    state = data.get("state") or data.get("status")
+    if isinstance(state, str) and state:
+        return state.lower()
+    return None
 
 
 def _stable_hash(payload: dict) -> str:
@@ -79,7 +94,8 @@ def _create_webhook_event(*, provider: str, payload: dict, headers: dict):
             payload_field = name
             break
     if payload_field:
-        create_kwargs[payload_field] = payload
+        # mídia/QR em base64 vão para o blob storage; no JSON fica a referência
+        create_kwargs[payload_field] = strip_payload(payload)
 
     # headers (tenta vários nomes comuns)
     headers_field = None
@@ -88,7 +104,7 @@ def _create_webhook_event(*, provider: str, payload: dict, headers: dict):
             headers_field = name
             break
     if headers_field:
-        create_kwargs[headers_field] = headers
+        create_kwargs[headers_field] = slim_headers(headers)
 
     WebhookEvent.objects.create(**create_kwargs)
     return True
@@ -99,19 +115,28 @@ def _create_webhook_event(*, provider: str, payload: dict, headers: dict):
 def evolution_webhook(request):
     payload = request.data if isinstance(request.data, dict) else {}
 
-    # 1) Mantém QR cache
-    event = _get_event(payload)
-    instance = _get_instance(payload)
-    qr_base64 = _get_qr_base64(payload)
-
-    if event == "QRCODE_UPDATED" and instance and qr_base64:
-        cache.set(f"evo:qr:{instance}", qr_base64, timeout=60 * 10)  # 10 min
-
-    # 2) Salva no inbox
-    _create_webhook_event(
-        provider="evolution",
-        payload=payload,
-        headers=dict(request.headers),
-    )
+    # 1) Estado de pareamento (cache versionado + pub/sub para o long-poll)
+    event = get_event(payload)
+    instance = get_instance(payload)
+
+    with tracing.span("evolution.webhook", event=event, instance=instance) as sp:
+        if instance and event == "QRCODE_UPDATED":
+            qr_base64 = _get_qr_base64(payload)
+            pairing_code = _get_pairing_code(payload)
+            if qr_base64 or pairing_code:
+                publish_pairing(instance, qr_base64=qr_base64, pairing_code=pairing_code)
+        elif instance and event == "CONNECTION_UPDATE":
+            state = _get_connection_state(payload)
+            if state:
+                record_state(instance, state, source="webhook")
+                publish_pairing(instance, state=state)
+
+        # 2) Salva no inbox (o correlation_id vai junto nos headers para o ingest)
+        created = _create_webhook_event(
+            provider="evolution",
+            payload=payload,
+            headers={**request.headers, tracing.TRACE_HEADER: tracing.correlation_id()},
+        )
+        sp.set(duplicate=not created)
 
     return Response({"ok": True})
@@ -0,0 +1,454 @@
+"""
+Gateway do LLM: o único lugar que fala com a API (OpenAI-compatível).
+
+RAG (embeddings, resposta) e agents passam por aqui e dividem o mesmo
+transporte:
+
+  - pool keep-alive por base_url (apps.providers.base.http) isolado por
+    bulkhead + circuit breaker (apps.providers.base.resilience);
+  - credenciais por workspace (BYOK): WorkspaceProvider(provider="openai")
+    com api_key (e base_url opcional) tem precedência sobre OPENAI_API_KEY;
+    lookup em cache, invalidado por signal (apps.channels.signals);
+  - roteamento de modelo: `route` ("chat", "rag", "agent", "embed") ou um
+    alias em LLM_MODEL_ROUTES viram o modelo concreto; nome de modelo passa direto;
+  - timeouts (connect, read) separados; hedging opcional — se a primeira
+    chamada não responde em LLM_HEDGE_AFTER segundos sai uma segunda igual e
+    vale a que chegar primeiro (padrão só em embeddings: idempotente e barato);
+  - streaming (SSE da Responses API) com o mesmo Completion no final;
+  - tokens vêm do `usage` da resposta e vão para /metrics; custo via
+    apps.audit.usage.estimate_cost.
+
+Config é lida em settings a cada chamada (nada congelado no import).
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+from decimal import Decimal
+from functools import partial
+
+import requests
+from django.conf import settings
+
+from apps.audit.usage import estimate_cost
+from apps.channels.models import WorkspaceProvider
+from apps.core import tracing
+from apps.core.cache import namespace
+from apps.core.metrics import registry
+from apps.providers.base.http import http_pool
+from apps.providers.base.resilience import UpstreamUnavailable, breakers
+
+logger = logging.getLogger(__name__)
+
+REQUESTS = registry.counter("llm_requests_total", "Chamadas ao LLM", ["operation", "status"])
+TOKENS = registry.counter("llm_tokens_total", "Tokens consumidos no LLM (do `usage`)", ["operation", "model", "direction"])
+SECONDS = registry.histogram("llm_request_seconds", "Latência das chamadas ao LLM", ["operation"])
+HEDGES = registry.counter("llm_hedges_total", "Chamadas duplicadas por hedging", ["operation", "winner"])
+
+DEFAULT_ROUTES = {"chat": "gpt-4o-mini", "embed": "text-embedding-3-small"}
+
+_credentials = namespace("llm-credentials", l1=True)
+
+
+class LLMError(RuntimeError):
+    def __init__(self, message: str, *, status_code: int | None = None, text: str | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.text = text
+
+
+class LLMUnavailable(LLMError):
+    """Upstream fora, 5xx/429 ou circuito aberto: vale tentar de novo mais tarde."""
+
+    def __init__(self, message: str, *, status_code: int | None = 503, retry_after: float | None = None):
+        super().__init__(message, status_code=status_code)
+        self.retry_after = retry_after
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+# ---------- credenciais (BYOK) ----------
+
+@dataclass(frozen=True)
+class Credentials:
+    base_url: str
+    api_key: str = field(repr=False)
+    byok: bool = False
+
+
+def default_base_url() -> str:
+    return (_setting("OPENAI_BASE_URL", "") or "https://api.openai.com/v1").rstrip("/")
+
+
+def _load_workspace_credentials(workspace_id) -> dict | None:
+    row = (
+        WorkspaceProvider.objects.filter(workspace_id=workspace_id, provider=WorkspaceProvider.Provider.OPENAI)
+        .values("base_url", "api_key")
+        .first()
+    )
+    return row if row and row["api_key"] else None
+
+
+def credentials_for(workspace_id=None) -> Credentials:
+    own = None
+    if workspace_id:
+        own = _credentials.get_or_set(
+            str(workspace_id),
+            partial(_load_workspace_credentials, workspace_id),
+            timeout=int(_setting("LLM_CREDENTIALS_TTL", 300)),
+            none_timeout=int(_setting("LLM_CREDENTIALS_TTL", 300)),
+        )
+    if own:
+        return Credentials((own["base_url"] or default_base_url()).rstrip("/"), own["api_key"], byok=True)
+
+    api_key = _setting("OPENAI_API_KEY", "")
+    if not api_key:
+        raise LLMError("OPENAI_API_KEY não configurada.")
+    return Credentials(default_base_url(), api_key)
+
+
+def invalidate_credentials(workspace_id):
+    _credentials.delete(str(workspace_id))
+
+
+# ---------- roteamento de modelo ----------
+
+def resolve_model(model: str | None = None, *, route: str = "chat") -> str:
+    """Alias/rota -> modelo concreto. `model` explícito que não é alias passa direto."""
+    routes = {
+        **DEFAULT_ROUTES,
+        "chat": _setting("LLM_CHAT_MODEL", DEFAULT_ROUTES["chat"]),
+        "embed": _setting("LLM_EMBED_MODEL", DEFAULT_ROUTES["embed"]),
+        **_setting("LLM_MODEL_ROUTES", {}),
+    }
+    name = model or route
+    # segue alias encadeado ("agent" -> "chat" -> modelo), sem loop
+    for _ in range(len(routes) + 1):
+        if name not in routes or routes[name] == name:
+            break
+        name = routes[name]
+    if name == route and route not in routes:
+        name = routes["chat"]
+    return name
+
+
+# ---------- resultados ----------
+
+@dataclass
+class Completion:
+    text: str
+    model: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    @property
+    def cost_usd(self) -> Decimal:
+        return estimate_cost(self.model, self.input_tokens, self.output_tokens)
+
+
+@dataclass
+class Embeddings:
+    vectors: list[list[float]]
+    model: str
+    input_tokens: int = 0
+
+    @property
+    def cost_usd(self) -> Decimal:
+        return estimate_cost(self.model, self.input_tokens, 0)
+
+
+def parse_completion(out: dict, model: str) -> Completion:
+    """Corpo de /responses (ou o `response` do evento response.completed) -> Completion."""
+    text_parts = []
+    for item in out.get("output", []) or []:
+        for c in item.get("content", []) or []:
+            if c.get("type") == "output_text":
+                text_parts.append(c.get("text", ""))
+
+    usage = out.get("usage", {}) or {}
+    return Completion(
+        text="\n".join([t for t in text_parts if t]).strip(),
+        model=out.get("model") or model,
+        input_tokens=int(usage.get("input_tokens") or 0),
+        output_tokens=int(usage.get("output_tokens") or 0),
+    )
+
+
+def _account(operation: str, model: str, input_tokens: int, output_tokens: int = 0):
+    if input_tokens:
+        TOKENS.inc(input_tokens, operation=operation, model=model, direction="input")
+    if output_tokens:
+        TOKENS.inc(output_tokens, operation=operation, model=model, direction="output")
+
+
+class CompletionStream:
+    """
+    Itera os pedaços de texto conforme chegam; depois de consumido,
+    `.completion` tem o texto inteiro e os tokens do evento final.
+
+        stream = gateway.stream(messages, workspace_id=ws.id)
+        for delta in stream:
+            ...
+        stream.completion.total_tokens
+    """
+
+    def __init__(self, response: requests.Response, model: str):
+        self._response = response
+        self.model = model
+        self.completion: Completion | None = None
+
+    def _events(self):
+        # SSE é sempre UTF-8; sem charset no Content-Type o requests assumiria latin-1
+        self._response.encoding = "utf-8"
+        for line in self._response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            try:
+                yield json.loads(data)
+            except ValueError:
+                logger.warning("llm stream: evento inválido ignorado: %s", data[:200])
+
+    def __iter__(self):
+        parts = []
+        try:
+            for event in self._events():
+                kind = event.get("type")
+                if kind == "response.output_text.delta":
+                    delta = event.get("delta") or ""
+                    parts.append(delta)
+                    yield delta
+                elif kind == "response.completed":
+                    self.completion = parse_completion(event.get("response") or {}, self.model)
+                elif kind in ("error", "response.failed"):
+                    error = event.get("error") or (event.get("response") or {}).get("error") or {}
+                    raise LLMError(f"LLM stream error: {error.get('message') or event}")
+        finally:
+            self.close()
+
+        if self.completion is None:
+            # stream cortado antes do evento final: sem usage, fica o texto
+            self.completion = Completion(text="".join(parts).strip(), model=self.model)
+        elif not self.completion.text:
+            self.completion.text = "".join(parts).strip()
+        _account("stream", self.completion.model, self.completion.input_tokens, self.completion.output_tokens)
+
+    def close(self):
+        self._response.close()
+
+
+# ---------- gateway ----------
+
+class LLMGateway:
+    def __init__(self):
+        self._hedge_executor = None
+        self._hedge_slots = None
+        self._lock = threading.Lock()
+
+    # ----- transporte -----
+
+    @staticmethod
+    def _timeout(read: float | None, default_read: str, fallback: float) -> tuple[float, float]:
+        return (
+            float(_setting("LLM_CONNECT_TIMEOUT", 3.05)),
+            float(read if read is not None else _setting(default_read, fallback)),
+        )
+
+    def _post(self, creds: Credentials, path: str, payload: dict, *, timeout, stream: bool = False):
+        url = f"{creds.base_url}{path}"
+        headers = {"Authorization": f"Bearer {creds.api_key}", "Content-Type": "application/json"}
+        try:
+            with breakers.guard(creds.base_url) as breaker:
+                try:
+                    r = http_pool.request(
+                        "POST", url, base_url=creds.base_url, headers=headers,
+                        json=payload, timeout=timeout, stream=stream,
+                    )
+                except requests.RequestException as e:
+                    breaker.record_failure(f"{type(e).__name__}: {e}")
+                    raise LLMUnavailable(f"LLM unreachable on POST {path}: {e}") from e
+                except BaseException:
+                    breaker.release_probe()
+                    raise
+                # 429 é cota da key (às vezes BYOK de um workspace), não o upstream fora
+                if r.status_code >= 500:
+                    breaker.record_failure(f"HTTP {r.status_code} on POST {path}")
+                else:
+                    breaker.record_success()
+        except UpstreamUnavailable as e:
+            raise LLMUnavailable(str(e), retry_after=e.retry_after) from e
+
+        if r.status_code >= 400:
+            text = r.text
+            r.close()
+            if r.status_code == 429 or r.status_code >= 500:
+                retry_after = r.headers.get("Retry-After")
+                raise LLMUnavailable(
+                    f"LLM error {r.status_code} on POST {path} | body={text[:500]}",
+                    status_code=r.status_code,
+                    retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+                )
+            raise LLMError(f"LLM error {r.status_code} on POST {path} | body={text[:500]}",
+                           status_code=r.status_code, text=text)
+        return r
+
+    def _call(self, operation: str, creds: Credentials, path: str, payload: dict, *, timeout) -> dict:
+        t0 = time.perf_counter()
+        status = "error"
+        try:
+            r = self._post(creds, path, payload, timeout=timeout)
+            status = "ok"
+            return r.json()
+        finally:
+            SECONDS.observe(time.perf_counter() - t0, operation=operation)
+            REQUESTS.inc(operation=operation, status=status)
+
+    def _submit(self, fn):
+        """
+        fn() numa thread do pool de hedging, ou None se não há worker livre:
+        nada fica na fila, então o relógio do LLM_HEDGE_AFTER corre com a
+        chamada já no ar e uma fila cheia não vira chamadas duplicadas.
+        """
+        with self._lock:
+            if self._hedge_executor is None:
+                workers = int(_setting("LLM_HEDGE_WORKERS", 16))
+                self._hedge_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-hedge")
+                self._hedge_slots = threading.BoundedSemaphore(workers)
+        if not self._hedge_slots.acquire(blocking=False):
+            return None
+        try:
+            future = self._hedge_executor.submit(tracing.wrap(fn))
+        except BaseException:
+            self._hedge_slots.release()
+            raise
+        future.add_done_callback(lambda _: self._hedge_slots.release())
+        return future
+
+    def _hedged(self, operation: str, fn, hedge: bool):
+        """
+        fn() e, se ela passar de LLM_HEDGE_AFTER, uma cópia em paralelo; vale a
+        primeira que der certo. A perdedora não é cancelada (requests não
+        aborta no meio), só ignorada — por isso hedging custa uma chamada a mais.
+        Com o pool ocupado a chamada roda no thread de quem chamou, sem hedge.
+        """
+        delay = float(_setting("LLM_HEDGE_AFTER", 0)) if hedge else 0
+        if delay <= 0:
+            return fn()
+
+        first = self._submit(fn)
+        if first is None:
+            HEDGES.inc(operation=operation, winner="skipped")
+            return fn()
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeout:
+            pass
+
+        second = self._submit(fn)
+        if second is None:
+            HEDGES.inc(operation=operation, winner="skipped")
+            return first.result()
+        pending = {first: "primary", second: "hedge"}
+        error = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                winner = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                HEDGES.inc(operation=operation, winner=winner)
+                return result
+        raise error
+
+    # ----- operações -----
+
+    @tracing.traced("llm.complete")
+    def complete(
+        self,
+        messages: list[dict],
+        *,
+        workspace_id=None,
+        model: str | None = None,
+        route: str = "chat",
+        timeout: float | None = None,
+        hedge: bool = False,
+    ) -> Completion:
+        """Uma chamada à Responses API (`input` = [{"role", "content"}, ...])."""
+        creds = credentials_for(workspace_id)
+        model = resolve_model(model, route=route)
+        out = self._hedged("complete", partial(
+            self._call, "complete", creds, "/responses", {"model": model, "input": messages},
+            timeout=self._timeout(timeout, "LLM_READ_TIMEOUT", 90),
+        ), hedge)
+        completion = parse_completion(out, model)
+        _account("complete", completion.model, completion.input_tokens, completion.output_tokens)
+        return completion
+
+    def stream(
+        self,
+        messages: list[dict],
+        *,
+        workspace_id=None,
+        model: str | None = None,
+        route: str = "chat",
+        timeout: float | None = None,
+    ) -> CompletionStream:
+        """Como `complete`, mas devolve o texto em pedaços (SSE). Sem hedging."""
+        creds = credentials_for(workspace_id)
+        model = resolve_model(model, route=route)
+        with tracing.span("llm.stream", model=model):
+            try:
+                r = self._post(
+                    creds, "/responses", {"model": model, "input": messages, "stream": True},
+                    timeout=self._timeout(timeout, "LLM_READ_TIMEOUT", 90), stream=True,
+                )
+            except LLMError:
+                REQUESTS.inc(operation="stream", status="error")
+                raise
+        REQUESTS.inc(operation="stream", status="ok")
+        return CompletionStream(r, model)
+
+    @tracing.traced("llm.embed")
+    def embed(
+        self,
+        texts: list[str],
+        *,
+        workspace_id=None,
+        model: str | None = None,
+        timeout: float | None = None,
+        hedge: bool = True,
+    ) -> Embeddings:
+        if not texts:
+            return Embeddings(vectors=[], model=resolve_model(model, route="embed"))
+        creds = credentials_for(workspace_id)
+        model = resolve_model(model, route="embed")
+        out = self._hedged("embed", partial(
+            self._call, "embed", creds, "/embeddings", {"model": model, "input": texts},
+            timeout=self._timeout(timeout, "LLM_EMBED_TIMEOUT", 60),
+        ), hedge)
+        data = sorted(out.get("data", []), key=lambda item: item.get("index", 0))
+        usage = out.get("usage", {}) or {}
+        result = Embeddings(
+            vectors=[item["embedding"] for item in data],
+            model=out.get("model") or model,
+            input_tokens=int(usage.get("prompt_tokens") or usage.get("total_tokens") or 0),
+        )
+        _account("embed", result.model, result.input_tokens)
+        return result
+
+
+gateway = LLMGateway()
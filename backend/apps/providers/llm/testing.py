@@ -0,0 +1,124 @@
+"""
+Servidor local que faz o papel da API do LLM nos testes (respostas gravadas).
+
+    with RecordedLLMServer() as llm, llm.settings():
+        gateway.complete([...])          # sai de verdade pelo pool HTTP
+    llm.requests                         # [(path, headers, body), ...]
+
+Responde com as gravações de `recordings/` (formato real da API):
+POST /responses (JSON ou SSE com "stream": true) e POST /embeddings — os
+vetores são gerados do texto (determinísticos, `dimensions` posições), o
+resto do corpo é o gravado. `delays` (segundos por request, em ordem) e
+`fail_with` (status) simulam upstream lento ou fora; `output_text` troca o
+texto da resposta JSON ("" = resposta sem texto).
+"""
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from django.test import override_settings
+
+RECORDINGS = Path(__file__).resolve().parent / "recordings"
+
+
+def recording(name: str) -> str:
+    return (RECORDINGS / name).read_text(encoding="utf-8")
+
+
+def fake_embedding(text: str, dimensions: int = 1536) -> list[float]:
+    """Vetor determinístico (mesmo texto -> mesmo vetor; textos iguais têm similaridade 1)."""
+    seed = hashlib.sha256(text.encode("utf-8")).digest()
+    return [((seed[i % len(seed)] + i) % 251) / 251.0 - 0.5 for i in range(dimensions)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "RecordedLLMServer"
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        path = self.path.split("?")[0]
+        delay, fail_with = self.server.owner._next(path, dict(self.headers), body)
+        if delay:
+            threading.Event().wait(delay)
+        if fail_with:
+            return self._send(fail_with, json.dumps({"error": {"message": "stub failure"}}).encode())
+
+        if path.endswith("/responses"):
+            if body.get("stream"):
+                return self._send(200, recording("responses_stream.sse").encode("utf-8"), "text/event-stream")
+            out = json.loads(recording("responses.json"))
+            if self.server.owner.output_text is not None:
+                out["output"][0]["content"][0]["text"] = self.server.owner.output_text
+            return self._send(200, json.dumps(out).encode("utf-8"))
+
+        if path.endswith("/embeddings"):
+            texts = body.get("input") or []
+            texts = [texts] if isinstance(texts, str) else texts
+            out = json.loads(recording("embeddings.json"))
+            template = out["data"][0]
+            out["data"] = [
+                {**template, "index": i, "embedding": fake_embedding(text, self.server.owner.dimensions)}
+                for i, text in enumerate(texts)
+            ]
+            out["model"] = body.get("model") or out["model"]
+            tokens = sum(max(1, len(t) // 4) for t in texts)
+            out["usage"] = {"prompt_tokens": tokens, "total_tokens": tokens}
+            return self._send(200, json.dumps(out).encode("utf-8"))
+
+        self._send(404, b'{"error": {"message": "not found"}}')
+
+    def log_message(self, *args):
+        pass
+
+
+class RecordedLLMServer:
+    def __init__(self, *, delays=(), fail_with: int | None = None, dimensions: int = 1536,
+                 output_text: str | None = None):
+        self.delays = list(delays)
+        self.fail_with = fail_with
+        self.output_text = output_text
+        self.dimensions = dimensions
+        self.requests: list[tuple[str, dict, dict]] = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _next(self, path: str, headers: dict, body: dict):
+        with self._lock:
+            self.requests.append((path, headers, body))
+            delay = self.delays.pop(0) if self.delays else 0
+        return delay, self.fail_with
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    def settings(self, **extra):
+        """override_settings apontando OPENAI_* para este servidor."""
+        return override_settings(OPENAI_BASE_URL=self.base_url, OPENAI_API_KEY="sk-test", **extra)
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.owner = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
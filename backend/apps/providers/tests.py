@@ -0,0 +1,357 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from apps.channels.models import WorkspaceProvider
+from apps.channels.signals import provider_status_buffer
+from apps.providers.base.http import (AsyncClientPool, SessionPool,
+                                       async_http_pool, http_pool)
+from apps.providers.base.resilience import (CLOSED, HALF_OPEN, OPEN, Bulkhead,
+                                            BulkheadFull, CircuitBreaker,
+                                            CircuitOpen, breakers)
+from apps.providers.evolution.async_client import AsyncEvolutionClient
+from apps.providers.evolution.client import (EvolutionClient,
+                                             EvolutionClientError,
+                                             EvolutionUnavailable,
+                                             forget_variants)
+from apps.providers.llm.gateway import (TOKENS, LLMError, LLMGateway,
+                                        LLMUnavailable, credentials_for,
+                                        gateway, resolve_model)
+from apps.providers.llm.testing import RecordedLLMServer
+from apps.tenants.models import Workspace
+from django.test import SimpleTestCase, TestCase, override_settings
+
+
+class _EvolutionStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply(200, {"instance": {"state": "open"}, "path": self.path})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+        # simula a v2: só aceita {"number", "text"}
+        if "text" not in body:
+            return self._reply(400, {"error": "text is required"})
+        self._reply(201, {"key": {"id": "MSG1"}, "path": self.path})
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServerMixin:
+    handler = _EvolutionStub
+
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+
+class SessionPoolTests(LocalServerMixin, SimpleTestCase):
+    def test_session_is_shared_per_base_url(self):
+        pool = SessionPool()
+        self.assertIs(pool.get("http://evo:8080/"), pool.get("http://evo:8080"))
+        self.assertIsNot(pool.get("http://evo:8080"), pool.get("http://other:8080"))
+
+    def test_keep_alive_reuses_connection_across_clients(self):
+        self.addCleanup(http_pool.close_all)
+
+        # um client novo por request (como na view) continua usando o mesmo socket
+        for _ in range(3):
+            st = EvolutionClient(base_url=self.base_url, api_key="k").get_status("inst")
+            self.assertEqual(st["instance"]["state"], "open")
+
+        stats = http_pool.stats()[self.base_url]
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["errors"], 0)
+        self.assertEqual(stats["connections_opened"], 1)
+
+
+class _SlowEvolution(_EvolutionStub):
+    hits = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        time.sleep(0.5)
+        self._reply(200, {})
+
+
+class ReadTimeoutTests(LocalServerMixin, SimpleTestCase):
+    handler = _SlowEvolution
+
+    def test_read_timeout_is_not_retried(self):
+        self.addCleanup(http_pool.close_all)
+        _SlowEvolution.hits = 0
+        with self.assertRaises(requests.RequestException):
+            http_pool.request("GET", self.base_url + "/", base_url=self.base_url, timeout=0.1)
+        self.assertEqual(_SlowEvolution.hits, 1)
+
+
+class AsyncEvolutionClientTests(LocalServerMixin, SimpleTestCase):
+    def test_status_fan_out_and_send_text_fallback(self):
+        async def scenario():
+            client = AsyncEvolutionClient(base_url=self.base_url, api_key="k")
+            try:
+                statuses = await client.get_status_many(["a", "b", "c"], concurrency=2)
+                sent = await client.send_text("a", number="5511", text="oi")
+                with self.assertRaises(EvolutionClientError):
+                    await client._request("POST", "/message/sendText/a", json={})
+            finally:
+                await async_http_pool.aclose()
+            return statuses, sent
+
+        statuses, sent = asyncio.run(scenario())
+        self.assertEqual(set(statuses), {"a", "b", "c"})
+        self.assertEqual(statuses["b"]["path"], "/instance/connectionState/b")
+        self.assertEqual(sent["key"]["id"], "MSG1")
+
+
+class AsyncClientPoolTests(SimpleTestCase):
+    def test_clients_of_closed_loops_are_evicted(self):
+        pool = AsyncClientPool()
+
+        async def client():
+            return pool.get("http://evo:8080")
+
+        first = asyncio.run(client())
+        second = asyncio.run(client())
+        self.assertIsNot(first, second)
+        self.assertEqual(len(pool._clients), 1)
+
+    @override_settings(HTTP_ASYNC_MAX_CONNECTIONS=123, HTTP_POOL_MAXSIZE=7)
+    def test_pool_limits_are_applied_to_the_transport(self):
+        async def client():
+            return AsyncClientPool().get("http://evo:8080")
+
+        pool = asyncio.run(client())._transport._pool
+        self.assertEqual((pool._max_connections, pool._max_keepalive_connections), (123, 7))
+
+
+class _CountingEvolution(_EvolutionStub):
+    posts: list = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+        type(self).posts.append(body)
+        if "text" not in body or body["number"] == "invalido":
+            return self._reply(400, {"error": "bad request"})
+        self._reply(201, {"key": {"id": "MSG1"}, "path": self.path})
+
+
+class SendTextVariantTests(LocalServerMixin, SimpleTestCase):
+    handler = _CountingEvolution
+
+    def setUp(self):
+        super().setUp()
+        _CountingEvolution.posts = []
+        forget_variants()
+        self.addCleanup(forget_variants)
+        self.addCleanup(http_pool.close_all)
+
+    def test_detected_variant_sends_a_single_body(self):
+        client = EvolutionClient(base_url=self.base_url, api_key="k")
+        client.send_text("a", number="5511", text="oi")
+        self.assertEqual(len(_CountingEvolution.posts), 2)
+
+        # v2 memoizada: um POST por mensagem, e um 400 de verdade não é repetido
+        _CountingEvolution.posts = []
+        client.send_text("a", number="5511", text="oi")
+        with self.assertRaises(EvolutionClientError):
+            client.send_text("a", number="invalido", text="oi")
+        self.assertEqual(_CountingEvolution.posts, [
+            {"number": "5511", "text": "oi"},
+            {"number": "invalido", "text": "oi"},
+        ])
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_threshold_and_recovers_through_half_open(self):
+        changes = []
+        breaker = CircuitBreaker("evo", failure_threshold=2, reset_timeout=0.05,
+                                 on_change=lambda b, old, new: changes.append(new))
+
+        breaker.before_call()
+        breaker.record_failure("boom")
+        breaker.before_call()
+        breaker.record_failure("boom")
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        breaker.before_call()  # sonda de half-open
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()  # só uma sonda por vez
+        breaker.record_success()
+
+        breaker.before_call()
+        self.assertEqual(changes, [OPEN, HALF_OPEN, CLOSED])
+
+    def test_bulkhead_rejects_when_full(self):
+        bulkhead = Bulkhead("evo", limit=1, acquire_timeout=0.01)
+        with bulkhead.slot():
+            with self.assertRaises(BulkheadFull):
+                with bulkhead.slot():
+                    pass
+        with bulkhead.slot():
+            self.assertEqual(bulkhead.in_flight, 1)
+        self.assertEqual(bulkhead.rejected, 1)
+
+
+class _FlakyEvolution(_EvolutionStub):
+    hits = 0
+    broken = True
+
+    def do_GET(self):
+        type(self).hits += 1
+        if self.broken:
+            return self._reply(500, {"error": "internal"})
+        super().do_GET()
+
+
+@override_settings(UPSTREAM_BREAKER_FAILURES=2, UPSTREAM_BREAKER_RESET_SECONDS=60)
+class EvolutionCircuitTests(LocalServerMixin, TestCase):
+    handler = _FlakyEvolution
+
+    def setUp(self):
+        super().setUp()
+        _FlakyEvolution.hits = 0
+        _FlakyEvolution.broken = True
+        breakers.reset()
+        provider_status_buffer.flush()
+        self.addCleanup(breakers.reset)
+        self.addCleanup(http_pool.close_all)
+        self.provider = WorkspaceProvider.objects.create(
+            workspace=Workspace.objects.create(name="Acme"),
+            provider=WorkspaceProvider.Provider.EVOLUTION,
+            base_url=self.base_url + "/",
+            status=WorkspaceProvider.Status.READY,
+        )
+
+    def test_open_circuit_fails_fast_without_calling_upstream(self):
+        client = EvolutionClient(base_url=self.base_url, api_key="k")
+        for _ in range(2):
+            with self.assertRaises(EvolutionClientError) as ctx:
+                client.get_status("inst")
+            self.assertEqual(ctx.exception.status_code, 500)
+
+        with self.assertRaises(EvolutionUnavailable) as ctx:
+            client.get_status("inst")
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertGreater(ctx.exception.retry_after, 0)
+        # retries do urllib3 (5xx em GET) contam como uma chamada lógica
+        hits = _FlakyEvolution.hits
+        with self.assertRaises(EvolutionUnavailable):
+            client.get_status("inst")
+        self.assertEqual(_FlakyEvolution.hits, hits)
+        self.assertEqual(breakers.stats()[self.base_url]["state"], OPEN)
+
+        # o listener do breaker não toca o banco: só o buffer grava
+        self.assertEqual(provider_status_buffer.pending(), 1)
+        provider_status_buffer.flush()
+        self.provider.refresh_from_db()
+        self.assertEqual(self.provider.status, WorkspaceProvider.Status.ERROR)
+        self.assertIn("HTTP 500", self.provider.last_error)
+
+        # volta a responder: a sonda de half-open fecha o circuito e o provider fica READY
+        breakers.breaker(self.base_url).opened_at -= 120
+        _FlakyEvolution.broken = False
+        client.get_status("inst")
+        provider_status_buffer.flush()
+        self.provider.refresh_from_db()
+        self.assertEqual(self.provider.status, WorkspaceProvider.Status.READY)
+
+
+class LLMGatewayTests(TestCase):
+    def setUp(self):
+        self.workspace = Workspace.objects.create(name="Acme")
+        self.llm = RecordedLLMServer().start()
+        self.addCleanup(self.llm.stop)
+
+    def test_complete_routes_model_and_counts_tokens_from_usage(self):
+        before = TOKENS.value(operation="complete", model="gpt-4o-mini-2024-07-18", direction="output")
+        with self.llm.settings(LLM_MODEL_ROUTES={"rag": "gpt-4o", "agent": "chat"}):
+            completion = gateway.complete([{"role": "user", "content": "prazo?"}], route="rag")
+            self.assertEqual(resolve_model(route="agent"), "gpt-4o-mini")
+            self.assertEqual(resolve_model("gpt-4.1"), "gpt-4.1")
+
+        path, headers, body = self.llm.requests[0]
+        self.assertEqual((path, body["model"]), ("/v1/responses", "gpt-4o"))
+        self.assertEqual(headers["Authorization"], "Bearer sk-test")
+        self.assertEqual(completion.text, "O prazo de entrega é de 2 dias úteis.")
+        self.assertEqual((completion.input_tokens, completion.output_tokens), (36, 12))
+        self.assertEqual(
+            TOKENS.value(operation="complete", model="gpt-4o-mini-2024-07-18", direction="output"), before + 12)
+
+    def test_workspace_key_overrides_default_and_invalidates_on_save(self):
+        with self.llm.settings():
+            self.assertFalse(credentials_for(self.workspace.id).byok)
+            provider = WorkspaceProvider.objects.create(
+                workspace=self.workspace, provider=WorkspaceProvider.Provider.OPENAI, api_key="sk-byok")
+            gateway.embed(["oi"], workspace_id=self.workspace.id)
+
+            provider.api_key = "sk-rotated"
+            provider.base_url = self.llm.base_url
+            provider.save()
+            creds = credentials_for(self.workspace.id)
+
+        self.assertEqual(self.llm.requests[0][1]["Authorization"], "Bearer sk-byok")
+        self.assertEqual((creds.api_key, creds.byok), ("sk-rotated", True))
+
+    def test_stream_yields_deltas_and_final_usage(self):
+        with self.llm.settings():
+            stream = gateway.stream([{"role": "user", "content": "prazo?"}])
+            deltas = list(stream)
+
+        self.assertTrue(self.llm.requests[0][2]["stream"])
+        self.assertEqual(deltas, ["O prazo de entrega ", "é de 2 dias úteis."])
+        self.assertEqual(stream.completion.text, "O prazo de entrega é de 2 dias úteis.")
+        self.assertEqual(stream.completion.total_tokens, 48)
+
+    def test_slow_embedding_is_hedged(self):
+        self.llm.delays = [1.0]
+        with self.llm.settings(LLM_HEDGE_AFTER=0.1):
+            t0 = time.monotonic()
+            result = gateway.embed(["qual o prazo?"])
+            elapsed = time.monotonic() - t0
+
+        self.assertLess(elapsed, 0.9)
+        self.assertEqual(len(self.llm.requests), 2)
+        self.assertEqual(len(result.vectors[0]), 1536)
+        self.assertGreater(result.input_tokens, 0)
+
+    def test_no_hedge_when_pool_is_busy(self):
+        self.llm.delays = [0.5]
+        llm_gateway = LLMGateway()
+        with self.llm.settings(LLM_HEDGE_AFTER=0.1, LLM_HEDGE_WORKERS=1):
+            result = llm_gateway.embed(["qual o prazo?"])
+
+        # o único worker está com a primária: sem cópia duplicada
+        self.assertEqual(len(self.llm.requests), 1)
+        self.assertEqual(len(result.vectors[0]), 1536)
+
+    def test_upstream_errors(self):
+        self.llm.fail_with = 503
+        with self.llm.settings(), self.assertRaises(LLMUnavailable):
+            gateway.complete([{"role": "user", "content": "oi"}])
+
+        self.llm.fail_with = 400
+        with self.llm.settings(), self.assertRaises(LLMError) as ctx:
+            gateway.complete([{"role": "user", "content": "oi"}])
+        self.assertNotIsInstance(ctx.exception, LLMUnavailable)
+        self.assertEqual(ctx.exception.status_code, 400)
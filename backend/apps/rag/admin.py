@@ -1,3 +1,12 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import AnswerCacheEntry, KnowledgeDocument
+
+admin.site.register(KnowledgeDocument)
+
+
+@admin.register(AnswerCacheEntry)
+class AnswerCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ("question", "workspace", "scope", "model", "hits", "created_at", "expires_at")
+    list_filter = ("scope",)
+    exclude = ("embedding",)
@@ -0,0 +1,170 @@
+"""
+Cache semântico de respostas, na frente de answer_with_context / do LLM do agent.
+
+Pergunta de cliente se repete com outras palavras; a geração é a chamada
+mais lenta e cara do caminho. Com RAG_ANSWER_CACHE ligado (e, nos agents,
+Agent.answer_cache), a pergunta é embutida uma vez e:
+
+  - procura-se a resposta mais próxima do mesmo workspace/scope/modelo
+    (distância cosseno no pgvector, índice HNSW) com similaridade >=
+    RAG_ANSWER_CACHE_THRESHOLD e ainda não expirada;
+  - só vale se os documentos que foram contexto seguem na versão gravada
+    (KnowledgeDocument.version sobe a cada reindexação); entrada velha é
+    apagada na hora. Reindexar/apagar um documento também limpa as entradas
+    que o citam (`evict_document`);
+  - no miss, o mesmo embedding serve o retrieval e a resposta nova é gravada
+    com TTL de RAG_ANSWER_CACHE_TTL segundos (`prune` / manage.py
+    prune_answer_cache remove as expiradas).
+
+Resposta sem documento citado não entra: um documento novo pode mudá-la.
+Hits/misses vão para o uso por workspace (rag.cache_hit / rag.cache_miss nos
+rollups de apps.audit) e para /metrics.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from pgvector.django import CosineDistance
+
+from apps.audit import usage
+from apps.core.metrics import registry
+
+from .models import AnswerCacheEntry, KnowledgeDocument
+
+logger = logging.getLogger(__name__)
+
+LOOKUPS = registry.counter(
+    "rag_answer_cache_total", "Consultas ao cache semântico de respostas", ["scope", "result"])
+
+# candidatos acima do limiar checados por consulta (os primeiros podem estar velhos)
+_CANDIDATES = 3
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "RAG_ANSWER_CACHE", False))
+
+
+def threshold() -> float:
+    return float(getattr(settings, "RAG_ANSWER_CACHE_THRESHOLD", 0.95))
+
+
+def _scope_label(scope: str) -> str:
+    # "agent:<id>" vira "agent" no /metrics (sem um label por agent)
+    return scope.split(":", 1)[0]
+
+
+def _fresh(entries: list[AnswerCacheEntry]) -> set:
+    """Ids das entradas cujos documentos seguem indexados na versão gravada."""
+    doc_ids = {doc_id for e in entries for doc_id in e.documents}
+    current = {
+        str(doc_id): version
+        for doc_id, version in KnowledgeDocument.objects.filter(
+            id__in=doc_ids, status=KnowledgeDocument.STATUS_INDEXED,
+        ).values_list("id", "version")
+    }
+    return {
+        e.id for e in entries
+        if e.documents and all(current.get(doc_id) == version for doc_id, version in e.documents.items())
+    }
+
+
+def lookup(workspace_id, embedding, *, scope: str, model: str, actor: str = "") -> AnswerCacheEntry | None:
+    now = timezone.now()
+    candidates = list(
+        AnswerCacheEntry.objects.filter(workspace_id=workspace_id, scope=scope, model=model, expires_at__gt=now)
+        .annotate(distance=CosineDistance("embedding", embedding))
+        .filter(distance__lte=1 - threshold())
+        .order_by("distance")[:_CANDIDATES]
+    )
+    fresh = _fresh(candidates) if candidates else set()
+    stale = [e.id for e in candidates if e.id not in fresh]
+    if stale:
+        AnswerCacheEntry.objects.filter(id__in=stale).delete()
+
+    hit = next((e for e in candidates if e.id in fresh), None)
+    if hit is None:
+        LOOKUPS.inc(scope=_scope_label(scope), result="stale" if stale else "miss")
+        usage.record(usage.ANSWER_CACHE_MISS, workspace_id, actor=actor, scope=scope)
+        return None
+
+    AnswerCacheEntry.objects.filter(id=hit.id).update(hits=F("hits") + 1, last_hit_at=now)
+    hit.hits += 1
+    hit.similarity = round(1 - float(hit.distance), 4)
+    LOOKUPS.inc(scope=_scope_label(scope), result="hit")
+    usage.record(
+        usage.ANSWER_CACHE_HIT, workspace_id, actor=actor, scope=scope,
+        entry_id=str(hit.id), similarity=hit.similarity, saved_tokens=hit.tokens,
+    )
+    return hit
+
+
+def document_versions(sources: list[dict]) -> dict[str, int]:
+    """{document_id: version} das fontes (search_chunks já traz a versão; senão, do banco)."""
+    versions = {s["document_id"]: s.get("document_version") for s in sources if s.get("document_id")}
+    missing = [doc_id for doc_id, version in versions.items() if version is None]
+    if missing:
+        found = {
+            str(doc_id): version
+            for doc_id, version in KnowledgeDocument.objects.filter(id__in=missing).values_list("id", "version")
+        }
+        for doc_id in missing:
+            if doc_id in found:
+                versions[doc_id] = found[doc_id]
+            else:
+                versions.pop(doc_id)
+    return versions
+
+
+def store(
+    workspace_id,
+    question: str,
+    embedding,
+    *,
+    scope: str,
+    model: str,
+    answer: str,
+    sources: list[dict],
+    tokens: int = 0,
+    cost_usd=0,
+) -> AnswerCacheEntry | None:
+    if not answer:
+        return None
+    now = timezone.now()
+    try:
+        # savepoint: falha do cache não derruba a transação de quem respondeu
+        with transaction.atomic():
+            documents = document_versions(sources)
+            if not documents:
+                return None
+            return AnswerCacheEntry.objects.create(
+                workspace_id=workspace_id,
+                scope=scope,
+                model=model,
+                question=question,
+                embedding=embedding,
+                documents=documents,
+                sources=sources,
+                answer=answer,
+                tokens=tokens,
+                cost_usd=Decimal(str(cost_usd or 0)),
+                created_at=now,
+                expires_at=now + timedelta(seconds=int(getattr(settings, "RAG_ANSWER_CACHE_TTL", 86400))),
+            )
+    except Exception:
+        logger.exception("answer cache: falha ao gravar entrada (scope=%s)", scope)
+        return None
+
+
+def evict_document(document: KnowledgeDocument) -> int:
+    """Apaga as respostas que citaram o documento (reindexado ou removido)."""
+    return AnswerCacheEntry.objects.filter(
+        workspace_id=document.workspace_id, documents__has_key=str(document.id),
+    ).delete()[0]
+
+
+def prune(*, now=None) -> int:
+    return AnswerCacheEntry.objects.filter(expires_at__lte=now or timezone.now()).delete()[0]
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from apps.rag.answer_cache import prune
+
+
+class Command(BaseCommand):
+    help = "Remove respostas expiradas do cache semântico (RAG_ANSWER_CACHE_TTL)."
+
+    def handle(self, *args, **opts):
+        self.stdout.write(f"{prune()} removed")
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.28 on 2026-10-19 08:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import pgvector.django.indexes
+import pgvector.django.vector
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0002_apikey_prefix_last_used'),
+        ('rag', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgedocument',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='AnswerCacheEntry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('scope', models.CharField(max_length=100)),
+                ('model', models.CharField(max_length=100)),
+                ('question', models.TextField()),
+                ('embedding', pgvector.django.vector.VectorField(dimensions=1536)),
+                ('documents', models.JSONField(default=dict)),
+                ('sources', models.JSONField(blank=True, default=list)),
+                ('answer', models.TextField()),
+                ('tokens', models.PositiveIntegerField(default=0)),
+                ('cost_usd', models.DecimalField(decimal_places=6, default=0, max_digits=12)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answer_cache_entries', to='tenants.workspace')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['workspace', 'scope', 'model'], name='rag_answer_cache_scope_idx'), pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='rag_answer_cache_hnsw', opclasses=['vector_cosine_ops'])],
+            },
+        ),
+    ]
@@ -2,7 +2,7 @@ import uuid
 
 from django.db import models
 from django.utils import timezone
-from pgvector.django import VectorField
+from pgvector.django import HnswIndex, VectorField
 
 
 class KnowledgeDocument(models.Model):
@@ -38,6 +38,8 @@ class KnowledgeDocument(models.Model):
 
     created_at = models.DateTimeField(default=timezone.now)
     indexed_at = models.DateTimeField(null=True, blank=True)
+    # +1 a cada (re)indexação: respostas em cache guardam a versão que citaram
+    version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.filename} ({self.status})"
@@ -61,3 +63,50 @@ class KnowledgeChunk(models.Model):
 
     def __str__(self):
         return f"{self.document_id}#{self.chunk_index}"
+
+
+class AnswerCacheEntry(models.Model):
+    """
+    Resposta já gerada, reaproveitada para perguntas parecidas (apps.rag.answer_cache).
+    Vale até `expires_at` e enquanto os documentos citados seguem na mesma versão.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    workspace = models.ForeignKey(
+        "tenants.Workspace",
+        on_delete=models.CASCADE,
+        related_name="answer_cache_entries",
+    )
+    # "playground" ou "agent:<id>": prompts diferentes não dividem respostas
+    scope = models.CharField(max_length=100)
+    model = models.CharField(max_length=100)
+
+    question = models.TextField()
+    embedding = VectorField(dimensions=1536)
+    # {document_id: version} dos documentos usados como contexto
+    documents = models.JSONField(default=dict)
+    sources = models.JSONField(default=list, blank=True)
+    answer = models.TextField()
+    # custo da geração original (o que cada hit economiza)
+    tokens = models.PositiveIntegerField(default=0)
+    cost_usd = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["workspace", "scope", "model"], name="rag_answer_cache_scope_idx"),
+            HnswIndex(
+                name="rag_answer_cache_hnsw",
+                fields=["embedding"],
+                m=16,
+                ef_construction=64,
+                opclasses=["vector_cosine_ops"],
+            ),
+        ]
+
+    def __str__(self):
+        return f"AnswerCacheEntry({self.scope}, hits={self.hits})"
@@ -33,3 +33,5 @@ class KnowledgeDocumentSerializer(serializers.ModelSerializer):
 class PlaygroundQuerySerializer(serializers.Serializer):
     question = serializers.CharField(min_length=1, max_length=4000)
     top_k = serializers.IntegerField(min_value=1, max_value=20, default=5)
+    # false = ignora o cache semântico (só tem efeito com RAG_ANSWER_CACHE)
+    cache = serializers.BooleanField(default=True)
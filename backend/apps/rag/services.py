@@ -1,26 +1,16 @@
-import os
 import re
 from io import BytesIO
 
-import requests
+from django.db.models import F
 from django.utils import timezone
 from pgvector.django import CosineDistance
 from pypdf import PdfReader
 
-from .models import KnowledgeChunk, KnowledgeDocument
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
-OPENAI_EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
-OPENAI_CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
-
-
-def _headers():
-    return {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json",
-    }
+from apps.core import tracing
+from apps.providers.llm.gateway import gateway
 
+from . import answer_cache
+from .models import KnowledgeChunk, KnowledgeDocument
 
 def extract_text_from_upload(uploaded_file, content_type: str) -> str:
     """
@@ -66,71 +56,50 @@ def chunk_text(text: str, max_chars: int = 900, overlap: int = 120, max_chunks:
     return chunks
 
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
-    if not OPENAI_API_KEY:
-        raise RuntimeError("OPENAI_API_KEY não configurada.")
+def embed_texts(texts: list[str], *, workspace_id=None, hedge: bool = True) -> list[list[float]]:
+    return gateway.embed(texts, workspace_id=workspace_id, hedge=hedge).vectors
 
-    payload = {"model": OPENAI_EMBED_MODEL, "input": texts}
-    r = requests.post(
-        f"{OPENAI_BASE_URL}/embeddings",
-        headers=_headers(),
-        json=payload,
-        timeout=60,
-    )
-    r.raise_for_status()
-    data = r.json()
-    return [item["embedding"] for item in data["data"]]
+
+# devolvida quando o LLM não gera texto; não é resposta de verdade (fora do cache)
+NO_ANSWER = "Não consegui gerar resposta."
 
 
-def answer_with_context(question: str, contexts: list[str]) -> tuple[str, int, float]:
+@tracing.traced("rag.answer_with_context")
+def answer_with_context(question: str, contexts: list[str], *, workspace_id=None) -> tuple[str, int, float]:
     context_block = "\n\n".join(
         [f"[{i+1}] {c}" for i, c in enumerate(contexts)])
 
-    payload = {
-        "model": OPENAI_CHAT_MODEL,
-        "input": [
-            {
-                "role": "system",
-                "content": (
-                    "Você é um assistente do Omnichat. Responda em PT-BR. "
-                    "Use o CONTEXTO fornecido quando for relevante. "
-                    "Se não houver base no contexto, diga que não encontrou nos documentos."
-                ),
-            },
-            {
-                "role": "user",
-                "content": f"PERGUNTA:\n{question}\n\nCONTEXTO:\n{context_block}",
-            },
-        ],
-    }
-
-    r = requests.post(
-        f"{OPENAI_BASE_URL}/responses",
-        headers=_headers(),
-        json=payload,
-        timeout=90,
+    completion = gateway.complete([
+        {
+            "role": "system",
+            "content": (
+                "Você é um assistente do Omnichat. Responda em PT-BR. "
+                "Use o CONTEXTO fornecido quando for relevante. "
+                "Se não houver base no contexto, diga que não encontrou nos documentos."
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"PERGUNTA:\n{question}\n\nCONTEXTO:\n{context_block}",
+        },
+    ], workspace_id=workspace_id, route="rag")
+
+    return (
+        completion.text or NO_ANSWER,
+        completion.total_tokens,
+        float(completion.cost_usd),
     )
-    r.raise_for_status()
-    out = r.json()
-
-    text_parts = []
-    for item in out.get("output", []):
-        for c in item.get("content", []):
-            if c.get("type") == "output_text":
-                text_parts.append(c.get("text", ""))
-
-    answer = "\n".join([t for t in text_parts if t]).strip()
-
-    usage = out.get("usage", {}) or {}
-    tokens = int(usage.get("total_tokens") or 0)
-
-    return answer or "Não consegui gerar resposta.", tokens, 0.0
 
 
+@tracing.traced("rag.index_document")
 def index_document(doc: KnowledgeDocument) -> KnowledgeDocument:
     doc.status = KnowledgeDocument.STATUS_PROCESSING
     doc.error_message = None
-    doc.save(update_fields=["status", "error_message"])
+    doc.version = F("version") + 1
+    doc.save(update_fields=["status", "error_message", "version"])
+    doc.refresh_from_db(fields=["version"])
+    # respostas em cache que citavam a versão anterior não valem mais
+    answer_cache.evict_document(doc)
 
     try:
         if not doc.file:
@@ -142,7 +111,8 @@ def index_document(doc: KnowledgeDocument) -> KnowledgeDocument:
         # limpa chunks antigos
         KnowledgeChunk.objects.filter(document=doc).delete()
 
-        embeddings = embed_texts(chunks) if chunks else []
+        # lote grande demora por natureza: hedging aqui só dobraria o custo
+        embeddings = embed_texts(chunks, workspace_id=doc.workspace_id, hedge=False) if chunks else []
 
         bulk = [
             KnowledgeChunk(document=doc, chunk_index=i,
@@ -166,8 +136,10 @@ def index_document(doc: KnowledgeDocument) -> KnowledgeDocument:
         return doc
 
 
-def search_chunks(workspace_id, question: str, top_k: int = 5):
-    q_emb = embed_texts([question])[0]
+@tracing.traced("rag.search_chunks")
+def search_chunks(workspace_id, question: str, top_k: int = 5, *, embedding=None):
+    """`embedding` da pergunta, se quem chama já tem (cache semântico): evita embutir de novo."""
+    q_emb = embedding if embedding is not None else embed_texts([question], workspace_id=workspace_id)[0]
 
     qs = KnowledgeChunk.objects.select_related("document").all()
     if workspace_id:
@@ -183,6 +155,7 @@ def search_chunks(workspace_id, question: str, top_k: int = 5):
             {
                 "document_id": str(ch.document_id),
                 "filename": ch.document.filename,
+                "document_version": ch.document.version,
                 "chunk": ch.content,
                 "score": score,
             }
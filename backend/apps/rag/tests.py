@@ -1,3 +1,109 @@
-from django.test import TestCase
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from apps.providers.llm.testing import RecordedLLMServer
+from apps.rag import answer_cache
+from apps.rag.models import AnswerCacheEntry, KnowledgeDocument
+from apps.rag.services import index_document
+from apps.tenants.models import Membership, Workspace
+
+User = get_user_model()
+
+
+class PlaygroundTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", password="pass")
+        self.workspace = Workspace.objects.create(name="Acme", created_by=self.user)
+        Membership.objects.create(workspace=self.workspace, user=self.user, role=Membership.ROLE_MEMBER)
+        self.client.force_authenticate(self.user)
+        self.llm = RecordedLLMServer().start()
+        self.addCleanup(self.llm.stop)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media.name))
+
+    def _document(self):
+        return KnowledgeDocument.objects.create(
+            workspace=self.workspace, filename="faq.txt", file_type="text/plain",
+            file=SimpleUploadedFile("faq.txt", b"Entrega em 2 dias uteis para todo o Brasil."),
+        )
+
+    def _ask(self, question="Qual o prazo?"):
+        return self.client.post(
+            "/api/v1/rag/playground/ask/", {"question": question, "top_k": 3},
+            format="json", HTTP_X_WORKSPACE_ID=str(self.workspace.id),
+        )
+
+    def _paths(self):
+        paths = [path for path, _, _ in self.llm.requests]
+        self.llm.requests.clear()
+        return paths
+
+    def test_index_and_ask_through_gateway(self):
+        with self.llm.settings():
+            doc = index_document(self._document())
+            response = self._ask()
+
+        self.assertEqual(doc.status, KnowledgeDocument.STATUS_INDEXED)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["answer"], "O prazo de entrega é de 2 dias úteis.")
+        self.assertEqual(response.data["tokens_used"], 48)
+        self.assertEqual([s["filename"] for s in response.data["sources"]], ["faq.txt"])
+        self.assertEqual([path for path, _, _ in self.llm.requests],
+                         ["/v1/embeddings", "/v1/embeddings", "/v1/responses"])
+
+    def test_answer_cache_hits_until_document_is_reindexed(self):
+        with self.llm.settings(RAG_ANSWER_CACHE=True):
+            doc = index_document(self._document())
+            self._paths()
+
+            first = self._ask()
+            # uma embedding só: a da pergunta serve o cache e o retrieval
+            self.assertEqual(self._paths(), ["/v1/embeddings", "/v1/responses"])
+            second = self._ask()
+            self.assertEqual(self._paths(), ["/v1/embeddings"])
+
+            index_document(doc)
+            self._paths()
+            third = self._ask()
+            self.assertEqual(self._paths(), ["/v1/embeddings", "/v1/responses"])
+
+        self.assertFalse(first.data["cached"])
+        self.assertEqual((second.data["cached"], second.data["tokens_used"]), (True, 0))
+        self.assertEqual(second.data["answer"], first.data["answer"])
+        self.assertEqual(second.data["similarity"], 1.0)
+        self.assertFalse(third.data["cached"])
+        entry = AnswerCacheEntry.objects.get()
+        self.assertEqual(entry.documents, {str(doc.id): 2})
+        self.assertEqual(entry.hits, 0)
+
+    def test_fallback_answer_is_not_cached(self):
+        self.llm.output_text = ""
+        with self.llm.settings(RAG_ANSWER_CACHE=True):
+            index_document(self._document())
+            first = self._ask()
+            self.llm.output_text = None
+            second = self._ask()
+
+        self.assertEqual(first.data["answer"], "Não consegui gerar resposta.")
+        self.assertFalse(second.data["cached"])
+        self.assertEqual(second.data["answer"], "O prazo de entrega é de 2 dias úteis.")
+        self.assertEqual(AnswerCacheEntry.objects.get().answer, second.data["answer"])
+
+    def test_stale_or_expired_entries_are_not_served(self):
+        with self.llm.settings(RAG_ANSWER_CACHE=True):
+            doc = index_document(self._document())
+            self._ask()
+            # versão mudou por fora (ex.: outro processo reindexou): a entrada é descartada no lookup
+            KnowledgeDocument.objects.filter(id=doc.id).update(version=5)
+            self.assertFalse(self._ask().data["cached"])
+            self.assertEqual(AnswerCacheEntry.objects.count(), 1)
+
+            self.assertTrue(self._ask().data["cached"])
+            self.assertEqual(answer_cache.prune(now=timezone.now() + timedelta(days=2)), 1)
+            self.assertFalse(self._ask(question="Qual o prazo?").data["cached"])
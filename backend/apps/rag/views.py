@@ -1,12 +1,15 @@
+from apps.audit import usage
+from apps.providers.llm.gateway import resolve_model
 from apps.tenants.models import Workspace
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from . import answer_cache
 from .models import KnowledgeChunk, KnowledgeDocument
 from .serializers import KnowledgeDocumentSerializer, PlaygroundQuerySerializer
-from .services import answer_with_context, index_document, search_chunks
+from .services import NO_ANSWER, answer_with_context, embed_texts, index_document, search_chunks
 
 
 def get_workspace_id(request):
@@ -80,11 +83,42 @@ class PlaygroundAskView(APIView):
 
         question = ser.validated_data["question"]
         top_k = ser.validated_data["top_k"]
-
-        sources = search_chunks(str(ws.id), question, top_k=top_k)
+        actor = usage.actor_for(request)
+
+        embedding = None
+        use_cache = answer_cache.enabled() and ser.validated_data["cache"]
+        if use_cache:
+            model = resolve_model(route="rag")
+            embedding = embed_texts([question], workspace_id=ws.id)[0]
+            hit = answer_cache.lookup(ws.id, embedding, scope="playground", model=model, actor=actor)
+            if hit is not None:
+                usage.record(usage.RAG_QUERY, ws.id, actor=actor, top_k=top_k,
+                             sources=len(hit.sources), cached=True)
+                return Response(
+                    {
+                        "answer": hit.answer,
+                        "sources": hit.sources,
+                        "tokens_used": 0,
+                        "cost_usd": 0.0,
+                        "cached": True,
+                        "similarity": hit.similarity,
+                    }
+                )
+
+        sources = search_chunks(str(ws.id), question, top_k=top_k, embedding=embedding)
         contexts = [s["chunk"] for s in sources]
 
-        answer, tokens_used, cost_usd = answer_with_context(question, contexts)
+        answer, tokens_used, cost_usd = answer_with_context(question, contexts, workspace_id=ws.id)
+        usage.record(
+            usage.RAG_QUERY, ws.id,
+            tokens=tokens_used, cost_usd=cost_usd, actor=actor,
+            top_k=top_k, sources=len(sources), cached=False,
+        )
+        if use_cache and answer != NO_ANSWER:
+            answer_cache.store(
+                ws.id, question, embedding, scope="playground", model=model,
+                answer=answer, sources=sources, tokens=tokens_used, cost_usd=cost_usd,
+            )
 
         return Response(
             {
@@ -92,6 +126,7 @@ class PlaygroundAskView(APIView):
                 "sources": sources,
                 "tokens_used": tokens_used,
                 "cost_usd": cost_usd,
+                "cached": False,
             }
         )
 
@@ -105,6 +140,8 @@ class KnowledgeDetailView(APIView):
         except KnowledgeDocument.DoesNotExist:
             return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
 
+        answer_cache.evict_document(doc)
+
         # apaga chunks (FK CASCADE já faria, mas mantém explícito)
         KnowledgeChunk.objects.filter(document=doc).delete()
 
@@ -0,0 +1,132 @@
+"""
+Autenticação por API key (clientes máquina/integrações).
+
+    Authorization: Api-Key omk_1a2b3c4d_<segredo>
+    (ou X-Api-Key: omk_1a2b3c4d_<segredo>)
+
+- o prefixo (omk_ + 8 hex) é público e é validado sem banco: lixo é
+  recusado antes de calcular hash/consultar cache;
+- a key é achada pelo sha256 do segredo (índice único em key_hash);
+- resultado positivo e negativo fica em cache (APIKEY_CACHE_TTL /
+  APIKEY_NEGATIVE_TTL, com L1 em memória — apps.core.cache); save/delete da
+  ApiKey invalidam (apps.tenants.signals);
+- last_used_at vai para um BatchBuffer e é gravado em lote, fora do request.
+
+O workspace vem da própria key: X-Workspace-ID é opcional e, se vier, tem que
+bater (ver apps.tenants.workspace).
+"""
+import hashlib
+import re
+import secrets
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import authentication, exceptions
+
+from apps.core.buffers import BatchBuffer
+from apps.core.cache import namespace
+from apps.tenants.models import ApiKey
+
+
+KEY_PREFIX = "omk_"
+_PREFIX_RE = re.compile(r"^omk_[0-9a-f]{8}$")
+key_cache = namespace("apikey", l1=True)
+
+
+def hash_secret(secret: str) -> str:
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()
+
+
+def generate_key() -> tuple[str, str]:
+    """Retorna (prefixo público, segredo completo)."""
+    prefix = f"{KEY_PREFIX}{secrets.token_hex(4)}"
+    return prefix, f"{prefix}_{secrets.token_urlsafe(32)}"
+
+
+def split_prefix(secret: str) -> str | None:
+    """Prefixo de uma key no formato atual; "" para keys antigas (sem prefixo); None = inválida."""
+    if not secret.startswith(KEY_PREFIX):
+        return ""
+    prefix, sep, rest = secret[:12], secret[12:13], secret[13:]
+    if sep != "_" or not rest or not _PREFIX_RE.match(prefix):
+        return None
+    return prefix
+
+
+def invalidate_api_key(key_hash: str):
+    key_cache.delete(key_hash)
+
+
+def _write_last_used(items: dict):
+    ApiKey.objects.bulk_update(
+        [ApiKey(id=key_id, last_used_at=used_at) for key_id, used_at in items.items()],
+        ["last_used_at"],
+    )
+
+
+last_used_buffer = BatchBuffer(
+    "apikey-last-used",
+    _write_last_used,
+    interval=float(getattr(settings, "APIKEY_TOUCH_INTERVAL", 10)),
+)
+
+
+class ApiKeyUser:
+    """Usuário "sintético" de um request autenticado por API key (sem linha em auth_user)."""
+
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+    is_staff = False
+    is_superuser = False
+    id = pk = None
+
+    def __init__(self, api_key: ApiKey):
+        self.api_key = api_key
+        self.username = f"api-key:{api_key.prefix or api_key.id}"
+
+    def __str__(self):
+        return self.username
+
+
+class ApiKeyAuthentication(authentication.BaseAuthentication):
+    keyword = "Api-Key"
+
+    def _get_secret(self, request) -> str | None:
+        header = authentication.get_authorization_header(request).split()
+        if header and header[0].lower() == self.keyword.lower().encode():
+            if len(header) != 2:
+                raise exceptions.AuthenticationFailed("Header Api-Key inválido.")
+            return header[1].decode("utf-8", errors="ignore")
+        return request.headers.get("X-Api-Key") or None
+
+    def authenticate(self, request):
+        secret = self._get_secret(request)
+        if secret is None:
+            return None
+
+        prefix = split_prefix(secret)
+        if prefix is None:
+            raise exceptions.AuthenticationFailed("API key inválida.")
+
+        api_key = self._lookup(prefix, hash_secret(secret))
+        if api_key is None:
+            raise exceptions.AuthenticationFailed("API key inválida.")
+
+        last_used_buffer.add(api_key.id, timezone.now())
+        return ApiKeyUser(api_key), api_key
+
+    def _lookup(self, prefix: str, key_hash: str) -> ApiKey | None:
+        return key_cache.get_or_set(
+            key_hash,
+            lambda: (
+                ApiKey.objects.select_related("workspace")
+                .filter(key_hash=key_hash, prefix=prefix, is_active=True)
+                .first()
+            ),
+            timeout=int(getattr(settings, "APIKEY_CACHE_TTL", 300)),
+            none_timeout=int(getattr(settings, "APIKEY_NEGATIVE_TTL", 30)),
+        )
+
+    def authenticate_header(self, request):
+        return self.keyword
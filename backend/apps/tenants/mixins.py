@@ -1,25 +1,16 @@
-from rest_framework.exceptions import ValidationError, NotFound
-
-from apps.tenants.models import Workspace
+from apps.tenants.workspace import resolve_workspace_access
 
 
 class WorkspaceRequiredMixin:
     """
-    Garante que X-Workspace-ID exista e injeta request.workspace
-    sem quebrar o pipeline do DRF (content negotiation, renderer, etc).
-    """
-
-    def initial(self, request, *args, **kwargs):
-        # chama o DRF primeiro (isso prepara accepted_renderer, etc)
-        super().initial(request, *args, **kwargs)
+    Garante que X-Workspace-ID exista e injeta request.workspace /
+    request.workspace_role (resolvidos via cache, ver apps.tenants.workspace).
 
-        workspace_id = request.headers.get("X-Workspace-ID")
-        if not workspace_id:
-            raise ValidationError({"detail": "X-Workspace-ID header é obrigatório."})
-
-        try:
-            workspace = Workspace.objects.get(id=workspace_id)
-        except Workspace.DoesNotExist:
-            raise NotFound({"detail": "Workspace não encontrado."})
+    Resolve antes das permissões: IsWorkspaceMember/IsWorkspaceAdmin só leem
+    o role já resolvido. Anônimo cai direto no IsAuthenticated (401).
+    """
 
-        request.workspace = workspace
+    def check_permissions(self, request):
+        if request.user and request.user.is_authenticated:
+            request.workspace, request.workspace_role = resolve_workspace_access(request)
+        super().check_permissions(request)
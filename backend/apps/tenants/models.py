@@ -62,7 +62,11 @@ class ApiKey(models.Model):
         related_name="api_keys",
     )
     name = models.CharField(max_length=255)
-    key_hash = models.CharField(max_length=64)
+    # parte pública do segredo ("omk_xxxxxxxx"): identifica a key na UI e nos logs
+    prefix = models.CharField(max_length=16, blank=True, default="", db_index=True)
+    key_hash = models.CharField(max_length=64, unique=True)
+    is_active = models.BooleanField(default=True)
+    last_used_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
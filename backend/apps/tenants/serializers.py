@@ -1,9 +1,7 @@
-import hashlib
-import secrets
-
 from django.db import transaction
 from rest_framework import serializers
 
+from apps.tenants.authentication import generate_key, hash_secret
 from apps.tenants.models import ApiKey, Membership, Workspace
 
 
@@ -22,16 +20,20 @@ class WorkspaceSerializer(serializers.ModelSerializer):
         if not user or not user.is_authenticated:
             return None
 
-        m = Membership.objects.filter(workspace=obj, user=user).first()
-        if not m:
+        if hasattr(obj, "member_role"):
+            # anotado pelo WorkspaceViewSet (sem query por workspace)
+            role = obj.member_role
+        else:
+            role = Membership.objects.filter(workspace=obj, user=user).values_list("role", flat=True).first()
+        if not role:
             return None
 
         # regra simples: quem criou o workspace aparece como "owner" no frontend
-        if obj.created_by_id == user.id:
+        if obj.created_by_id is not None and obj.created_by_id == user.id:
             return "owner"
 
         # caso contrário, espelha a role real da membership
-        return m.role
+        return role
 
     @transaction.atomic
     def create(self, validated_data):
@@ -67,19 +69,19 @@ class ApiKeyCreateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ApiKey
-        fields = ["id", "name", "created_at", "secret"]
-        read_only_fields = ["id", "created_at", "secret"]
+        fields = ["id", "name", "prefix", "created_at", "secret"]
+        read_only_fields = ["id", "prefix", "created_at", "secret"]
 
     def create(self, validated_data):
         request = self.context.get("request")
         workspace = getattr(request, "workspace", None)
         if workspace is None:
             raise serializers.ValidationError("Workspace inválido.")
-        secret = secrets.token_urlsafe(32)
-        key_hash = hashlib.sha256(secret.encode("utf-8")).hexdigest()
+        prefix, secret = generate_key()
         api_key = ApiKey.objects.create(
             workspace=workspace,
-            key_hash=key_hash,
+            prefix=prefix,
+            key_hash=hash_secret(secret),
             **validated_data,
         )
         api_key._secret = secret
@@ -98,5 +100,5 @@ class ApiKeyCreateSerializer(serializers.ModelSerializer):
 class ApiKeySerializer(serializers.ModelSerializer):
     class Meta:
         model = ApiKey
-        fields = ["id", "name", "created_at"]
-        read_only_fields = ["id", "created_at"]
+        fields = ["id", "name", "prefix", "is_active", "last_used_at", "created_at"]
+        read_only_fields = ["id", "prefix", "is_active", "last_used_at", "created_at"]
@@ -0,0 +1,27 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.tenants.authentication import invalidate_api_key
+from apps.tenants.models import ApiKey, Membership, Workspace
+from apps.tenants.workspace import invalidate_access
+
+
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+def invalidate_membership_access(sender, instance, **kwargs):
+    invalidate_access([instance.user_id], instance.workspace_id)
+
+
+@receiver(post_save, sender=Workspace)
+def invalidate_workspace_access(sender, instance, created, **kwargs):
+    # o workspace vai inteiro no cache: renomear precisa refletir para todos os membros
+    if created:
+        return
+    user_ids = Membership.objects.filter(workspace=instance).values_list("user_id", flat=True)
+    invalidate_access(list(user_ids), instance.pk)
+
+
+@receiver(post_save, sender=ApiKey)
+@receiver(post_delete, sender=ApiKey)
+def invalidate_api_key_lookup(sender, instance, **kwargs):
+    invalidate_api_key(instance.key_hash)
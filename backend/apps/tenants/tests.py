@@ -2,16 +2,20 @@ import hashlib
 import uuid
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from apps.core import cache as core_cache
+from apps.core.testing import QueryCountMixin
+from apps.tenants.authentication import last_used_buffer
 from apps.tenants.models import ApiKey, Membership, Workspace
 
 
 User = get_user_model()
 
 
-class WorkspaceTests(APITestCase):
+class WorkspaceTests(QueryCountMixin, APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="user", password="pass")
         self.other_user = User.objects.create_user(username="other", password="pass")
@@ -45,6 +49,28 @@ class WorkspaceTests(APITestCase):
         self.assertIn(str(workspace.id), workspace_ids)
         self.assertNotIn(str(other_workspace.id), workspace_ids)
 
+    def test_list_workspaces_roles_in_single_query(self):
+        def grow():
+            n = Workspace.objects.count()
+            workspace = Workspace.objects.create(name=f"W{n}", created_by=self.other_user)
+            Membership.objects.create(workspace=workspace, user=self.user, role=Membership.ROLE_MEMBER)
+            Membership.objects.create(workspace=workspace, user=self.other_user, role=Membership.ROLE_ADMIN)
+
+        own = Workspace.objects.create(name="Own", created_by=self.user)
+        Membership.objects.create(workspace=own, user=self.user, role=Membership.ROLE_ADMIN)
+        grow()
+
+        self.client.force_authenticate(self.user)
+        response = self.assertConstantQueries(
+            lambda: self.client.get("/api/v1/tenants/workspaces/"),
+            grow=grow,
+            expected=1,
+        )
+        roles = {item["name"]: item["role"] for item in response.data}
+        self.assertEqual(len(roles), 5)
+        self.assertEqual(roles.pop("Own"), "owner")
+        self.assertEqual(set(roles.values()), {Membership.ROLE_MEMBER})
+
 
 class WorkspaceHeaderTests(APITestCase):
     def setUp(self):
@@ -88,6 +114,58 @@ class WorkspaceHeaderTests(APITestCase):
         self.assertEqual(len(response.data), 1)
 
 
+class WorkspaceAccessCacheTests(QueryCountMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        core_cache.reset()
+        self.user = User.objects.create_user(username="user", password="pass")
+        self.workspace = Workspace.objects.create(name="Acme", created_by=self.user)
+        self.membership = Membership.objects.create(
+            workspace=self.workspace,
+            user=self.user,
+            role=Membership.ROLE_MEMBER,
+        )
+        self.client.force_authenticate(self.user)
+
+    def _list(self):
+        return self.client.get(
+            "/api/v1/tenants/memberships/",
+            HTTP_X_WORKSPACE_ID=str(self.workspace.id),
+        )
+
+    def test_warm_path_authorizes_without_queries(self):
+        # frio: 1 query de acesso (workspace + role) + 1 da listagem
+        with self.assertNumQueries(2):
+            self.assertEqual(self._list().status_code, status.HTTP_200_OK)
+        # quente: só a listagem
+        with self.assertNumQueries(1):
+            self.assertEqual(self._list().status_code, status.HTTP_200_OK)
+
+    def test_memberships_list_constant_queries(self):
+        def grow():
+            user = User.objects.create_user(username=f"u{User.objects.count()}", password="pass")
+            Membership.objects.create(workspace=self.workspace, user=user, role=Membership.ROLE_MEMBER)
+
+        self.assertConstantQueries(self._list, grow=grow, expected=1)
+
+    def test_membership_changes_invalidate(self):
+        self.assertEqual(self._list().status_code, status.HTTP_200_OK)
+        response = self.client.delete(
+            f"/api/v1/tenants/memberships/{self.membership.id}/",
+            HTTP_X_WORKSPACE_ID=str(self.workspace.id),
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.membership.role = Membership.ROLE_ADMIN
+        self.membership.save()
+        response = self.client.delete(
+            f"/api/v1/tenants/memberships/{self.membership.id}/",
+            HTTP_X_WORKSPACE_ID=str(self.workspace.id),
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self._list().status_code, status.HTTP_403_FORBIDDEN)
+
+
 class ApiKeyTests(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="user", password="pass")
@@ -119,3 +197,79 @@ class ApiKeyTests(APITestCase):
         )
         self.assertEqual(list_response.status_code, status.HTTP_200_OK)
         self.assertNotIn("secret", list_response.data[0])
+
+
+class ApiKeyAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        core_cache.reset()
+        last_used_buffer.flush()
+        self.user = User.objects.create_user(username="user", password="pass")
+        self.workspace = Workspace.objects.create(name="Acme", created_by=self.user)
+        self.other = Workspace.objects.create(name="Other", created_by=self.user)
+        Membership.objects.create(workspace=self.workspace, user=self.user, role=Membership.ROLE_ADMIN)
+
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            "/api/v1/tenants/api-keys/",
+            {"name": "Integração"},
+            format="json",
+            HTTP_X_WORKSPACE_ID=str(self.workspace.id),
+        )
+        self.secret = response.data["secret"]
+        self.api_key = ApiKey.objects.get(id=response.data["id"])
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Api-Key {self.secret}")
+
+    def _list(self, **headers):
+        return self.client.get("/api/v1/tenants/memberships/", **headers)
+
+    def test_secret_has_public_prefix(self):
+        self.assertTrue(self.api_key.prefix.startswith("omk_"))
+        self.assertTrue(self.secret.startswith(self.api_key.prefix + "_"))
+
+    def test_authenticates_into_key_workspace_with_cached_lookup(self):
+        # frio: lookup da key (com workspace) + listagem
+        with self.assertNumQueries(2):
+            response = self._list()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        # quente: só a listagem
+        with self.assertNumQueries(1):
+            self.assertEqual(self._list(HTTP_X_WORKSPACE_ID=str(self.workspace.id)).status_code, 200)
+
+    def test_other_workspace_and_admin_actions_forbidden(self):
+        self.assertEqual(
+            self._list(HTTP_X_WORKSPACE_ID=str(self.other.id)).status_code,
+            status.HTTP_403_FORBIDDEN,
+        )
+        response = self.client.post("/api/v1/tenants/api-keys/", {"name": "x"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_invalid_keys_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Api-Key omk_zz_nope")
+        with self.assertNumQueries(0):
+            self.assertEqual(self._list().status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_X_API_KEY=self.secret + "x")
+        self.assertEqual(self._list().status_code, status.HTTP_401_UNAUTHORIZED)
+        # negativo também fica em cache
+        with self.assertNumQueries(0):
+            self.assertEqual(self._list().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoked_key_is_invalidated(self):
+        self.assertEqual(self._list().status_code, status.HTTP_200_OK)
+        self.api_key.is_active = False
+        self.api_key.save()
+        self.assertEqual(self._list().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_last_used_at_written_in_batch(self):
+        for _ in range(3):
+            self.assertEqual(self._list().status_code, status.HTTP_200_OK)
+        self.api_key.refresh_from_db()
+        self.assertIsNone(self.api_key.last_used_at)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(last_used_buffer.flush(), 1)
+        self.api_key.refresh_from_db()
+        self.assertIsNotNone(self.api_key.last_used_at)
@@ -1,5 +1,7 @@
+from django.db.models import Exists, OuterRef, Subquery
 from rest_framework import mixins, viewsets
 from rest_framework.permissions import IsAuthenticated
+from rest_framework_simplejwt.authentication import JWTAuthentication
 
 from apps.tenants.mixins import WorkspaceRequiredMixin
 from apps.tenants.models import ApiKey, Membership, Workspace
@@ -15,9 +17,16 @@ from apps.tenants.serializers import (
 class WorkspaceViewSet(mixins.ListModelMixin, mixins.CreateModelMixin, viewsets.GenericViewSet):
     serializer_class = WorkspaceSerializer
     permission_classes = [IsAuthenticated]
+    # workspaces "do usuário": API keys já são de um workspace só
+    authentication_classes = [JWTAuthentication]
 
     def get_queryset(self):
-        return Workspace.objects.filter(memberships__user=self.request.user).distinct()
+        # role vem na mesma query; Exists no lugar de join + distinct
+        memberships = Membership.objects.filter(workspace=OuterRef("pk"), user=self.request.user)
+        return (
+            Workspace.objects.filter(Exists(memberships))
+            .annotate(member_role=Subquery(memberships.values("role")[:1]))
+        )
 
 
 class MembershipViewSet(WorkspaceRequiredMixin, viewsets.ModelViewSet):
@@ -1,15 +1,59 @@
+"""
+Resolução de (usuário, X-Workspace-ID) -> workspace + role.
+
+Roda em todo request autenticado com workspace, então:
+  - request: resolvido uma vez (request.workspace / request.workspace_role);
+  - cache compartilhado com TTL curto (WORKSPACE_ACCESS_TTL), no namespace do
+    workspace e com L1 em memória (apps.core.cache);
+  - miss: uma única query (workspace + role do usuário via subquery).
+
+Mudanças de Membership/Workspace invalidam via signals (apps.tenants.signals).
+
+Requests autenticados por API key não consultam Membership: o workspace é o
+da key (já carregado pela autenticação) e o role é sempre "member".
+"""
 import uuid
 
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
 from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 
-from apps.tenants.models import Membership, Workspace
+from apps.core.cache import tenant
+from apps.tenants.models import ApiKey, Membership, Workspace
 
 
 WORKSPACE_HEADER = "X-Workspace-ID"
 
 
-def resolve_workspace(request):
+def access_cache(workspace_id):
+    return tenant(workspace_id, "access", l1=True)
+
+
+def invalidate_access(user_ids, workspace_id):
+    access_cache(workspace_id).delete_many(user_ids)
+
+
+def _load_access(user_id, workspace_uuid):
+    """(workspace, role ou None) numa query só; None se o workspace não existe."""
+    role = Membership.objects.filter(workspace=OuterRef("pk"), user_id=user_id).values("role")[:1]
+    workspace = Workspace.objects.filter(id=workspace_uuid).annotate(member_role=Subquery(role)).first()
+    return (workspace, workspace.member_role) if workspace else None
+
+
+def resolve_workspace_access(request) -> tuple[Workspace, str]:
+    """
+    Retorna (workspace, role). Levanta:
+      - ValidationError (400) sem header;
+      - NotFound (404) se o workspace não existe;
+      - PermissionDenied (403) se o usuário não é membro.
+    """
+    cached = getattr(request, "_workspace_access", None)
+    if cached is not None:
+        return cached
+
     workspace_id = request.headers.get(WORKSPACE_HEADER)
+    if isinstance(request.auth, ApiKey):
+        return _resolve_api_key_access(request, workspace_id)
     if not workspace_id:
         raise ValidationError({"detail": "X-Workspace-ID header é obrigatório."})
 
@@ -18,16 +62,34 @@ def resolve_workspace(request):
     except ValueError as exc:
         raise NotFound("Workspace não encontrado.") from exc
 
-    try:
-        workspace = Workspace.objects.get(id=workspace_uuid)
-    except Workspace.DoesNotExist as exc:
-        raise NotFound("Workspace não encontrado.") from exc
-
     user = request.user
     if not user or not user.is_authenticated:
         raise PermissionDenied("Usuário sem acesso ao workspace.")
 
-    if not Membership.objects.filter(workspace=workspace, user=user).exists():
+    entry = access_cache(workspace_uuid).get_or_set(
+        user.pk,
+        lambda: _load_access(user.pk, workspace_uuid),
+        timeout=int(getattr(settings, "WORKSPACE_ACCESS_TTL", 60)),
+        none_timeout=int(getattr(settings, "WORKSPACE_ACCESS_NEGATIVE_TTL", 10)),
+    )
+    if entry is None:
+        raise NotFound("Workspace não encontrado.")
+
+    workspace, role = entry
+    if not role:
         raise PermissionDenied("Usuário sem acesso ao workspace.")
 
-    return workspace
+    request._workspace_access = (workspace, role)
+    return workspace, role
+
+
+def _resolve_api_key_access(request, workspace_id: str | None) -> tuple[Workspace, str]:
+    api_key = request.auth
+    if workspace_id and workspace_id != str(api_key.workspace_id):
+        raise PermissionDenied("API key não pertence a este workspace.")
+    request._workspace_access = (api_key.workspace, Membership.ROLE_MEMBER)
+    return request._workspace_access
+
+
+def resolve_workspace(request) -> Workspace:
+    return resolve_workspace_access(request)[0]
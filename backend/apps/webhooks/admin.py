@@ -8,3 +8,7 @@ class WebhookEventAdmin(admin.ModelAdmin):
     list_display = ("id", "provider", "idempotency_key", "created_at")
     search_fields = ("id", "provider", "idempotency_key")
     list_filter = ("provider", "created_at")
+
+    def get_queryset(self, request):
+        # payload/headers só são carregados quando a página de detalhe acessa
+        return super().get_queryset(request).defer("raw_payload", "raw_headers", "normalized")
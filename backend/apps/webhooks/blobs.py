@@ -0,0 +1,157 @@
+"""
+Offload de blobs (mídia/QR em base64) dos payloads de webhook.
+
+A Evolution manda mídia e QR code inline como base64 (às vezes em data URL).
+Guardar isso em `WebhookEvent.raw_payload` faz a tabela crescer muito e toda
+leitura de linha puxa megabytes. Aqui:
+
+  - strings grandes em base64 são detectadas no ingest, decodificadas e gravadas
+    em storage endereçado por conteúdo (sha256), com dedupe natural;
+  - no JSON fica só uma referência: {"$blob": "<sha256>", "size": ..., ...};
+  - `hydrate_payload` reconstrói o payload original sob demanda.
+"""
+import base64
+import binascii
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+BLOB_REF_KEY = "$blob"
+
+_DATA_URL_RE = re.compile(r"^data:([\w.+-]+/[\w.+-]+);base64,", re.IGNORECASE)
+_BASE64_RE = re.compile(r"^[A-Za-z0-9+/\r\n]+={0,2}$")
+
+# headers que nunca devem ir para o banco (segredos / ruído de transporte)
+_DROPPED_HEADERS = {
+    "authorization",
+    "cookie",
+    "apikey",
+    "x-api-key",
+    "proxy-authorization",
+}
+
+_KEPT_HEADERS = {
+    "content-type",
+    "content-length",
+    "user-agent",
+}
+
+
+def blob_storage() -> FileSystemStorage:
+    return FileSystemStorage(location=str(settings.WEBHOOK_BLOB_ROOT))
+
+
+def _blob_path(digest: str) -> str:
+    return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+def _min_chars() -> int:
+    return int(getattr(settings, "WEBHOOK_BLOB_MIN_CHARS", 2048))
+
+
+def is_blob_ref(value) -> bool:
+    return isinstance(value, dict) and isinstance(value.get(BLOB_REF_KEY), str)
+
+
+def _decode_candidate(value: str):
+    """
+    Retorna (bytes, mime, encoding) se a string parece base64 grande.
+    Senão, None (fica inline).
+    """
+    if len(value) < _min_chars():
+        return None
+
+    mime = None
+    encoding = "base64"
+    body = value
+
+    m = _DATA_URL_RE.match(value)
+    if m:
+        mime = m.group(1).lower()
+        encoding = "data_url"
+        body = value[m.end():]
+
+    body = body.strip()
+    if not _BASE64_RE.fullmatch(body):
+        return None
+
+    try:
+        raw = base64.b64decode(body.replace("\r", "").replace("\n", ""), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+    return raw, mime, encoding
+
+
+def store_blob(raw: bytes) -> str:
+    digest = hashlib.sha256(raw).hexdigest()
+    storage = blob_storage()
+    path = _blob_path(digest)
+    # endereçado por conteúdo: se já existe, é o mesmo blob
+    if not storage.exists(path):
+        storage.save(path, ContentFile(raw))
+    return digest
+
+
+def load_blob(ref: dict) -> bytes:
+    with blob_storage().open(_blob_path(ref[BLOB_REF_KEY]), "rb") as fh:
+        return fh.read()
+
+
+def strip_payload(payload):
+    """
+    Devolve uma cópia do payload com blobs base64 trocados por referências.
+    Não altera o objeto original (request.data continua intacto).
+    """
+    if isinstance(payload, dict):
+        return {k: strip_payload(v) for k, v in payload.items()}
+    if isinstance(payload, list):
+        return [strip_payload(v) for v in payload]
+    if isinstance(payload, str):
+        decoded = _decode_candidate(payload)
+        if decoded is None:
+            return payload
+        raw, mime, encoding = decoded
+        return {
+            BLOB_REF_KEY: store_blob(raw),
+            "size": len(raw),
+            "mime": mime,
+            "encoding": encoding,
+        }
+    return payload
+
+
+def _rehydrate_ref(ref: dict) -> str:
+    b64 = base64.b64encode(load_blob(ref)).decode("ascii")
+    if ref.get("encoding") == "data_url":
+        return f"data:{ref.get('mime') or 'application/octet-stream'};base64,{b64}"
+    return b64
+
+
+def hydrate_payload(payload):
+    """Inverso de `strip_payload`: troca as referências pelo base64 original."""
+    if is_blob_ref(payload):
+        return _rehydrate_ref(payload)
+    if isinstance(payload, dict):
+        return {k: hydrate_payload(v) for k, v in payload.items()}
+    if isinstance(payload, list):
+        return [hydrate_payload(v) for v in payload]
+    return payload
+
+
+def slim_headers(headers: dict) -> dict:
+    """
+    Mantém só os headers úteis para auditoria/assinatura.
+    `X-*` entram (assinaturas, request ids), segredos nunca.
+    """
+    out = {}
+    for name, value in (headers or {}).items():
+        key = str(name).lower()
+        if key in _DROPPED_HEADERS:
+            continue
+        if key in _KEPT_HEADERS or key.startswith("x-"):
+            out[name] = value
+    return out
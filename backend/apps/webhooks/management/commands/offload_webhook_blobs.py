@@ -0,0 +1,45 @@
+from apps.webhooks.blobs import slim_headers, strip_payload
+from apps.webhooks.models import WebhookEvent
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Move base64 grandes de WebhookEvents já gravados para o blob storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        batch_size = opts["batch_size"]
+        qs = WebhookEvent.objects.order_by("created_at", "id").only(
+            "id", "created_at", "raw_payload", "raw_headers")
+
+        changed = 0
+        scanned = 0
+        last = None
+        while True:
+            page = qs
+            if last is not None:
+                page = page.filter(created_at__gte=last[0]).exclude(
+                    created_at=last[0], id__lte=last[1])
+            rows = list(page[:batch_size])
+            if not rows:
+                break
+
+            dirty = []
+            for ev in rows:
+                payload = strip_payload(ev.raw_payload)
+                headers = slim_headers(ev.raw_headers)
+                if payload != ev.raw_payload or headers != ev.raw_headers:
+                    ev.raw_payload = payload
+                    ev.raw_headers = headers
+                    dirty.append(ev)
+
+            if dirty:
+                WebhookEvent.objects.bulk_update(dirty, ["raw_payload", "raw_headers"])
+
+            scanned += len(rows)
+            changed += len(dirty)
+            last = (rows[-1].created_at, rows[-1].id)
+
+        self.stdout.write(f"scanned={scanned} offloaded={changed}")
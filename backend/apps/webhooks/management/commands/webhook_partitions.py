@@ -0,0 +1,41 @@
+from apps.webhooks.partitions import (archive_partition, ensure_partitions,
+                                      expired_partitions)
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria partições futuras de WebhookEvent e arquiva (JSONL gzip) + remove "
+        "as partições fora da retenção."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ahead", type=int, default=2,
+                            help="Quantos períodos futuros manter criados.")
+        parser.add_argument("--retention-days", type=int, default=None,
+                            help="Sobrescreve settings.WEBHOOK_RETENTION_DAYS (0 = sem retenção).")
+        parser.add_argument("--archive-dir", default=None,
+                            help="Sobrescreve settings.WEBHOOK_ARCHIVE_DIR.")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Só lista o que seria arquivado.")
+
+    def handle(self, *args, **opts):
+        retention = opts["retention_days"]
+        if retention is None:
+            retention = getattr(settings, "WEBHOOK_RETENTION_DAYS", 0)
+        archive_dir = opts["archive_dir"] or settings.WEBHOOK_ARCHIVE_DIR
+
+        if not opts["dry_run"]:
+            for name in ensure_partitions(ahead=opts["ahead"]):
+                self.stdout.write(f"created {name}")
+
+        if not retention:
+            return
+
+        for part in expired_partitions(retention):
+            if opts["dry_run"]:
+                self.stdout.write(f"would archive {part.name}")
+                continue
+            path, rows = archive_partition(part, archive_dir)
+            self.stdout.write(f"archived {part.name} rows={rows} -> {path}")
@@ -0,0 +1,75 @@
+# Converte webhooks_webhookevent em tabela particionada por RANGE (created_at).
+#
+# O Postgres exige que a PK inclua a chave de partição, então no banco a PK
+# passa a ser (id, created_at). Para o ORM nada muda: `id` continua sendo o
+# primary key do model (UUID, único na prática).
+#
+# Todas as linhas existentes vão para a partição DEFAULT; o comando
+# `manage.py webhook_partitions` cria as partições por período e move as
+# linhas da DEFAULT para elas.
+
+from django.db import migrations
+
+FORWARD_SQL = """
+ALTER TABLE webhooks_webhookevent RENAME TO webhooks_webhookevent_legacy;
+
+CREATE TABLE webhooks_webhookevent (
+    id uuid NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    provider varchar(255) NOT NULL,
+    idempotency_key varchar(255) NOT NULL,
+    raw_payload jsonb NOT NULL,
+    raw_headers jsonb NOT NULL,
+    normalized jsonb NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE webhooks_webhookevent_default
+    PARTITION OF webhooks_webhookevent DEFAULT;
+
+INSERT INTO webhooks_webhookevent
+    (id, created_at, provider, idempotency_key, raw_payload, raw_headers, normalized)
+SELECT id, created_at, provider, idempotency_key, raw_payload, raw_headers, normalized
+FROM webhooks_webhookevent_legacy;
+
+DROP TABLE webhooks_webhookevent_legacy;
+
+CREATE INDEX webhooks_we_idem_key_idx
+    ON webhooks_webhookevent (idempotency_key);
+CREATE INDEX webhooks_we_created_at_idx
+    ON webhooks_webhookevent (created_at DESC);
+"""
+
+REVERSE_SQL = """
+ALTER TABLE webhooks_webhookevent RENAME TO webhooks_webhookevent_partitioned;
+
+CREATE TABLE webhooks_webhookevent (
+    id uuid NOT NULL PRIMARY KEY,
+    created_at timestamp with time zone NOT NULL,
+    provider varchar(255) NOT NULL,
+    idempotency_key varchar(255) NOT NULL,
+    raw_payload jsonb NOT NULL,
+    raw_headers jsonb NOT NULL,
+    normalized jsonb NULL
+);
+
+INSERT INTO webhooks_webhookevent
+SELECT id, created_at, provider, idempotency_key, raw_payload, raw_headers, normalized
+FROM webhooks_webhookevent_partitioned;
+
+DROP TABLE webhooks_webhookevent_partitioned CASCADE;
+
+CREATE INDEX webhooks_we_idem_key_idx
+    ON webhooks_webhookevent (idempotency_key);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(FORWARD_SQL, REVERSE_SQL),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.28 on 2026-10-19 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0002_partition_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(condition=models.Q(('normalized__isnull', True)), fields=['created_at'], name='webhooks_we_pending_idx'),
+        ),
+    ]
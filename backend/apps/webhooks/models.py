@@ -23,6 +23,20 @@ class WebhookEvent(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # fila do ingest: eventos ainda não normalizados
+            models.Index(
+                fields=["created_at"],
+                name="webhooks_we_pending_idx",
+                condition=models.Q(normalized__isnull=True),
+            ),
+        ]
+
+    def hydrated_payload(self) -> dict:
+        """Payload com os blobs (mídia/QR) re-hidratados a partir do storage."""
+        from apps.webhooks.blobs import hydrate_payload
+
+        return hydrate_payload(self.raw_payload)
 
     def __str__(self) -> str:
         return f"WebhookEvent(provider={self.provider}, id={self.id})"
@@ -0,0 +1,251 @@
+"""
+Manutenção das partições de WebhookEvent (RANGE em created_at).
+
+  - `ensure_partitions`: cria as partições do período atual + `ahead` períodos
+    e tira da DEFAULT (em lotes) as linhas que já têm partição própria;
+  - `archive_partition`: exporta uma partição para JSONL gzip, faz DETACH e
+    DROP (sem DELETE linha a linha);
+  - `expired_partitions`: partições inteiramente fora da retenção.
+
+O intervalo ("month" ou "day") vem de settings.WEBHOOK_PARTITION_INTERVAL e
+deve ser fixo por ambiente: partições de intervalos diferentes se sobrepõem.
+"""
+import gzip
+import json
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from pathlib import Path
+
+from apps.webhooks.models import WebhookEvent
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+PARENT_TABLE = WebhookEvent._meta.db_table
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+
+_NAME_RE = re.compile(
+    rf"^{PARENT_TABLE}_p(?P<y>\d{{4}})_(?P<m>\d{{2}})(?:_(?P<d>\d{{2}}))?$")
+
+_COLUMNS = (
+    "id",
+    "created_at",
+    "provider",
+    "idempotency_key",
+    "raw_payload",
+    "raw_headers",
+    "normalized",
+)
+
+
+@dataclass(frozen=True)
+class Partition:
+    name: str
+    start: datetime
+    end: datetime
+
+
+def _interval(interval: str | None = None) -> str:
+    value = (interval or getattr(settings, "WEBHOOK_PARTITION_INTERVAL", "month")).lower()
+    if value not in {"month", "day"}:
+        raise ValueError(f"Intervalo de partição inválido: {value}")
+    return value
+
+
+def period_start(dt: datetime, interval: str) -> datetime:
+    dt = dt.astimezone(dt_timezone.utc)
+    if interval == "day":
+        return datetime(dt.year, dt.month, dt.day, tzinfo=dt_timezone.utc)
+    return datetime(dt.year, dt.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_period(start: datetime, interval: str) -> datetime:
+    if interval == "day":
+        return start + timedelta(days=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_for(start: datetime, interval: str) -> Partition:
+    if interval == "day":
+        suffix = start.strftime("%Y_%m_%d")
+    else:
+        suffix = start.strftime("%Y_%m")
+    return Partition(
+        name=f"{PARENT_TABLE}_p{suffix}",
+        start=start,
+        end=next_period(start, interval),
+    )
+
+
+def _parse_partition(name: str) -> Partition | None:
+    m = _NAME_RE.match(name)
+    if not m:
+        return None
+    y, mo, d = int(m.group("y")), int(m.group("m")), m.group("d")
+    if d:
+        return partition_for(datetime(y, mo, int(d), tzinfo=dt_timezone.utc), "day")
+    return partition_for(datetime(y, mo, 1, tzinfo=dt_timezone.utc), "month")
+
+
+def list_partitions() -> list[Partition]:
+    """Partições por período atualmente anexadas (a DEFAULT fica de fora)."""
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = %s
+            """,
+            [PARENT_TABLE],
+        )
+        names = [row[0] for row in cur.fetchall()]
+
+    parts = [p for p in (_parse_partition(n) for n in names) if p]
+    return sorted(parts, key=lambda p: p.start)
+
+
+def _oldest_default_row() -> datetime | None:
+    with connection.cursor() as cur:
+        cur.execute(f'SELECT min(created_at) FROM "{DEFAULT_PARTITION}"')
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _move_from_default(cur, part: Partition, limit: int | None = None) -> int:
+    limit_sql = "LIMIT %s" if limit else ""
+    cur.execute(
+        f"""
+        WITH moved AS (
+            DELETE FROM "{DEFAULT_PARTITION}"
+            WHERE ctid IN (
+                SELECT ctid FROM "{DEFAULT_PARTITION}"
+                WHERE created_at >= %s AND created_at < %s
+                {limit_sql}
+            )
+            RETURNING *
+        )
+        INSERT INTO "{part.name}" SELECT * FROM moved
+        """,
+        [part.start, part.end] + ([limit] if limit else []),
+    )
+    return cur.rowcount
+
+
+def _create_partition(part: Partition, *, batch_size: int = 5000) -> None:
+    """
+    Cria a partição fora da árvore, move para ela as linhas do período que
+    caíram na DEFAULT e só então faz ATTACH (o Postgres recusa criar uma
+    partição cujo range já tem linhas na DEFAULT).
+
+    A mudança sai em lotes de `batch_size`, cada um na sua transação (locks
+    curtos na DEFAULT); o resto que chegou nesse meio-tempo vai junto com o
+    ATTACH. Até o ATTACH as linhas movidas não aparecem na tabela pai — por
+    isso a tabela é reaproveitada (IF NOT EXISTS) se uma rodada anterior parou
+    no meio.
+    """
+    with connection.cursor() as cur:
+        cur.execute(
+            f'CREATE TABLE IF NOT EXISTS "{part.name}" '
+            f'(LIKE "{PARENT_TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        )
+    while True:
+        with transaction.atomic(), connection.cursor() as cur:
+            if _move_from_default(cur, part, batch_size) < batch_size:
+                break
+    with transaction.atomic(), connection.cursor() as cur:
+        _move_from_default(cur, part)
+        cur.execute(
+            f'ALTER TABLE "{PARENT_TABLE}" ATTACH PARTITION "{part.name}" '
+            f"FOR VALUES FROM (%s) TO (%s)",
+            [part.start, part.end],
+        )
+
+
+def ensure_partitions(*, ahead: int = 2, now: datetime | None = None, interval: str | None = None,
+                      batch_size: int = 5000) -> list[str]:
+    """
+    Garante partições do período mais antigo presente na DEFAULT (ou do período
+    atual) até `ahead` períodos no futuro. Retorna os nomes criados.
+    """
+    interval = _interval(interval)
+    now = now or timezone.now()
+
+    start = period_start(now, interval)
+    oldest = _oldest_default_row()
+    if oldest is not None:
+        start = min(start, period_start(oldest, interval))
+
+    stop = period_start(now, interval)
+    for _ in range(ahead + 1):
+        stop = next_period(stop, interval)
+
+    existing = {p.name for p in list_partitions()}
+    created = []
+    cursor = start
+    while cursor < stop:
+        part = partition_for(cursor, interval)
+        if part.name not in existing:
+            _create_partition(part, batch_size=batch_size)
+            created.append(part.name)
+        cursor = part.end
+    return created
+
+
+def expired_partitions(retention_days: int, *, now: datetime | None = None) -> list[Partition]:
+    cutoff = (now or timezone.now()) - timedelta(days=retention_days)
+    return [p for p in list_partitions() if p.end <= cutoff]
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def archive_partition(part: Partition, archive_dir, *, batch_size: int = 1000) -> tuple[Path, int]:
+    """
+    Exporta a partição para `<archive_dir>/<nome>.jsonl.gz` e remove do banco
+    com DETACH + DROP. O arquivo é escrito em `.tmp` e renomeado no final, então
+    se algo falhar a partição continua intacta.
+
+    A leitura usa cursor server-side (declarado dentro da transação, serve
+    também atrás do PgBouncer): só `batch_size` linhas em memória por vez.
+    """
+    archive_dir = Path(archive_dir)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    final_path = archive_dir / f"{part.name}.jsonl.gz"
+    tmp_path = final_path.with_suffix(".gz.tmp")
+
+    rows = 0
+    cols = ", ".join(_COLUMNS)
+    with transaction.atomic(), connection.chunked_cursor() as cur, \
+            gzip.open(tmp_path, "wt", encoding="utf-8") as fh:
+        cur.execute(f'SELECT {cols} FROM "{part.name}" ORDER BY created_at, id')
+        while True:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                break
+            for record in batch:
+                item = dict(zip(_COLUMNS, record))
+                for key in ("raw_payload", "raw_headers", "normalized"):
+                    # psycopg2 pode devolver jsonb já decodificado ou como str
+                    if isinstance(item[key], str):
+                        item[key] = json.loads(item[key])
+                fh.write(json.dumps(item, ensure_ascii=False, default=_json_default))
+                fh.write("\n")
+                rows += 1
+
+    os.replace(tmp_path, final_path)
+
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.execute(f'ALTER TABLE "{PARENT_TABLE}" DETACH PARTITION "{part.name}"')
+        cur.execute(f'DROP TABLE "{part.name}"')
+
+    return final_path, rows
@@ -1,6 +1,21 @@
+import base64
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
 from django.urls import reverse
 from rest_framework.test import APITestCase
 
+from . import partitions
+from .blobs import BLOB_REF_KEY, strip_payload
 from .models import WebhookEvent
 
 
@@ -30,3 +45,81 @@ class WebhookInboxTests(APITestCase):
         self.assertEqual(r2.status_code, 200)
         self.assertEqual(WebhookEvent.objects.count(), 1)
         self.assertEqual(r2.json()["idempotent"], True)
+
+
+class WebhookBlobOffloadTests(APITestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(WEBHOOK_BLOB_ROOT=tmp.name, WEBHOOK_BLOB_MIN_CHARS=64)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_large_base64_is_offloaded_and_hydrated(self):
+        media = base64.b64encode(b"\x89PNG" + b"x" * 4096).decode("ascii")
+        payload = {
+            "event": "messages.upsert",
+            "data": {"message": {"base64": media}, "qrcode": {"base64": f"data:image/png;base64,{media}"}},
+        }
+
+        response = self.client.post(
+            reverse("webhooks-inbox"),
+            {
+                "provider": "evolution",
+                "payload": payload,
+                "headers": {"apikey": "secret", "X-Signature": "abc"},
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        event = WebhookEvent.objects.get()
+        stored = event.raw_payload["data"]["message"]["base64"]
+        self.assertIn(BLOB_REF_KEY, stored)
+        self.assertEqual(stored["size"], 4100)
+        self.assertEqual(
+            event.raw_headers,
+            {"X-Signature": "abc", "X-Correlation-ID": response["X-Correlation-ID"]},
+        )
+        self.assertEqual(event.hydrated_payload(), payload)
+
+    def test_small_strings_stay_inline(self):
+        self.assertEqual(strip_payload({"text": "oi, tudo bem?"}), {"text": "oi, tudo bem?"})
+
+
+class WebhookPartitionTests(APITestCase):
+    def test_default_rows_move_in_batches_before_attach(self):
+        now = timezone.now()
+        for i in range(5):
+            WebhookEvent.objects.create(provider="acme", idempotency_key=f"k{i}", raw_payload={"n": i})
+        WebhookEvent.objects.update(created_at=now - timedelta(days=400))
+
+        created = partitions.ensure_partitions(ahead=0, now=now, interval="month", batch_size=2)
+
+        old = partitions.partition_for(partitions.period_start(now - timedelta(days=400), "month"), "month")
+        self.assertIn(old.name, created)
+        with connection.cursor() as cur:
+            cur.execute(f'SELECT count(*) FROM "{partitions.DEFAULT_PARTITION}"')
+            self.assertEqual(cur.fetchone()[0], 0)
+            cur.execute(f'SELECT count(*) FROM "{old.name}"')
+            self.assertEqual(cur.fetchone()[0], 5)
+        self.assertEqual(WebhookEvent.objects.count(), 5)
+
+    def test_old_partition_is_archived_and_dropped(self):
+        old = WebhookEvent.objects.create(provider="acme", idempotency_key="old", raw_payload={"n": 1})
+        WebhookEvent.objects.create(provider="acme", idempotency_key="new", raw_payload={"n": 2})
+        WebhookEvent.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=120))
+
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        call_command("webhook_partitions", retention_days=60, archive_dir=archive_dir, stdout=StringIO())
+
+        self.assertEqual(list(WebhookEvent.objects.values_list("idempotency_key", flat=True)), ["new"])
+
+        rows = []
+        for name in sorted(os.listdir(archive_dir)):
+            self.assertTrue(name.endswith(".jsonl.gz"))
+            with gzip.open(os.path.join(archive_dir, name), "rt") as fh:
+                rows.extend(json.loads(line) for line in fh)
+        self.assertEqual([r["idempotency_key"] for r in rows], ["old"])
+        self.assertEqual(rows[0]["raw_payload"], {"n": 1})
@@ -13,4 +13,5 @@ urlpatterns = [
     path("agents/", include("apps.agents.urls")),
     path("rag/", include("apps.rag.urls")),
     path("audit/", include("apps.audit.urls")),
+    path("core/", include("apps.core.urls")),
 ]
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import json
 import os
 from pathlib import Path
 
@@ -70,6 +71,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "apps.core.middleware.PerformanceMiddleware",
+    "apps.core.middleware.CorrelationIdMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     "corsheaders.middleware.CorsMiddleware",
@@ -112,6 +115,18 @@ WSGI_APPLICATION = 'setup.wsgi.application'
 # }
 
 POSTGRES_HOST = env("POSTGRES_HOST")
+
+# Conexões (apps.core.db):
+#   - DB_CONN_MAX_AGE: 0 abre/fecha uma conexão por request; >0 reaproveita a
+#     conexão do worker por até N segundos (prod.py liga por padrão);
+#   - DB_CONN_HEALTH_CHECKS: testa a conexão reaproveitada antes do request;
+#   - DB_POOL_MODE=transaction: atrás de PgBouncer em transaction pooling —
+#     sem cursores server-side (iterator() não segura cursor entre transações)
+#     e sem estado de sessão. O timezone (UTC, = TIME_ZONE) vai no pacote de
+#     startup (options) em vez do SET por sessão do Django; apps.core.db recusa
+#     subir em transaction sem ele. No PgBouncer, `options` precisa estar em
+#     track_extra_parameters (1.20+), não em ignore_startup_parameters.
+DB_POOL_MODE = env("DB_POOL_MODE", "session")
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -120,9 +135,62 @@ DATABASES = {
         "PASSWORD": env("POSTGRES_PASSWORD", "omnichat"),
         "HOST": POSTGRES_HOST,
         "PORT": env("POSTGRES_PORT", "5432"),
+        "CONN_MAX_AGE": int(env("DB_CONN_MAX_AGE", "0")),
+        "CONN_HEALTH_CHECKS": env("DB_CONN_HEALTH_CHECKS", "1") == "1",
+        "DISABLE_SERVER_SIDE_CURSORS": DB_POOL_MODE == "transaction",
+        "OPTIONS": {
+            "connect_timeout": int(env("DB_CONNECT_TIMEOUT", "5")),
+            "application_name": env("DB_APPLICATION_NAME", "omnichat"),
+            "options": "-c timezone=UTC",
+        },
     }
 }
 
+# Instrumentação (apps.core.middleware / GET /metrics): latência e contagem
+# sempre; queries por request só numa fração amostrada dos requests
+PERF_SAMPLE_RATE = float(env("PERF_SAMPLE_RATE", "0.05"))
+PERF_SERVER_TIMING = env("PERF_SERVER_TIMING", "1") == "1"
+METRICS_TOKEN = env("METRICS_TOKEN", "")
+# sem METRICS_TOKEN o /metrics só responde com isto desligado (dev)
+METRICS_REQUIRE_TOKEN = env("METRICS_REQUIRE_TOKEN", "0") == "1"
+
+# Tracing (apps.core.tracing): TRACING_EXPORTER=file grava spans em OTLP/JSON
+# (uma linha por lote) para o collector; TRACING_SLOW_MS>0 loga spans lentos
+TRACING_EXPORTER = env("TRACING_EXPORTER", "")
+TRACING_FILE = env("TRACING_FILE", str(BASE_DIR / "traces.jsonl"))
+TRACING_SERVICE_NAME = env("TRACING_SERVICE_NAME", "omnichat")
+TRACING_FLUSH_INTERVAL = float(env("TRACING_FLUSH_INTERVAL", "2"))
+TRACING_SLOW_MS = float(env("TRACING_SLOW_MS", "0"))
+
+# Cache e pub/sub (apps.core.cache / apps.core.pubsub): com REDIS_URL tudo é
+# compartilhado entre processos; sem ele cai para memória do processo (dev/testes)
+REDIS_URL = env("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": env("CACHE_KEY_PREFIX", "omnichat"),
+            "TIMEOUT": 300,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "TIMEOUT": 300,
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+
+# L1 em memória do processo para chaves quentes (opt-in por namespace):
+# staleness entre processos limitada a CACHE_L1_TTL segundos
+CACHE_L1_TTL = float(env("CACHE_L1_TTL", "5"))
+CACHE_L1_MAX_ITEMS = int(env("CACHE_L1_MAX_ITEMS", "2000"))
+# stampede: quem não pegou o lock espera até CACHE_LOCK_WAIT s pelo valor
+CACHE_LOCK_TIMEOUT = float(env("CACHE_LOCK_TIMEOUT", "10"))
+CACHE_LOCK_WAIT = float(env("CACHE_LOCK_WAIT", "2"))
+
 
 EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = BASE_DIR / "email"
@@ -185,11 +253,127 @@ CORS_ALLOW_HEADERS = list(default_headers) + [
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "apps.tenants.authentication.ApiKeyAuthentication",
     ),
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
 }
 
 EVOLUTION_BASE_URL = env("EVOLUTION_BASE_URL", "http://localhost:8080")
 EVOLUTION_API_KEY = env("EVOLUTION_API_KEY", "")
+EVOLUTION_CONNECT_TIMEOUT = float(env("EVOLUTION_CONNECT_TIMEOUT", "3.05"))
+EVOLUTION_READ_TIMEOUT = float(env("EVOLUTION_READ_TIMEOUT", "20"))
+
+# Pareamento (QR/pairing code) por short poll em evolution/pairing/ (apps.channels.pairing).
+# MAX_WAIT > 0 deixa o request esperar o webhook, segurando um worker síncrono:
+# no máximo MAX_WAITERS esperas por processo
+EVOLUTION_PAIRING_TTL = int(env("EVOLUTION_PAIRING_TTL", "600"))
+EVOLUTION_PAIRING_POLL_INTERVAL = float(env("EVOLUTION_PAIRING_POLL_INTERVAL", "2"))
+EVOLUTION_PAIRING_MAX_WAIT = float(env("EVOLUTION_PAIRING_MAX_WAIT", "0"))
+EVOLUTION_PAIRING_MAX_WAITERS = int(env("EVOLUTION_PAIRING_MAX_WAITERS", "4"))
+# threads do estágio paralelo de setup (settings/webhook/connect) no connect
+EVOLUTION_SETUP_WORKERS = int(env("EVOLUTION_SETUP_WORKERS", "16"))
+
+# apps.channels.resolver: instância -> Channel (namespace "chres", L1 + django cache)
+CHANNEL_RESOLVER_TTL = int(env("CHANNEL_RESOLVER_TTL", "600"))
+CHANNEL_RESOLVER_NEGATIVE_TTL = int(env("CHANNEL_RESOLVER_NEGATIVE_TTL", "15"))
+
+# Estado de conexão em cache (apps.channels.connection): webhook mantém; fan-out só p/ velhos
+CHANNEL_STATE_TTL = int(env("CHANNEL_STATE_TTL", "86400"))
+CHANNEL_STATE_MAX_AGE = float(env("CHANNEL_STATE_MAX_AGE", "60"))
+CHANNEL_STATE_WEBHOOK_MAX_AGE = float(env("CHANNEL_STATE_WEBHOOK_MAX_AGE", "900"))
+CHANNEL_STATUS_CONCURRENCY = int(env("CHANNEL_STATUS_CONCURRENCY", "16"))
+# manage.py reconcile_channels: intervalo < CHANNEL_STATE_MAX_AGE mantém o cache sempre fresco
+CHANNEL_RECONCILE_INTERVAL = float(env("CHANNEL_RECONCILE_INTERVAL", "30"))
+
+# Pool HTTP compartilhado (apps.providers.base.http): keep-alive por base_url
+HTTP_POOL_CONNECTIONS = int(env("HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(env("HTTP_POOL_MAXSIZE", "32"))
+HTTP_RETRIES = int(env("HTTP_RETRIES", "2"))
+HTTP_ASYNC_MAX_CONNECTIONS = int(env("HTTP_ASYNC_MAX_CONNECTIONS", "1000"))
+
+# Isolamento por upstream (apps.providers.base.resilience): circuit breaker + bulkhead por base_url
+UPSTREAM_BREAKER_FAILURES = int(env("UPSTREAM_BREAKER_FAILURES", "5"))
+UPSTREAM_BREAKER_RESET_SECONDS = float(env("UPSTREAM_BREAKER_RESET_SECONDS", "30"))
+UPSTREAM_BULKHEAD_SIZE = int(env("UPSTREAM_BULKHEAD_SIZE", "16"))
+UPSTREAM_BULKHEAD_WAIT = float(env("UPSTREAM_BULKHEAD_WAIT", "0.5"))
+# abrir/fechar do breaker -> WorkspaceProvider.status, gravado em lote (apps.channels.signals)
+PROVIDER_STATUS_FLUSH_INTERVAL = float(env("PROVIDER_STATUS_FLUSH_INTERVAL", "5"))
+
+# Cache de (usuário, workspace) -> workspace + role (apps.tenants.workspace);
+# invalidado por signals em Membership/Workspace, TTL é só a rede de segurança
+WORKSPACE_ACCESS_TTL = int(env("WORKSPACE_ACCESS_TTL", "60"))
+WORKSPACE_ACCESS_NEGATIVE_TTL = int(env("WORKSPACE_ACCESS_NEGATIVE_TTL", "10"))
+
+# API keys (apps.tenants.authentication): lookup por hash em cache;
+# last_used_at gravado em lote a cada APIKEY_TOUCH_INTERVAL segundos
+APIKEY_CACHE_TTL = int(env("APIKEY_CACHE_TTL", "300"))
+APIKEY_NEGATIVE_TTL = int(env("APIKEY_NEGATIVE_TTL", "30"))
+APIKEY_TOUCH_INTERVAL = float(env("APIKEY_TOUCH_INTERVAL", "10"))
+
+# Gateway do LLM (apps.providers.llm.gateway): RAG e agents usam o mesmo transporte.
+# Workspace com WorkspaceProvider(provider="openai") usa a própria key (BYOK).
+# LLM_MODEL_ROUTES (JSON) = {"rag": "gpt-4o", "agent": "chat", ...}: rota/alias -> modelo.
+# LLM_HEDGE_AFTER: segundos até duplicar uma chamada lenta (só embeddings; 0 = desliga);
+# LLM_HEDGE_WORKERS limita as chamadas em hedging no processo (acima disso, sem hedge)
+OPENAI_API_KEY = env("OPENAI_API_KEY", "")
+OPENAI_BASE_URL = env("OPENAI_BASE_URL", "https://api.openai.com/v1")
+LLM_CHAT_MODEL = env("OPENAI_CHAT_MODEL", "gpt-4o-mini")
+LLM_EMBED_MODEL = env("OPENAI_EMBED_MODEL", "text-embedding-3-small")
+LLM_MODEL_ROUTES = json.loads(env("LLM_MODEL_ROUTES", "{}"))
+LLM_CONNECT_TIMEOUT = float(env("LLM_CONNECT_TIMEOUT", "3.05"))
+LLM_READ_TIMEOUT = float(env("LLM_READ_TIMEOUT", "90"))
+LLM_EMBED_TIMEOUT = float(env("LLM_EMBED_TIMEOUT", "60"))
+LLM_HEDGE_AFTER = float(env("LLM_HEDGE_AFTER", "2"))
+LLM_HEDGE_WORKERS = int(env("LLM_HEDGE_WORKERS", "16"))
+LLM_CREDENTIALS_TTL = int(env("LLM_CREDENTIALS_TTL", "300"))
+
+# Cache semântico de respostas (apps.rag.answer_cache), opt-in: playground e agents
+# com Agent.answer_cache reaproveitam a resposta de uma pergunta com similaridade
+# cosseno >= RAG_ANSWER_CACHE_THRESHOLD, enquanto os documentos citados não mudam.
+# Entradas expiram em RAG_ANSWER_CACHE_TTL segundos (manage.py prune_answer_cache)
+RAG_ANSWER_CACHE = env("RAG_ANSWER_CACHE", "0") == "1"
+RAG_ANSWER_CACHE_THRESHOLD = float(env("RAG_ANSWER_CACHE_THRESHOLD", "0.95"))
+RAG_ANSWER_CACHE_TTL = int(env("RAG_ANSWER_CACHE_TTL", "86400"))
+
+# Agents (manage.py agent_worker): pool de workers para o LLM com limite de
+# runs simultâneos por workspace (um tenant não ocupa todos os workers)
+AGENT_WORKERS = int(env("AGENT_WORKERS", "8"))
+AGENT_WORKSPACE_CONCURRENCY = int(env("AGENT_WORKSPACE_CONCURRENCY", "2"))
+AGENT_MAX_ATTEMPTS = int(env("AGENT_MAX_ATTEMPTS", "3"))
+AGENT_LEASE_SECONDS = int(env("AGENT_LEASE_SECONDS", "300"))
+# debounce: rajada de mensagens vira um run após AGENT_DEBOUNCE_SECONDS de silêncio,
+# esperando no máximo AGENT_DEBOUNCE_MAX_SECONDS desde a primeira mensagem
+AGENT_DEBOUNCE_SECONDS = float(env("AGENT_DEBOUNCE_SECONDS", "3"))
+AGENT_DEBOUNCE_MAX_SECONDS = float(env("AGENT_DEBOUNCE_MAX_SECONDS", "15"))
+# histórico no prompt: janela por conversa (Conversation.recent_messages) de
+# CONVERSATION_HISTORY_SIZE mensagens, cortada por orçamento de tokens (0 = sem corte)
+CONVERSATION_HISTORY_SIZE = int(env("CONVERSATION_HISTORY_SIZE", "20"))
+AGENT_HISTORY_MAX_TOKENS = int(env("AGENT_HISTORY_MAX_TOKENS", "2000"))
+
+# Uso/auditoria (apps.audit.usage): eventos em buffer, gravados em lote junto
+# com os rollups minuto/hora/dia; LLM_PRICES (JSON) = {"modelo": [usd_in, usd_out]} por 1M tokens
+USAGE_FLUSH_INTERVAL = float(env("USAGE_FLUSH_INTERVAL", "5"))
+USAGE_BUFFER_SIZE = int(env("USAGE_BUFFER_SIZE", "2000"))
+# flushes seguidos que podem falhar (banco fora) antes de o lote ser descartado
+USAGE_FLUSH_RETRIES = int(env("USAGE_FLUSH_RETRIES", "3"))
+USAGE_MINUTE_RETENTION_HOURS = int(env("USAGE_MINUTE_RETENTION_HOURS", "48"))
+USAGE_HOUR_RETENTION_DAYS = int(env("USAGE_HOUR_RETENTION_DAYS", "90"))
+LLM_PRICES = json.loads(env("LLM_PRICES", "{}"))
+
+# Outbox (manage.py outbox_worker): rate limit por instância da Evolution
+OUTBOX_WORKERS = int(env("OUTBOX_WORKERS", "8"))
+OUTBOX_RATE_PER_SECOND = float(env("OUTBOX_RATE_PER_SECOND", "1"))
+OUTBOX_BURST = float(env("OUTBOX_BURST", "5"))
+OUTBOX_MAX_ATTEMPTS = int(env("OUTBOX_MAX_ATTEMPTS", "5"))
 
 PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "")
+
+# Webhooks: base64 grandes (mídia/QR) saem do raw_payload e vão para storage local
+WEBHOOK_BLOB_ROOT = env("WEBHOOK_BLOB_ROOT", str(BASE_DIR / "media" / "webhook_blobs"))
+WEBHOOK_BLOB_MIN_CHARS = int(env("WEBHOOK_BLOB_MIN_CHARS", "2048"))
+
+# Webhooks: particionamento por created_at + retenção (manage.py webhook_partitions)
+WEBHOOK_PARTITION_INTERVAL = env("WEBHOOK_PARTITION_INTERVAL", "month")
+WEBHOOK_RETENTION_DAYS = int(env("WEBHOOK_RETENTION_DAYS", "90"))
+WEBHOOK_ARCHIVE_DIR = env("WEBHOOK_ARCHIVE_DIR", str(BASE_DIR / "media" / "webhook_archive"))
+
@@ -1,3 +1,15 @@
 from .base import *  # noqa
+from .base import DATABASES, env
 
 DEBUG = False
+
+SECRET_KEY = env("DJANGO_SECRET_KEY", SECRET_KEY)  # noqa: F405
+ALLOWED_HOSTS = [h.strip() for h in env("DJANGO_ALLOWED_HOSTS", "*").split(",") if h.strip()]
+
+# /metrics expõe rotas e upstreams (base_url): em produção só com METRICS_TOKEN
+METRICS_REQUIRE_TOKEN = env("METRICS_REQUIRE_TOKEN", "1") == "1"
+
+# Conexões persistentes por padrão em produção (ver DB_* em base.py).
+# Com PgBouncer em transaction pooling, o pooler já reaproveita as conexões do
+# lado do Postgres; manter a conexão com o PgBouncer evita só o handshake.
+DATABASES["default"]["CONN_MAX_AGE"] = int(env("DB_CONN_MAX_AGE", "60"))
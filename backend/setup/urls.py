@@ -14,6 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from apps.core.views import metrics_view
 from apps.providers.evolution.webhooks import evolution_webhook
 from django.contrib import admin
 from django.urls import include, path
@@ -22,4 +23,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path("api/v1/", include("setup.api.urls")),
     path("api/v1/providers/evolution/webhook/", evolution_webhook),
+    path("metrics", metrics_view),
 ]
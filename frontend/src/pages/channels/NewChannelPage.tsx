@@ -25,9 +25,33 @@ type EvolutionConnectDTO = {
   pairing_code?: string | null;
   qr_base64?: string | null;
   qr_data_url?: string | null;
+  version?: number;
   raw?: any;
 };
 
+type EvolutionPairingDTO = {
+  channel_id?: string;
+  instance?: string;
+  version?: number;
+  changed?: boolean;
+  state?: string;
+  connected?: boolean;
+  qr_base64?: string | null;
+  qr_data_url?: string | null;
+  pairing_code?: string | null;
+  poll_after?: number;
+};
+
+// short poll: o backend só lê o estado versionado (não segura worker);
+// repete a cada poll_after segundos e desiste do primeiro QR após PAIRING_QR_WAIT_S
+const PAIRING_QR_WAIT_S = 25;
+const PAIRING_POLL_S = 2;
+
+const sleep = (ms: number) => new Promise((r) => setTimeout(r, ms));
+
+const pollDelayMs = (pair?: EvolutionPairingDTO) =>
+  Math.max(0.5, Number(pair?.poll_after ?? PAIRING_POLL_S)) * 1000;
+
 type EvolutionStatusDTO = {
   channel_id?: string;
   instance?: string;
@@ -98,6 +122,7 @@ export default function NewChannelPage() {
   const [polling, setPolling] = useState(false);
   const [pollFallbackTried, setPollFallbackTried] = useState(false);
   const [lastPhoneDigits, setLastPhoneDigits] = useState<string | null>(null);
+  const [pairingVersion, setPairingVersion] = useState(0);
 
   // Pairing / QR
   const [phoneNumber, setPhoneNumber] = useState('');
@@ -184,18 +209,18 @@ export default function NewChannelPage() {
         setLastPhoneDigits(digits || null);
 
         try {
-          // conecta (QR)
+          // conecta (QR): responde na hora; o QR pode chegar depois pelo webhook
           const connectRes = await api.post<EvolutionConnectDTO>(
             `/channels/${created.id}/evolution/connect/`,
             {
               phone_number: digits || undefined,
-              qr_timeout_s: 45,
               prefer_pairing: false,
             },
-            { timeout: 70000 }
+            { timeout: 30000 }
           );
 
           const connect = (connectRes as any)?.data ?? connectRes;
+          let version = Number(connect?.version ?? 0);
 
           const pc =
             connect?.pairing_code ??
@@ -204,8 +229,23 @@ export default function NewChannelPage() {
 
           if (pc) setPairingCode(String(pc));
 
-          const qr = pickQrDataUrl(connect);
+          let qr = pickQrDataUrl(connect);
+
+          // ainda sem QR: espera o QRCODE_UPDATED (short poll)
+          const qrDeadline = Date.now() + PAIRING_QR_WAIT_S * 1000;
+          while (!pc && !qr && Date.now() < qrDeadline) {
+            const pairRes = await api.get<EvolutionPairingDTO>(
+              `/channels/${created.id}/evolution/pairing/?since=${version}`
+            );
+            const pair = (pairRes as any)?.data ?? pairRes;
+            version = Number(pair?.version ?? version);
+            qr = pickQrDataUrl(pair);
+            if (qr || pair?.connected) break;
+            await sleep(pollDelayMs(pair));
+          }
+
           if (qr) setQrSrc(qr);
+          setPairingVersion(version);
 
           // fallback (pairing) se não veio nada
           if (!pc && !qr && digits && !pollFallbackTried) {
@@ -215,7 +255,6 @@ export default function NewChannelPage() {
               `/channels/${created.id}/evolution/connect/`,
               {
                 phone_number: digits,
-                qr_timeout_s: 10,
                 prefer_pairing: true,
               },
               { timeout: 30000 }
@@ -304,7 +343,6 @@ export default function NewChannelPage() {
             `/channels/${createdChannelId}/evolution/connect/`,
             {
               phone_number: lastPhoneDigits,
-              qr_timeout_s: 10,
               prefer_pairing: true,
             }
           );
@@ -333,6 +371,43 @@ export default function NewChannelPage() {
     };
   }, [polling, createdChannelId, navigate, lastPhoneDigits, pollFallbackTried, channelsUrl]);
 
+  // Short poll do pareamento: QR rotacionado e conexão chegam pela versão
+  useEffect(() => {
+    if (!polling || !createdChannelId) return;
+
+    let stopped = false;
+
+    (async () => {
+      let since = pairingVersion;
+      while (!stopped) {
+        try {
+          const pairRes = await api.get<EvolutionPairingDTO>(
+            `/channels/${createdChannelId}/evolution/pairing/?since=${since}`
+          );
+          const pair = (pairRes as any)?.data ?? pairRes;
+          if (stopped) return;
+
+          since = Number(pair?.version ?? since);
+          if (pair?.connected) return; // o polling de status ativa e navega
+
+          if (pair?.changed) {
+            const qr = pickQrDataUrl(pair);
+            if (qr) setQrSrc(qr);
+            if (pair?.pairing_code) setPairingCode(String(pair.pairing_code));
+          }
+          await sleep(pollDelayMs(pair));
+        } catch {
+          // rede/timeout: espera um pouco antes de tentar de novo
+          await sleep(PAIRING_POLL_S * 1000);
+        }
+      }
+    })();
+
+    return () => {
+      stopped = true;
+    };
+  }, [polling, createdChannelId, pairingVersion]);
+
   return (
     <div className="max-w-2xl mx-auto">
       {/* Header */}